@@ -13,7 +13,7 @@ if ON_RENDER:
     from psycogreen.gevent import patch_psycopg
     patch_psycopg()
 
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, session
+from flask import Flask, Response, render_template, request, jsonify, send_file, send_from_directory, redirect, url_for, session
 from flask_socketio import SocketIO, emit, join_room as sio_join_room
 import json
 from werkzeug.utils import secure_filename
@@ -22,14 +22,33 @@ import uuid
 import random
 import re
 import string
+import tempfile
+import threading
 import time as _time
 from functools import wraps
+from urllib.parse import quote, urlencode
 import boto3
+from boto3.s3.transfer import TransferConfig
 import psycopg2
 import psycopg2.pool
 import psycopg2.extras
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user
 from authlib.integrations.flask_client import OAuth
+import image_queries
+from b2_multipart import StreamingUpload
+from b2_signing import PresignedUrlCache, SigV4Presigner
+from embedding_store import EmbeddingBuilder, EmbeddingStore, from_wire
+from image_hashes import DuplicateIndex, pick_distinct, to_db as to_db_hash
+from image_metadata import META_COLUMNS, MetadataBackfill, compute_metadata, public_metadata
+from image_proxy import DiskLRU, ImageProxy, parse_crop
+from image_catalog import ImageCatalog
+from leaderboard import LeaderboardCache
+from collection_summary import CollectionSummary, summary_rows
+from collection_rename import CollectionRename
+from jobs import STATUSES as JOB_STATUSES, JobQueue
+from tagger_service import TaggerClient, TaggerError
+from retag import CollectionRetag
+from thumbnails import ThumbnailBuilder, pick_thumbnail, savings as thumbnail_savings, thumbnail_keys
 
 # Load .env file if present (python-dotenv)
 try:
@@ -86,42 +105,99 @@ _s3 = boto3.client(
     region_name=B2_REGION or 'us-east-1',
 )
 
+# Signed URLs are reused until B2_URL_REUSE_FRACTION of their lifetime has passed
+# (0.5 → a 6h URL is handed out for 3h, so every URL served has ≥3h left). Besides
+# skipping the signing cost, a stable URL lets browsers keep the image cached.
+B2_URL_CACHE_SIZE = int(os.environ.get('B2_URL_CACHE_SIZE', 50000))
+B2_URL_REUSE_FRACTION = float(os.environ.get('B2_URL_REUSE_FRACTION', 0.5))
+_b2_url_cache = PresignedUrlCache(B2_URL_CACHE_SIZE, B2_URL_REUSE_FRACTION)
+
 def _b2_sign_url(key: str, expires_in: int = B2_URL_EXPIRY_SECONDS):
     """Generate a time-limited URL for a private B2 object. Pass-through falsy keys unchanged."""
     if not key:
         return key
-    return _s3.generate_presigned_url(
-        'get_object', Params={'Bucket': B2_BUCKET, 'Key': key}, ExpiresIn=expires_in
-    )
+    url = _b2_url_cache.get(key, expires_in)
+    if url is None:
+        url = _s3.generate_presigned_url(
+            'get_object', Params={'Bucket': B2_BUCKET, 'Key': key}, ExpiresIn=expires_in
+        )
+        _b2_url_cache.put(key, expires_in, url)
+    return url
+
+# Bulk signing (whole collections / catalog listings) skips botocore's per-call
+# request-building and signs locally — same bytes as generate_presigned_url.
+# Only possible once the region is known; without it botocore falls back to
+# SigV2 for 'us-east-1', which the local signer doesn't replicate.
+_b2_presigner = (SigV4Presigner(B2_ENDPOINT, B2_BUCKET, B2_KEY_ID, B2_APPLICATION_KEY, B2_REGION)
+                 if B2_ENDPOINT and B2_REGION else None)
+
+def _b2_sign_urls(keys: list, expires_in: int = B2_URL_EXPIRY_SECONDS):
+    """Batch form of _b2_sign_url(): returns signed URLs in the same order as keys,
+    reusing cached URLs and signing all the misses in one local SigV4 pass."""
+    urls = list(keys)
+    missing = []
+    for i, key in enumerate(keys):
+        if key:
+            cached = _b2_url_cache.get(key, expires_in)
+            if cached is None:
+                missing.append(i)
+            else:
+                urls[i] = cached
+    if not missing:
+        return urls
+    if _b2_presigner is None:
+        for i in missing:
+            urls[i] = _s3.generate_presigned_url(
+                'get_object', Params={'Bucket': B2_BUCKET, 'Key': keys[i]}, ExpiresIn=expires_in
+            )
+            _b2_url_cache.put(keys[i], expires_in, urls[i])
+        return urls
+    signed_at = _time.time()
+    fresh = _b2_presigner.presign_get([keys[i] for i in missing], expires_in, signed_at)
+    for i, url in zip(missing, fresh):
+        urls[i] = url
+        _b2_url_cache.put(keys[i], expires_in, url, signed_at=signed_at)
+    return urls
 
-def _b2_upload_fileobj(fileobj, key: str, content_type: str = None):
-    """Upload a file-like object to the B2 bucket, return its storage key (not a URL)."""
+# Multipart uploads: part size and parts in flight, for upload_fileobj (seekable
+# files) and StreamingUpload (request bodies) alike.
+B2_PART_SIZE = int(os.environ.get('B2_PART_SIZE_MB', 16)) * 1024 * 1024
+B2_UPLOAD_CONCURRENCY = int(os.environ.get('B2_UPLOAD_CONCURRENCY', 4))
+_b2_transfer_config = TransferConfig(multipart_threshold=B2_PART_SIZE, multipart_chunksize=B2_PART_SIZE,
+                                     max_concurrency=B2_UPLOAD_CONCURRENCY)
+
+def _b2_upload_fileobj(fileobj, key: str, content_type: str = None, callback=None):
+    """Upload a file-like object to the B2 bucket, return its storage key (not a URL).
+    callback(bytes_transferred) is called as chunks go out (boto3 Callback)."""
     extra_args = {}
     if content_type:
         extra_args['ContentType'] = content_type
-    _s3.upload_fileobj(fileobj, B2_BUCKET, key, ExtraArgs=extra_args)
+    _s3.upload_fileobj(fileobj, B2_BUCKET, key, ExtraArgs=extra_args,
+                       Config=_b2_transfer_config, Callback=callback)
     return key
 
+def _b2_upload_stream(stream, key: str, content_type: str = None, on_progress=None) -> dict:
+    """Upload a non-seekable stream (e.g. request.stream) part by part without
+    spooling it; see b2_multipart.StreamingUpload. Returns {'key', 'bytes', 'parts'}."""
+    return StreamingUpload(_s3, B2_BUCKET, key, content_type, part_size=B2_PART_SIZE,
+                           concurrency=B2_UPLOAD_CONCURRENCY, on_progress=on_progress).upload(stream)
+
 def _b2_delete_object(key: str):
     _s3.delete_object(Bucket=B2_BUCKET, Key=key)
 
-def _b2_delete_prefix(prefix: str):
-    """Delete every object under a folder prefix (a whole collection's images and videos)."""
+def _b2_delete_prefix(prefix: str, on_progress=None) -> int:
+    """Delete every object under a folder prefix (a whole collection's images and videos).
+    Returns the number of keys deleted; on_progress(deleted) is called after each page."""
+    deleted = 0
     paginator = _s3.get_paginator('list_objects_v2')
     for page in paginator.paginate(Bucket=B2_BUCKET, Prefix=prefix):
         objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
         if objects:
             _s3.delete_objects(Bucket=B2_BUCKET, Delete={'Objects': objects})
-
-def _b2_move_object(old_key: str, new_key: str):
-    """Copy an object to a new key and delete the old one (used for collection rename); returns the new key."""
-    _s3.copy_object(
-        Bucket=B2_BUCKET,
-        CopySource={'Bucket': B2_BUCKET, 'Key': old_key},
-        Key=new_key,
-    )
-    _s3.delete_object(Bucket=B2_BUCKET, Key=old_key)
-    return new_key
+            deleted += len(objects)
+            if on_progress:
+                on_progress(deleted)
+    return deleted
 
 # ── Auth setup ────────────────────────────────────────────────────────────────
 
@@ -145,15 +221,29 @@ google_oauth = _oauth.register(
 
 _db_pool = None
 
+# Requests, job handlers and their inner pools (rename copies, thumbnail and
+# metadata batches) all borrow from one pool. ThreadedConnectionPool raises as
+# soon as it is empty, so borrowers first take a slot of this semaphore, which
+# waits up to DB_POOL_TIMEOUT seconds for a connection to come back.
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+_db_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
 def _db_url():
     return (os.environ.get('INTERNAL_POSTGRES_DATABASE_URL') or
             os.environ.get('DATABASE_URL', ''))
 
 def _get_db():
     global _db_pool
-    if _db_pool is None:
-        _db_pool = psycopg2.pool.ThreadedConnectionPool(1, 10, dsn=_db_url())
-    return _db_pool.getconn()
+    if not _db_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise psycopg2.pool.PoolError(f'no database connection free after {DB_POOL_TIMEOUT:g}s')
+    try:
+        if _db_pool is None:
+            _db_pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_MAX, dsn=_db_url())
+        return _db_pool.getconn()
+    except Exception:
+        _db_slots.release()
+        raise
 
 def _release_db(conn):
     global _db_pool
@@ -161,7 +251,8 @@ def _release_db(conn):
         try:
             _db_pool.putconn(conn)
         except Exception:
-            pass
+            return
+        _db_slots.release()
 
 def init_db():
     """Create tables if they don't exist. Uses a direct connection, not the pool."""
@@ -233,11 +324,48 @@ def init_db():
             ALTER TABLE images
             ADD COLUMN IF NOT EXISTS body_parts JSONB DEFAULT '{}'::jsonb
         """)
+        # Responsive derivatives generated for the image (see thumbnails.py)
+        cur.execute("""
+            ALTER TABLE images
+            ADD COLUMN IF NOT EXISTS thumbs JSONB DEFAULT '{}'::jsonb
+        """)
+        # Size / colour / placeholder metadata (see image_metadata.py); NULL until computed
+        cur.execute("""
+            ALTER TABLE images
+            ADD COLUMN IF NOT EXISTS width INTEGER,
+            ADD COLUMN IF NOT EXISTS height INTEGER,
+            ADD COLUMN IF NOT EXISTS byte_size BIGINT,
+            ADD COLUMN IF NOT EXISTS dominant_color VARCHAR(7),
+            ADD COLUMN IF NOT EXISTS blurhash VARCHAR(64)
+        """)
+        # Perceptual hash for near-duplicate detection (see image_hashes.py)
+        cur.execute("ALTER TABLE images ADD COLUMN IF NOT EXISTS phash BIGINT")
+        # GIN index so tag containment / overlap (tags @> / &&) doesn't scan the table
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_images_tags ON images USING GIN (tags)")
         # Add user_id FK to scores if not present
         cur.execute("""
             ALTER TABLE scores
             ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id) ON DELETE SET NULL
         """)
+        # Typed ranking columns for scores (data keeps the full entry). Backfill
+        # rows written before the columns existed; 'time' is whole seconds.
+        cur.execute("""
+            ALTER TABLE scores
+            ADD COLUMN IF NOT EXISTS score   INTEGER,
+            ADD COLUMN IF NOT EXISTS time_ms BIGINT
+        """)
+        cur.execute("""
+            UPDATE scores SET
+                score   = CASE WHEN data->>'score' ~ '^-?[0-9]+$'
+                               THEN (data->>'score')::int ELSE 0 END,
+                time_ms = CASE WHEN data->>'time' ~ '^-?[0-9]+$'
+                               THEN (data->>'time')::bigint * 1000 END
+            WHERE score IS NULL
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_scores_rank
+            ON scores (collection_name, game_type, score DESC, time_ms ASC)
+        """)
         cur.execute("""
             CREATE TABLE IF NOT EXISTS videos (
                 id              SERIAL PRIMARY KEY,
@@ -253,6 +381,42 @@ def init_db():
                 UNIQUE(collection_name, filename)
             )
         """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS collection_renames (
+                old_name    VARCHAR(255) PRIMARY KEY,
+                new_name    VARCHAR(255) NOT NULL,
+                phase       VARCHAR(20) NOT NULL DEFAULT 'copying',
+                total       INTEGER DEFAULT 0,
+                copied      INTEGER DEFAULT 0,
+                deleted     INTEGER DEFAULT 0,
+                error       TEXT,
+                started_at  TIMESTAMPTZ DEFAULT NOW(),
+                updated_at  TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id            BIGSERIAL PRIMARY KEY,
+                kind          VARCHAR(50) NOT NULL,
+                payload       JSONB NOT NULL DEFAULT '{}',
+                status        VARCHAR(20) NOT NULL DEFAULT 'queued',
+                progress      JSONB NOT NULL DEFAULT '{}',
+                result        JSONB,
+                error         TEXT,
+                attempts      INTEGER NOT NULL DEFAULT 0,
+                max_attempts  INTEGER NOT NULL DEFAULT 3,
+                created_by    INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                created_at    TIMESTAMPTZ DEFAULT NOW(),
+                started_at    TIMESTAMPTZ,
+                finished_at   TIMESTAMPTZ,
+                updated_at    TIMESTAMPTZ DEFAULT NOW(),
+                locked_until  TIMESTAMPTZ
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_unfinished
+            ON jobs (id) WHERE status IN ('queued', 'running')
+        """)
         cur.execute("""
             CREATE TABLE IF NOT EXISTS video_collection_access (
                 id              SERIAL PRIMARY KEY,
@@ -304,9 +468,12 @@ def _ensure_collection(safe_name: str):
             "INSERT INTO collections (name) VALUES (%s) ON CONFLICT DO NOTHING",
             (safe_name,)
         )
+        created = cur.rowcount == 1
         conn.commit()
     finally:
         _release_db(conn)
+    if created:
+        _collection_summary.invalidate()
 
 def _collection_exists(safe_name: str):
     conn = _get_db()
@@ -323,29 +490,143 @@ def _get_image_key(collection: str, filename: str):
     return f"{collection}/{filename}" if collection else filename
 
 def _load_tags():
-    """Return all images as a dict keyed by 'collection/filename'."""
+    """Return all images as a dict keyed by 'collection/filename'.
+    Catalog-wide read — anything scoped to one collection or image should use
+    _load_collection_images() / _load_image() instead."""
+    return _image_catalog.all_images()
+
+def _load_collection_images(collection: str):
+    """Return {filename: entry} for one collection (entry shape matches _load_tags())."""
+    return _image_catalog.collection(collection)
+
+def _load_image(collection: str, filename: str):
+    """Return one image's entry (same shape as _load_tags() values), or None."""
+    return _image_catalog.image(collection, filename)
+
+def _query_all_images():
     conn = _get_db()
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT collection_name, filename, url, tags, locked, body_parts FROM images"
-        )
-        result = {}
-        for coll, fname, url, tags, locked, body_parts in cur.fetchall():
-            result[f"{coll}/{fname}"] = {
-                'tags':       list(tags) if tags else [],
-                'locked':     bool(locked),
-                'url':        url,
-                'body_parts': dict(body_parts) if body_parts else {},
-            }
-        return result
+        return image_queries.all_images(conn)
+    finally:
+        _release_db(conn)
+
+def _query_collection_images(collection: str):
+    conn = _get_db()
+    try:
+        return image_queries.collection_images(conn, collection)
+    finally:
+        _release_db(conn)
+
+def _load_images_page(collection: str = None, after: tuple = None, limit: int = 100):
+    """Return one keyset page of (collection, filename, entry) tuples ordered by
+    (collection, filename), starting after the given (collection, filename)."""
+    conn = _get_db()
+    try:
+        return image_queries.images_page(conn, collection, after, limit)
+    finally:
+        _release_db(conn)
+
+def _load_empty_collections():
+    conn = _get_db()
+    try:
+        return image_queries.empty_collections(conn)
     finally:
         _release_db(conn)
 
+# Streamed catalog responses read the images table through a server-side cursor
+# this many rows at a time, signing each batch before writing it out.
+CATALOG_STREAM_BATCH = 1000
+
+def _iter_signed_image_batches(after: tuple = None):
+    """Yield [(collection, filename, entry, signed_url)] batches for every image
+    after `after`. The pooled connection is held only while the stream is open."""
+    conn = _get_db()
+    try:
+        for batch in image_queries.iter_image_batches(conn, after, CATALOG_STREAM_BATCH):
+            urls = _b2_sign_urls([entry['url'] for _coll, _fname, entry in batch])
+            yield [(coll, fname, entry, url) for (coll, fname, entry), url in zip(batch, urls)]
+    finally:
+        _release_db(conn)
+
+def _keyset_args():
+    """Parse ?limit=N&cursor=<collection/filename> for the paged endpoints.
+
+    Returns (limit, after): limit is None when no paging was requested, is
+    clamped to MAX_PAGE_SIZE otherwise, and defaults to MAX_PAGE_SIZE when only
+    a cursor is given; after is a (collection, filename) tuple or None. Raises
+    ValueError on a malformed limit or cursor.
+    """
+    limit = request.args.get('limit')
+    if limit:
+        limit = max(1, min(int(limit), image_queries.MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return limit or None, None
+    if '/' not in cursor:
+        raise ValueError('cursor must be <collection>/<filename>')
+    return limit or image_queries.MAX_PAGE_SIZE, tuple(cursor.split('/', 1))
+
+def _wants_stream():
+    return request.args.get('stream', '').lower() in ('1', 'true')
+
+# The images table is read on every page but changes rarely, so reads go through
+# an in-process catalog. Every mutator below updates it after committing and
+# NOTIFYs IMAGE_CATALOG_CHANNEL inside its transaction, so other gunicorn workers
+# drop their copy of that collection (see _image_catalog_listener). The TTL is a
+# backstop for notifications missed while a listener was reconnecting.
+IMAGE_CATALOG_TTL = float(os.environ.get('IMAGE_CATALOG_TTL', 300))
+IMAGE_CATALOG_CHANNEL = 'image_catalog'
+_image_catalog = ImageCatalog(_query_all_images, _query_collection_images, ttl=IMAGE_CATALOG_TTL)
+_catalog_origin = uuid.uuid4().hex   # lets the listener skip this process's own NOTIFYs
+
+def _notify_image_catalog(cur, collection: str = None):
+    """Queue a cross-worker invalidation for one collection (None = everything).
+    Delivered by Postgres only if/when the surrounding transaction commits."""
+    cur.execute("SELECT pg_notify(%s, %s)", (
+        IMAGE_CATALOG_CHANNEL,
+        json.dumps({'origin': _catalog_origin, 'collection': collection}),
+    ))
+
+def _image_catalog_listener():
+    """Background task: LISTEN for other workers' catalog changes and invalidate ours."""
+    import select
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(_db_url())
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {IMAGE_CATALOG_CHANNEL}")
+            # Anything committed while we weren't listening is unknown — start clean
+            _image_catalog.invalidate()
+            _collection_summary.invalidate()
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    try:
+                        payload = json.loads(note.payload)
+                    except ValueError:
+                        payload = {}
+                    if payload.get('origin') != _catalog_origin:
+                        _image_catalog.invalidate(payload.get('collection'))
+                        _collection_summary.invalidate()
+        except Exception as e:
+            print(f"[image-catalog] listener error, retrying: {e}")
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        socketio.sleep(5)
+
 def _save_tags(tags: dict):
     """UPSERT image rows from dict. Does not delete — use _db_delete_image() for that."""
     if not tags:
         return
+    saved = []
     conn = _get_db()
     try:
         cur = conn.cursor()
@@ -365,25 +646,51 @@ def _save_tags(tags: dict):
                   value.get('tags', []),
                   value.get('locked', False),
                   json.dumps(value.get('body_parts', {}))))
+            saved.append((coll, fname, value))
+        for coll in {coll for coll, _fname, _value in saved}:
+            _notify_image_catalog(cur, coll)
         conn.commit()
     finally:
         _release_db(conn)
+    for coll, fname, value in saved:
+        _image_catalog.put(coll, fname, {
+            'tags':       list(value.get('tags', [])),
+            'locked':     bool(value.get('locked', False)),
+            'url':        value['url'],
+            'body_parts': dict(value.get('body_parts', {})),
+            'thumbs':     dict(value.get('thumbs', {})),
+            'meta':       dict(value.get('meta', {})),
+        })
 
-def _db_insert_image(collection: str, filename: str, url: str, user_id: int = None):
-    """Insert a new image row, ensuring its collection exists first."""
+def _db_insert_image(collection: str, filename: str, url: str, user_id: int = None, meta: dict = None):
+    """Insert a new image row, ensuring its collection exists first.
+    `meta` is its compute_metadata() result; without it the row is left for
+    the metadata backfill."""
     _ensure_collection(collection)
+    meta = meta or {}
     conn = _get_db()
     try:
         cur = conn.cursor()
         cur.execute("""
-            INSERT INTO images (collection_name, filename, url, tags, locked, uploaded_by)
-            VALUES (%s, %s, %s, '{}', FALSE, %s)
+            INSERT INTO images (collection_name, filename, url, tags, locked, uploaded_by,
+                                width, height, byte_size, dominant_color, blurhash, phash)
+            VALUES (%s, %s, %s, '{}', FALSE, %s, %s, %s, %s, %s, %s, %s)
             ON CONFLICT (collection_name, filename) DO UPDATE
-                SET url = EXCLUDED.url, uploaded_by = COALESCE(EXCLUDED.uploaded_by, images.uploaded_by)
-        """, (collection, filename, url, user_id))
+                SET url = EXCLUDED.url, uploaded_by = COALESCE(EXCLUDED.uploaded_by, images.uploaded_by),
+                    width = EXCLUDED.width, height = EXCLUDED.height, byte_size = EXCLUDED.byte_size,
+                    dominant_color = EXCLUDED.dominant_color, blurhash = EXCLUDED.blurhash,
+                    phash = EXCLUDED.phash
+        """, (collection, filename, url, user_id,
+              *(meta.get(column) for column in META_COLUMNS),
+              to_db_hash(meta['phash']) if meta.get('phash') is not None else None))
+        _notify_image_catalog(cur, collection)
         conn.commit()
     finally:
         _release_db(conn)
+    if not _image_catalog.update(collection, filename, url=url, meta=dict(meta)):
+        _image_catalog.put(collection, filename, {'tags': [], 'locked': False, 'url': url,
+                                                  'body_parts': {}, 'thumbs': {}, 'meta': dict(meta)})
+    _collection_summary.invalidate()
 
 def _db_delete_image(collection: str, filename: str):
     conn = _get_db()
@@ -393,9 +700,12 @@ def _db_delete_image(collection: str, filename: str):
             "DELETE FROM images WHERE collection_name = %s AND filename = %s",
             (collection, filename)
         )
+        _notify_image_catalog(cur, collection)
         conn.commit()
     finally:
         _release_db(conn)
+    _image_catalog.remove(collection, filename)
+    _collection_summary.invalidate()
 
 def _image_exists_in_tags(safe_name: str, filename: str):
     conn = _get_db()
@@ -450,9 +760,14 @@ def _set_image_tags(collection: str, filename: str, tags: list, locked: bool = N
                 UPDATE images SET tags = %s
                 WHERE collection_name = %s AND filename = %s
             """, (cleaned, collection, filename))
+        _notify_image_catalog(cur, collection)
         conn.commit()
     finally:
         _release_db(conn)
+    if locked is not None:
+        _image_catalog.update(collection, filename, tags=cleaned, locked=bool(locked))
+    else:
+        _image_catalog.update(collection, filename, tags=cleaned)
 
 def _set_image_body_parts_and_tags(collection: str, filename: str, body_parts: dict, tags: list):
     """Update body_parts and tags for an image in a single round-trip."""
@@ -463,9 +778,26 @@ def _set_image_body_parts_and_tags(collection: str, filename: str, body_parts: d
             "UPDATE images SET body_parts = %s::jsonb, tags = %s WHERE collection_name = %s AND filename = %s",
             (json.dumps(body_parts), tags, collection, filename)
         )
+        _notify_image_catalog(cur, collection)
         conn.commit()
     finally:
         _release_db(conn)
+    _image_catalog.update(collection, filename, body_parts=dict(body_parts), tags=list(tags))
+
+def _set_image_body_parts(collection: str, filename: str, body_parts: dict):
+    """Update only body_parts for an image, leaving its tags unchanged."""
+    conn = _get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE images SET body_parts = %s::jsonb WHERE collection_name = %s AND filename = %s",
+            (json.dumps(body_parts), collection, filename)
+        )
+        _notify_image_catalog(cur, collection)
+        conn.commit()
+    finally:
+        _release_db(conn)
+    _image_catalog.update(collection, filename, body_parts=dict(body_parts))
 
 def _set_image_locked(collection: str, filename: str, locked: bool):
     conn = _get_db()
@@ -475,9 +807,11 @@ def _set_image_locked(collection: str, filename: str, locked: bool):
             "UPDATE images SET locked = %s WHERE collection_name = %s AND filename = %s",
             (locked, collection, filename)
         )
+        _notify_image_catalog(cur, collection)
         conn.commit()
     finally:
         _release_db(conn)
+    _image_catalog.update(collection, filename, locked=bool(locked))
 
 # ── Videos / Access control ────────────────────────────────────────────────────
 
@@ -499,6 +833,7 @@ def _db_insert_video(collection: str, filename: str, url: str, thumbnail_url: st
         conn.commit()
     finally:
         _release_db(conn)
+    _collection_summary.invalidate()
 
 def _db_delete_video(video_id: int):
     conn = _get_db()
@@ -508,6 +843,7 @@ def _db_delete_video(video_id: int):
         conn.commit()
     finally:
         _release_db(conn)
+    _collection_summary.invalidate()
 
 def _load_collection_videos(collection: str):
     """Return all video rows for a collection as a list of dicts, with signed, directly-usable URLs."""
@@ -566,6 +902,23 @@ def _user_accessible_video_ids(user_id: int, collection: str):
     finally:
         _release_db(conn)
 
+def _user_video_collections(user_id: int) -> set:
+    """Names of the collections where the user holds a collection-level grant or
+    a grant on at least one video — one query for every collection."""
+    conn = _get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT collection_name FROM video_collection_access WHERE user_id = %s
+            UNION
+            SELECT v.collection_name FROM video_item_access a
+            JOIN videos v ON v.id = a.video_id
+            WHERE a.user_id = %s
+        """, (user_id, user_id))
+        return {row[0] for row in cur.fetchall()}
+    finally:
+        _release_db(conn)
+
 def _user_can_view_any_video_in_collection(user, collection: str):
     """True if this user (object with is_authenticated/is_admin/id) can see at least one video here."""
     if not user or not user.is_authenticated:
@@ -655,28 +1008,248 @@ def _normalize_tags_entry(entry):
 
 # ── Scores ────────────────────────────────────────────────────────────────────
 
+# Ranking order for a (collection, game_type) board; the trailing id makes ties
+# deterministic (oldest first), which is what LeaderboardCache.record assumes.
+SCORE_ORDER = "score DESC, time_ms ASC NULLS LAST, id ASC"
+# Rows kept per (collection, game_type); submit_score trims the rest.
+LEADERBOARD_DEPTH = 10
+
+def _query_top_scores(depth: int):
+    """Top `depth` rows per (collection, game_type), as
+    (collection, game_type, score, time_ms, data) in rank order."""
+    conn = _get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT collection_name, game_type, score, time_ms, data FROM (
+                SELECT collection_name, game_type, score, time_ms, data,
+                       ROW_NUMBER() OVER (PARTITION BY collection_name, game_type
+                                          ORDER BY {SCORE_ORDER}) AS rank
+                FROM scores
+            ) ranked
+            WHERE rank <= %s
+            ORDER BY collection_name, game_type, rank
+        """, (depth,))
+        return cur.fetchall()
+    finally:
+        _release_db(conn)
+
+_leaderboards = LeaderboardCache(_query_top_scores, depth=LEADERBOARD_DEPTH,
+                                 ttl=float(os.environ.get('LEADERBOARD_TTL', 300)))
+
 def _load_scores():
     """Return {collection: {game_type: [entries sorted desc by score]}}."""
+    return _leaderboards.all()
+
+# ── Collection summary ────────────────────────────────────────────────────────
+
+def _query_collection_summary():
     conn = _get_db()
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT collection_name, game_type, data
-            FROM scores
-            ORDER BY collection_name, game_type,
-                     (data->>'score')::int DESC,
-                     (data->>'time')::int  ASC  NULLS LAST
-        """)
-        result = {}
-        for coll, gtype, data in cur.fetchall():
-            result.setdefault(coll, {}).setdefault(gtype, []).append(data)
-        return result
+        return summary_rows(conn)
     finally:
         _release_db(conn)
 
+# Image / video counts per collection for the home and management pages. Rebuilt
+# with one aggregate query after any upload, delete, rename or collection change
+# (and on foreign catalog notifications); shares the catalog's TTL as a backstop.
+_collection_summary = CollectionSummary(_query_collection_summary, ttl=IMAGE_CATALOG_TTL)
+
+def _collection_summaries(scores_per_game: int = 3):
+    """[{'name', 'images', 'videos', 'top_scores': {game_type: [entries]}}] for every
+    collection, from the cached counts plus the in-memory leaderboards."""
+    boards = _leaderboards.all(scores_per_game)
+    return [
+        {'name': name, 'images': c['images'], 'videos': c['videos'],
+         'top_scores': boards.get(name, {})}
+        for name, c in _collection_summary.counts().items()
+    ]
+
+def _visible_summaries(summaries: list) -> list:
+    """Summaries as the current user may see them: video counts are access-
+    controlled like the videos, so they are dropped for collections whose
+    videos this user cannot view (always, for guests). Costs at most one query."""
+    if current_user.is_authenticated and current_user.is_admin:
+        return summaries
+    visible = set()
+    if current_user.is_authenticated and any(s['videos'] for s in summaries):
+        visible = _user_video_collections(current_user.id)
+    return [s if not s['videos'] or s['name'] in visible
+            else {k: v for k, v in s.items() if k != 'videos'}
+            for s in summaries]
+
 def _save_scores(scores: dict):
     pass  # no-op — scores are written directly in submit_score()
 
+# ── Background jobs ───────────────────────────────────────────────────────────
+
+def _emit_job_update(job: dict):
+    socketio.emit('job_update', job, room=f"job:{job['id']}")
+
+# Collection rename / delete and video upload run as rows in the jobs table,
+# drained by JOB_WORKERS in-process workers (see jobs.py). Set JOB_WORKERS=0 to
+# only enqueue (e.g. in tests, or when another process runs the workers).
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+_jobs = JobQueue(_get_db, _release_db, spawn=socketio.start_background_task,
+                 on_update=_emit_job_update, workers=JOB_WORKERS,
+                 lease_seconds=int(os.environ.get('JOB_LEASE_SECONDS', 600)))
+
+def _job_accepted(job_id: int, **extra):
+    return jsonify({'success': True, 'job_id': job_id, **extra}), 202
+
+# ── CPU-bound work ────────────────────────────────────────────────────────────
+
+# Under gevent every "thread" (ThreadPoolExecutor workers included) is a greenlet
+# on the one event loop that serves game traffic, so Pillow / numpy work run
+# there stalls every request. _offload runs it in the hub's pool of real OS
+# threads instead (Pillow and numpy release the GIL), blocking only the calling
+# greenlet. Without gevent (local dev) it is a plain call.
+def _offload(fn, *args):
+    if not ON_RENDER:
+        return fn(*args)
+    import gevent
+    return gevent.get_hub().threadpool.apply(fn, args)
+
+# ── Tagger service ────────────────────────────────────────────────────────────
+
+# Models live in the separate tagger_service.py process (TAGGER_SOCKET), so this
+# process never imports torch; calls block only the calling greenlet.
+_tagger = TaggerClient()
+
+# Settings for tags written by the retag pipeline
+RETAG_TOP_K = 8
+RETAG_THRESHOLD = 0.15
+RETAG_BATCH_SIZE = int(os.environ.get('RETAG_BATCH_SIZE', 32))
+
+# Tag-on-upload: each collection upload is appended to a not-yet-started
+# 'retag_images' job for its collection (one job per TAG_ON_UPLOAD_JOB_SIZE
+# images), so bursts coalesce into batches. Uploads get 429 + Retry-After while
+# more than TAG_ON_UPLOAD_MAX_PENDING uploads are waiting to be tagged.
+TAG_ON_UPLOAD = os.environ.get('TAG_ON_UPLOAD', '1') == '1'
+TAG_ON_UPLOAD_JOB_SIZE = int(os.environ.get('TAG_ON_UPLOAD_JOB_SIZE', 256))
+TAG_ON_UPLOAD_MAX_PENDING = int(os.environ.get('TAG_ON_UPLOAD_MAX_PENDING', 2000))
+
+def _upload_tagging_backlog() -> int:
+    return _jobs.backlog('retag_images', 'filenames', scope='upload')
+
+def _queue_upload_tagging(collection: str, filename: str, user_id: int = None):
+    """Queue a new upload for auto-tagging; returns the job id (None on failure —
+    the upload itself has already succeeded)."""
+    try:
+        return _jobs.enqueue_coalesced('retag_images', 'filenames', [filename], user_id=user_id,
+                                       max_items=TAG_ON_UPLOAD_JOB_SIZE,
+                                       collection=collection, scope='upload')
+    except Exception as e:
+        print(f"[tagger] Could not queue {collection}/{filename} for tagging: {e}")
+        return None
+
+# ── Thumbnails ────────────────────────────────────────────────────────────────
+
+# New uploads are appended to a not-yet-started 'build_thumbnails' job for their
+# collection, the same way tag-on-upload batches into 'retag_images' jobs.
+THUMBS_ON_UPLOAD = os.environ.get('THUMBS_ON_UPLOAD', '1') == '1'
+THUMBS_JOB_SIZE = int(os.environ.get('THUMBS_JOB_SIZE', 256))
+THUMBS_WORKERS = int(os.environ.get('THUMBS_WORKERS', 4))
+
+def _queue_upload_thumbnails(collection: str, filename: str, user_id: int = None):
+    """Queue derivative generation for a new upload; returns the job id (None on failure)."""
+    try:
+        return _jobs.enqueue_coalesced('build_thumbnails', 'filenames', [filename], user_id=user_id,
+                                       max_items=THUMBS_JOB_SIZE, collection=collection, scope='upload')
+    except Exception as e:
+        print(f"[thumbs] Could not queue {collection}/{filename} for thumbnails: {e}")
+        return None
+
+# ── Image metadata ────────────────────────────────────────────────────────────
+
+# Size / colour / blurhash of each image (image_metadata.py), computed at upload
+# and backfilled for older images by the 'image_metadata' job.
+METADATA_BATCH_SIZE = int(os.environ.get('METADATA_BATCH_SIZE', 64))
+METADATA_WORKERS = int(os.environ.get('METADATA_WORKERS', 8))
+
+def _upload_metadata(stream):
+    """compute_metadata() of an uploaded file (run via _offload), rewinding it
+    for the B2 upload; None when it cannot be decoded (the backfill will try
+    again later)."""
+    try:
+        return _offload(compute_metadata, stream.read())
+    except Exception as e:
+        print(f"[metadata] Could not read upload: {e}")
+        return None
+    finally:
+        stream.seek(0)
+
+def _image_metadata(value: dict) -> dict:
+    """Client-facing metadata of a catalog entry ({} when not computed yet)."""
+    return public_metadata(value.get('meta'))
+
+# ── Duplicate detection ───────────────────────────────────────────────────────
+
+# Images whose perceptual hashes differ in at most this many of 64 bits are
+# treated as the same photo (re-encoded, resized or lightly edited).
+DUPLICATE_MAX_DISTANCE = int(os.environ.get('DUPLICATE_MAX_DISTANCE', 6))
+
+_duplicate_index = DuplicateIndex()
+
+def _collection_hashes(collection: str) -> dict:
+    """{filename: perceptual hash} of a collection's hashed images."""
+    return {filename: value['meta']['phash'] for filename, value in _load_collection_images(collection).items()
+            if value.get('url') and (value.get('meta') or {}).get('phash') is not None}
+
+def _find_duplicates(collection: str, image_hash: int, distance: int = None, exclude=()) -> list:
+    """[(hamming distance, filename)] of near-duplicates of `image_hash`, nearest first."""
+    distance = DUPLICATE_MAX_DISTANCE if distance is None else distance
+    return _duplicate_index.near(collection, _collection_hashes(collection), image_hash, distance, exclude)
+
+# ── Image embeddings ──────────────────────────────────────────────────────────
+
+# CLIP image embeddings per collection (embedding_store.py), computed by the
+# tagger service and kept on local disk; they back /similar, /search and the
+# hard distractors in oddoneout / whoisthat / remix. New uploads are appended
+# to a not-yet-started 'build_embeddings' job like thumbnails.
+EMBEDDINGS_DIR = os.environ.get('EMBEDDINGS_DIR', os.path.join('data', 'embeddings'))
+EMBED_ON_UPLOAD = os.environ.get('EMBED_ON_UPLOAD', '1') == '1'
+EMBED_JOB_SIZE = int(os.environ.get('EMBED_JOB_SIZE', 256))
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', 32))
+SIMILAR_MAX_RESULTS = 100
+
+_embeddings = EmbeddingStore(EMBEDDINGS_DIR)
+
+def _queue_upload_embeddings(collection: str, filename: str, user_id: int = None):
+    """Queue embedding of a new upload; returns the job id (None on failure)."""
+    try:
+        return _jobs.enqueue_coalesced('build_embeddings', 'filenames', [filename], user_id=user_id,
+                                       max_items=EMBED_JOB_SIZE, collection=collection, scope='upload')
+    except Exception as e:
+        print(f"[embeddings] Could not queue {collection}/{filename} for embedding: {e}")
+        return None
+
+def _embed_image_bytes(images: list):
+    """EmbeddingBuilder's embed(): (model, float32 matrix) from the tagger service."""
+    model, rows = _tagger.embed_images(images)
+    return model, from_wire(rows)
+
+def _nearest_images(collection: str, query, k: int, exclude=()) -> list:
+    """[(similarity, filename)] of the `k` catalog images nearest the embedding
+    `query`, best first. Rows of images deleted since the last build are skipped."""
+    index = _embeddings.get(collection)
+    if index is None or query is None:
+        return []
+    images = _load_collection_images(collection)
+    stale = {name for name in index.ids if not (images.get(name) or {}).get('url')}
+    return index.search(query, k, stale.union(exclude))
+
+# ── Image proxy ───────────────────────────────────────────────────────────────
+
+# /img/<collection>/<filename> renders resized / cropped copies of originals
+# (image_proxy.py), cached on local disk up to IMG_CACHE_MAX_MB.
+IMG_CACHE_DIR = os.environ.get('IMG_CACHE_DIR', os.path.join('data', 'img_cache'))
+IMG_CACHE_MAX_MB = int(os.environ.get('IMG_CACHE_MAX_MB', 1024))
+IMG_MAX_DIM = int(os.environ.get('IMG_MAX_DIM', 2048))
+
+_image_proxy = ImageProxy(lambda key: _s3.get_object(Bucket=B2_BUCKET, Key=key)['Body'].read(),
+                          DiskLRU(IMG_CACHE_DIR, IMG_CACHE_MAX_MB * 1024 * 1024), max_dim=IMG_MAX_DIM)
+
 # ── User model ────────────────────────────────────────────────────────────────
 
 class User(UserMixin):
@@ -801,41 +1374,100 @@ def allowed_file(filename):
 def allowed_video_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_VIDEO_EXTENSIONS
 
-def _get_collection_image_urls(collection: str):
-    """Return signed, directly-usable image URLs for a collection."""
-    tags_data = _load_tags()
-    prefix = f"{collection}/"
-    urls = []
-    for key, value in tags_data.items():
-        if key.startswith(prefix) and isinstance(value, dict) and value.get('url'):
-            urls.append(_b2_sign_url(value['url']))
-    return urls
+def _thumbnail_formats():
+    """Derivative formats this request's browser takes, best first. Only an
+    explicit image/avif in Accept counts (every browser accepts */*)."""
+    try:
+        accept = request.headers.get('Accept', '')
+    except RuntimeError:   # outside a request
+        accept = ''
+    return ('avif', 'webp') if 'image/avif' in accept else ('webp',)
+
+def _image_key_for_width(value: dict, width: int = None, formats=('webp',)) -> str:
+    """Storage key to serve for a catalog entry at `width` CSS px: the narrowest
+    derivative at least that wide, else the original."""
+    if width:
+        return pick_thumbnail(value['url'], value.get('thumbs'), width, formats) or value['url']
+    return value['url']
+
+# Derivative widths (CSS px) requested by the game pages: small grid tiles and
+# single large cards. Puzzle gets a fixed-size render from /img, and zoom its
+# magnified piece as an /img crop instead of cutting it from the original.
+GRID_IMAGE_WIDTH = 320
+CARD_IMAGE_WIDTH = 640
+PUZZLE_IMAGE_WIDTH = 1024
+ZOOM_CROP_WIDTH = 800
+
+def _get_collection_game_images(collection: str, width: int = None):
+    """Return (signed, directly-usable image URLs for a collection, {url: metadata}
+    for those with computed metadata). With `width`, each URL is the smallest
+    derivative that fills it (or the original)."""
+    formats = _thumbnail_formats()
+    values = [value for value in _load_collection_images(collection).values() if value.get('url')]
+    urls = _b2_sign_urls([_image_key_for_width(value, width, formats) for value in values])
+    return urls, _meta_by_url(urls, values)
+
+def _meta_by_url(urls, values) -> dict:
+    """{url: client-facing metadata} for game templates (window.IMAGE_META)."""
+    return {url: meta for url, value in zip(urls, values) if (meta := _image_metadata(value))}
+
+def _proxy_image_url(collection: str, filename: str, **params) -> str:
+    """URL of an /img render (w=, h=, crop= as in image_proxy). Built by hand
+    rather than with url_for so it also works from socket background tasks."""
+    if isinstance(params.get('crop'), dict):
+        params['crop'] = ','.join(str(params['crop'][k]) for k in ('x', 'y', 'w', 'h'))
+    url = f"/img/{quote(collection)}/{quote(filename)}"
+    return f"{url}?{urlencode(params, safe=',')}" if params else url
+
+@app.route('/img/<collection>/<filename>')
+@auth_or_guest
+def image_proxy(collection, filename):
+    """Resized / cropped copy of an image: ?w= and/or ?h= (fit inside, never
+    upscaled), ?crop=x,y,w,h (fractions, applied first). WebP when the browser
+    accepts it, else JPEG. Strong ETag; revalidations are answered up front."""
+    safe_name = _safe_collection_name(collection)
+    entry = _load_image(safe_name, filename) if safe_name else None
+    if not entry or not entry.get('url'):
+        return jsonify({'error': 'Image not found'}), 404
+    try:
+        width = request.args.get('w', type=int) or None
+        height = request.args.get('h', type=int) or None
+        crop = parse_crop(request.args.get('crop'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if (width is not None and width < 1) or (height is not None and height < 1):
+        return jsonify({'error': 'w and h must be positive'}), 400
+    # Sources are capped at max_dim (IMG_MAX_DIM), so larger boxes render the
+    # same bytes; clamp them so they share one ETag and cache entry.
+    width = min(width, _image_proxy.max_dim) if width else None
+    height = min(height, _image_proxy.max_dim) if height else None
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+
+    etag = _image_proxy.etag(entry['url'], width, height, crop, fmt)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        try:
+            path, mimetype = _image_proxy.render(entry['url'], width, height, crop, fmt)
+        except Exception as e:
+            return jsonify({'error': f'Could not render image: {e}'}), 502
+        resp = send_file(path, mimetype=mimetype, conditional=False)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, max-age=86400'
+    resp.headers['Vary'] = 'Accept'
+    return resp
 
 @app.route('/')
 @auth_or_guest
 def index():
-    # Render a home page that lists collections and image counts, plus top scores.
-    scores_data = _load_scores()
-    leaderboards = {}
-    for coll, entries in scores_data.items():
-        if isinstance(entries, list):
-            leaderboards[coll] = entries[:5]
-        else:
-            leaderboards[coll] = []
-
-    # Count images per collection from tags.json
-    tags_data = _load_tags()
-    collections = {}
-    for key in tags_data:
-        if '/' in key and isinstance(tags_data[key], dict) and tags_data[key].get('url'):
-            coll_name = key.split('/')[0]
-            collections[coll_name] = collections.get(coll_name, 0) + 1
-
-    # Include empty collections
-    for coll_name in _load_collections():
-        collections.setdefault(coll_name, 0)
-
-    return render_template('home.html', collections=collections, leaderboards=leaderboards)
+    # Render a home page that lists collections with image / video counts and top
+    # scores — all from the cached collection summary, no per-request table scans.
+    summaries = _visible_summaries(_collection_summaries())
+    collections = {c['name']: c['images'] for c in summaries}
+    video_counts = {c['name']: c['videos'] for c in summaries if c.get('videos')}
+    leaderboards = {c['name']: c['top_scores'] for c in summaries}
+    return render_template('home.html', collections=collections, video_counts=video_counts,
+                           leaderboards=leaderboards)
 
 
 def _safe_collection_name(name: str):
@@ -851,20 +1483,15 @@ def _safe_collection_name(name: str):
 @auth_or_guest
 def collection_view(collection_name):
     collection = _safe_collection_name(collection_name)
-    tags_data = _load_tags()
     images = []      # list of filenames (used as keys for tags/delete operations)
     image_urls = {}  # filename -> signed B2 URL
     image_tags = {}
 
-    prefix = f"{collection}/"
-    for key, value in tags_data.items():
-        if not key.startswith(prefix):
-            continue
-        filename = key[len(prefix):]
-        if not isinstance(value, dict) or not value.get('url'):
-            continue
+    entries = {f: v for f, v in _load_collection_images(collection).items() if v.get('url')}
+    signed = dict(zip(entries, _b2_sign_urls([v['url'] for v in entries.values()])))
+    for filename, value in entries.items():
         images.append(filename)
-        image_urls[filename] = _b2_sign_url(value['url'])
+        image_urls[filename] = signed[filename]
         raw_tags = value.get('tags', [])
         if isinstance(raw_tags, list):
             image_tags[filename] = [str(t) for t in raw_tags if isinstance(t, (str, int, float))]
@@ -888,28 +1515,59 @@ def upload_file(collection=None):
 
     if file and allowed_file(file.filename):
         collection = _safe_collection_name(collection or '')
+        if collection and TAG_ON_UPLOAD and _upload_tagging_backlog() >= TAG_ON_UPLOAD_MAX_PENDING:
+            resp = jsonify({'error': 'Too many images waiting to be tagged; retry shortly',
+                            'retry_after': 10})
+            resp.headers['Retry-After'] = '10'
+            return resp, 429
         ext = os.path.splitext(secure_filename(file.filename))[1].lower()
         filename = str(uuid.uuid4()) + ext
         key = _get_image_key(collection, filename)
+        meta = _upload_metadata(file.stream) if collection else None
+        if meta and not request.form.get('allow_duplicate'):
+            # Refuse a re-upload of a photo the collection already has, before
+            # it costs B2 storage or tagging; the client may resend with
+            # allow_duplicate=1.
+            duplicates = _find_duplicates(collection, meta['phash'])
+            if duplicates:
+                urls = _b2_sign_urls([_get_image_key(collection, name) for _d, name in duplicates])
+                return jsonify({
+                    'error': 'This image looks like a duplicate of one already in the collection',
+                    'duplicates': [{'filename': name, 'url': url, 'distance': d}
+                                   for (d, name), url in zip(duplicates, urls)],
+                }), 409
 
         try:
             _b2_upload_fileobj(file.stream, key, file.mimetype)
         except Exception as e:
             return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+        tag_job_id = None
         if collection:
             user_id = current_user.id if current_user.is_authenticated else None
-            _db_insert_image(collection, filename, key, user_id=user_id)
+            _db_insert_image(collection, filename, key, user_id=user_id, meta=meta)
+            if TAG_ON_UPLOAD:
+                # Tags arrive later as an 'image_tags' Socket.IO event
+                tag_job_id = _queue_upload_tagging(collection, filename, user_id)
+            if THUMBS_ON_UPLOAD:
+                _queue_upload_thumbnails(collection, filename, user_id)
+            if EMBED_ON_UPLOAD:
+                _queue_upload_embeddings(collection, filename, user_id)
 
         return jsonify({
             'success': True,
             'filename': filename,
             'url': _b2_sign_url(key),
-            'tags': []
+            'tags': [],
+            'tag_job_id': tag_job_id,
+            **public_metadata(meta),
         })
 
     return jsonify({'error': 'Invalid file type'}), 400
 
+# Videos wait here between the upload request and their B2 upload job.
+VIDEO_SPOOL_DIR = os.environ.get('VIDEO_SPOOL_DIR') or os.path.join(tempfile.gettempdir(), 'video-spool')
+
 @app.route('/upload-video/<collection>', methods=['POST'])
 @admin_required
 def upload_video(collection):
@@ -931,24 +1589,97 @@ def upload_video(collection):
 
     ext = os.path.splitext(secure_filename(file.filename))[1].lower()
     filename = str(uuid.uuid4()) + ext
-    key = _get_image_key(safe_name, filename)
 
+    # Spool to local disk and hand the B2 upload to a job, so a large video
+    # does not hold this worker for the whole transfer.
     try:
-        _b2_upload_fileobj(file.stream, key, file.mimetype)
+        os.makedirs(VIDEO_SPOOL_DIR, exist_ok=True)
+        spool_path = os.path.join(VIDEO_SPOOL_DIR, filename)
+        file.save(spool_path)
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+    job_id = _jobs.enqueue('upload_video', {
+        'collection': safe_name, 'filename': filename, 'path': spool_path,
+        'content_type': file.mimetype, 'user_id': current_user.id,
+    }, user_id=current_user.id)
+    return _job_accepted(job_id, filename=filename)
+
+def _job_upload_video(job):
+    """Job: push a spooled video to B2 and insert its row."""
+    p = job.payload
+    key = _get_image_key(p['collection'], p['filename'])
+    total = os.path.getsize(p['path'])
+    sent = {'bytes': 0, 'reported': 0}
+    sent_lock = threading.Lock()
+
+    def on_chunk(n):
+        # boto3 calls this per chunk from its transfer threads; report once per part
+        with sent_lock:
+            sent['bytes'] += n
+            if sent['bytes'] - sent['reported'] < B2_PART_SIZE and sent['bytes'] < total:
+                return
+            sent['reported'] = done = sent['bytes']
+        job.progress(bytes=done, total=total)
+
+    with open(p['path'], 'rb') as f:
+        _b2_upload_fileobj(f, key, p.get('content_type'), callback=on_chunk)
     # B2 has no Cloudinary-style auto thumbnail/duration probe (would need ffmpeg) —
     # videos uploaded from here on simply have no poster image / duration metadata.
-    _db_insert_video(safe_name, filename, key, thumbnail_url=None,
-                      duration=None, user_id=current_user.id)
+    _db_insert_video(p['collection'], p['filename'], key, thumbnail_url=None,
+                      duration=None, user_id=p.get('user_id'))
+    os.remove(p['path'])
+    return {'collection': p['collection'], 'filename': p['filename']}
 
-    return jsonify({
-        'success': True,
-        'filename': filename,
-        'url': _b2_sign_url(key),
-        'thumbnail_url': None,
-    })
+def _discard_video_spool(job):
+    """upload_video gave up: the spooled file will never be uploaded."""
+    try:
+        os.remove(job.payload['path'])
+    except OSError:
+        pass
+
+_jobs.register('upload_video', _job_upload_video, on_failed=_discard_video_spool)
+
+@app.route('/upload-video/<collection>/stream', methods=['PUT'])
+@admin_required
+def upload_video_stream(collection):
+    """Admin-only: upload a video sent as the raw request body (not form data),
+    streamed to B2 as parallel multipart parts while it arrives — no disk spool,
+    no job. ?filename= is the original name; with ?upload_id=, progress is
+    pushed to Socket.IO room upload:<upload_id> as 'video_upload_progress'."""
+    original = request.args.get('filename', '')
+    if not allowed_video_file(original):
+        return jsonify({'error': 'Invalid file type'}), 400
+    safe_name = _safe_collection_name(collection)
+    if not safe_name:
+        return jsonify({'error': 'Invalid collection name'}), 400
+    total = request.content_length
+    if not total:
+        return jsonify({'error': 'Content-Length required'}), 411
+
+    ext = os.path.splitext(secure_filename(original))[1].lower()
+    filename = str(uuid.uuid4()) + ext
+    key = _get_image_key(safe_name, filename)
+    upload_id = request.args.get('upload_id')
+
+    def on_progress(done, parts):
+        if upload_id:
+            socketio.emit('video_upload_progress', {
+                'upload_id': upload_id, 'collection': safe_name, 'filename': filename,
+                'bytes': done, 'total': total, 'parts': parts,
+            }, room=f'upload:{upload_id}')
+
+    try:
+        result = _b2_upload_stream(request.stream, key, request.mimetype or None, on_progress)
+    except Exception as e:
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+    if result['bytes'] != total:
+        _b2_delete_object(key)
+        return jsonify({'error': 'Upload incomplete'}), 400
+    _db_insert_video(safe_name, filename, key, thumbnail_url=None, duration=None,
+                      user_id=current_user.id)
+    return jsonify({'success': True, 'filename': filename, 'bytes': result['bytes'],
+                    'parts': result['parts']})
 
 @app.route('/get-quote')
 def get_quote():
@@ -973,9 +1704,7 @@ def get_quote():
         filename = request.args.get('filename', '')
         
         if collection and filename:
-            all_tags = _load_tags()
-            image_key = _get_image_key(collection, filename)
-            image_data = all_tags.get(image_key)
+            image_data = _load_image(collection, filename)
             
             # Handle both new format (list of strings) and old format (dict with 'detailed')
             image_tag_names = []
@@ -1206,39 +1935,35 @@ def submit_score():
                 'time': time_val
             })
 
+        score_val = int(entry.get('score', 0))
+        time_ms = int(entry['time']) * 1000 if 'time' in entry else None
         conn = _get_db()
         try:
             cur = conn.cursor()
             # Insert new score row
             cur.execute(
-                "INSERT INTO scores (collection_name, game_type, data, user_id) VALUES (%s, %s, %s, %s)",
-                (collection, game_type, json.dumps(entry), current_user.id)
+                "INSERT INTO scores (collection_name, game_type, data, user_id, score, time_ms) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                (collection, game_type, json.dumps(entry), current_user.id, score_val, time_ms)
             )
-            # Keep only top 10 for this (collection, game_type)
-            cur.execute("""
+            # Keep only the top LEADERBOARD_DEPTH for this (collection, game_type)
+            # — an index range scan on idx_scores_rank.
+            cur.execute(f"""
                 DELETE FROM scores
                 WHERE collection_name = %s AND game_type = %s
                   AND id NOT IN (
                       SELECT id FROM scores
                       WHERE collection_name = %s AND game_type = %s
-                      ORDER BY (data->>'score')::int DESC,
-                               (data->>'time')::int  ASC NULLS LAST
-                      LIMIT 10
+                      ORDER BY {SCORE_ORDER}
+                      LIMIT %s
                   )
-            """, (collection, game_type, collection, game_type))
-            # Fetch current top 5 for the response
-            cur.execute("""
-                SELECT data FROM scores
-                WHERE collection_name = %s AND game_type = %s
-                ORDER BY (data->>'score')::int DESC,
-                         (data->>'time')::int  ASC NULLS LAST
-                LIMIT 5
-            """, (collection, game_type))
-            leaderboard = [r[0] for r in cur.fetchall()]
+            """, (collection, game_type, collection, game_type, LEADERBOARD_DEPTH))
             conn.commit()
         finally:
             _release_db(conn)
 
+        # Current top 5 for the response, from the board this score was folded into
+        leaderboard = _leaderboards.record(collection, game_type, score_val, time_ms, entry)[:5]
         is_top = any(e == entry for e in leaderboard)
         return jsonify({'success': True, 'updated': is_top, 'score': entry.get('score', 0), 'leaderboard': leaderboard})
     except Exception as e:
@@ -1253,26 +1978,7 @@ def get_high_scores(collection):
         if not collection:
             return jsonify({'error': 'Invalid collection'}), 400
 
-        conn = _get_db()
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT game_type, data
-                FROM scores
-                WHERE collection_name = %s
-                ORDER BY game_type,
-                         (data->>'score')::int DESC,
-                         (data->>'time')::int  ASC NULLS LAST
-            """, (collection,))
-            result = {}
-            for gtype, data in cur.fetchall():
-                bucket = result.setdefault(gtype, [])
-                if len(bucket) < 3:
-                    bucket.append(data)
-        finally:
-            _release_db(conn)
-
-        return jsonify(result)
+        return jsonify(_leaderboards.collection(collection, 3))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1290,6 +1996,9 @@ def delete_image_in_collection(collection, filename):
     collection = _safe_collection_name(collection)
     try:
         _b2_delete_object(_get_image_key(collection, filename))
+        entry = _load_image(collection, filename) or {}
+        for key in thumbnail_keys(entry.get('url', ''), entry.get('thumbs')):
+            _b2_delete_object(key)
         _db_delete_image(collection, filename)
         return jsonify({'success': True})
     except Exception as e:
@@ -1308,8 +2017,8 @@ def game():
 @app.route('/collection/<collection_name>/game')
 def collection_game(collection_name):
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('game.html', images=image_urls, collection=collection)
+    image_urls, image_meta = _get_collection_game_images(collection, GRID_IMAGE_WIDTH)
+    return render_template('game.html', images=image_urls, image_meta=image_meta, collection=collection)
 
 
 @app.route('/puzzle')
@@ -1322,80 +2031,98 @@ def puzzle():
 def collection_puzzle(collection_name):
     """Render the puzzle slider game for a specific collection."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('puzzle.html', images=image_urls, collection=collection)
+    # The board is at most ~600px square: a 1024px render instead of the original
+    entries = [(filename, value) for filename, value in _load_collection_images(collection).items()
+               if value.get('url')]
+    image_urls = [_proxy_image_url(collection, filename, w=PUZZLE_IMAGE_WIDTH) for filename, _value in entries]
+    image_meta = _meta_by_url(image_urls, [value for _filename, value in entries])
+    return render_template('puzzle.html', images=image_urls, image_meta=image_meta, collection=collection)
 
 
 @app.route('/collection/<collection_name>/sequence')
 def collection_sequence(collection_name):
     """Render the sequence memory game for a specific collection."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('sequence.html', images=image_urls, collection=collection)
+    image_urls, image_meta = _get_collection_game_images(collection, GRID_IMAGE_WIDTH)
+    return render_template('sequence.html', images=image_urls, image_meta=image_meta, collection=collection)
 
 
 @app.route('/collection/<collection_name>/flashcards')
 def collection_flashcards(collection_name):
     """Render the flashcards memory game for a specific collection."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('flashcards.html', images=image_urls, collection=collection)
+    image_urls, image_meta = _get_collection_game_images(collection, CARD_IMAGE_WIDTH)
+    return render_template('flashcards.html', images=image_urls, image_meta=image_meta, collection=collection)
 
 
 @app.route('/collection/<collection_name>/hunt')
 def collection_hunt(collection_name):
     """Simple Image Hunt game: show target image, player must find it in a grid."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('hunt.html', images=image_urls, collection=collection)
+    image_urls, image_meta = _get_collection_game_images(collection, GRID_IMAGE_WIDTH)
+    return render_template('hunt.html', images=image_urls, image_meta=image_meta, collection=collection)
 
 
 @app.route('/collection/<collection_name>/zoom')
 def collection_zoom(collection_name):
-    """Zoom Challenge game: show zoomed-in portion of image, identify which full image it is."""
+    """Zoom Challenge game: show zoomed-in portion of image, identify which full image it is.
+    The options are grid-sized derivatives; zoom.js requests the piece itself
+    from /img (crop_sources maps each option URL to its /img path)."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('zoom.html', images=image_urls, collection=collection)
+    formats = _thumbnail_formats()
+    entries = [(filename, value) for filename, value in _load_collection_images(collection).items()
+               if value.get('url')]
+    image_urls = _b2_sign_urls([_image_key_for_width(value, GRID_IMAGE_WIDTH, formats) for _f, value in entries])
+    crop_sources = {url: _proxy_image_url(collection, filename) for url, (filename, _v) in zip(image_urls, entries)}
+    image_meta = _meta_by_url(image_urls, [value for _filename, value in entries])
+    return render_template('zoom.html', images=image_urls, image_meta=image_meta, collection=collection,
+                           crop_sources=crop_sources, crop_width=ZOOM_CROP_WIDTH)
 
 
 @app.route('/collection/<collection_name>/whack')
 def collection_whack(collection_name):
     """Whack-a-Mole game: click images as they appear on screen."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('whack.html', images=image_urls, collection=collection)
+    image_urls, image_meta = _get_collection_game_images(collection, GRID_IMAGE_WIDTH)
+    return render_template('whack.html', images=image_urls, image_meta=image_meta, collection=collection)
 
 
 @app.route('/collection/<collection_name>/recall')
 def collection_recall(collection_name):
     """Recall Grid game: memorize image positions and select the original spot."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('recall.html', images=image_urls, collection=collection)
+    image_urls, image_meta = _get_collection_game_images(collection, GRID_IMAGE_WIDTH)
+    return render_template('recall.html', images=image_urls, image_meta=image_meta, collection=collection)
 
 
 @app.route('/collection/<collection_name>/missing')
 def collection_missing(collection_name):
     """Missing Piece game: identify which image disappeared from the shown grid."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('missing.html', images=image_urls, collection=collection)
+    image_urls, image_meta = _get_collection_game_images(collection, GRID_IMAGE_WIDTH)
+    return render_template('missing.html', images=image_urls, image_meta=image_meta, collection=collection)
 
 
 @app.route('/collection/<collection_name>/trail')
 def collection_trail(collection_name):
     """Trail Trace game: follow a route through a memorized image grid."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('trail.html', images=image_urls, collection=collection)
+    image_urls, image_meta = _get_collection_game_images(collection, GRID_IMAGE_WIDTH)
+    return render_template('trail.html', images=image_urls, image_meta=image_meta, collection=collection)
 
 
 @app.route('/collection/<collection_name>/remix')
 def collection_remix(collection_name):
     """Remix Match game: identify which stylized remix belongs to the target image."""
     collection = _safe_collection_name(collection_name)
-    image_urls = _get_collection_image_urls(collection)
-    return render_template('remix.html', images=image_urls, collection=collection)
+    # Like _get_collection_game_images(), keeping each URL's filename so the
+    # page can ask /similar for look-alike options
+    formats = _thumbnail_formats()
+    entries = [(f, value) for f, value in _load_collection_images(collection).items() if value.get('url')]
+    image_urls = _b2_sign_urls([_image_key_for_width(value, CARD_IMAGE_WIDTH, formats) for _f, value in entries])
+    return render_template('remix.html', images=image_urls,
+                           image_meta=_meta_by_url(image_urls, [value for _f, value in entries]),
+                           image_files=dict(zip(image_urls, [f for f, _v in entries])), collection=collection)
 
 
 @app.route('/tag-match')
@@ -1414,31 +2141,64 @@ def collection_tag_match(collection_name):
 
 
 
+def _stream_json(key: str, fragment_batches, brackets: str = '[]'):
+    """Write {"<key>": [...]} (or {...} with brackets='{}') incrementally from
+    batches of pre-encoded JSON values / "name": value members."""
+    yield f'{{{json.dumps(key)}: {brackets[0]}'
+    sep = ''
+    for fragments in fragment_batches:
+        if fragments:
+            yield sep + ', '.join(fragments)
+            sep = ', '
+    yield f'{brackets[1]}}}'
+
+
 @app.route('/api/images')
 def api_images_all():
-    """Return a JSON list of all image URLs."""
+    """Return a JSON list of all image URLs.
+    ?limit=N[&cursor=<collection/filename>] returns one page plus a next_cursor;
+    ?stream=1 writes the (remaining) list incrementally instead of all at once."""
+    try:
+        limit, after = _keyset_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if _wants_stream():
+        batches = ([json.dumps(url) for *_row, url in batch if url]
+                   for batch in _iter_signed_image_batches(after))
+        return Response(_stream_json('images', batches), mimetype='application/json')
+
+    if limit or after:
+        limit = limit or image_queries.MAX_PAGE_SIZE
+        page = _load_images_page(None, after, limit)
+        result = {'images': [url for url in _b2_sign_urls([v['url'] for _c, _f, v in page]) if url]}
+        if len(page) == limit:
+            result['next_cursor'] = '/'.join(page[-1][:2])
+        return jsonify(result)
+
     tags_data = _load_tags()
-    result = [
-        _b2_sign_url(v['url']) for v in tags_data.values()
+    result = _b2_sign_urls([
+        v['url'] for v in tags_data.values()
         if isinstance(v, dict) and v.get('url')
-    ]
+    ])
     return jsonify({'images': result})
 
 
 @app.route('/manage-collections')
 def manage_collections():
     """Render collection management page."""
-    tags_data = _load_tags()
-    collections = {}
-    for key in tags_data:
-        if '/' in key and isinstance(tags_data[key], dict) and tags_data[key].get('url'):
-            coll_name = key.split('/')[0]
-            collections[coll_name] = collections.get(coll_name, 0) + 1
-    for coll_name in _load_collections():
-        collections.setdefault(coll_name, 0)
+    collections = {name: c['images'] for name, c in _collection_summary.counts().items()}
     return render_template('manage-collections.html', collections=collections)
 
 
+@app.route('/api/collections/summary')
+@auth_or_guest
+def api_collections_summary():
+    """Per-collection image / video counts and top-3 scores per game, in one
+    response. Video counts only appear where the user may view the videos."""
+    return jsonify({'collections': _visible_summaries(_collection_summaries())})
+
+
 @app.route('/api/collections/create', methods=['POST'])
 @admin_required
 def api_create_collection():
@@ -1463,10 +2223,22 @@ def api_create_collection():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# Concurrent B2 CopyObject / DeleteObjects calls per collection rename.
+RENAME_WORKERS = int(os.environ.get('RENAME_WORKERS', 16))
+
+def _pending_renames(old_name: str = None):
+    conn = _get_db()
+    try:
+        return CollectionRename.pending(conn, old_name)
+    finally:
+        _release_db(conn)
+
 @app.route('/api/collections/rename', methods=['POST'])
 @admin_required
 def api_rename_collection():
-    """Rename a collection: moves all B2 assets and updates the images/videos tables."""
+    """Queue a collection rename (moves all B2 assets and updates the images/videos
+    tables); returns its job id. Re-posting the same rename after an interruption
+    resumes it (see collection_rename)."""
     data = request.get_json()
     old_name = data.get('old_name', '').strip()
     new_name = data.get('new_name', '').strip()
@@ -1480,115 +2252,71 @@ def api_rename_collection():
     if not safe_new or safe_new != new_name:
         return jsonify({'success': False, 'error': 'Invalid new name'}), 400
 
-    if not _collection_exists(safe_old):
-        return jsonify({'success': False, 'error': 'Collection not found'}), 404
-
-    if _collection_exists(safe_new):
-        return jsonify({'success': False, 'error': 'Target name already exists'}), 400
+    pending = _pending_renames(safe_old)
+    if pending and pending[0]['new_name'] != safe_new:
+        return jsonify({'success': False,
+                        'error': f"Already being renamed to {pending[0]['new_name']}"}), 409
+    if not pending:
+        if not _collection_exists(safe_old):
+            return jsonify({'success': False, 'error': 'Collection not found'}), 404
+
+        if _collection_exists(safe_new):
+            return jsonify({'success': False, 'error': 'Target name already exists'}), 400
+
+    job_id = _jobs.find_active('rename_collection', old_name=safe_old)
+    if job_id is not None:
+        if _jobs.find_active('rename_collection', old_name=safe_old, new_name=safe_new) is None:
+            return jsonify({'success': False, 'error': 'A rename of this collection is already queued'}), 409
+    else:
+        job_id = _jobs.enqueue('rename_collection', {'old_name': safe_old, 'new_name': safe_new},
+                               user_id=current_user.id)
+    return _job_accepted(job_id)
 
-    try:
-        # Create new collection record first
-        _ensure_collection(safe_new)
+def _job_rename_collection(job):
+    """Job: run (or resume) a CollectionRename, mirroring its progress onto the job."""
+    old_name, new_name = job.payload['old_name'], job.payload['new_name']
 
-        # Move each B2 object to the new prefix and update its DB row
-        conn = _get_db()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT filename, url FROM images WHERE collection_name = %s",
-                (safe_old,)
-            )
-            rows = cur.fetchall()
-        finally:
-            _release_db(conn)
+    def on_progress(progress):
+        job.progress(**progress)
+        socketio.emit('collection_rename_progress', progress)
 
-        for filename, old_url in rows:
-            new_url = old_url
-            try:
-                new_url = _b2_move_object(
-                    _get_image_key(safe_old, filename),
-                    _get_image_key(safe_new, filename)
-                )
-            except Exception:
-                pass
-
-            conn = _get_db()
-            try:
-                cur = conn.cursor()
-                cur.execute("""
-                    UPDATE images
-                    SET collection_name = %s, url = %s
-                    WHERE collection_name = %s AND filename = %s
-                """, (safe_new, new_url, safe_old, filename))
-                conn.commit()
-            finally:
-                _release_db(conn)
-
-        # Move each video object to the new prefix and update its DB row
-        conn = _get_db()
+    rename = CollectionRename(
+        _s3, B2_BUCKET, _get_db, _release_db, old_name, new_name,
+        workers=RENAME_WORKERS, notify=_notify_image_catalog, on_progress=on_progress,
+    )
+    try:
+        result = rename.run()
+        _embeddings.rename(old_name, new_name)
+        # The commit cleared images.thumbs (derivatives are not copied); rebuild
+        # them under the new name instead of serving originals until someone does.
         try:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT filename, url FROM videos WHERE collection_name = %s",
-                (safe_old,)
-            )
-            video_rows = cur.fetchall()
-        finally:
-            _release_db(conn)
-
-        for filename, old_url in video_rows:
-            new_url = old_url
-            try:
-                new_url = _b2_move_object(
-                    _get_image_key(safe_old, filename),
-                    _get_image_key(safe_new, filename)
-                )
-            except Exception:
-                pass
-
-            conn = _get_db()
-            try:
-                cur = conn.cursor()
-                cur.execute("""
-                    UPDATE videos
-                    SET collection_name = %s, url = %s
-                    WHERE collection_name = %s AND filename = %s
-                """, (safe_new, new_url, safe_old, filename))
-                conn.commit()
-            finally:
-                _release_db(conn)
+            if not _jobs.find_active('build_thumbnails', collection=new_name, scope='all'):
+                _jobs.enqueue('build_thumbnails', {'collection': new_name, 'scope': 'all', 'force': False})
+        except Exception as e:
+            print(f"[thumbs] Could not queue thumbnails for renamed {new_name}: {e}")
+        return result
+    finally:
+        # Rows may have moved even if cleanup failed afterwards
+        _image_catalog.invalidate(old_name)
+        _image_catalog.invalidate(new_name)
+        _collection_summary.invalidate()
 
-        # Carry over collection-level video access grants to the new name
-        # (they'd otherwise be lost when the old collection row cascade-deletes below)
-        conn = _get_db()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                "UPDATE video_collection_access SET collection_name = %s WHERE collection_name = %s",
-                (safe_new, safe_old)
-            )
-            conn.commit()
-        finally:
-            _release_db(conn)
+_jobs.register('rename_collection', _job_rename_collection)
 
-        # Remove old collection record (all images/videos already moved above)
-        conn = _get_db()
-        try:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM collections WHERE name = %s", (safe_old,))
-            conn.commit()
-        finally:
-            _release_db(conn)
 
-        return jsonify({'success': True, 'message': 'Collection renamed'})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+@app.route('/api/collections/rename/status')
+@admin_required
+def api_rename_status():
+    """Unfinished renames (?old_name= for one), with their phase and counts."""
+    old_name = request.args.get('old_name')
+    renames = _pending_renames(_safe_collection_name(old_name) if old_name else None)
+    return jsonify({'success': True, 'renames': renames})
 
 
 @app.route('/api/collections/delete', methods=['POST'])
 @admin_required
 def api_delete_collection():
-    """Delete a collection and all its images/videos."""
+    """Queue deletion of a collection and all its images/videos; returns its job id."""
     data = request.get_json()
     name = data.get('name', '').strip()
 
@@ -1600,54 +2328,83 @@ def api_delete_collection():
     if not _collection_exists(safe_name):
         return jsonify({'success': False, 'error': 'Collection not found'}), 404
 
-    try:
-        # Delete all B2 objects under this collection's folder (images and videos together)
-        try:
-            _b2_delete_prefix(f"{safe_name}/")
-        except Exception:
-            pass
+    job_id = _jobs.find_active('delete_collection', name=safe_name)
+    if job_id is None:
+        job_id = _jobs.enqueue('delete_collection', {'name': safe_name}, user_id=current_user.id)
+    return _job_accepted(job_id)
 
-        # DELETE FROM collections CASCADE-deletes all images/videos rows automatically
-        conn = _get_db()
-        try:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM collections WHERE name = %s", (safe_name,))
-            conn.commit()
-        finally:
-            _release_db(conn)
+def _job_delete_collection(job):
+    """Job: delete a collection's B2 folder and derivatives, then its row (cascading to images/videos).
+    The row goes last so a failed B2 delete is retried rather than orphaning objects."""
+    name = job.payload['name']
+    deleted = _b2_delete_prefix(f"{name}/", on_progress=lambda n: job.progress(deleted=n))
+    deleted += _b2_delete_prefix(f"thumbs/{name}/", on_progress=lambda n: job.progress(deleted=deleted + n))
 
-        return jsonify({'success': True, 'message': 'Collection deleted'})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    # DELETE FROM collections CASCADE-deletes all images/videos rows automatically
+    conn = _get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM collections WHERE name = %s", (name,))
+        _notify_image_catalog(cur, name)
+        conn.commit()
+    finally:
+        _release_db(conn)
+    _image_catalog.invalidate(name)
+    _collection_summary.invalidate()
+    _embeddings.drop(name)
+    return {'name': name, 'deleted': deleted}
+
+_jobs.register('delete_collection', _job_delete_collection)
 
 
 @app.route('/api/collections/<collection_name>/images', methods=['GET'])
 def api_collection_images(collection_name):
-    """Get all images in a collection with their tags and lock status."""
+    """Get all images in a collection with their tags and lock status.
+    Optional ?limit=N[&after=<filename>] returns one page plus a next_cursor;
+    ?w=<px> adds a thumb_url sized for that display width. Images with computed
+    metadata also carry width, height, aspect, byte_size, dominant_color and
+    blurhash, so grids can be laid out before any image loads."""
     safe_name = _safe_collection_name(collection_name)
+    width = request.args.get('w', type=int)
 
     if not _collection_exists(safe_name):
         return jsonify({'success': False, 'error': 'Collection not found'}), 404
 
-    tags_data = _load_tags()
-    images = []
-    prefix = f"{safe_name}/"
+    next_cursor = None
+    if request.args.get('limit'):
+        try:
+            limit = int(request.args['limit'])
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+        after = request.args.get('after')
+        page = _load_images_page(safe_name, (safe_name, after) if after else None, limit)
+        rows = [(filename, value) for _coll, filename, value in page]
+        if len(page) == max(1, min(limit, image_queries.MAX_PAGE_SIZE)):
+            next_cursor = rows[-1][0]
+    else:
+        rows = _load_collection_images(safe_name).items()
 
-    for key, value in tags_data.items():
-        if not key.startswith(prefix):
-            continue
-        filename = key[len(prefix):]
-        if not isinstance(value, dict) or not value.get('url'):
-            continue
+    rows = [(filename, value) for filename, value in rows if value.get('url')]
+    urls = _b2_sign_urls([value['url'] for _filename, value in rows])
+    images = []
+    for (filename, value), url in zip(rows, urls):
         normalized = _normalize_tags_entry(value)
         images.append({
             'filename':   filename,
-            'url':        _b2_sign_url(value['url']),
+            'url':        url,
             'tags':       normalized['tags'],
             'body_parts': normalized.get('body_parts', {}),
-            'locked':     normalized.get('locked', False)
+            'locked':     normalized.get('locked', False),
+            **_image_metadata(value),
         })
-
+    if width:
+        formats = _thumbnail_formats()
+        thumb_urls = _b2_sign_urls([_image_key_for_width(value, width, formats) for _f, value in rows])
+        for image, thumb_url in zip(images, thumb_urls):
+            image['thumb_url'] = thumb_url
+
+    if next_cursor is not None:
+        return jsonify({'success': True, 'images': images, 'next_cursor': next_cursor})
     return jsonify({'success': True, 'images': images})
 
 
@@ -1673,16 +2430,324 @@ def api_update_image_tags(collection_name, filename):
     return jsonify({'success': True, 'tags': tags})
 
 
+def _job_retag_images(job):
+    """Job handler: retag a collection's unlocked images (all of them, or
+    payload['filenames']) through the tagger service; see retag.py."""
+    collection = job.payload['collection']
+
+    def tag_images(images):
+        return _tagger.tag_images(images, collection=collection,
+                                  top_k=RETAG_TOP_K, threshold=RETAG_THRESHOLD)
+
+    def on_written(rows):
+        for filename, tags in rows:
+            _image_catalog.update(collection, filename, tags=list(tags))
+        # Live update for open tagger pages (see collection_subscribe)
+        urls = _b2_sign_urls([_get_image_key(collection, filename) for filename, _tags in rows])
+        socketio.emit('image_tags', {
+            'collection': collection,
+            'images': [{'filename': filename, 'tags': list(tags), 'url': url}
+                       for (filename, tags), url in zip(rows, urls)],
+        }, room=f'collection:{collection}')
+
+    return CollectionRetag(
+        _s3, B2_BUCKET, _get_db, _release_db, tag_images, collection,
+        filenames=job.payload.get('filenames'), batch_size=RETAG_BATCH_SIZE,
+        notify=_notify_image_catalog, on_written=on_written,
+        on_progress=lambda progress: job.progress(**progress),
+    ).run()
+
+_jobs.register('retag_images', _job_retag_images)
+
+
 @app.route('/api/images/<collection_name>/<filename>/retag', methods=['POST'])
+@admin_required
 def api_retag_image(collection_name, filename):
-    """Auto-generate tags for a specific image (disabled — no tagger configured)."""
-    return jsonify({'success': False, 'error': 'Auto-tagging is not available'}), 501
+    """Admin-only: queue a retag of one image; responds with the job id."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _image_exists_in_tags(safe_name, filename):
+        return jsonify({'success': False, 'error': 'Image not found'}), 404
+    if _get_image_locked_status(safe_name, filename):
+        return jsonify({'success': False, 'error': 'Image is locked'}), 409
+    job_id = _jobs.enqueue('retag_images', {'collection': safe_name, 'filenames': [filename],
+                                            'scope': 'images'}, user_id=current_user.id)
+    return _job_accepted(job_id, collection=safe_name, filename=filename)
 
 
 @app.route('/api/collections/<collection_name>/retag-all', methods=['POST'])
+@admin_required
 def api_retag_all_images(collection_name):
-    """Auto-generate tags for all images in a collection (disabled — no tagger configured)."""
-    return jsonify({'success': False, 'error': 'Auto-tagging is not available'}), 501
+    """Admin-only: queue a retag of every unlocked image in a collection.
+    Progress ({total, done, tagged, untagged, locked}) is on the job."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _collection_exists(safe_name):
+        return jsonify({'success': False, 'error': 'Collection not found'}), 404
+    job_id = _jobs.find_active('retag_images', collection=safe_name, scope='all')
+    if job_id is None:
+        job_id = _jobs.enqueue('retag_images', {'collection': safe_name, 'scope': 'all'},
+                               user_id=current_user.id)
+    return _job_accepted(job_id, collection=safe_name)
+
+
+def _job_build_thumbnails(job):
+    """Job handler: generate missing derivatives for one collection (all of its
+    images, or payload['filenames']) or, without payload['collection'], for
+    every collection in turn; see thumbnails.py."""
+    p = job.payload
+    collections = [p['collection']] if p.get('collection') else _load_collections()
+    totals = {}
+    for collection in collections:
+        def on_written(rows, collection=collection):
+            for filename, thumbs in rows:
+                _image_catalog.update(collection, filename, thumbs=thumbs)
+
+        result = ThumbnailBuilder(
+            _s3, B2_BUCKET, _get_db, _release_db, collection, filenames=p.get('filenames'),
+            force=bool(p.get('force')), workers=THUMBS_WORKERS, notify=_notify_image_catalog,
+            on_written=on_written, on_progress=lambda progress: job.progress(**progress),
+            offload=_offload,
+        ).run()
+        for key in ('total', 'generated', 'failed', 'skipped', 'bytes_saved'):
+            totals[key] = totals.get(key, 0) + result[key]
+    return {'collections': len(collections), **totals}
+
+_jobs.register('build_thumbnails', _job_build_thumbnails)
+
+
+def _job_image_metadata(job):
+    """Job handler: compute missing size / colour / blurhash metadata for one
+    collection (payload['collection']) or every image; see image_metadata.py."""
+    def on_written(rows):
+        for collection, filename, meta in rows:
+            _image_catalog.update(collection, filename, meta=meta)
+
+    return MetadataBackfill(
+        _s3, B2_BUCKET, _get_db, _release_db, collection=job.payload.get('collection'),
+        batch_size=METADATA_BATCH_SIZE, workers=METADATA_WORKERS, notify=_notify_image_catalog,
+        on_written=on_written, on_progress=lambda progress: job.progress(**progress), offload=_offload,
+    ).run()
+
+_jobs.register('image_metadata', _job_image_metadata)
+
+
+@app.route('/api/collections/<collection_name>/thumbnails', methods=['GET'])
+@admin_required
+def api_thumbnail_stats(collection_name):
+    """Admin-only: bytes the originals cost vs. a grid of each derivative width /
+    format, for images that have been processed; see thumbnails.savings()."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _collection_exists(safe_name):
+        return jsonify({'success': False, 'error': 'Collection not found'}), 404
+    stats = thumbnail_savings(_load_collection_images(safe_name).values())
+    return jsonify({'success': True, 'collection': safe_name, **stats})
+
+
+@app.route('/api/collections/<collection_name>/thumbnails', methods=['POST'])
+@admin_required
+def api_build_thumbnails(collection_name):
+    """Admin-only: backfill a collection's missing derivatives (?force=1 rebuilds
+    them all). Progress ({total, done, generated, failed, skipped}) is on the job."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _collection_exists(safe_name):
+        return jsonify({'success': False, 'error': 'Collection not found'}), 404
+    force = request.args.get('force') == '1'
+    job_id = _jobs.find_active('build_thumbnails', collection=safe_name, scope='all', force=force)
+    if job_id is None:
+        job_id = _jobs.enqueue('build_thumbnails', {'collection': safe_name, 'scope': 'all', 'force': force},
+                               user_id=current_user.id)
+    return _job_accepted(job_id, collection=safe_name)
+
+
+@app.route('/api/thumbnails/backfill', methods=['POST'])
+@admin_required
+def api_backfill_thumbnails():
+    """Admin-only: one job that backfills missing derivatives in every collection."""
+    job_id = _jobs.find_active('build_thumbnails', scope='everything')
+    if job_id is None:
+        job_id = _jobs.enqueue('build_thumbnails', {'scope': 'everything'}, user_id=current_user.id)
+    return _job_accepted(job_id)
+
+
+@app.route('/api/collections/<collection_name>/metadata', methods=['POST'])
+@admin_required
+def api_build_image_metadata(collection_name):
+    """Admin-only: compute missing image metadata for a collection. Progress
+    ({done, updated, failed}) is on the job."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _collection_exists(safe_name):
+        return jsonify({'success': False, 'error': 'Collection not found'}), 404
+    job_id = _jobs.find_active('image_metadata', collection=safe_name)
+    if job_id is None:
+        job_id = _jobs.enqueue('image_metadata', {'collection': safe_name}, user_id=current_user.id)
+    return _job_accepted(job_id, collection=safe_name)
+
+
+@app.route('/api/metadata/backfill', methods=['POST'])
+@admin_required
+def api_backfill_image_metadata():
+    """Admin-only: one job that computes missing metadata for every image."""
+    job_id = _jobs.find_active('image_metadata', scope='everything')
+    if job_id is None:
+        job_id = _jobs.enqueue('image_metadata', {'scope': 'everything'}, user_id=current_user.id)
+    return _job_accepted(job_id)
+
+
+@app.route('/api/collections/<collection_name>/duplicates', methods=['GET'])
+@admin_required
+def api_duplicate_report(collection_name):
+    """Admin-only: clusters of near-duplicate images in a collection, largest
+    first. ?distance=<bits> overrides DUPLICATE_MAX_DISTANCE. Images without a
+    perceptual hash yet (see /api/metadata/backfill) are counted as unhashed."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _collection_exists(safe_name):
+        return jsonify({'success': False, 'error': 'Collection not found'}), 404
+    distance = request.args.get('distance', DUPLICATE_MAX_DISTANCE, type=int)
+    if not 0 <= distance <= 32:
+        return jsonify({'success': False, 'error': 'distance must be between 0 and 32'}), 400
+
+    images = {f: v for f, v in _load_collection_images(safe_name).items() if v.get('url')}
+    hashes = _collection_hashes(safe_name)
+    clusters = _duplicate_index.clusters(safe_name, hashes, distance)
+    members = [name for cluster in clusters for name, _d in cluster]
+    formats = _thumbnail_formats()
+    urls = dict(zip(members, _b2_sign_urls([_image_key_for_width(images[name], GRID_IMAGE_WIDTH, formats)
+                                            for name in members])))
+    return jsonify({
+        'success': True,
+        'collection': safe_name,
+        'distance': distance,
+        'images': len(images),
+        'unhashed': len(images) - len(hashes),
+        # Copies that could be deleted, keeping one image per cluster
+        'redundant': len(members) - len(clusters),
+        'clusters': [[{'filename': name, 'url': urls[name], 'distance': d,
+                       'tags': images[name].get('tags', []), **_image_metadata(images[name])}
+                      for name, d in cluster] for cluster in clusters],
+    })
+
+
+def _job_build_embeddings(job):
+    """Job handler: embed one collection's missing images (all of them, or
+    payload['filenames']) or, without payload['collection'], every collection's;
+    see embedding_store.py. Needs the tagger service."""
+    p = job.payload
+    collections = [p['collection']] if p.get('collection') else _load_collections()
+    totals = {}
+    for collection in collections:
+        images = {f: v['url'] for f, v in _load_collection_images(collection).items() if v.get('url')}
+        result = EmbeddingBuilder(
+            _s3, B2_BUCKET, _embeddings, collection, images, _embed_image_bytes,
+            filenames=p.get('filenames'), force=bool(p.get('force')), batch_size=EMBED_BATCH_SIZE,
+            workers=THUMBS_WORKERS, on_progress=lambda progress: job.progress(**progress),
+        ).run()
+        for key in ('total', 'embedded', 'failed', 'skipped'):
+            totals[key] = totals.get(key, 0) + result[key]
+    return {'collections': len(collections), **totals}
+
+_jobs.register('build_embeddings', _job_build_embeddings)
+
+
+@app.route('/api/collections/<collection_name>/embeddings', methods=['GET'])
+@admin_required
+def api_embedding_stats(collection_name):
+    """Admin-only: how much of a collection is embedded, with which model, and
+    whether it has an ANN index."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _collection_exists(safe_name):
+        return jsonify({'success': False, 'error': 'Collection not found'}), 404
+    images = {f for f, v in _load_collection_images(safe_name).items() if v.get('url')}
+    index = _embeddings.get(safe_name)
+    missing = len(images) if index is None else sum(1 for f in images if f not in index)
+    return jsonify({'success': True, 'collection': safe_name, 'images': len(images), 'missing': missing,
+                    **_embeddings.stats(safe_name)})
+
+
+@app.route('/api/collections/<collection_name>/embeddings', methods=['POST'])
+@admin_required
+def api_build_embeddings(collection_name):
+    """Admin-only: embed a collection's missing images (?force=1 re-embeds them
+    all). Progress ({total, done, embedded, failed, skipped}) is on the job."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _collection_exists(safe_name):
+        return jsonify({'success': False, 'error': 'Collection not found'}), 404
+    force = request.args.get('force') == '1'
+    job_id = _jobs.find_active('build_embeddings', collection=safe_name, scope='all', force=force)
+    if job_id is None:
+        job_id = _jobs.enqueue('build_embeddings', {'collection': safe_name, 'scope': 'all', 'force': force},
+                               user_id=current_user.id)
+    return _job_accepted(job_id, collection=safe_name)
+
+
+@app.route('/api/embeddings/backfill', methods=['POST'])
+@admin_required
+def api_backfill_embeddings():
+    """Admin-only: one job that embeds missing images in every collection."""
+    job_id = _jobs.find_active('build_embeddings', scope='everything')
+    if job_id is None:
+        job_id = _jobs.enqueue('build_embeddings', {'scope': 'everything'}, user_id=current_user.id)
+    return _job_accepted(job_id)
+
+
+def _similarity_results(collection: str, found: list, width: int = None) -> list:
+    """Client-facing entries for [(similarity, filename)] from _nearest_images()."""
+    images = _load_collection_images(collection)
+    formats = _thumbnail_formats()
+    urls = _b2_sign_urls([_image_key_for_width(images[name], width, formats) for _s, name in found])
+    return [{'filename': name, 'url': url, 'score': round(score, 4),
+             'tags': images[name].get('tags', []), **_image_metadata(images[name])}
+            for (score, name), url in zip(found, urls)]
+
+def _result_count():
+    """?k= (default 10) within 1..SIMILAR_MAX_RESULTS, or None when invalid."""
+    k = request.args.get('k', 10, type=int)
+    return k if k is not None and 1 <= k <= SIMILAR_MAX_RESULTS else None
+
+
+@app.route('/api/collections/<collection_name>/similar', methods=['GET'])
+def api_similar_images(collection_name):
+    """The images that look most like ?filename= (repeatable: like all of them
+    together), most similar first, with their similarity score. ?k= caps the
+    count, ?w=<px> sizes the URLs like /images?w=. indexed=false means none of
+    the given images has an embedding yet; callers fall back to random picks."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _collection_exists(safe_name):
+        return jsonify({'success': False, 'error': 'Collection not found'}), 404
+    filenames = request.args.getlist('filename')
+    k = _result_count()
+    if not filenames or k is None:
+        return jsonify({'success': False,
+                        'error': f'filename and a k between 1 and {SIMILAR_MAX_RESULTS} required'}), 400
+    index = _embeddings.get(safe_name)
+    query = index.query_vector(filenames) if index is not None else None
+    found = _nearest_images(safe_name, query, k, exclude=filenames)
+    return jsonify({'success': True, 'collection': safe_name, 'indexed': query is not None,
+                    'images': _similarity_results(safe_name, found, request.args.get('w', type=int))})
+
+
+@app.route('/api/collections/<collection_name>/search', methods=['GET'])
+def api_search_images(collection_name):
+    """Text-to-image search: the images whose CLIP embedding best matches ?q=,
+    best first (?k=, ?w= as for /similar). 503 while the tagger service, which
+    embeds the query, is unavailable."""
+    safe_name = _safe_collection_name(collection_name)
+    if not _collection_exists(safe_name):
+        return jsonify({'success': False, 'error': 'Collection not found'}), 404
+    text = request.args.get('q', '').strip()
+    k = _result_count()
+    if not text or k is None:
+        return jsonify({'success': False, 'error': f'q and a k between 1 and {SIMILAR_MAX_RESULTS} required'}), 400
+    index = _embeddings.get(safe_name)
+    if index is None:
+        return jsonify({'success': True, 'collection': safe_name, 'indexed': False, 'images': []})
+    try:
+        model, rows = _tagger.embed_texts([text])
+    except TaggerError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    if model != index.model:
+        return jsonify({'success': False, 'error': f'Embeddings were built with {index.model}; rebuild them'}), 409
+    found = _nearest_images(safe_name, from_wire(rows)[0], k)
+    return jsonify({'success': True, 'collection': safe_name, 'indexed': True,
+                    'images': _similarity_results(safe_name, found, request.args.get('w', type=int))})
 
 
 @app.route('/api/images/<collection_name>/<filename>/lock', methods=['POST'])
@@ -1739,15 +2804,14 @@ def tagger_view(collection_name):
     safe_name = _safe_collection_name(collection_name)
     if not _collection_exists(safe_name):
         return "Collection not found", 404
-    tags_data = _load_tags()
     images = []
-    prefix = f"{safe_name}/"
-    for key, value in sorted(tags_data.items()):
-        if not key.startswith(prefix) or not isinstance(value, dict) or not value.get('url'):
-            continue
+    # _load_collection_images() already returns filenames in sorted order
+    entries = [(f, v) for f, v in _load_collection_images(safe_name).items() if v.get('url')]
+    urls = _b2_sign_urls([value['url'] for _filename, value in entries])
+    for (filename, value), url in zip(entries, urls):
         images.append({
-            'filename':   key[len(prefix):],
-            'url':        _b2_sign_url(value['url']),
+            'filename':   filename,
+            'url':        url,
             'tags':       value.get('tags', []),
             'body_parts': value.get('body_parts', {}),
         })
@@ -1776,30 +2840,69 @@ def api_update_body_parts(collection_name, filename):
         _set_image_body_parts_and_tags(safe_name, filename, cleaned_parts, cleaned_tags)
     else:
         # Body parts only — leave tags unchanged
-        conn = _get_db()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                "UPDATE images SET body_parts = %s::jsonb WHERE collection_name = %s AND filename = %s",
-                (json.dumps(cleaned_parts), safe_name, filename)
-            )
-            conn.commit()
-        finally:
-            _release_db(conn)
+        _set_image_body_parts(safe_name, filename, cleaned_parts)
 
     return jsonify({'success': True})
 
 
+def _stream_collections(after: tuple, empty: list):
+    """Write {"collections": {name: [urls]}} incrementally. Rows arrive ordered by
+    collection, so each collection's list is opened and closed exactly once."""
+    yield '{"collections": {'
+    current = None
+    for batch in _iter_signed_image_batches(after):
+        out = []
+        for coll, _fname, _entry, url in batch:
+            if not url:
+                continue
+            if coll != current:
+                out.append(f'{"], " if current is not None else ""}{json.dumps(coll)}: [{json.dumps(url)}')
+                current = coll
+            else:
+                out.append(f', {json.dumps(url)}')
+        if out:
+            yield ''.join(out)
+    if current is not None:
+        yield ']'
+    for i, coll in enumerate(empty):
+        yield f'{", " if current is not None or i else ""}{json.dumps(coll)}: []'
+    yield '}}'
+
+
 @app.route('/api/collections')
 def api_collections():
-    """Return a JSON mapping of collection name -> list of image URLs."""
+    """Return a JSON mapping of collection name -> list of image URLs.
+    ?limit=N[&cursor=<collection/filename>] returns one page plus a next_cursor
+    (a collection can span pages; empty collections come with the last page);
+    ?stream=1 writes the (remaining) mapping incrementally instead."""
+    try:
+        limit, after = _keyset_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if _wants_stream():
+        empty = _load_empty_collections() if after is None else []
+        return Response(_stream_collections(after, empty), mimetype='application/json')
+
+    if limit or after:
+        limit = limit or image_queries.MAX_PAGE_SIZE
+        page = _load_images_page(None, after, limit)
+        result = {}
+        for (coll_name, _fname, _entry), url in zip(page, _b2_sign_urls([v['url'] for _c, _f, v in page])):
+            if url:
+                result.setdefault(coll_name, []).append(url)
+        if len(page) == limit:
+            return jsonify({'collections': result, 'next_cursor': '/'.join(page[-1][:2])})
+        for coll_name in _load_empty_collections():
+            result.setdefault(coll_name, [])
+        return jsonify({'collections': result})
+
     tags_data = _load_tags()
+    entries = [(key.split('/')[0], value['url']) for key, value in tags_data.items()
+               if '/' in key and isinstance(value, dict) and value.get('url')]
     result = {}
-    for key, value in tags_data.items():
-        if '/' not in key or not isinstance(value, dict) or not value.get('url'):
-            continue
-        coll_name = key.split('/')[0]
-        result.setdefault(coll_name, []).append(_b2_sign_url(value['url']))
+    for (coll_name, _key), url in zip(entries, _b2_sign_urls([k for _c, k in entries])):
+        result.setdefault(coll_name, []).append(url)
 
     # Include empty collections with no images yet
     for coll_name in _load_collections():
@@ -1810,14 +2913,36 @@ def api_collections():
 
 @app.route('/api/tags')
 def api_all_tags():
-    """Return all image tags."""
+    """Return all image tags.
+    ?limit=N[&cursor=<collection/filename>] returns one page plus a next_cursor;
+    ?stream=1 writes the (remaining) mapping incrementally instead."""
+    try:
+        limit, after = _keyset_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if _wants_stream():
+        batches = ([f'{json.dumps(f"{coll}/{fname}")}: {json.dumps({**entry, "url": url} if url else entry)}'
+                    for coll, fname, entry, url in batch]
+                   for batch in _iter_signed_image_batches(after))
+        return Response(_stream_json('tags', batches, '{}'), mimetype='application/json')
+
+    if limit or after:
+        limit = limit or image_queries.MAX_PAGE_SIZE
+        page = _load_images_page(None, after, limit)
+        urls = _b2_sign_urls([v['url'] for _c, _f, v in page])
+        result = {'tags': {f"{coll}/{fname}": {**entry, 'url': url} if url else entry
+                           for (coll, fname, entry), url in zip(page, urls)}}
+        if len(page) == limit:
+            result['next_cursor'] = '/'.join(page[-1][:2])
+        return jsonify(result)
+
     tags_data = _load_tags()
     # Sign URLs in a copy for the response — _load_tags()'s own return value must
     # keep raw keys, since update_image_tags() round-trips it through _save_tags().
-    signed = {
-        k: {**v, 'url': _b2_sign_url(v['url'])} if isinstance(v, dict) and v.get('url') else v
-        for k, v in tags_data.items()
-    }
+    signable = [k for k, v in tags_data.items() if isinstance(v, dict) and v.get('url')]
+    urls = dict(zip(signable, _b2_sign_urls([tags_data[k]['url'] for k in signable])))
+    signed = {k: {**v, 'url': urls[k]} if k in urls else v for k, v in tags_data.items()}
     return jsonify({'tags': signed})
 
 
@@ -1825,11 +2950,9 @@ def api_all_tags():
 def api_image_tags(collection, filename):
     """Get tags for a specific image."""
     collection = _safe_collection_name(collection)
-    image_key = _get_image_key(collection, filename)
-    tags_data = _load_tags()
-    
-    if image_key in tags_data:
-        tags = tags_data[image_key]
+    tags = _load_image(collection, filename)
+
+    if tags is not None:
         # Handle both formats: list of strings or dict with 'tags' key
         if isinstance(tags, list):
             return jsonify({
@@ -1859,12 +2982,10 @@ def update_image_tags(collection, filename):
         if not isinstance(new_tags, list):
             return jsonify({'error': 'Tags must be a list'}), 400
         
-        tags_data = _load_tags()
-        if image_key not in tags_data:
-            tags_data[image_key] = {}
-        
-        tags_data[image_key]['tags'] = new_tags
-        _save_tags(tags_data)
+        # Only upsert this one image — _save_tags() writes every row it's given
+        entry = _load_image(collection, filename) or {}
+        entry['tags'] = new_tags
+        _save_tags({image_key: entry})
         
         return jsonify({'success': True, 'tags': new_tags})
     except Exception as e:
@@ -1872,43 +2993,59 @@ def update_image_tags(collection, filename):
 
 
 @app.route('/api/retag/<collection>/<filename>', methods=['POST'])
+@admin_required
 def retag_image(collection, filename):
-    """Re-analyze and update tags for an existing image (disabled — no tagger configured)."""
-    return jsonify({'error': 'Auto-tagging is not available'}), 501
+    """Re-analyze and update tags for an existing image (same as api_retag_image)."""
+    return api_retag_image(collection, filename)
 
 
 @app.route('/api/search-by-tag')
 def search_by_tag():
-    """Search images by tag. Query param: tag=<tag_name>"""
+    """Search images by tag (case-insensitive). Query param: tag=<tag_name>
+    Optional ?limit=N[&cursor=<collection/filename>] returns one page plus a next_cursor."""
     search_tag = request.args.get('tag', '').lower()
     if not search_tag:
         return jsonify({'error': 'Tag parameter required'}), 400
-    
-    tags_data = _load_tags()
-    matching_images = []
-    
-    for image_key, tag_info in tags_data.items():
-        if not isinstance(tag_info, dict):
-            continue
-        image_tags = [t.lower() for t in tag_info.get('tags', [])]
-        if search_tag in image_tags and tag_info.get('url'):
-            matching_images.append({
-                'url': _b2_sign_url(tag_info['url']),
-                'tags': tag_info.get('tags', []),
-                'key': image_key
-            })
-    
-    return jsonify({
+    try:
+        limit, after = _keyset_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    total, page = _image_catalog.find_by_tags([search_tag], ignore_case=True,
+                                              after=after, limit=limit)
+    rows = [(coll, fname, info) for coll, fname, info in page if info.get('url')]
+    urls = _b2_sign_urls([info['url'] for _coll, _fname, info in rows])
+    matching_images = [
+        {'url': url, 'tags': info.get('tags', []), 'key': f"{coll}/{fname}"}
+        for (coll, fname, info), url in zip(rows, urls)
+    ]
+
+    result = {
         'tag': search_tag,
-        'count': len(matching_images),
+        'count': total if limit else len(matching_images),
         'images': matching_images
-    })
+    }
+    if limit and len(page) == limit:
+        result['next_cursor'] = '/'.join(page[-1][:2])
+    return jsonify(result)
 
 
 @app.route('/api/tagger-config', methods=['GET', 'POST'])
+@admin_required
 def api_tagger_config():
-    """Tagger configuration endpoint (disabled — auto-tagging is not available)."""
-    return jsonify({'success': False, 'message': 'Auto-tagging is not available'}), 501
+    """Admin-only: the tagger service's status / config (GET), or hot-swap its
+    backend (POST, set_tagger_config keys) once the new model is warm."""
+    try:
+        if request.method == 'GET':
+            return jsonify({'success': True, 'status': _tagger.status()})
+        config = request.get_json(silent=True) or {}
+        allowed = {'backend', 'model_path', 'labels_path', 'backend_overrides', 'ort_options'}
+        config = {k: v for k, v in config.items() if k in allowed}
+        if not config:
+            return jsonify({'success': False, 'error': f'Expected some of {sorted(allowed)}'}), 400
+        return jsonify({'success': True, 'status': _tagger.swap(config)})
+    except TaggerError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
 
 
 @app.route('/tags')
@@ -1919,89 +3056,59 @@ def tags_view():
 
 @app.route('/api/tags-with-counts')
 def api_tags_with_counts():
-    """Return all tags grouped by collection with image counts."""
-    tags_data = _load_tags()
-    tag_counts = {}  # {tag: {collections: {collection: count}, total: count}}
-    
-    # Iterate through all tagged images
-    for image_key, tags_info in tags_data.items():
-        # Extract collection name from image_key (format: collection/filename)
-        parts = image_key.split('/')
-        if len(parts) < 2:
-            continue
-        
-        collection = parts[0]
-        
-        # Extract tags
-        tags = []
-        if isinstance(tags_info, list):
-            tags = tags_info
-        elif isinstance(tags_info, dict):
-            tags = tags_info.get('tags', [])
-        
-        # Count each tag
-        for tag in tags:
-            if tag not in tag_counts:
-                tag_counts[tag] = {'collections': {}, 'total': 0}
-            
-            if collection not in tag_counts[tag]['collections']:
-                tag_counts[tag]['collections'][collection] = 0
-            
-            tag_counts[tag]['collections'][collection] += 1
-            tag_counts[tag]['total'] += 1
-    
-    # Sort by total count (descending)
-    sorted_tags = sorted(tag_counts.items(), key=lambda x: x[1]['total'], reverse=True)
-    
-    return jsonify({
+    """Return all tags grouped by collection with image counts, most used first.
+    Optional ?limit=N[&cursor=<offset>] returns one page plus a next_cursor."""
+    tag_counts = _image_catalog.tag_counts()
+    next_cursor = None
+    if request.args.get('limit'):
+        try:
+            limit = max(1, min(int(request.args['limit']), image_queries.MAX_PAGE_SIZE))
+            offset = max(0, int(request.args.get('cursor') or 0))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit and cursor must be integers'}), 400
+        if offset + limit < len(tag_counts):
+            next_cursor = str(offset + limit)
+        tag_counts = tag_counts[offset:offset + limit]
+
+    result = {
         'success': True,
-        'tags': [{'tag': tag, 'counts': data} for tag, data in sorted_tags]
-    })
+        'tags': [{'tag': tag, 'counts': {'collections': collections, 'total': total}}
+                 for tag, collections, total in tag_counts]
+    }
+    if next_cursor is not None:
+        result['next_cursor'] = next_cursor
+    return jsonify(result)
 
 
 @app.route('/api/images-by-tags')
 def api_images_by_tags():
-    """Get images filtered by specific tags."""
+    """Get images filtered by specific tags (any of them, or all with ?matchAll=true).
+    Optional ?limit=N[&cursor=<collection/filename>] returns one page plus a next_cursor;
+    count is always the total number of matches."""
     tags_filter = request.args.getlist('tags')  # Multiple tags can be passed
     match_all = request.args.get('matchAll', 'false').lower() == 'true'
-    
+
     if not tags_filter:
         return jsonify({'success': False, 'error': 'No tags provided'}), 400
-    
-    tags_data = _load_tags()
-    matching_images = []
-    
-    # Iterate through all tagged images
-    for image_key, tags_info in tags_data.items():
-        if not isinstance(tags_info, dict) or not tags_info.get('url'):
-            continue
-        parts = image_key.split('/')
-        if len(parts) < 2:
-            continue
+    try:
+        limit, after = _keyset_args()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    total, page = _image_catalog.find_by_tags(tags_filter, match_all=match_all,
+                                              after=after, limit=limit)
+    rows = [(coll, fname, info) for coll, fname, info in page if info.get('url')]
+    urls = _b2_sign_urls([info['url'] for _coll, _fname, info in rows])
+    matching_images = [
+        {'filename': fname, 'collection': coll, 'url': url, 'tags': info.get('tags', [])}
+        for (coll, fname, info), url in zip(rows, urls)
+    ]
 
-        collection = parts[0]
-        filename = '/'.join(parts[1:])
-        tags = tags_info.get('tags', [])
-
-        # Check if image matches filter
-        if match_all:
-            if all(tag in tags for tag in tags_filter):
-                matching_images.append({
-                    'filename': filename,
-                    'collection': collection,
-                    'url': _b2_sign_url(tags_info['url']),
-                    'tags': tags
-                })
-        else:
-            if any(tag in tags for tag in tags_filter):
-                matching_images.append({
-                    'filename': filename,
-                    'collection': collection,
-                    'url': _b2_sign_url(tags_info['url']),
-                    'tags': tags
-                })
-    
-    return jsonify({'success': True, 'images': matching_images, 'count': len(matching_images)})
+    result = {'success': True, 'images': matching_images,
+              'count': total if limit else len(matching_images)}
+    if limit and len(page) == limit:
+        result['next_cursor'] = '/'.join(page[-1][:2])
+    return jsonify(result)
 
 
 @app.route('/collection/<collection_name>/spotlight')
@@ -2055,9 +3162,10 @@ def collection_bracket(collection_name):
 
 @app.route('/collection/<collection_name>/scratch')
 def collection_scratch(collection_name):
-    """Striptease Scratch Card: scratch away tiles to reveal a hidden image, then identify it."""
+    """Striptease Scratch Card: scratch away tiles to reveal a hidden image, then identify it.
+    scratch.js asks /api/collections/<name>/images for card-sized thumb_urls."""
     collection = _safe_collection_name(collection_name)
-    return render_template('scratch.html', collection=collection)
+    return render_template('scratch.html', collection=collection, image_width=CARD_IMAGE_WIDTH)
 
 
 @app.route('/collection/<collection_name>/behindblur')
@@ -2836,6 +3944,72 @@ def api_set_admin(user_id):
         _release_db(conn)
     return jsonify({'success': True, 'is_admin': make_admin})
 
+@app.route('/api/admin/cache-stats')
+@admin_required
+def api_cache_stats():
+    """Hit/miss counters for the in-process caches."""
+    return jsonify({'success': True, 'b2_urls': _b2_url_cache.stats(),
+                    'image_catalog': _image_catalog.stats()})
+
+@app.route('/api/jobs')
+@admin_required
+def api_jobs():
+    """Recent background jobs, newest first (?status=queued|running|succeeded|failed, ?limit=N)."""
+    status = request.args.get('status')
+    if status and status not in JOB_STATUSES:
+        return jsonify({'success': False, 'error': 'Invalid status'}), 400
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit'}), 400
+    return jsonify({'success': True, 'jobs': _jobs.list(status=status, limit=limit)})
+
+@app.route('/api/jobs/<int:job_id>')
+@admin_required
+def api_job(job_id):
+    """One job's status, progress, result and error."""
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@socketio.on('job_subscribe')
+def job_subscribe(data):
+    """Join room job:<id> to receive 'job_update' events for that job (admins only)."""
+    if not current_user.is_authenticated or not current_user.is_admin:
+        return
+    try:
+        job_id = int((data or {}).get('job_id'))
+    except (TypeError, ValueError):
+        return
+    sio_join_room(f'job:{job_id}')
+    job = _jobs.get(job_id)
+    if job is not None:
+        emit('job_update', job)
+
+@socketio.on('upload_subscribe')
+def upload_subscribe(data):
+    """Join room upload:<upload_id> for a streaming video upload's progress
+    (admins only). Acknowledged with True once joined, so static/js/video-upload.js
+    starts the PUT only after it will receive every event."""
+    if not current_user.is_authenticated or not current_user.is_admin:
+        return False
+    upload_id = str((data or {}).get('upload_id') or '')[:64]
+    if not upload_id:
+        return False
+    sio_join_room(f'upload:{upload_id}')
+    return True
+
+@socketio.on('collection_subscribe')
+def collection_subscribe(data):
+    """Join room collection:<name> to receive 'image_tags' events as a
+    collection's images are auto-tagged (admins only)."""
+    if not current_user.is_authenticated or not current_user.is_admin:
+        return
+    safe_name = _safe_collection_name((data or {}).get('collection') or '')
+    if safe_name:
+        sio_join_room(f'collection:{safe_name}')
+
 # ── Admin: video collections & access control ─────────────────────────────────
 
 def _all_users_basic():
@@ -2985,6 +4159,7 @@ _vz_sid_room = {}   # socket id -> room_code, for disconnect cleanup
 VZ_ROUNDS_PER_MATCH = 5
 VZ_ANSWER_WINDOW = 14   # seconds players get to lock in a guess each round
 VZ_REVEAL_PAUSE = 5      # seconds the reveal stays up before the next round
+VZ_SNIPPET_PX = 512      # size of the canvas the snippet is drawn on (versuszoom.js)
 
 
 def _vz_gen_code():
@@ -2995,14 +4170,12 @@ def _vz_gen_code():
             return code
 
 
-def _vz_collection_images(collection):
-    tags_data = _load_tags()
-    prefix = f"{collection}/"
-    images = []
-    for key, value in tags_data.items():
-        if key.startswith(prefix) and isinstance(value, dict) and value.get('url'):
-            images.append({'filename': key[len(prefix):], 'url': _b2_sign_url(value['url'])})
-    return images
+def _vz_collection_images(collection, width=None):
+    entries = [(f, v) for f, v in _load_collection_images(collection).items() if v.get('url')]
+    urls = _b2_sign_urls([_image_key_for_width(v, width) for _filename, v in entries])
+    return [{'filename': filename, 'url': url, 'meta': _image_metadata(value),
+             'phash': (value.get('meta') or {}).get('phash')}
+            for (filename, value), url in zip(entries, urls)]
 
 
 def _vz_random_crop():
@@ -3042,7 +4215,10 @@ def _vz_start_round(room, code):
             'round': room['round'],
             'totalRounds': VZ_ROUNDS_PER_MATCH,
             'images': [pair[0]['url'], pair[1]['url']],
-            'yourCrop': {'imageUrl': pair[idx]['url'], 'box': crops[idx]},
+            # The snippet is cut server-side (/img), so only the crop is downloaded
+            'yourCrop': {'imageUrl': _proxy_image_url(room['collection'], pair[idx]['filename'],
+                                                      crop=crops[idx], w=VZ_SNIPPET_PX, h=VZ_SNIPPET_PX),
+                         'box': {'x': 0, 'y': 0, 'w': 1, 'h': 1}},
             'secondsLeft': VZ_ANSWER_WINDOW,
             'players': room['players'],
             'scores': room['scores'],
@@ -3113,7 +4289,8 @@ def vz_create(data):
     collection = _safe_collection_name(str(data.get('collection') or ''))
     username = str(data.get('username') or 'Player 1').strip()[:20] or 'Player 1'
     opponent_name = str(data.get('opponentUsername') or 'Player 2').strip()[:20] or 'Player 2'
-    images = _vz_collection_images(collection)
+    # The two choices are shown as cards; the snippet itself comes from /img
+    images = _vz_collection_images(collection, CARD_IMAGE_WIDTH)
     if len(images) < 4:
         emit('vz_error', {'message': 'This collection needs at least 4 images to play.'})
         return
@@ -3214,16 +4391,18 @@ def _mm_gen_code():
             return code
 
 
-def _mm_build_board(collection, num_images):
+def _mm_build_board(collection, num_images, card_width=None):
     """num_images is the count of *unique* images the host picked — the
     board itself has twice that many cards (each image appears as a pair)."""
-    images = _vz_collection_images(collection)
+    images = _vz_collection_images(collection, card_width)
     if len(images) < num_images:
-        return None, len(images)
-    chosen = random.sample(images, num_images)
+        return None, None, len(images)
+    # Skip near-duplicates so two "different" pairs never show the same photo
+    chosen = pick_distinct(random.sample(images, len(images)), num_images,
+                           lambda img: img['phash'], DUPLICATE_MAX_DISTANCE)
     board = [img['url'] for img in chosen] * 2
     random.shuffle(board)
-    return board, len(images)
+    return board, {img['url']: img['meta'] for img in chosen}, len(images)
 
 
 @socketio.on('mm_create')
@@ -3252,7 +4431,7 @@ def mm_create(data):
     if fit_mode not in ('fit', 'stretch'):
         fit_mode = 'fit'
 
-    board, available = _mm_build_board(collection, num_images)
+    board, board_meta, available = _mm_build_board(collection, num_images, card_width)
     if board is None:
         emit('mm_error', {'message': f'This collection only has {available} images available — pick {available} or fewer.'})
         return
@@ -3261,6 +4440,7 @@ def mm_create(data):
     _mm_rooms[code] = {
         'collection': collection,
         'board': board,
+        'board_meta': board_meta,   # url -> placeholder metadata, sent with each flip
         'card_width': card_width,
         'card_height': card_height,
         'fit_mode': fit_mode,
@@ -3333,7 +4513,9 @@ def mm_flip(data):
         return
 
     room['flipped'].append(index)
-    socketio.emit('mm_card_flipped', {'index': index, 'imageUrl': room['board'][index]}, room=code)
+    url = room['board'][index]
+    socketio.emit('mm_card_flipped', {'index': index, 'imageUrl': url,
+                                      'imageMeta': room.get('board_meta', {}).get(url, {})}, room=code)
 
     if len(room['flipped']) == 2:
         _mm_resolve_flip(room, code)
@@ -3489,11 +4671,9 @@ def _cc_gen_code():
 def _cc_collection_images(collection, keyword_map):
     """Images with at least 2 of the keyword_map's categories present —
     fewer than 2 would make the round a forced, uninformative "match"."""
-    tags_data = _load_tags()
-    prefix = f"{collection}/"
     eligible = []
-    for key, value in tags_data.items():
-        if not key.startswith(prefix) or not isinstance(value, dict) or not value.get('url'):
+    for filename, value in _load_collection_images(collection).items():
+        if not value.get('url'):
             continue
         body_parts = value.get('body_parts', {})
         if body_parts:
@@ -3507,7 +4687,7 @@ def _cc_collection_images(collection, keyword_map):
             tags = [str(t) for t in raw_tags if isinstance(t, (str, int, float))]
             options = _cc_categorize_tags(tags, keyword_map)
         if len(options) >= 2:
-            eligible.append({'filename': key[len(prefix):], 'url': _b2_sign_url(value['url']), 'options': options})
+            eligible.append({'filename': filename, 'url': _b2_sign_url(value['url']), 'options': options})
     return eligible
 
 
@@ -3718,6 +4898,14 @@ try:
 except Exception as _init_err:
     print(f"WARNING: DB init skipped: {_init_err}")
 
+# Cross-worker image-catalog invalidation (LISTEN/NOTIFY). Set
+# IMAGE_CATALOG_LISTEN=0 to rely on the TTL alone (e.g. in tests).
+if os.environ.get('IMAGE_CATALOG_LISTEN', '1') != '0':
+    socketio.start_background_task(_image_catalog_listener)
+
+# Background job workers (see "Background jobs" above); JOB_WORKERS=0 disables them.
+_jobs.start()
+
 # Pre-fetch Google's OIDC discovery document + JWKS now, at process startup,
 # instead of lazily on the first user's login click. Authlib only fetches
 # this once and caches it in-process — without pre-warming, whoever hits
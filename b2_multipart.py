@@ -0,0 +1,121 @@
+"""
+Streaming multipart uploads to B2.
+
+upload_fileobj() needs a seekable file, so a large request body used to be
+spooled to disk first and uploaded afterwards. StreamingUpload instead reads
+the body straight off the socket, one part at a time, and uploads parts on a
+small thread pool while the next one is being read:
+
+  * memory is bounded to about part_size * (concurrency + 1);
+  * a body smaller than one part goes up with a single PutObject;
+  * any failure aborts the multipart upload, so no orphaned parts are left
+    (and billed) in the bucket.
+
+Parts must be at least MIN_PART_SIZE, except the last one.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+def read_part(stream, size: int) -> bytes:
+    """Read up to `size` bytes, looping over short reads; b'' at end of stream."""
+    chunks, remaining = [], size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+class StreamingUpload:
+    """Upload a non-seekable stream to `key` (see module docstring).
+
+    on_progress(bytes_uploaded, parts_uploaded) is called after each part.
+    """
+
+    def __init__(self, s3, bucket: str, key: str, content_type: str = None,
+                 part_size: int = 16 * 1024 * 1024, concurrency: int = 4,
+                 on_progress: Callable[[int, int], None] = None):
+        self._s3 = s3
+        self._bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = max(MIN_PART_SIZE, int(part_size))
+        self.concurrency = max(1, int(concurrency))
+        self._on_progress = on_progress
+        self._lock = threading.Lock()
+        self.bytes_uploaded = 0
+        self.parts_uploaded = 0
+
+    def _extra(self) -> Dict:
+        return {'ContentType': self.content_type} if self.content_type else {}
+
+    def _uploaded(self, size: int):
+        with self._lock:
+            self.bytes_uploaded += size
+            self.parts_uploaded += 1
+            done = (self.bytes_uploaded, self.parts_uploaded)
+        if self._on_progress:
+            self._on_progress(*done)
+
+    def upload(self, stream) -> Dict:
+        """Consume `stream` to EOF; returns {'key', 'bytes', 'parts'}."""
+        first = read_part(stream, self.part_size)
+        second = read_part(stream, self.part_size) if len(first) == self.part_size else b''
+        if not second:
+            self._s3.put_object(Bucket=self._bucket, Key=self.key, Body=first, **self._extra())
+            self._uploaded(len(first))
+            return {'key': self.key, 'bytes': len(first), 'parts': 1}
+
+        upload_id = self._s3.create_multipart_upload(
+            Bucket=self._bucket, Key=self.key, **self._extra())['UploadId']
+        try:
+            parts = self._upload_parts(upload_id, stream, [first, second])
+            self._s3.complete_multipart_upload(
+                Bucket=self._bucket, Key=self.key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts})
+        except BaseException:
+            try:
+                self._s3.abort_multipart_upload(Bucket=self._bucket, Key=self.key, UploadId=upload_id)
+            except Exception as e:
+                print(f"[b2] Could not abort multipart upload of {self.key}: {e}")
+            raise
+        return {'key': self.key, 'bytes': self.bytes_uploaded, 'parts': len(parts)}
+
+    def _upload_parts(self, upload_id: str, stream, first_parts) -> list:
+        # At most `concurrency` parts in flight plus the one being read
+        slots = threading.BoundedSemaphore(self.concurrency)
+
+        def put(number: int, body: bytes):
+            try:
+                response = self._s3.upload_part(Bucket=self._bucket, Key=self.key, UploadId=upload_id,
+                                                PartNumber=number, Body=body)
+                self._uploaded(len(body))
+                return {'PartNumber': number, 'ETag': response['ETag']}
+            finally:
+                slots.release()
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            number, pending = 0, list(first_parts)
+            while True:
+                body = pending.pop(0) if pending else read_part(stream, self.part_size)
+                if not body:
+                    break
+                number += 1
+                if number > MAX_PARTS:
+                    raise ValueError(f'Upload exceeds {MAX_PARTS} parts of {self.part_size} bytes')
+                slots.acquire()
+                futures.append(pool.submit(put, number, body))
+                failed = next((f for f in futures if f.done() and f.exception()), None)
+                if failed is not None:
+                    break
+            # result() re-raises the first part failure, if any
+            return [f.result() for f in futures]
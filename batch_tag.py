@@ -1,146 +1,121 @@
 """
 Batch tagging utility for existing images in collections.
-Re-analyzes all images and updates their tags.
+
+Retags every unlocked image of the given collections (default: all of them)
+straight from B2 and writes the tags to Postgres — the same pipeline as the
+app's retag-all job (retag.py), for running by hand from a shell.
+
+Images go to the warm tagger service (tagger_service.py) when one is running,
+otherwise the models are loaded in this process. Either way results are
+cached by content hash (tag_cache.py).
+
+Required env vars (same names the app itself uses):
+    DATABASE_URL (or INTERNAL_POSTGRES_DATABASE_URL)
+    B2_KEY_ID, B2_APPLICATION_KEY, B2_BUCKET, B2_ENDPOINT_URL
+
+Usage:
+    python batch_tag.py [collection ...] [--local] [--no-cache]
 """
 
+import json
 import os
 import sys
-import json
-from pathlib import Path
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from image_tagger import analyze_image
-
-UPLOAD_FOLDER = os.path.join('static', 'uploads')
-TAGS_FILE = os.path.join('data', 'tags.json')
-ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
-
-def load_tags():
-    """Load existing tags."""
-    if os.path.exists(TAGS_FILE):
-        try:
-            with open(TAGS_FILE, 'r') as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
-
-def save_tags(tags):
-    """Save tags to file."""
-    os.makedirs(os.path.dirname(TAGS_FILE), exist_ok=True)
-    with open(TAGS_FILE, 'w') as f:
-        json.dump(tags, f, indent=2)
-
-def get_image_key(collection, filename):
-    """Generate image key for storage."""
-    return f"{collection}/{filename}" if collection else filename
-
-def find_all_images():
-    """Find all images in upload folder."""
-    images = []
-    
-    if not os.path.exists(UPLOAD_FOLDER):
-        return images
-    
-    # Check root level
-    for file in os.listdir(UPLOAD_FOLDER):
-        filepath = os.path.join(UPLOAD_FOLDER, file)
-        if os.path.isfile(filepath):
-            ext = os.path.splitext(file)[1].lower()
-            if ext in ALLOWED_EXTENSIONS:
-                images.append(('', file, filepath))
-    
-    # Check collections (subdirectories)
-    for collection in os.listdir(UPLOAD_FOLDER):
-        collection_path = os.path.join(UPLOAD_FOLDER, collection)
-        if os.path.isdir(collection_path):
-            for file in os.listdir(collection_path):
-                filepath = os.path.join(collection_path, file)
-                if os.path.isfile(filepath):
-                    ext = os.path.splitext(file)[1].lower()
-                    if ext in ALLOWED_EXTENSIONS:
-                        images.append((collection, file, filepath))
-    
-    return images
-
-def batch_tag_images(force_retag=False):
-    """Tag all images in the upload folder."""
-    print("\n" + "="*70)
-    print("Batch Image Tagging Utility")
-    print("="*70 + "\n")
-    
-    # Load existing tags
-    all_tags = load_tags()
-    print(f"Loaded {len(all_tags)} existing image tags")
-    
-    # Find all images
-    images = find_all_images()
-    print(f"Found {len(images)} images in upload folder\n")
-    
-    if not images:
-        print("No images found. Upload some images first!")
-        return
-    
-    # Process each image
-    tagged_count = 0
-    skipped_count = 0
-    error_count = 0
-    
-    for i, (collection, filename, filepath) in enumerate(images, 1):
-        image_key = get_image_key(collection, filename)
-        display_name = f"{collection}/{filename}" if collection else filename
-        
-        # Skip if already tagged (unless force_retag)
-        if not force_retag and image_key in all_tags:
-            print(f"[{i}/{len(images)}] Skipped (already tagged): {display_name}")
-            skipped_count += 1
-            continue
-        
-        try:
-            print(f"[{i}/{len(images)}] Analyzing: {display_name}...", end=' ')
-            
-            # Analyze image
-            tags_result = analyze_image(filepath, top_k=8, threshold=0.15)
-            tags = [t['tag'] for t in tags_result]
-            
-            if tags:
-                all_tags[image_key] = {
-                    'tags': tags,
-                    'detailed': tags_result
-                }
-                tagged_count += 1
-                print(f"Tagged: {', '.join(tags[:3])}{'...' if len(tags) > 3 else ''}")
-            else:
-                print("No tags generated")
-                error_count += 1
-                
-        except Exception as e:
-            print(f"Error: {e}")
-            error_count += 1
-    
-    # Save updated tags
-    if tagged_count > 0:
-        save_tags(all_tags)
-        print(f"\nSaved tags to {TAGS_FILE}")
-    
-    # Summary
-    print("\n" + "="*70)
-    print("Summary:")
-    print(f"  Total images:     {len(images)}")
-    print(f"  Newly tagged:     {tagged_count}")
-    print(f"  Skipped:          {skipped_count}")
-    print(f"  Errors:           {error_count}")
-    print("="*70 + "\n")
+from retag import CollectionRetag
+from tagger_service import TaggerClient
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+# Same settings as the app's retag job (app.RETAG_TOP_K / RETAG_THRESHOLD)
+TOP_K = 8
+THRESHOLD = 0.15
+BATCH_SIZE = int(os.environ.get('RETAG_BATCH_SIZE', 32))
+
+
+def notify_catalog(cur, collection):
+    """Tell running app workers to reload the collection (app._notify_image_catalog)."""
+    cur.execute("SELECT pg_notify(%s, %s)",
+                ('image_catalog', json.dumps({'origin': 'batch_tag', 'collection': collection})))
+
+
+def make_tagger(use_service=True, use_cache=True):
+    """tag_images(images, collection) via the tagger service, or in-process."""
+    client = TaggerClient()
+    if use_service and client.available():
+        print(f"Using tagger service at {client.socket_path}")
+        return lambda images, collection: client.tag_images(
+            images, collection=collection, top_k=TOP_K, threshold=THRESHOLD)
+
+    from image_tagger import analyze_images
+    from tag_cache import TagCache
+    print("No tagger service running; loading models in this process")
+    cache = TagCache() if use_cache else None
+    return lambda images, collection: analyze_images(
+        images, top_k=TOP_K, threshold=THRESHOLD, cache=cache, collection=collection)
+
+
+def batch_tag_collections(collections=None, use_service=True, use_cache=True):
+    """Retag the given collections (all when None)."""
+    import boto3
+    import psycopg2
+
+    db_url = os.environ.get('INTERNAL_POSTGRES_DATABASE_URL') or os.environ.get('DATABASE_URL', '')
+    b2 = {k: os.environ.get(k, '') for k in ('B2_KEY_ID', 'B2_APPLICATION_KEY', 'B2_BUCKET', 'B2_ENDPOINT_URL')}
+    if not db_url:
+        sys.exit("DATABASE_URL (or INTERNAL_POSTGRES_DATABASE_URL) is not set.")
+    if not all(b2.values()):
+        sys.exit("B2_KEY_ID, B2_APPLICATION_KEY, B2_BUCKET, and B2_ENDPOINT_URL must all be set.")
+
+    s3 = boto3.client('s3', endpoint_url=b2['B2_ENDPOINT_URL'],
+                      aws_access_key_id=b2['B2_KEY_ID'], aws_secret_access_key=b2['B2_APPLICATION_KEY'])
+    conn = psycopg2.connect(db_url)
+    try:
+        if not collections:
+            cur = conn.cursor()
+            cur.execute("SELECT name FROM collections ORDER BY name")
+            collections = [row[0] for row in cur.fetchall()]
+        tag = make_tagger(use_service, use_cache)
+
+        def report(p):
+            print(f"  {p['collection']}: {p['done']}/{p['total']} "
+                  f"(tagged {p['tagged']}, untagged {p['untagged']}, locked {p['locked']})")
+
+        print("\n" + "=" * 70)
+        print("Batch Image Tagging Utility")
+        print("=" * 70 + "\n")
+        totals = {'total': 0, 'tagged': 0, 'untagged': 0, 'locked': 0}
+        for collection in collections:
+            print(f"Retagging {collection}...")
+            result = CollectionRetag(
+                s3, b2['B2_BUCKET'], lambda: conn, lambda _conn: None,
+                lambda images, c=collection: tag(images, c), collection,
+                batch_size=BATCH_SIZE, notify=notify_catalog, on_progress=report,
+            ).run()
+            for key in totals:
+                totals[key] += result[key]
+
+        print("\n" + "=" * 70)
+        print("Summary:")
+        print(f"  Collections:      {len(collections)}")
+        print(f"  Images retagged:  {totals['tagged']} of {totals['total']}")
+        print(f"  No tags / errors: {totals['untagged']}")
+        print(f"  Locked (skipped): {totals['locked']}")
+        print("=" * 70 + "\n")
+    finally:
+        conn.close()
+
 
 if __name__ == "__main__":
-    force = '--force' in sys.argv or '-f' in sys.argv
-    
-    if force:
-        print("\nForce mode enabled - will re-tag all images\n")
-    
+    args = [a for a in sys.argv[1:] if not a.startswith('-')]
     try:
-        batch_tag_images(force_retag=force)
+        batch_tag_collections(args or None, use_service='--local' not in sys.argv,
+                              use_cache='--no-cache' not in sys.argv)
     except KeyboardInterrupt:
         print("\n\nInterrupted by user\n")
     except Exception as e:
@@ -0,0 +1,561 @@
+"""
+Benchmarks for the app's hot paths.
+
+Each benchmark is a plain function registered in BENCHMARKS and prints a small
+results table. Benchmarks that need Postgres read the same DATABASE_URL (or
+INTERNAL_POSTGRES_DATABASE_URL) the app uses and work inside a throwaway schema
+that is dropped afterwards, so they never touch real data.
+
+Usage:
+    python benchmarks.py --list
+    python benchmarks.py <name> [--repeat N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def _timeit(fn, repeat):
+    """Median wall time of fn() in milliseconds over `repeat` runs (after one warm-up)."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _bench_db_connection():
+    """Open a direct connection with search_path pointed at a fresh scratch schema."""
+    import psycopg2
+    db_url = os.environ.get('INTERNAL_POSTGRES_DATABASE_URL') or os.environ.get('DATABASE_URL', '')
+    if not db_url:
+        sys.exit("DATABASE_URL (or INTERNAL_POSTGRES_DATABASE_URL) is not set.")
+    conn = psycopg2.connect(db_url)
+    conn.autocommit = True
+    schema = f"bench_{os.getpid()}"
+    cur = conn.cursor()
+    cur.execute(f"CREATE SCHEMA {schema}")
+    cur.execute(f"SET search_path TO {schema}")
+    cur.execute("""
+        CREATE TABLE images (
+            id              SERIAL PRIMARY KEY,
+            collection_name VARCHAR(255) NOT NULL,
+            filename        VARCHAR(500) NOT NULL,
+            url             TEXT NOT NULL,
+            tags            TEXT[]  DEFAULT '{}',
+            locked          BOOLEAN DEFAULT FALSE,
+            body_parts      JSONB DEFAULT '{}'::jsonb,
+            created_at      TIMESTAMPTZ DEFAULT NOW(),
+            UNIQUE(collection_name, filename)
+        )
+    """)
+    return conn, schema
+
+
+def _drop_bench_schema(conn, schema):
+    try:
+        conn.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+    finally:
+        conn.close()
+
+
+def _seed_images(conn, collection, count, start=0):
+    import psycopg2.extras
+    rows = [
+        (collection, f"{i:08d}.jpg", f"{collection}/{i:08d}.jpg", ['solo', 'outdoor', f't{i % 50}'])
+        for i in range(start, start + count)
+    ]
+    psycopg2.extras.execute_values(
+        conn.cursor(),
+        "INSERT INTO images (collection_name, filename, url, tags) VALUES %s",
+        rows, page_size=5000
+    )
+    conn.cursor().execute("ANALYZE images")
+
+
+@benchmark('collection-query')
+def bench_collection_query(repeat):
+    """Per-collection load: legacy full-table scan + prefix filter vs image_queries.
+
+    The target collection stays at 500 images while the *other* collections
+    grow; the scoped query should stay flat, the legacy scan should not.
+    """
+    import image_queries
+
+    conn, schema = _bench_db_connection()
+    try:
+        _seed_images(conn, 'target', 500)
+
+        def legacy():
+            data = image_queries.all_images(conn)
+            return {k: v for k, v in data.items() if k.startswith('target/')}
+
+        def scoped():
+            return image_queries.collection_images(conn, 'target')
+
+        print(f"{'other rows':>12} {'legacy ms':>12} {'scoped ms':>12}")
+        seeded = 0
+        for other_rows in (0, 10_000, 50_000):
+            _seed_images(conn, 'other', other_rows - seeded, start=seeded)
+            seeded = other_rows
+            assert len(legacy()) == len(scoped()) == 500
+            print(f"{other_rows:>12} {_timeit(legacy, repeat):>12.2f} {_timeit(scoped, repeat):>12.2f}")
+    finally:
+        _drop_bench_schema(conn, schema)
+
+
+@benchmark('presign')
+def bench_presign(repeat, count=10_000):
+    """Per-URL presign cost at 10k keys: boto3 generate_presigned_url vs SigV4Presigner."""
+    import boto3
+    from b2_signing import SigV4Presigner
+
+    endpoint, bucket, region = 'https://s3.us-west-004.backblazeb2.com', 'gamecum-media', 'us-west-004'
+    keys = [f"Real/{i:08d}-{i * 7919 % 100003}.jpg" for i in range(count)]
+    client = boto3.client('s3', endpoint_url=endpoint, region_name=region,
+                          aws_access_key_id='bench-key', aws_secret_access_key='bench-secret')
+    presigner = SigV4Presigner(endpoint, bucket, 'bench-key', 'bench-secret', region)
+
+    def botocore_loop():
+        for key in keys:
+            client.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key},
+                                          ExpiresIn=21600)
+
+    def local_batch():
+        presigner.presign_get(keys, 21600)
+
+    boto_ms = _timeit(botocore_loop, repeat)
+    local_ms = _timeit(local_batch, repeat)
+    print(f"{'signer':<22} {'total ms':>10} {'us / URL':>10}")
+    print(f"{'botocore (per key)':<22} {boto_ms:>10.1f} {boto_ms * 1000 / count:>10.2f}")
+    print(f"{'SigV4Presigner batch':<22} {local_ms:>10.1f} {local_ms * 1000 / count:>10.2f}")
+    print(f"speed-up: {boto_ms / local_ms:.1f}x")
+
+
+@benchmark('tag-index')
+def bench_tag_index(repeat, count=50_000):
+    """Tag AND/OR filter at 50k images: legacy per-image list scan vs TagIndex postings."""
+    from tag_index import TagIndex, page_keys
+
+    images = {
+        (f"c{i % 20}", f"{i:08d}.jpg"): ['solo', f't{i % 50}', f'u{i % 7}', f'v{i % 300}']
+        for i in range(count)
+    }
+    index = TagIndex()
+    for (coll, fname), tags in images.items():
+        index.add(coll, fname, tags)
+    queries = [(['t3', 'u2'], True), (['v10', 'v20', 'v30'], False), (['solo', 't7'], True)]
+
+    def legacy():
+        for wanted, match_all in queries:
+            test = all if match_all else any
+            [key for key, tags in images.items() if test(tag in tags for tag in wanted)]
+
+    def indexed():
+        for wanted, match_all in queries:
+            page_keys(index.match(wanted, match_all=match_all), limit=60)
+
+    legacy_ms = _timeit(legacy, repeat)
+    indexed_ms = _timeit(indexed, repeat)
+    print(f"{'path':<22} {'ms / 3 queries':>16}")
+    print(f"{'legacy scan':<22} {legacy_ms:>16.2f}")
+    print(f"{'TagIndex + page':<22} {indexed_ms:>16.2f}")
+    print(f"speed-up: {legacy_ms / indexed_ms:.1f}x")
+
+
+class _SyntheticImagesConn:
+    """Stand-in psycopg2 connection serving `rows` generated images to the
+    image_queries SQL (full scan, keyset page, named-cursor scan), materialising
+    rows only as fetchall()/fetchmany() would."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def _generate(self, after=None, limit=None):
+        start = 0
+        if after is not None:
+            start = next((i + 1 for i in range(self.rows) if self._key(i) == tuple(after)), self.rows)
+        stop = self.rows if limit is None else min(self.rows, start + limit)
+        for i in range(start, stop):
+            coll, fname = self._key(i)
+            yield coll, fname, f"{coll}/{fname}", ['solo', 'outdoor', f't{i % 50}'], False, {}
+
+    @staticmethod
+    def _key(i):
+        return f"c{i // 2500:02d}", f"{i:08d}.jpg"
+
+    def cursor(self, *a, **kw):
+        conn = self
+
+        class _Cur:
+            itersize = 2000
+            _rows = iter(())
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, params=()):
+                if 'FROM collections' in sql or 'FROM images' not in sql:
+                    self._rows = iter(())
+                    return
+                params = list(params or ())
+                limit = params.pop() if 'LIMIT' in sql else None
+                after = params[-2:] if '>' in sql else None
+                self._rows = conn._generate(after, limit)
+
+            def fetchall(self):
+                return list(self._rows)
+
+            def fetchmany(self, size):
+                return [row for _, row in zip(range(size), self._rows)]
+
+        return _Cur()
+
+
+def _catalog_stream_child(path, rows, repeat):
+    """Runs in a fresh interpreter: one request to `path` against a synthetic
+    images table, printing JSON with TTFB / total time and peak RSS growth."""
+    import contextlib
+    import io
+    import json
+    import resource
+
+    os.environ.update({
+        'IMAGE_CATALOG_LISTEN': '0', 'DATABASE_URL': '', 'B2_URL_CACHE_SIZE': '0',
+        'B2_ENDPOINT_URL': 'https://s3.us-west-004.backblazeb2.com', 'B2_BUCKET': 'gamecum-media',
+        'B2_KEY_ID': 'bench-key', 'B2_APPLICATION_KEY': 'bench-secret',
+    })
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+    conn = _SyntheticImagesConn(rows)
+    app_module._get_db = lambda: conn
+    app_module._release_db = lambda c: None
+    app_module._load_collections = lambda: []
+    app_module._image_catalog.all_images()   # the buffered path reads a warm catalog in production
+    client = app_module.app.test_client()
+
+    def request_once():
+        start = time.perf_counter()
+        response = client.get(path, buffered=False)
+        chunks = iter(response.response)
+        size = len(next(chunks, b''))
+        ttfb = time.perf_counter() - start
+        size += sum(len(chunk) for chunk in chunks)
+        response.close()
+        return ttfb * 1000, (time.perf_counter() - start) * 1000, size
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ttfb, total, size = request_once()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = [request_once() for _ in range(repeat)]
+    print(json.dumps({
+        'ttfb_ms':  statistics.median([ttfb] + [t[0] for t in timings]),
+        'total_ms': statistics.median([total] + [t[1] for t in timings]),
+        'rss_mb':   (peak_kb - baseline_kb) / 1024,
+        'bytes':    size,
+    }))
+
+
+@benchmark('catalog-stream')
+def bench_catalog_stream(repeat, rows=50_000):
+    """Peak RSS growth and TTFB of the catalog endpoints at 50k rows: buffered vs page vs stream.
+
+    Each measurement runs in its own interpreter (peak RSS is a process-wide
+    high-water mark) against a synthetic images table, with the local presigner
+    signing and the URL cache disabled so every mode signs every URL it returns.
+    """
+    import json
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'request':<34} {'TTFB ms':>9} {'total ms':>9} {'peak RSS +MB':>13} {'KB out':>9}")
+    for endpoint in ('/api/tags', '/api/collections', '/api/images'):
+        for label, query in (('buffered', ''), ('page of 1000', '?limit=1000'), ('stream', '?stream=1')):
+            out = subprocess.run(
+                [sys.executable, '-c',
+                 f"import benchmarks; benchmarks._catalog_stream_child({endpoint + query!r}, {rows}, {repeat})"],
+                cwd=here, capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            r = json.loads(out)
+            print(f"{endpoint + ' ' + label:<34} {r['ttfb_ms']:>9.1f} {r['total_ms']:>9.1f} "
+                  f"{r['rss_mb']:>13.1f} {r['bytes'] / 1024:>9.0f}")
+
+
+def _synthetic_images(directory, count, size=(640, 480)):
+    """Write `count` noise JPEGs into directory; returns their paths."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        pixels = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+        path = os.path.join(directory, f"{i:04d}.jpg")
+        Image.fromarray(pixels).save(path, quality=85)
+        paths.append(path)
+    return paths
+
+
+@benchmark('tagger-batch')
+def bench_tagger_batch(repeat, count=32, batch_sizes=(1, 2, 4, 8, 16)):
+    """Images/sec of analyze_images on CPU for the configured tagger backend vs batch size."""
+    import tempfile
+    import image_tagger
+
+    backend = image_tagger._split_backend(image_tagger._backend_for(''))[0]
+    if backend == 'wd14' and not image_tagger._wd14_ready():
+        backend = 'clip'
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = _synthetic_images(tmp, count)
+        loaders = {
+            'clip': image_tagger._load_clip_model,
+            'blip': image_tagger._load_blip_models,
+            'wd14': lambda: image_tagger._load_wd14(image_tagger._config['model_path'],
+                                                    image_tagger._config['labels_path']),
+        }
+        try:
+            loaders[backend]()   # load the model outside the timings
+        except ImportError as e:
+            sys.exit(f"Tagger backend {backend!r} is not installed: {e}")
+        print(f"backend: {backend}, {count} images of 640x480")
+        print(f"{'batch size':>10} {'ms total':>10} {'images/sec':>11}")
+        for batch_size in batch_sizes:
+            ms = _timeit(lambda: image_tagger.analyze_images(paths, batch_size=batch_size), repeat)
+            print(f"{batch_size:>10} {ms:>10.0f} {count * 1000 / ms:>11.1f}")
+
+
+@benchmark('clip-text-cache')
+def bench_clip_text_cache(repeat, count=8):
+    """Per-image CLIP tagging: re-encoding every ALL_TAGS prompt vs cached text embeddings."""
+    import tempfile
+    import image_tagger
+    from PIL import Image
+
+    try:
+        model, processor = image_tagger._load_clip_model()
+    except ImportError as e:
+        sys.exit(f"CLIP is not installed: {e}")
+    torch = image_tagger._torch
+    prompts = image_tagger._clip_prompts()
+    with tempfile.TemporaryDirectory() as tmp:
+        images = [Image.open(p).convert('RGB') for p in _synthetic_images(tmp, count)]
+
+    def full_forward():
+        # What _analyze_clip did before: text + image towers for every image
+        for image in images:
+            inputs = processor(text=prompts, images=image, return_tensors="pt", padding=True)
+            with torch.no_grad():
+                model(**inputs).logits_per_image.softmax(dim=1)
+
+    def cached_text():
+        for image in images:
+            image_tagger._clip_batch([image])
+
+    image_tagger._clip_text_side()
+    before = _timeit(full_forward, repeat) / count
+    after = _timeit(cached_text, repeat) / count
+    print(f"{len(prompts)} prompts, {count} images")
+    print(f"{'path':<26} {'ms / image':>11}")
+    print(f"{'text + image towers':<26} {before:>11.1f}")
+    print(f"{'cached text embeddings':<26} {after:>11.1f}")
+    print(f"speed-up: {before / after:.1f}x")
+
+
+class _FakeOnnxSession:
+    """onnxruntime.InferenceSession stand-in returning fixed random logits, so the
+    WD14 pre/post-processing is timed without a model."""
+
+    def __init__(self, n_labels, max_batch=64):
+        import numpy as np
+        self._logits = np.random.default_rng(0).normal(-4.0, 2.0, (max_batch, n_labels)).astype(np.float32)
+
+    def get_inputs(self):
+        import types
+        return [types.SimpleNamespace(name='input', shape=['N', 448, 448, 3])]
+
+    def run(self, outputs, feeds):
+        return [self._logits[:feeds['input'].shape[0]]]
+
+
+@benchmark('wd14-postprocess')
+def bench_wd14_postprocess(repeat, n_labels=9000, count=16):
+    """WD14 preprocess + sigmoid/threshold/top-k per image (fake ONNX session, ~9k labels):
+    per-label Python loop vs vectorized batch."""
+    import numpy as np
+    from unittest.mock import patch
+    from PIL import Image
+    import image_tagger
+
+    labels = [f"tag_{i}" for i in range(n_labels)] + sorted(image_tagger.FILTERED_TAGS)
+    session = _FakeOnnxSession(len(labels))
+    images = [Image.fromarray(np.random.default_rng(i).integers(0, 256, (480, 640, 3), dtype=np.uint8))
+              for i in range(count)]
+
+    def legacy():
+        # _preprocess_wd14 / _analyze_wd14 / analyze_image before vectorizing
+        for image in images:
+            img = image.convert('RGB').resize((448, 448), Image.BICUBIC)
+            arr = np.asarray(img).astype('float32') / 255.0
+            arr = ((arr - 0.5) / 0.5)[None, :, :, :]
+            logits = session.run(None, {'input': arr})[0].reshape(-1)
+            conf = 1 / (1 + np.exp(-logits))
+            results = []
+            for idx, p in enumerate(conf):
+                p = float(p)
+                if p >= 0.35 and idx < len(labels):
+                    results.append({'tag': labels[idx], 'confidence': round(p, 3)})
+            results.sort(key=lambda x: x['confidence'], reverse=True)
+            [r for r in results[:20] if r['tag'] not in image_tagger.FILTERED_TAGS][:10]
+
+    def vectorized():
+        image_tagger._wd14_batch([image_tagger._wd14_pixels(image) for image in images],
+                                 top_k=10, threshold=0.35)
+
+    with patch.object(image_tagger, '_load_wd14', lambda m, l: (session, labels)):
+        legacy_ms = _timeit(legacy, repeat) / count
+        vector_ms = _timeit(vectorized, repeat) / count
+
+        # Post-processing alone (no resize), where the per-label loop lives
+        logits = session.run(None, {'input': np.empty((count, 1))})[0]
+        keep = image_tagger._wd14_keep_mask(labels)
+
+        def loop_post():
+            for row in logits:
+                conf = 1 / (1 + np.exp(-row))
+                sorted(({'tag': labels[i], 'confidence': round(float(p), 3)}
+                        for i, p in enumerate(conf) if p >= 0.35), key=lambda x: x['confidence'])
+
+        def vector_post():
+            probs = 1 / (1 + np.exp(-logits))
+            for row in probs:
+                image_tagger._rank_wd14(row, labels, keep, 10, 0.35)
+
+        loop_ms = _timeit(loop_post, repeat) / count
+        vpost_ms = _timeit(vector_post, repeat) / count
+
+    print(f"{len(labels)} labels, {count} images of 640x480")
+    print(f"{'stage':<28} {'loop ms/img':>12} {'vector ms/img':>14}")
+    print(f"{'post-process only':<28} {loop_ms:>12.3f} {vpost_ms:>14.3f}")
+    print(f"{'preprocess + post-process':<28} {legacy_ms:>12.3f} {vector_ms:>14.3f}")
+
+
+@benchmark('tagger-variants')
+def bench_tagger_variants(repeat, count=32):
+    """CPU images/sec and tag agreement vs fp32 of the INT8 / ONNX CLIP and BLIP variants."""
+    import tempfile
+    import image_tagger
+
+    image_dir = os.environ.get('TAGGER_BENCH_IMAGES')
+    with tempfile.TemporaryDirectory() as tmp:
+        if image_dir:
+            # Agreement on synthetic noise says little; point this at real photos
+            paths = sorted(os.path.join(image_dir, f) for f in os.listdir(image_dir)
+                           if f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))[:count]
+        else:
+            paths = _synthetic_images(tmp, count)
+        for reference in ('clip', 'blip'):
+            variants = [f'{reference}-{v}' for v in image_tagger.BACKEND_VARIANTS[reference] if v]
+            try:
+                report = image_tagger.compare_backends(paths, variants, reference=reference)
+            except ImportError as e:
+                sys.exit(f"Tagger backend {reference!r} is not installed: {e}")
+            print(f"{len(paths)} images, reference: {reference} (fp32)")
+            print(f"{'backend':<16} {'images/sec':>11} {'jaccard':>8} {'top-1':>6}")
+            for name, row in report.items():
+                print(f"{name:<16} {row['images_per_sec']:>11.2f} {row['jaccard']:>8.3f} {row['top1']:>6.3f}")
+
+
+@benchmark('wd14-ort-options')
+def bench_wd14_ort_options(repeat):
+    """WD14 session load time and latency across onnxruntime thread / optimization settings."""
+    import image_tagger
+
+    if not image_tagger._wd14_ready():
+        sys.exit("WD14 model/labels are not configured (python image_tagger.py --set-wd14 ...).")
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        sys.exit(f"onnxruntime is not installed: {e}")
+    for batch_size in (1, 8):
+        print(f"batch size {batch_size}:")
+        image_tagger._print_ort_benchmark(image_tagger.benchmark_ort_options(
+            image_tagger._config['model_path'], batch_size=batch_size, runs=repeat))
+
+
+
+@benchmark('image-proxy')
+def bench_image_proxy(repeat):
+    """/img render latency for a 4000x3000 JPEG: client-style full decode + crop vs
+    proxy cold (fetch + decode), warm source (mmap) and cached output."""
+    import io
+    import tempfile
+    from PIL import Image
+    from image_proxy import DiskLRU, ImageProxy
+
+    buf = io.BytesIO()
+    Image.effect_noise((4000, 3000), 64).convert('RGB').save(buf, 'JPEG', quality=90)
+    original = buf.getvalue()
+    crop = (0.3, 0.3, 0.25, 0.25)
+
+    def full_decode_and_crop():
+        with Image.open(io.BytesIO(original)) as img:
+            img.load()
+            img.crop((1200, 900, 2200, 1650)).resize((512, 384))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proxy = ImageProxy(lambda key: original, DiskLRU(tmp, 1 << 30))
+        counter = iter(range(10 ** 6))
+        cold = _timeit(lambda: proxy.render(f'k{next(counter)}', 512, 512, crop), repeat)
+        proxy.render('warm', 512, 512, crop)
+        sizes = iter(range(100, 10 ** 6))
+        warm_source = _timeit(lambda: proxy.render('warm', next(sizes), None, crop), repeat)
+        cached = _timeit(lambda: proxy.render('warm', 512, 512, crop), repeat)
+    print(f"original: {len(original) / 1e6:.1f} MB")
+    print(f"{'path':<28} {'ms':>9}")
+    for name, ms in (('full decode + crop', _timeit(full_decode_and_crop, repeat)),
+                     ('proxy cold', cold), ('proxy warm source', warm_source), ('proxy cached output', cached)):
+        print(f"{name:<28} {ms:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('name', nargs='?', help='benchmark to run')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per measurement')
+    parser.add_argument('--list', action='store_true', help='list available benchmarks')
+    args = parser.parse_args()
+
+    if args.list or not args.name:
+        for name, fn in BENCHMARKS.items():
+            print(f"  {name:<24} {(fn.__doc__ or '').strip().splitlines()[0]}")
+        return
+    if args.name not in BENCHMARKS:
+        sys.exit(f"Unknown benchmark {args.name!r} — see --list")
+    BENCHMARKS[args.name](args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""
+Resumable collection rename.
+
+A rename moves every image / video object from '<old>/' to '<new>/' in B2 and
+repoints the rows. It runs in three phases, recorded in the collection_renames
+table so an interrupted rename picks up where it stopped when it is re-run:
+
+  copying  server-side CopyObject of each object on a bounded thread pool.
+           On resume, keys already present under the new prefix are skipped.
+           Rows whose source object no longer exists are counted as missing
+           and dropped at commit, rather than repointed at a key that was
+           never written.
+  cleanup  entered by a single transaction that moves the rows with set-based
+           UPDATEs and drops the old collection; the old keys are then removed
+           with batched DeleteObjects calls (up to 1000 keys per request).
+           The transaction locks the old collection row, which holds off new
+           uploads into it, and only moves rows whose objects were copied. If
+           uploads arrived during the copy, it backs out, copies those too and
+           tries again (up to COMMIT_ROUNDS times).
+           Image derivatives (thumbs/<old>/, see thumbnails.py) are not copied:
+           the rows forget them and they are deleted with the old keys, to be
+           rebuilt by the next thumbnail backfill.
+  done     the collection_renames row is deleted.
+
+Nothing in the database changes until every copy has succeeded, so a failed
+rename leaves the old collection fully intact and readable.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List
+
+# DeleteObjects accepts at most 1000 keys per request.
+DELETE_BATCH = 1000
+# Commit attempts before giving up on a collection that keeps receiving uploads.
+COMMIT_ROUNDS = 5
+
+
+class RenameError(Exception):
+    """A rename step failed; the rename can be resumed by running it again."""
+
+
+class CollectionRename:
+    """Move collection `old` to `new` (see module docstring).
+
+    get_db / release_db borrow and return a pooled connection; notify(cur,
+    collection) is called inside the commit transaction for each collection
+    touched; on_progress(progress_dict) is called as the rename advances.
+    """
+
+    def __init__(self, s3, bucket: str, get_db: Callable, release_db: Callable,
+                 old: str, new: str, workers: int = 8,
+                 notify: Callable = None, on_progress: Callable[[Dict], None] = None,
+                 progress_interval: float = 1.0):
+        self._s3 = s3
+        self._bucket = bucket
+        self._get_db = get_db
+        self._release_db = release_db
+        self.old = old
+        self.new = new
+        self.workers = max(1, int(workers))
+        self._notify = notify
+        self._on_progress = on_progress
+        self._progress_interval = progress_interval
+        self._last_report = 0.0
+        self.progress = {'old_name': old, 'new_name': new, 'phase': 'copying',
+                         'total': 0, 'copied': 0, 'missing': 0, 'deleted': 0}
+        self.missing = []   # filenames whose source object was gone at copy time
+
+    # ── State ────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def pending(conn, old: str = None) -> List[Dict]:
+        """Unfinished renames (optionally just the one for `old`)."""
+        cur = conn.cursor()
+        sql = ("SELECT old_name, new_name, phase, total, copied, deleted, error "
+               "FROM collection_renames")
+        if old is not None:
+            cur.execute(sql + " WHERE old_name = %s", (old,))
+        else:
+            cur.execute(sql + " ORDER BY started_at")
+        cols = ('old_name', 'new_name', 'phase', 'total', 'copied', 'deleted', 'error')
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    def _execute(self, sql: str, params=()):
+        conn = self._get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall() if cur.description else []
+            conn.commit()
+            return rows
+        finally:
+            self._release_db(conn)
+
+    def _begin(self):
+        rows = self._execute("""
+            INSERT INTO collection_renames (old_name, new_name) VALUES (%s, %s)
+            ON CONFLICT (old_name) DO UPDATE SET error = NULL, updated_at = NOW()
+            RETURNING new_name, phase, total, copied
+        """, (self.old, self.new))
+        new_name, phase, total, copied = rows[0]
+        if new_name != self.new:
+            raise RenameError(f"'{self.old}' is already being renamed to '{new_name}'")
+        self.progress.update(phase=phase, total=total or 0, copied=copied or 0)
+
+    def _report(self, force: bool = False, persist: bool = True):
+        now = time.monotonic()
+        if not force and now - self._last_report < self._progress_interval:
+            return
+        self._last_report = now
+        if persist:
+            p = self.progress
+            self._execute("""
+                UPDATE collection_renames
+                SET phase = %s, total = %s, copied = %s, deleted = %s, updated_at = NOW()
+                WHERE old_name = %s
+            """, (p['phase'], p['total'], p['copied'], p['deleted'], self.old))
+        if self._on_progress:
+            self._on_progress(dict(self.progress))
+
+    def _fail(self, message: str):
+        self._execute("UPDATE collection_renames SET error = %s, updated_at = NOW() "
+                      "WHERE old_name = %s", (message, self.old))
+        raise RenameError(message)
+
+    # ── Phases ───────────────────────────────────────────────────────────────
+
+    def _filenames(self, collection: str) -> List[str]:
+        rows = self._execute("""
+            SELECT filename FROM images WHERE collection_name = %s
+            UNION ALL
+            SELECT filename FROM videos WHERE collection_name = %s
+        """, (collection, collection))
+        return [row[0] for row in rows]
+
+    def _existing_keys(self, prefix: str) -> set:
+        keys = set()
+        paginator = self._s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self._bucket, Prefix=prefix):
+            keys.update(obj['Key'] for obj in page.get('Contents', []))
+        return keys
+
+    def _copy_all(self) -> set:
+        """Copy the old collection's objects; returns the filenames handled."""
+        filenames = self._filenames(self.old)
+        already = self._existing_keys(f'{self.new}/')
+        todo = [f for f in filenames if f'{self.new}/{f}' not in already]
+        self.progress.update(total=len(filenames), copied=len(filenames) - len(todo))
+        self._report(force=True)
+        self._copy(todo)
+        return set(filenames)
+
+    def _copy(self, todo: List[str]):
+        def copy(filename):
+            self._s3.copy_object(Bucket=self._bucket, Key=f'{self.new}/{filename}',
+                                 CopySource={'Bucket': self._bucket, 'Key': f'{self.old}/{filename}'})
+
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(copy, f): f for f in todo}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    if _is_missing(e):
+                        # Source object is gone; its row is dropped at commit
+                        self.missing.append(futures[future])
+                        self.progress['missing'] += 1
+                    else:
+                        failures.append(f'{futures[future]}: {e}')
+                    continue
+                self.progress['copied'] += 1
+                self._report()
+        if failures:
+            self._report(force=True)
+            self._fail(f'{len(failures)} copies failed, e.g. {failures[0]}')
+
+    def _commit(self, copied: set) -> List[str]:
+        """Move the rows of the `copied` filenames to the new collection in one
+        transaction. Returns [] on success, or the filenames of rows added since
+        the copy started (nothing is committed then)."""
+        conn = self._get_db()
+        try:
+            cur = conn.cursor()
+            # Uploads insert rows referencing the old collection, so this waits
+            # for in-flight ones and holds off new ones until the commit.
+            cur.execute("SELECT name FROM collections WHERE name = %s FOR UPDATE", (self.old,))
+            cur.execute("""
+                SELECT filename FROM images WHERE collection_name = %s AND NOT (filename = ANY(%s))
+                UNION ALL
+                SELECT filename FROM videos WHERE collection_name = %s AND NOT (filename = ANY(%s))
+            """, (self.old, sorted(copied), self.old, sorted(copied)))
+            late = [row[0] for row in cur.fetchall()]
+            if late:
+                conn.rollback()
+                return late
+            cur.execute("INSERT INTO collections (name) VALUES (%s) ON CONFLICT DO NOTHING",
+                        (self.new,))
+            if self.missing:
+                for table in ('images', 'videos'):
+                    cur.execute(f"DELETE FROM {table} WHERE collection_name = %s AND filename = ANY(%s)",
+                                (self.old, sorted(self.missing)))
+            for table, reset in (('images', ", thumbs = '{}'::jsonb"), ('videos', '')):
+                cur.execute(f"""
+                    UPDATE {table}
+                    SET collection_name = %s, url = %s || '/' || filename{reset}
+                    WHERE collection_name = %s AND filename = ANY(%s)
+                """, (self.new, self.new, self.old, sorted(copied)))
+            # Collection-level video grants would cascade-delete with the old row
+            cur.execute("UPDATE video_collection_access SET collection_name = %s WHERE collection_name = %s",
+                        (self.new, self.old))
+            cur.execute("DELETE FROM collections WHERE name = %s", (self.old,))
+            cur.execute("UPDATE collection_renames SET phase = 'cleanup', updated_at = NOW() "
+                        "WHERE old_name = %s", (self.old,))
+            if self._notify:
+                self._notify(cur, self.old)
+                self._notify(cur, self.new)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release_db(conn)
+        self.progress['phase'] = 'cleanup'
+        self._report(force=True, persist=False)
+        return []
+
+    def _delete_old(self):
+        old_keys = [f'{self.old}/{f}' for f in self._filenames(self.new)]
+        old_keys += sorted(self._existing_keys(f'thumbs/{self.old}/'))
+        batches = [old_keys[i:i + DELETE_BATCH] for i in range(0, len(old_keys), DELETE_BATCH)]
+
+        def delete(batch):
+            self._s3.delete_objects(Bucket=self._bucket,
+                                    Delete={'Objects': [{'Key': k} for k in batch], 'Quiet': True})
+            return len(batch)
+
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for future in as_completed([pool.submit(delete, b) for b in batches]):
+                try:
+                    n = future.result()
+                except Exception as e:
+                    failures.append(str(e))
+                    continue
+                self.progress['deleted'] += n
+                self._report()
+        if failures:
+            self._report(force=True)
+            self._fail(f'{len(failures)} delete batches failed, e.g. {failures[0]}')
+
+    def run(self) -> Dict:
+        """Run (or resume) the rename to completion; returns the final progress."""
+        self._begin()
+        if self.progress['phase'] == 'copying':
+            copied = self._copy_all()
+            for _round in range(COMMIT_ROUNDS):
+                late = self._commit(copied)
+                if not late:
+                    break
+                # Uploaded while we were copying: copy those as well, then retry
+                self.progress['total'] += len(late)
+                self._copy(late)
+                copied.update(late)
+            else:
+                self._fail(f"'{self.old}' kept receiving uploads; try the rename again")
+        self._delete_old()
+        self._execute("DELETE FROM collection_renames WHERE old_name = %s", (self.old,))
+        self.progress['phase'] = 'done'
+        self._report(force=True, persist=False)
+        return dict(self.progress)
+
+
+def _is_missing(exc: Exception) -> bool:
+    """True for a 404 / NoSuchKey ClientError from botocore."""
+    response = getattr(exc, 'response', None) or {}
+    return str(response.get('Error', {}).get('Code')) in ('NoSuchKey', '404', 'NotFound')
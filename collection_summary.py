@@ -0,0 +1,58 @@
+"""
+Per-collection summary for the home and management pages.
+
+Holds {collection: {'images': n, 'videos': n}} for every registered collection,
+built by one aggregate query (see summary_rows) and cached until a mutator that
+changes membership — upload, delete, rename, collection create/delete —
+invalidates it. Top scores are not stored here; callers merge them in from the
+LeaderboardCache, which is already in memory.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Iterable, Tuple
+
+SUMMARY_SQL = """
+    SELECT c.name, COALESCE(i.n, 0), COALESCE(v.n, 0)
+    FROM collections c
+    LEFT JOIN (SELECT collection_name, COUNT(*) FILTER (WHERE url <> '') AS n
+               FROM images GROUP BY collection_name) i ON i.collection_name = c.name
+    LEFT JOIN (SELECT collection_name, COUNT(*) AS n
+               FROM videos GROUP BY collection_name) v ON v.collection_name = c.name
+    ORDER BY c.name
+"""
+
+
+def summary_rows(conn) -> Iterable[Tuple[str, int, int]]:
+    """(collection, image_count, video_count) for every collection, in name order."""
+    cur = conn.cursor()
+    cur.execute(SUMMARY_SQL)
+    return cur.fetchall()
+
+
+class CollectionSummary:
+    """Cached {collection: {'images': n, 'videos': n}}, rebuilt after invalidate() or `ttl`."""
+
+    def __init__(self, load: Callable[[], Iterable[Tuple[str, int, int]]],
+                 ttl: float = 300, clock: Callable[[], float] = time.monotonic):
+        self._load = load
+        self.ttl = ttl
+        self._clock = clock
+        self._counts = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """{collection: {'images': n, 'videos': n}} in collection-name order."""
+        with self._lock:
+            if self._loaded_at is None or self._clock() - self._loaded_at >= self.ttl:
+                self._counts = {name: {'images': int(images), 'videos': int(videos)}
+                                for name, images, videos in self._load()}
+                self._loaded_at = self._clock()
+                self.loads += 1
+            return {name: dict(c) for name, c in self._counts.items()}
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
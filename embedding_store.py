@@ -0,0 +1,401 @@
+"""
+Per-collection CLIP image embeddings and nearest-neighbour search.
+
+Games that need a "hard" wrong answer (oddoneout, whoisthat, remix) used to
+draw one with random.sample over the whole pool, and nothing could answer
+"images like this one" or a free-text query. Each image now gets the CLIP
+image embedding of the model the tagger already loads (image_tagger.
+embed_images, computed in the tagger service), stored per collection under
+EMBEDDINGS_DIR:
+
+    <collection>/index.json          {model, dim, generation, ids: [filename, ...]}
+    <collection>/vectors-<gen>.f16   len(ids) x dim little-endian float16, row i = ids[i]
+    <collection>/ivf-<gen>.npz       ANN index (collections of ANN_MIN_ROWS+ images)
+
+The matrix is memory-mapped, so a collection costs page cache rather than
+heap, and rows are L2-normalized, so a dot product is the cosine similarity.
+A write produces a new generation of files and then swaps index.json in
+atomically; readers holding the previous generation keep a valid mapping.
+
+Small collections are searched exactly (one matrix-vector product). Larger
+ones also get an inverted-file index: spherical k-means splits the rows into
+about sqrt(n) lists and a query scores only the rows of its `nprobe` nearest
+lists, re-ranked exactly.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DTYPE = np.dtype('<f2')
+# Below this many rows an exact scan is as fast as probing an index
+ANN_MIN_ROWS = int(os.environ.get('EMBEDDINGS_ANN_MIN_ROWS', 4096))
+ANN_NPROBE = int(os.environ.get('EMBEDDINGS_ANN_NPROBE', 8))
+_KMEANS_ITERATIONS = 12
+_KMEANS_SAMPLE = 50000   # rows the centroids are trained on
+_SCAN_CHUNK = 65536      # rows scored per step of an exact scan
+
+
+def from_wire(rows: Sequence[bytes]) -> np.ndarray:
+    """TaggerClient.embed_* rows ('<f2' bytes each) -> (n, dim) float32 matrix."""
+    if not rows:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.frombuffer(b''.join(rows), dtype=DTYPE).reshape(len(rows), -1).astype(np.float32)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length (all-zero rows stay zero)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+def train_ivf(vectors: np.ndarray, nlist: int = None, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Spherical k-means over unit rows: (centroids, order, offsets), where the
+    rows of list c are order[offsets[c]:offsets[c + 1]]."""
+    n = len(vectors)
+    nlist = max(1, min(n, nlist or int(round(np.sqrt(n)))))
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(n, min(n, max(_KMEANS_SAMPLE, nlist)), replace=False)].astype(np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = ~np.bincount(assign, minlength=nlist).astype(bool)
+        # Re-seed empty lists from random rows rather than lose them
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize(sums)
+    assign = np.concatenate([np.argmax(vectors[i:i + _SCAN_CHUNK].astype(np.float32) @ centroids.T, axis=1)
+                             for i in range(0, n, _SCAN_CHUNK)])
+    order = np.argsort(assign, kind='stable').astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+    return centroids, order, offsets
+
+
+def _top(scores: np.ndarray, rows: np.ndarray, k: int) -> List[Tuple[float, int]]:
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k)[:k]
+        scores, rows = scores[keep], rows[keep]
+    best = np.argsort(-scores, kind='stable')
+    return [(float(scores[i]), int(rows[i])) for i in best]
+
+
+class CollectionIndex:
+    """One collection's embeddings (read-only): ids, memory-mapped vectors and
+    the optional IVF lists."""
+
+    def __init__(self, model: str, ids: List[str], vectors: np.ndarray, ivf=None, generation: str = None):
+        self.model = model
+        self.ids = ids
+        self.vectors = vectors
+        self.ivf = ivf
+        self.generation = generation
+        self._rows = {name: i for i, name in enumerate(ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, filename):
+        return filename in self._rows
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+    def vector(self, filename: str) -> Optional[np.ndarray]:
+        row = self._rows.get(filename)
+        return None if row is None else np.asarray(self.vectors[row], dtype=np.float32)
+
+    def query_vector(self, filenames: Iterable[str]) -> Optional[np.ndarray]:
+        """Unit mean of the given images' embeddings (None if none is indexed)."""
+        rows = [self._rows[f] for f in filenames if f in self._rows]
+        if not rows:
+            return None
+        mean = self.vectors[sorted(rows)].astype(np.float32).mean(axis=0)
+        return normalize(mean) if np.any(mean) else None
+
+    def search(self, query: np.ndarray, k: int = 10, exclude: Iterable[str] = (),
+               nprobe: int = None) -> List[Tuple[float, str]]:
+        """[(cosine similarity, filename)] of the `k` rows nearest `query`, best first."""
+        query = normalize(np.asarray(query, dtype=np.float32).ravel())
+        excluded = np.fromiter((self._rows[f] for f in set(exclude) if f in self._rows), dtype=np.int64)
+        if k <= 0 or len(self) == 0:
+            return []
+        if self.ivf is not None:
+            found = self._search_ivf(query, k, excluded, nprobe or ANN_NPROBE)
+        else:
+            found = self._search_exact(query, k, excluded)
+        return [(score, self.ids[row]) for score, row in found]
+
+    def _search_exact(self, query, k, excluded) -> List[Tuple[float, int]]:
+        best_scores, best_rows = np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        for start in range(0, len(self), _SCAN_CHUNK):
+            scores = self.vectors[start:start + _SCAN_CHUNK].astype(np.float32) @ query
+            rows = np.arange(start, start + len(scores))
+            if len(excluded):
+                keep = ~np.isin(rows, excluded)
+                scores, rows = scores[keep], rows[keep]
+            best = _top(np.concatenate([best_scores, scores]), np.concatenate([best_rows, rows]), k)
+            best_scores = np.array([s for s, _ in best], dtype=np.float32)
+            best_rows = np.array([r for _, r in best], dtype=np.int64)
+        return list(zip(best_scores.tolist(), best_rows.tolist()))
+
+    def _search_ivf(self, query, k, excluded, nprobe) -> List[Tuple[float, int]]:
+        centroids, order, offsets = self.ivf
+        lists = np.argsort(-(centroids @ query), kind='stable')
+        # Probe at least nprobe lists, and more until there are k candidates
+        parts, found = [], 0
+        for probed, c in enumerate(lists):
+            if probed >= nprobe and found >= k + len(excluded):
+                break
+            part = order[offsets[c]:offsets[c + 1]]
+            parts.append(part)
+            found += len(part)
+        rows = np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+        if len(excluded):
+            rows = rows[~np.isin(rows, excluded)]
+        return _top(self.vectors[rows].astype(np.float32) @ query, rows, k)
+
+
+class EmbeddingStore:
+    """Collection embeddings under `root` (see module docstring). get() caches
+    each loaded index until its index.json changes, so writes by a job in
+    another process are picked up on the next lookup."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._cache = {}   # collection -> (index.json mtime_ns, CollectionIndex)
+
+    def _dir(self, collection: str) -> str:
+        return os.path.join(self.root, collection)
+
+    @contextmanager
+    def locked(self, collection: str):
+        """Hold the collection's write lock: a flock on <root>/.<collection>.lock,
+        so it also serializes builders running in other processes."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, f'.{collection}.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get(self, collection: str) -> Optional[CollectionIndex]:
+        path = os.path.join(self._dir(collection), 'index.json')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._cache.pop(collection, None)
+            return None
+        with self._lock:
+            cached = self._cache.get(collection)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            index = self._load(collection, path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[embeddings] Could not load {collection}: {e}")
+            return None
+        with self._lock:
+            self._cache[collection] = (mtime, index)
+        return index
+
+    def _load(self, collection: str, path: str) -> CollectionIndex:
+        with open(path) as f:
+            info = json.load(f)
+        directory, gen = self._dir(collection), info['generation']
+        ids = info['ids']
+        if ids:
+            vectors = np.memmap(os.path.join(directory, f'vectors-{gen}.f16'), dtype=DTYPE, mode='r',
+                                shape=(len(ids), int(info['dim'])))
+        else:
+            vectors = np.zeros((0, int(info['dim'])), dtype=DTYPE)
+        ivf = None
+        if info.get('ivf'):
+            with np.load(os.path.join(directory, f'ivf-{gen}.npz')) as data:
+                ivf = (data['centroids'], data['order'], data['offsets'])
+        return CollectionIndex(info['model'], ids, vectors, ivf, gen)
+
+    def write(self, collection: str, ids: List[str], matrix: np.ndarray, model: str) -> CollectionIndex:
+        """Replace a collection's embeddings with `matrix` (row i = ids[i])."""
+        directory = self._dir(collection)
+        os.makedirs(directory, exist_ok=True)
+        matrix = np.ascontiguousarray(matrix, dtype=DTYPE)
+        if len(ids) != len(matrix):
+            raise ValueError(f'{len(ids)} ids for {len(matrix)} rows')
+        gen = f'{time.time_ns():x}'
+        files = [f'vectors-{gen}.f16']
+        _write_atomic(os.path.join(directory, files[0]), matrix.tobytes())
+        ivf = len(ids) >= ANN_MIN_ROWS
+        if ivf:
+            centroids, order, offsets = train_ivf(matrix)
+            files.append(f'ivf-{gen}.npz')
+            tmp = os.path.join(directory, f'.ivf-{gen}.npz')
+            np.savez(tmp, centroids=centroids, order=order, offsets=offsets)
+            os.replace(tmp, os.path.join(directory, files[1]))
+        info = {'model': model, 'dim': int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+                'generation': gen, 'ivf': ivf, 'ids': list(ids)}
+        _write_atomic(os.path.join(directory, 'index.json'), json.dumps(info).encode('utf-8'))
+        # Older generations: open memmaps stay valid after the unlink
+        for name in os.listdir(directory):
+            if name != 'index.json' and name not in files and not name.startswith('.'):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        return self.get(collection)
+
+    def rename(self, old: str, new: str):
+        """Follow a collection rename (no-op when `old` has no embeddings)."""
+        if not os.path.isdir(self._dir(old)):
+            return
+        shutil.rmtree(self._dir(new), ignore_errors=True)
+        os.replace(self._dir(old), self._dir(new))
+        with self._lock:
+            self._cache.pop(old, None)
+            self._cache.pop(new, None)
+
+    def drop(self, collection: str):
+        shutil.rmtree(self._dir(collection), ignore_errors=True)
+        with self._lock:
+            self._cache.pop(collection, None)
+
+    def stats(self, collection: str) -> Dict:
+        index = self.get(collection)
+        if index is None:
+            return {'indexed': 0, 'model': None, 'dim': 0, 'ann': False, 'bytes': 0}
+        return {'indexed': len(index), 'model': index.model, 'dim': index.dim, 'ann': index.ivf is not None,
+                'bytes': int(index.vectors.nbytes)}
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class EmbeddingBuilder:
+    """Bring collection `collection`'s embeddings up to date with the catalog.
+
+    `images` is {filename: storage key} of the collection's current images.
+    Rows of images no longer in it are dropped; images without a row (or only
+    `filenames`, when given) are fetched from B2 on a small thread pool and
+    embedded `batch_size` at a time by embed(list of bytes) -> (model name,
+    (n, dim) matrix). All-zero rows mean the image could not be read; those
+    images are counted as failed and retried next run. If the model differs
+    from the stored one, everything is re-embedded (force=True does so too).
+
+    The store is rewritten after the last batch and every `checkpoint` newly
+    embedded images, so an interrupted build keeps most of its work. Each
+    rewrite happens under the collection's lock and first merges in rows that
+    another build (e.g. an upload's job) added since this one started.
+    on_progress(progress_dict) is called as batches complete.
+    """
+
+    def __init__(self, s3, bucket: str, store: EmbeddingStore, collection: str, images: Dict[str, str],
+                 embed: Callable[[List[bytes]], Tuple[str, np.ndarray]], filenames: Optional[Sequence[str]] = None,
+                 force: bool = False, batch_size: int = 32, workers: int = 4, checkpoint: int = 2048,
+                 on_progress: Callable[[Dict], None] = None):
+        self._s3 = s3
+        self._bucket = bucket
+        self.store = store
+        self.collection = collection
+        self.images = dict(images)
+        self._embed = embed
+        self.filenames = list(filenames) if filenames is not None else None
+        self.force = force
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers))
+        self.checkpoint = max(1, int(checkpoint))
+        self._on_progress = on_progress
+        self.progress = {'collection': collection, 'total': 0, 'done': 0,
+                         'embedded': 0, 'failed': 0, 'skipped': 0}
+        self._dropped = set()   # stored rows of images no longer in the catalog
+
+    def _report(self):
+        if self._on_progress:
+            self._on_progress(dict(self.progress))
+
+    def fetch(self, key: str) -> bytes:
+        """Bytes of the original at `key` (b'' on failure, which embeds as a zero row)."""
+        try:
+            return self._s3.get_object(Bucket=self._bucket, Key=key)['Body'].read()
+        except Exception as e:
+            print(f"[embeddings] Could not read {key}: {e}")
+            return b''
+
+    def _save(self, model: str, rows: Dict[str, np.ndarray]):
+        with self.store.locked(self.collection):
+            current = self.store.get(self.collection)
+            if current is not None and current.model == model:
+                added = {name: np.array(current.vectors[i]) for i, name in enumerate(current.ids)
+                         if name not in rows and name not in self._dropped}
+                rows = {**added, **rows}
+            names = sorted(rows)
+            dim = len(next(iter(rows.values()))) if rows else 0
+            matrix = np.stack([rows[name] for name in names]) if names else np.zeros((0, dim), dtype=DTYPE)
+            self.store.write(self.collection, names, matrix, model)
+
+    def run(self) -> Dict:
+        """Embed every missing image; returns the final progress."""
+        existing = self.store.get(self.collection)
+        model = existing.model if existing is not None else None
+        if existing is not None:
+            self._dropped = set(existing.ids) - set(self.images)
+        rows = {}
+        if existing is not None and not self.force:
+            rows = {name: np.array(existing.vectors[i]) for i, name in enumerate(existing.ids)
+                    if name in self.images}
+        wanted = sorted(self.images) if self.filenames is None else sorted(set(self.filenames) & set(self.images))
+        todo = [name for name in wanted if name not in rows]
+        self.progress['skipped'] = len(wanted) - len(todo)
+        self.progress['total'] = len(todo)
+        self._report()
+        changed = existing is None or len(rows) != len(existing) or self.force
+        since_save = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            start = 0
+            while start < len(todo):
+                batch = todo[start:start + self.batch_size]
+                start += len(batch)
+                data = list(pool.map(self.fetch, [self.images[name] for name in batch]))
+                batch_model, matrix = self._embed(data)
+                if model is not None and batch_model != model and rows:
+                    # Stored rows came from another model: re-embed them too
+                    print(f"[embeddings] {self.collection}: model changed {model} -> {batch_model}; re-embedding")
+                    stale = sorted(set(rows) - set(batch))
+                    todo.extend(stale)
+                    rows = {}
+                    self.progress['total'] += len(stale)
+                    self.progress['skipped'] = max(0, self.progress['skipped'] - len(stale))
+                model = batch_model
+                matrix = normalize(matrix)
+                ok = np.any(matrix != 0, axis=1)
+                for name, vector, good in zip(batch, matrix, ok):
+                    if good:
+                        rows[name] = vector.astype(DTYPE)
+                self.progress['done'] += len(batch)
+                self.progress['embedded'] += int(ok.sum())
+                self.progress['failed'] += len(batch) - int(ok.sum())
+                changed = True
+                since_save += int(ok.sum())
+                if since_save >= self.checkpoint and start < len(todo):
+                    self._save(model, rows)
+                    since_save = 0
+                self._report()
+        if changed and model is not None:
+            self._save(model, rows)
+        return dict(self.progress)
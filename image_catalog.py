@@ -0,0 +1,195 @@
+"""
+In-process cache of the images table.
+
+The catalog holds {collection: {filename: entry}} (entry shape as in
+image_queries) and is kept coherent by write-through calls from the app's
+mutators after they commit. Other worker processes learn about changes through
+Postgres LISTEN/NOTIFY and simply invalidate the affected collection; a TTL
+bounds staleness if a notification is ever missed.
+
+The catalog also maintains a TagIndex over the images while it holds the full
+table, which serves the tag search / tag browser endpoints.
+
+Entries are treated as immutable — updates replace the entry dict rather than
+mutating it — so callers may hold on to what they read, but must not modify it.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tag_index import TagIndex, page_keys
+
+
+class ImageCatalog:
+    """Versioned {collection: {filename: entry}} cache with lazy per-collection loads.
+
+    load_all()            -> {'collection/filename': entry}
+    load_collection(name) -> {filename: entry}
+    """
+
+    def __init__(self, load_all: Callable[[], Dict[str, Dict]],
+                 load_collection: Callable[[str], Dict[str, Dict]],
+                 ttl: float = 300, clock: Callable[[], float] = time.monotonic):
+        self._load_all = load_all
+        self._load_collection = load_collection
+        self.ttl = ttl
+        self._clock = clock
+        self._collections = {}     # collection -> {filename: entry}
+        self._loaded_at = {}       # collection -> clock() at load
+        self._all_loaded_at = None # set when every collection is known to be cached
+        # Only trusted while _all_loaded_at is fresh; rebuilt on each full load.
+        self._tags = TagIndex()
+        # Loads happen under the lock on purpose: concurrent readers of a cold
+        # collection wait for the one query instead of all issuing it.
+        self._lock = threading.RLock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    # ── Reads ────────────────────────────────────────────────────────────────
+
+    def _fresh(self, loaded_at) -> bool:
+        return loaded_at is not None and self._clock() - loaded_at < self.ttl
+
+    def _cached_collection(self, collection: str) -> Dict[str, Dict]:
+        """The cached {filename: entry} dict for one collection, loading it unless
+        it's fresh. Hold the lock; the dict is shared, so copy what you return."""
+        if self._fresh(self._loaded_at.get(collection)) or (
+                collection not in self._loaded_at and self._fresh(self._all_loaded_at)):
+            self.hits += 1
+            return self._collections.get(collection, {})
+        self.misses += 1
+        images = self._load_collection(collection)
+        self._collections[collection] = images
+        self._loaded_at[collection] = self._clock()
+        self.version += 1
+        return images
+
+    def collection(self, collection: str) -> Dict[str, Dict]:
+        """{filename: entry} for one collection, in filename order."""
+        with self._lock:
+            return dict(self._cached_collection(collection))
+
+    def image(self, collection: str, filename: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._cached_collection(collection).get(filename)
+            return dict(entry) if entry is not None else None
+
+    def _ensure_all(self):
+        """Load the whole table (and rebuild the tag index) unless it's fresh. Hold the lock."""
+        if self._fresh(self._all_loaded_at):
+            self.hits += 1
+            return
+        self.misses += 1
+        by_collection = {}
+        self._tags.clear()
+        for key, entry in self._load_all().items():
+            coll, fname = key.split('/', 1)
+            by_collection.setdefault(coll, {})[fname] = entry
+            self._tags.add(coll, fname, entry.get('tags'))
+        now = self._clock()
+        self._collections = by_collection
+        self._loaded_at = {coll: now for coll in by_collection}
+        self._all_loaded_at = now
+        self.version += 1
+
+    def all_images(self) -> Dict[str, Dict]:
+        """Every image keyed by 'collection/filename' (the legacy _load_tags() shape)."""
+        with self._lock:
+            self._ensure_all()
+            return {
+                f"{coll}/{fname}": entry
+                for coll in sorted(self._collections)
+                for fname, entry in self._collections[coll].items()
+            }
+
+    # ── Tag queries (served from the TagIndex) ───────────────────────────────
+
+    def find_by_tags(self, tags: Iterable[str], match_all: bool = False,
+                     ignore_case: bool = False, after: Tuple[str, str] = None,
+                     limit: int = None) -> Tuple[int, List[Tuple[str, str, Dict]]]:
+        """Images carrying all / any of `tags`, in (collection, filename) order.
+
+        Returns (total matches, [(collection, filename, entry)]) where the list
+        is the page after `after` of at most `limit` rows (all rows if None).
+        """
+        with self._lock:
+            self._ensure_all()
+            keys = self._tags.match(tags, match_all=match_all, ignore_case=ignore_case)
+            page = page_keys(keys, after=after, limit=limit)
+            return len(keys), [(coll, fname, self._collections[coll][fname])
+                               for coll, fname in page]
+
+    def tag_counts(self) -> List[Tuple[str, Dict[str, int], int]]:
+        """[(tag, {collection: count}, total)], most used first."""
+        with self._lock:
+            self._ensure_all()
+            return self._tags.tag_counts()
+
+    # ── Write-through (call after the DB transaction commits) ────────────────
+
+    def put(self, collection: str, filename: str, entry: Dict):
+        """Insert or replace one image. No-op unless its collection is cached."""
+        with self._lock:
+            images = self._collections.get(collection)
+            if images is None:
+                if not self._fresh(self._all_loaded_at):
+                    return
+                images = self._collections[collection] = {}
+                self._loaded_at[collection] = self._clock()
+            old = images.get(filename)
+            if old is not None:
+                self._tags.discard(collection, filename, old.get('tags'))
+            images[filename] = dict(entry)
+            self._tags.add(collection, filename, entry.get('tags'))
+            if filename != max(images):
+                self._collections[collection] = dict(sorted(images.items()))
+            self.version += 1
+
+    def update(self, collection: str, filename: str, **fields) -> bool:
+        """Merge fields into a cached image; returns False if it isn't cached."""
+        with self._lock:
+            images = self._collections.get(collection)
+            if images is None or filename not in images:
+                return False
+            old = images[filename]
+            images[filename] = {**old, **fields}
+            if 'tags' in fields:
+                self._tags.discard(collection, filename, old.get('tags'))
+                self._tags.add(collection, filename, fields['tags'])
+            self.version += 1
+            return True
+
+    def remove(self, collection: str, filename: str):
+        with self._lock:
+            images = self._collections.get(collection)
+            old = images.pop(filename, None) if images is not None else None
+            if old is not None:
+                self._tags.discard(collection, filename, old.get('tags'))
+                self.version += 1
+
+    def invalidate(self, collection: str = None):
+        """Forget one collection (or everything) so the next read reloads from the DB."""
+        with self._lock:
+            if collection is None:
+                self._collections.clear()
+                self._loaded_at.clear()
+                self._tags.clear()
+            else:
+                self._collections.pop(collection, None)
+                self._loaded_at.pop(collection, None)
+            self._all_loaded_at = None
+            self.version += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'version':     self.version,
+                'collections': len(self._collections),
+                'images':      sum(len(v) for v in self._collections.values()),
+                'hits':        self.hits,
+                'misses':      self.misses,
+                'tags':        len(self._tags),
+                'ttl':         self.ttl,
+            }
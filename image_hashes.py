@@ -0,0 +1,187 @@
+"""
+Perceptual hashes and near-duplicate lookup.
+
+Every upload gets a fresh uuid filename, so the same photo uploaded twice used
+to become two images (twice the B2 storage and tagging work, and "different"
+cards in games that are visually identical). Each image now carries a 64-bit
+pHash (images.phash, computed with the rest of its metadata in
+image_metadata.py): the low-frequency 8x8 corner of the DCT of a 32x32
+greyscale copy, one bit per coefficient above the median. Re-encodes,
+resizes and small edits change only a few bits, so near-duplicates are
+images whose hashes are within a small Hamming distance.
+
+DuplicateIndex keeps a BK-tree per collection, built from the catalog and
+brought up to date as hashes are added, so a lookup visits a small part of
+the collection instead of comparing against every image.
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, TypeVar
+
+import numpy as np
+from PIL import Image
+
+T = TypeVar('T')
+
+HASH_BITS = 64
+_HASH_SIZE = 8        # 8x8 low-frequency coefficients -> 64 bits
+_SAMPLE_SIZE = 32     # DCT input size
+# Orthonormal DCT-II basis: _DCT @ x @ _DCT.T is the 2-D DCT of x
+_DCT = np.cos(np.pi * np.outer(np.arange(_SAMPLE_SIZE), 2 * np.arange(_SAMPLE_SIZE) + 1) / (2 * _SAMPLE_SIZE))
+
+
+def phash(img: Image.Image) -> int:
+    """64-bit perceptual hash of `img` (any mode, any size)."""
+    grey = np.asarray(img.convert('L').resize((_SAMPLE_SIZE, _SAMPLE_SIZE), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ grey @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].ravel()
+    bits = low > np.median(low)
+    return int(''.join('1' if b else '0' for b in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_db(value: int) -> int:
+    """Unsigned 64-bit hash -> the signed value Postgres BIGINT can hold."""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_db(value: int) -> int:
+    """Inverse of to_db()."""
+    return value % (1 << HASH_BITS)
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance.
+
+    Each node is [hash, values, {distance: child}]; values that share a hash
+    share a node. A radius-r search only descends into children whose edge
+    distance d satisfies |d - dist(query, node)| <= r (triangle inequality).
+    """
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value_hash: int, value):
+        self.size += 1
+        if self._root is None:
+            self._root = [value_hash, [value], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(value_hash, node[0])
+            if d == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value_hash, [value], {}]
+                return
+            node = child
+
+    def search(self, query: int, radius: int) -> List[Tuple[int, object]]:
+        """[(distance, value)] of every value within `radius`, nearest first."""
+        found, stack = [], [self._root] if self._root is not None else []
+        while stack:
+            node_hash, values, children = stack.pop()
+            d = hamming(query, node_hash)
+            if d <= radius:
+                found.extend((d, value) for value in values)
+            for edge, child in children.items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+def duplicate_clusters(tree: BKTree, hashes: Dict[str, int], radius: int) -> List[List[Tuple[str, int]]]:
+    """Groups of 2+ filenames linked by hashes within `radius` of each other
+    (transitively), largest first. Each group is [(filename, distance from the
+    group's first image)], in filename order."""
+    parent = {name: name for name in hashes}
+
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    for name, value_hash in hashes.items():
+        for _d, other in tree.search(value_hash, radius):
+            a, b = find(name), find(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+    groups = {}
+    for name in sorted(hashes):
+        groups.setdefault(find(name), []).append(name)
+    clusters = [[(name, hamming(hashes[names[0]], hashes[name])) for name in names]
+                for names in groups.values() if len(names) > 1]
+    clusters.sort(key=lambda c: (-len(c), c[0][0]))
+    return clusters
+
+
+def pick_distinct(items: Sequence[T], k: int, hash_of: Callable[[T], int], radius: int) -> List[T]:
+    """Up to `k` of `items` (in order), skipping any within `radius` of one
+    already picked; items without a hash (hash_of -> None) always qualify.
+    Falls back to the skipped items when there are not enough distinct ones."""
+    picked, skipped, hashes = [], [], []
+    for item in items:
+        if len(picked) == k:
+            break
+        h = hash_of(item)
+        if h is not None and any(hamming(h, other) <= radius for other in hashes):
+            skipped.append(item)
+            continue
+        picked.append(item)
+        if h is not None:
+            hashes.append(h)
+    return picked + skipped[:k - len(picked)]
+
+
+class DuplicateIndex:
+    """A BK-tree per collection, kept in step with {filename: hash} snapshots.
+
+    Callers pass the collection's current hashes (from the image catalog) with
+    every call. A snapshot that only adds images extends the cached tree;
+    anything else (a delete, a changed hash, a reload) rebuilds it. Comparing
+    snapshots is a dict comparison, far cheaper than a rebuild. Trees are
+    only read or extended under the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._trees = {}   # collection -> ({filename: hash}, BKTree)
+        self.builds = 0
+
+    def tree(self, collection: str, hashes: Dict[str, int]) -> BKTree:
+        with self._lock:
+            indexed, tree = self._trees.get(collection, ({}, None))
+            if tree is not None and indexed == hashes:
+                return tree
+            if tree is None or any(hashes.get(name) != h for name, h in indexed.items()):
+                tree, indexed = BKTree(), {}
+                self.builds += 1
+            indexed = dict(indexed)
+            for name, value_hash in hashes.items():
+                if name not in indexed:
+                    tree.add(value_hash, name)
+                    indexed[name] = value_hash
+            self._trees[collection] = (indexed, tree)
+            return tree
+
+    def near(self, collection: str, hashes: Dict[str, int], query: int, radius: int,
+             exclude: Iterable[str] = ()) -> List[Tuple[int, str]]:
+        """[(distance, filename)] of the collection's images within `radius` of `query`."""
+        exclude = set(exclude)
+        with self._lock:
+            found = self.tree(collection, hashes).search(query, radius)
+        return [(d, name) for d, name in found if name not in exclude]
+
+    def clusters(self, collection: str, hashes: Dict[str, int], radius: int) -> List[List[Tuple[str, int]]]:
+        with self._lock:
+            return duplicate_clusters(self.tree(collection, hashes), hashes, radius)
@@ -0,0 +1,228 @@
+"""
+Server-computed image metadata.
+
+Grids used to wait for every image to download before they could be laid out
+(and reflowed as each one arrived). Each image row now carries
+
+    width, height   displayed size in px (after EXIF rotation)
+    byte_size       size of the original in B2
+    dominant_color  '#rrggbb', the most common colour of a small median-cut palette
+    blurhash        a ~30 character BlurHash (https://blurha.sh) placeholder
+    phash           64-bit perceptual hash for duplicate detection (image_hashes.py)
+
+computed once at upload (compute_metadata) and backfilled for older images by
+MetadataBackfill, so clients can size cells and paint placeholders before any
+image bytes arrive. static/js/image-placeholders.js decodes the blurhash.
+"""
+
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from image_hashes import phash, to_db
+
+META_COLUMNS = ('width', 'height', 'byte_size', 'dominant_color', 'blurhash')
+
+# Decoded size the colour / blurhash work runs at — plenty for a 4x3 component hash
+_SAMPLE_PX = 64
+_BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _base83(value: int, length: int) -> str:
+    return ''.join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(rgb: np.ndarray) -> np.ndarray:
+    v = rgb / 255.0
+    return np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(v: float) -> int:
+    v = min(1.0, max(0.0, v))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(img: Image.Image, x_components: int = 4, y_components: int = 3) -> str:
+    """BlurHash of an RGB image (best fed a small one; cost is per pixel)."""
+    pixels = _srgb_to_linear(np.asarray(img.convert('RGB'), dtype=np.float64))
+    height, width = pixels.shape[:2]
+    xs = np.cos(np.pi * np.outer(np.arange(x_components), np.arange(width)) / width)    # (cx, w)
+    ys = np.cos(np.pi * np.outer(np.arange(y_components), np.arange(height)) / height)  # (cy, h)
+    # factors[j, i] = norm * mean over pixels of ys[j, y] * xs[i, x] * pixel
+    factors = np.einsum('jy,ix,yxc->jic', ys, xs, pixels) / (width * height)
+    factors[1:, :] *= 2
+    factors[0, 1:] *= 2
+    dc, ac = factors[0, 0], factors.reshape(-1, 3)[1:]
+
+    out = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, int(np.abs(ac).max() * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        out += _base83(quantised_max, 1)
+    else:
+        max_value = 1.0
+        out += _base83(0, 1)
+    out += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    quant = np.clip(np.floor(np.sign(ac) * np.abs(ac / max_value) ** 0.5 * 9 + 9.5), 0, 18).astype(int)
+    for r, g, b in quant:
+        out += _base83(int(r) * 19 * 19 + int(g) * 19 + int(b), 2)
+    return out
+
+
+def dominant_color(img: Image.Image, colors: int = 5) -> str:
+    """'#rrggbb' of the largest cluster in a small median-cut palette."""
+    quantized = img.convert('RGB').quantize(colors, method=Image.Quantize.MEDIANCUT)
+    _count, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def compute_metadata(source: Union[bytes, io.IOBase]) -> Dict:
+    """Metadata of an image given as bytes or a readable file (read from its
+    current position to the end). Raises if the image cannot be decoded."""
+    data = source if isinstance(source, bytes) else source.read()
+    with Image.open(io.BytesIO(data)) as img:
+        rotated = img.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+        width, height = (img.height, img.width) if rotated else (img.width, img.height)
+        img.draft('RGB', (_SAMPLE_PX, _SAMPLE_PX))   # JPEG: decode at 1/8 scale
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # Judge transparent images against white, as they are usually shown
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        img = img.convert('RGB')
+        img.thumbnail((_SAMPLE_PX, _SAMPLE_PX))
+    landscape = width >= height
+    return {
+        'width': width,
+        'height': height,
+        'byte_size': len(data),
+        'dominant_color': dominant_color(img),
+        'blurhash': blurhash(img, 4 if landscape else 3, 3 if landscape else 4),
+        'phash': phash(img),
+    }
+
+
+def public_metadata(meta: Optional[Dict]) -> Dict:
+    """Client-facing form of an entry's metadata: the columns plus aspect
+    (width / height); {} when it has not been computed yet."""
+    if not meta or not meta.get('width') or not meta.get('height'):
+        return {}
+    return {**{k: meta.get(k) for k in META_COLUMNS}, 'aspect': round(meta['width'] / meta['height'], 4)}
+
+
+class MetadataBackfill:
+    """Compute metadata for every image that lacks it or its perceptual hash
+    (optionally in one collection).
+
+    Streams the table in keyset order, `batch_size` rows at a time, so memory
+    stays flat however many images there are. Originals are fetched from B2 on
+    a small thread pool and decoded through offload(compute_metadata, data)
+    (see ThumbnailBuilder); each batch is written with one UPDATE ... FROM
+    (VALUES ...). Images that fail keep NULL metadata and are simply retried by
+    the next run.
+
+    notify(cur, collection) is called inside each write transaction for each
+    collection touched; on_written(rows) gets [(collection, filename, meta)];
+    on_progress(progress_dict) is called after every batch.
+    """
+
+    def __init__(self, s3, bucket: str, get_db: Callable, release_db: Callable,
+                 collection: str = None, batch_size: int = 64, workers: int = 8,
+                 notify: Callable = None, on_written: Callable = None,
+                 on_progress: Callable[[Dict], None] = None, offload: Callable = None):
+        self._s3 = s3
+        self._bucket = bucket
+        self._get_db = get_db
+        self._release_db = release_db
+        self.collection = collection
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers))
+        self._notify = notify
+        self._on_written = on_written
+        self._on_progress = on_progress
+        self._offload = offload or (lambda fn, *args: fn(*args))
+        self.progress = {'collection': collection, 'done': 0, 'updated': 0, 'failed': 0}
+
+    def _page(self, after: Optional[Tuple[str, str]]) -> List[Tuple[str, str, str]]:
+        clauses, params = ["(width IS NULL OR phash IS NULL)"], []
+        if self.collection is not None:
+            clauses.append("collection_name = %s")
+            params.append(self.collection)
+        if after is not None:
+            clauses.append("(collection_name, filename) > (%s, %s)")
+            params.extend(after)
+        conn = self._get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT collection_name, filename, url FROM images WHERE {' AND '.join(clauses)} "
+                        f"ORDER BY collection_name, filename LIMIT %s", (*params, self.batch_size))
+            return cur.fetchall()
+        finally:
+            self._release_db(conn)
+
+    def compute(self, key: str) -> Optional[Dict]:
+        try:
+            data = self._s3.get_object(Bucket=self._bucket, Key=key)['Body'].read()
+            return self._offload(compute_metadata, data)
+        except Exception as e:
+            print(f"[metadata] Could not read {key}: {e}")
+            return None
+
+    def _write(self, rows: List[Tuple[str, str, Dict]]):
+        if not rows:
+            return
+        values = ', '.join(['(%s, %s, %s::jsonb)'] * len(rows))
+        params = [p for coll, fname, meta in rows
+                  for p in (coll, fname, json.dumps({**meta, 'phash': to_db(meta['phash'])}))]
+        conn = self._get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                UPDATE images AS i
+                SET width = (v.meta->>'width')::int, height = (v.meta->>'height')::int,
+                    byte_size = (v.meta->>'byte_size')::bigint,
+                    dominant_color = v.meta->>'dominant_color', blurhash = v.meta->>'blurhash',
+                    phash = (v.meta->>'phash')::bigint
+                FROM (VALUES {values}) AS v(collection_name, filename, meta)
+                WHERE i.collection_name = v.collection_name AND i.filename = v.filename
+            """, params)
+            if self._notify:
+                for coll in sorted({coll for coll, _f, _m in rows}):
+                    self._notify(cur, coll)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release_db(conn)
+        if self._on_written:
+            self._on_written(rows)
+
+    def run(self) -> Dict:
+        """Backfill to the end of the table; returns the final progress."""
+        after = None
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                page = self._page(after)
+                if not page:
+                    break
+                after = page[-1][:2]
+                results = list(pool.map(self.compute, [url for _c, _f, url in page]))
+                rows = [(coll, fname, meta) for (coll, fname, _url), meta in zip(page, results) if meta]
+                self._write(rows)
+                self.progress['done'] += len(page)
+                self.progress['updated'] += len(rows)
+                self.progress['failed'] += len(page) - len(rows)
+                if self._on_progress:
+                    self._on_progress(dict(self.progress))
+                if len(page) < self.batch_size:
+                    break
+        return dict(self.progress)
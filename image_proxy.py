@@ -0,0 +1,267 @@
+"""
+On-demand image resizing and cropping for /img/<collection>/<filename>.
+
+Games that only need a crop (versus zoom) or a fixed size (puzzle) used to
+download the full original and cut it up client-side. ImageProxy renders
+exactly what was asked for, keeping two kinds of file in a size-bounded
+on-disk LRU (DiskLRU):
+
+  src  the original, decoded once, EXIF-rotated and capped at max_dim, stored
+       as raw pixels behind a 16-byte header. Renders mmap the file and wrap
+       it with Image.frombuffer, so a warm source costs no decode and no copy.
+  out  each encoded output (WebP or JPEG), served straight from disk.
+
+Every output is named by a hash of (source key, w, h, crop, format). Source
+keys are immutable uuid names, so that hash is also a strong ETag, known
+before anything is read: a revalidation is answered without touching the
+cache. Concurrent identical misses are coalesced (SingleFlight), so one cold
+image never causes N B2 GETs or N decodes.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+# Decoded-source header: magic, bands (3 = RGB, 4 = RGBA), width, height, padding to 16 bytes
+_SRC_HEADER = struct.Struct('<4sBII3x')
+_SRC_MAGIC = b'RAW1'
+_MODES = {3: 'RGB', 4: 'RGBA'}
+
+CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+# Bump to invalidate every cached output (and its ETag) after a rendering change
+RENDER_VERSION = 1
+
+
+class DiskLRU:
+    """Files under `root`, evicted least-recently-used past `max_bytes`.
+
+    Entries are plain files at root/<name[:2]>/<name>, written atomically
+    (temp file + rename), so readers can open, mmap or sendfile them directly.
+    Recency survives restarts through file mtimes, refreshed on hits.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._sizes = OrderedDict()   # name -> bytes, oldest first
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self._scan()
+
+    def _scan(self):
+        if not os.path.isdir(self.root):
+            return
+        found = []
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.startswith('.'):
+                    continue   # unfinished write from a crashed process
+                st = os.stat(os.path.join(shard_dir, name))
+                found.append((st.st_mtime, name, st.st_size))
+        for _mtime, name, size in sorted(found):
+            self._sizes[name] = size
+            self.total += size
+        self._evict()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def get(self, name: str) -> Optional[str]:
+        """Path of entry `name` (marking it recently used), or None."""
+        with self._lock:
+            if name not in self._sizes:
+                self.misses += 1
+                return None
+            self._sizes.move_to_end(name)
+            self.hits += 1
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except OSError:   # removed behind our back
+            with self._lock:
+                self.total -= self._sizes.pop(name, 0)
+            return None
+        return path
+
+    def put(self, name: str, data: bytes) -> str:
+        """Store `data` as entry `name`; returns its path."""
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = os.path.join(os.path.dirname(path), f'.{name}.{os.getpid()}.{threading.get_ident()}')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.total += len(data) - self._sizes.pop(name, 0)
+            self._sizes[name] = len(data)
+            self._evict(keep=name)
+        return path
+
+    def _evict(self, keep: str = None):
+        """Drop oldest entries until under budget. Hold the lock (or be in __init__)."""
+        while self.total > self.max_bytes and self._sizes:
+            name, size = next(iter(self._sizes.items()))
+            if name == keep:
+                break
+            del self._sizes[name]
+            self.total -= size
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._sizes), 'bytes': self.total, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """do(key, fn): concurrent callers with the same key share one fn() call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def parse_crop(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """'x,y,w,h' as fractions of the image (same convention as the versus zoom
+    crop boxes) -> a clamped tuple; None for no crop. Raises ValueError."""
+    if not value:
+        return None
+    parts = [float(p) for p in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError('crop must be x,y,w,h')
+    x, y, w, h = (min(1.0, max(0.0, p)) for p in parts)
+    w, h = min(w, 1.0 - x), min(h, 1.0 - y)
+    if w <= 0 or h <= 0:
+        raise ValueError('crop is empty')
+    return round(x, 4), round(y, 4), round(w, 4), round(h, 4)
+
+
+class ImageProxy:
+    """Render resized / cropped copies of B2 originals (see module docstring).
+
+    fetch(key) -> bytes of the original at storage key `key`.
+    """
+
+    def __init__(self, fetch: Callable[[str], bytes], cache: DiskLRU,
+                 max_dim: int = 2048, quality: int = 82):
+        self._fetch = fetch
+        self.cache = cache
+        self.max_dim = int(max_dim)
+        self.quality = int(quality)
+        self._flight = SingleFlight()
+
+    @staticmethod
+    def _name(*parts) -> str:
+        return hashlib.sha256('|'.join(str(p) for p in (RENDER_VERSION, *parts)).encode()).hexdigest()
+
+    def etag(self, key: str, width: int = None, height: int = None, crop=None, fmt: str = 'webp') -> str:
+        """Strong ETag of a render, without rendering it."""
+        return self._name('out', key, width, height, crop, fmt)[:32]
+
+    # ── Decoded sources ──────────────────────────────────────────────────────
+
+    def _decode(self, key: str) -> str:
+        """Fetch and decode the original into a raw src entry; returns its path."""
+        with Image.open(io.BytesIO(self._fetch(key))) as img:
+            img.draft('RGB', (self.max_dim, self.max_dim))   # JPEG: decode at reduced scale
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        img.thumbnail((self.max_dim, self.max_dim), Image.LANCZOS)
+        header = _SRC_HEADER.pack(_SRC_MAGIC, len(img.getbands()), img.width, img.height)
+        return self.cache.put(self._name('src', key), header + img.tobytes())
+
+    def _source(self, key: str) -> Image.Image:
+        """The decoded original, memory-mapped from the cache."""
+        name = self._name('src', key)
+        path = self.cache.get(name) or self._flight.do(('src', key), lambda: self._decode(key))
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:   # evicted since the lookup
+            f = open(self._flight.do(('src', key), lambda: self._decode(key)), 'rb')
+        with f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, bands, width, height = _SRC_HEADER.unpack_from(mapped)
+        if magic != _SRC_MAGIC:
+            raise ValueError(f'Corrupt cache entry for {key}')
+        mode = _MODES[bands]
+        # Zero-copy view of the pixels; the image keeps the mapping alive
+        return Image.frombuffer(mode, (width, height), memoryview(mapped)[_SRC_HEADER.size:],
+                                'raw', mode, 0, 1)
+
+    # ── Renders ──────────────────────────────────────────────────────────────
+
+    def _render(self, key: str, width, height, crop, fmt) -> str:
+        img = self._source(key)
+        if crop:
+            x, y, w, h = crop
+            img = img.crop((round(x * img.width), round(y * img.height),
+                            max(round((x + w) * img.width), round(x * img.width) + 1),
+                            max(round((y + h) * img.height), round(y * img.height) + 1)))
+        # Fit inside width x height (either may be omitted); never upscale
+        box_w = min(width or img.width, self.max_dim)
+        box_h = min(height or img.height, self.max_dim)
+        scale = min(1.0, box_w / img.width, box_h / img.height)
+        if scale < 1.0:
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                             Image.LANCZOS)
+        if fmt == 'jpeg' and img.mode == 'RGBA':
+            flat = Image.new('RGB', img.size, (255, 255, 255))
+            flat.paste(img, mask=img.getchannel('A'))
+            img = flat
+        buf = io.BytesIO()
+        img.save(buf, fmt.upper(), quality=self.quality)
+        return self.cache.put(self._name('out', key, width, height, crop, fmt), buf.getvalue())
+
+    def render(self, key: str, width: int = None, height: int = None, crop=None,
+               fmt: str = 'webp') -> Tuple[str, str]:
+        """(path, content type) of the requested render, producing it if needed."""
+        path = self.cache.get(self._name('out', key, width, height, crop, fmt)) or self._flight.do(
+            ('out', key, width, height, crop, fmt), lambda: self._render(key, width, height, crop, fmt))
+        return path, CONTENT_TYPES[fmt]
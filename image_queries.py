@@ -0,0 +1,146 @@
+"""
+Collection-scoped queries against the images table.
+
+Every function takes an open psycopg2 connection (the caller owns pooling and
+release) and pushes the collection / image filter into SQL so Postgres can use
+the UNIQUE(collection_name, filename) index, instead of pulling the whole table
+through psycopg2 and filtering on a 'collection/' prefix in Python.
+
+Entries come back in the same shape _load_tags() has always produced:
+    {'tags': [...], 'locked': bool, 'url': <B2 key>, 'body_parts': {...}}
+plus 'thumbs', the image's derivative record (see thumbnails.py), and 'meta',
+its size / colour / placeholder metadata (see image_metadata.py; {} until computed).
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+IMAGE_COLUMNS = ("collection_name, filename, url, tags, locked, body_parts, thumbs, "
+                 "width, height, byte_size, dominant_color, blurhash, phash")
+
+# Upper bound for a single page — keeps a bad ?limit= from turning a paged
+# request back into a full-table scan.
+MAX_PAGE_SIZE = 1000
+
+
+def _row_to_entry(url, tags, locked, body_parts, thumbs=None,
+                  width=None, height=None, byte_size=None, dominant_color=None, blurhash=None,
+                  phash=None) -> Dict:
+    meta = {}
+    if any(v is not None for v in (width, height, byte_size, dominant_color, blurhash, phash)):
+        meta = {'width': width, 'height': height, 'byte_size': byte_size,
+                'dominant_color': dominant_color, 'blurhash': blurhash,
+                # BIGINT is signed; the hash is an unsigned 64-bit value
+                'phash': phash % (1 << 64) if phash is not None else None}
+    return {
+        'tags':       list(tags) if tags else [],
+        'locked':     bool(locked),
+        'url':        url,
+        'body_parts': dict(body_parts) if body_parts else {},
+        'thumbs':     dict(thumbs) if thumbs else {},
+        'meta':       meta,
+    }
+
+
+def all_images(conn) -> Dict[str, Dict]:
+    """Every image, keyed by 'collection/filename' (the legacy _load_tags() shape)."""
+    cur = conn.cursor()
+    cur.execute(f"SELECT {IMAGE_COLUMNS} FROM images ORDER BY collection_name, filename")
+    return {
+        f"{coll}/{fname}": _row_to_entry(*fields)
+        for coll, fname, *fields in cur.fetchall()
+    }
+
+
+def collection_images(conn, collection: str) -> Dict[str, Dict]:
+    """All images in one collection, keyed by filename, in filename order."""
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT {IMAGE_COLUMNS} FROM images WHERE collection_name = %s ORDER BY filename",
+        (collection,)
+    )
+    return {
+        fname: _row_to_entry(*fields)
+        for _coll, fname, *fields in cur.fetchall()
+    }
+
+
+def image(conn, collection: str, filename: str) -> Optional[Dict]:
+    """A single image entry, or None if it doesn't exist."""
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT {IMAGE_COLUMNS} FROM images WHERE collection_name = %s AND filename = %s",
+        (collection, filename)
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    return _row_to_entry(*row[2:])
+
+
+def images_page(conn, collection: str = None, after: Tuple[str, str] = None,
+                limit: int = 100) -> List[Tuple[str, str, Dict]]:
+    """One keyset page of images ordered by (collection_name, filename).
+
+    `after` is the (collection, filename) of the last row of the previous page.
+    Pass `collection` to restrict the page to a single collection. Returns a
+    list of (collection, filename, entry) tuples — a short page means the end.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    clauses, params = [], []
+    if collection is not None:
+        clauses.append("collection_name = %s")
+        params.append(collection)
+    if after is not None:
+        clauses.append("(collection_name, filename) > (%s, %s)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT {IMAGE_COLUMNS} FROM images {where} "
+        f"ORDER BY collection_name, filename LIMIT %s",
+        (*params, limit)
+    )
+    return [
+        (coll, fname, _row_to_entry(*fields))
+        for coll, fname, *fields in cur.fetchall()
+    ]
+
+
+def iter_image_batches(conn, after: Tuple[str, str] = None,
+                       batch_size: int = 1000) -> Iterator[List[Tuple[str, str, Dict]]]:
+    """Every image after `after` in (collection_name, filename) order, as lists
+    of (collection, filename, entry) tuples of at most `batch_size`.
+
+    Reads through a server-side (named) cursor, so only one batch is held in
+    memory at a time. The connection must not be in autocommit mode and must
+    stay checked out until the iterator is exhausted or closed.
+    """
+    where, params = "", ()
+    if after is not None:
+        where, params = "WHERE (collection_name, filename) > (%s, %s)", tuple(after)
+    with conn.cursor(name='iter_image_batches') as cur:
+        cur.itersize = batch_size
+        cur.execute(
+            f"SELECT {IMAGE_COLUMNS} FROM images {where} ORDER BY collection_name, filename",
+            params
+        )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [
+                (coll, fname, _row_to_entry(*fields))
+                for coll, fname, *fields in rows
+            ]
+
+
+def empty_collections(conn) -> List[str]:
+    """Names of registered collections that have no images, in name order."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT c.name FROM collections c
+        WHERE NOT EXISTS (SELECT 1 FROM images i WHERE i.collection_name = c.name)
+        ORDER BY c.name
+    """)
+    return [row[0] for row in cur.fetchall()]
+
@@ -8,24 +8,39 @@ Backends supported:
 
 This module exposes a unified API:
 - analyze_image(image_path, top_k, threshold) -> List[{tag, confidence}]
+- analyze_images(image_paths, top_k, threshold, batch_size) -> one such list per path
 - get_primary_tags(image_path, max_tags) -> List[str]
 - set_tagger_config(dict) -> configure backend at runtime
+- compare_backends(image_paths, backends) -> throughput and tag agreement of
+  the INT8 / ONNX variants (BACKEND_VARIANTS) against fp32
 """
 
 import os
 import json
-from typing import List, Dict, Tuple, Optional
+import functools
+import hashlib
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Tuple, Optional, Union
 
 from PIL import Image
 
+from tag_cache import content_sha256
+
 # Optional deps; imported lazily when used
 _torch = None
 _clip_model = None
 _clip_processor = None
+# Lazily built INT8 / ONNX model variants and per-variant CLIP prompt embeddings,
+# keyed by (kind, variant); see BACKEND_VARIANTS.
+_variant_models: Dict[Tuple[str, str], object] = {}
 
 _ort = None
 _wd14_session = None
 _wd14_labels: Optional[List[str]] = None
+_wd14_keep = None   # (labels, bool mask of labels not in FILTERED_TAGS)
+_wd14_buffers = threading.local()   # per-thread float32 batch input, reused across batches
 
 _blip_model = None
 _blip_processor = None
@@ -34,13 +49,58 @@ _blip_vision_model = None
 # Runtime config (persisted in data/tagger_config.json)
 CONFIG_PATH = os.path.join('data', 'tagger_config.json')
 _config = {
-    'backend': 'blip',           # 'clip' | 'wd14' | 'blip'
+    'backend': 'blip',           # 'clip' | 'wd14' | 'blip', or a variant like 'clip-int8' (BACKEND_VARIANTS)
     'model_path': None,          # path to onnx model (for wd14)
     'labels_path': None,         # path to labels.csv/tags.txt (for wd14)
     # Optional per-collection overrides: { 'Real': 'blip', 'AI': 'wd14' }
-    'backend_overrides': {}
+    'backend_overrides': {},
+    # onnxruntime session settings for wd14; keys as in ORT_OPTION_DEFAULTS
+    'ort_options': {}
+}
+
+ORT_OPTION_DEFAULTS = {
+    'intra_op_threads': 0,           # threads inside one op; 0 = onnxruntime default (all cores)
+    'inter_op_threads': 0,           # threads across independent ops (parallel mode only)
+    'execution_mode': 'sequential',  # 'sequential' | 'parallel'
+    'graph_optimization': 'all',     # 'disable' | 'basic' | 'extended' | 'all'
+    # Save the optimized graph here on first load and load it directly afterwards
+    # (skips re-optimizing on every start; use 'extended' if the file moves hosts).
+    'optimized_model_path': None,
+    'cpu_mem_arena': True,           # onnxruntime's CPU memory arena
+    'mem_pattern': True,             # pre-plan allocations from the first run's shapes
+    'io_binding': False,             # bind the input and a preallocated output buffer
+    'self_benchmark': False,         # log a latency sweep of thread/optimization settings at load
 }
 
+# analyze_images(): images per model forward pass, and threads decoding /
+# preprocessing the next batch while the current one is in the model.
+TAGGER_BATCH_SIZE = int(os.environ.get('TAGGER_BATCH_SIZE', 8))
+TAGGER_DECODE_WORKERS = int(os.environ.get('TAGGER_DECODE_WORKERS', 4))
+
+# Cheaper CPU variants, usable anywhere a backend name is (config 'backend' and
+# 'backend_overrides') as '<backend>-<variant>':
+#   int8       PyTorch dynamic INT8 quantization of the Linear layers
+#   onnx       CLIP image tower exported to ONNX, run by onnxruntime
+#   onnx-int8  the same export with onnxruntime dynamic INT8 weights
+# BLIP only has int8: beam-search generate() does not export to a single graph.
+BACKEND_VARIANTS = {
+    'clip': ('', 'int8', 'onnx', 'onnx-int8'),
+    'blip': ('', 'int8'),
+    'wd14': ('',),
+}
+# Where exported / quantized ONNX models are written on first use
+TAGGER_ONNX_DIR = os.environ.get('TAGGER_ONNX_DIR', os.path.join('data', 'onnx_models'))
+
+# Bump when tag post-processing changes in a way the model identity doesn't
+# capture (BLIP caption parsing, ranking), so tag_cache entries are recomputed.
+TAG_RESULT_VERSION = 1
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+# Where CLIP prompt embeddings are kept between runs (keyed by model name and
+# prompt-list hash); set CLIP_TEXT_CACHE_DIR= (empty) to only cache in memory.
+CLIP_TEXT_CACHE_DIR = os.environ.get('CLIP_TEXT_CACHE_DIR', os.path.join('data', 'clip_text_cache'))
+
 # Tags to filter out (overly generic or anime-specific that don't add value)
 FILTERED_TAGS = {
     'general', 'sensitive', 'questionable', 'explicit',  # Rating tags
@@ -71,14 +131,16 @@ def _save_config_file():
 
 def set_tagger_config(new_conf: Dict):
     """Update runtime configuration and reset backends if needed."""
-    global _config, _clip_model, _clip_processor, _wd14_session, _wd14_labels, _blip_model, _blip_processor, _blip_vision_model
-    _config.update({k: new_conf[k] for k in ['backend','model_path','labels_path','backend_overrides'] if k in new_conf})
+    global _config, _clip_model, _clip_processor, _wd14_session, _wd14_labels, _wd14_keep, _blip_model, _blip_processor, _blip_vision_model
+    _config.update({k: new_conf[k] for k in ['backend','model_path','labels_path','backend_overrides','ort_options'] if k in new_conf})
     _save_config_file()
     # reset loaded models; lazy-reload on next call
     _clip_model = None
     _clip_processor = None
+    _variant_models.clear()
     _wd14_session = None
     _wd14_labels = None
+    _wd14_keep = None
     _blip_model = None
     _blip_processor = None
     _blip_vision_model = None
@@ -198,13 +260,246 @@ def _load_clip_model():
         from transformers import CLIPProcessor, CLIPModel
         import torch as _t
         _torch = _t
-        _clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-        _clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+        _clip_model = CLIPModel.from_pretrained(CLIP_MODEL_NAME)
+        _clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
         _clip_model.eval()
         print("[tagger] CLIP model loaded.")
     return _clip_model, _clip_processor
 
 
+def _clip_prompts() -> List[str]:
+    return [f"a photo of {tag}" for tag in ALL_TAGS]
+
+
+def _text_cache_path(model_name: str, prompts: List[str]) -> Optional[str]:
+    if not CLIP_TEXT_CACHE_DIR:
+        return None
+    digest = hashlib.sha256('\n'.join(prompts).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CLIP_TEXT_CACHE_DIR, f"{model_name.replace('/', '--')}-{digest}.npy")
+
+
+def _cached_text_embeddings(model_name: str, prompts: List[str], encode: Callable[[List[str]], 'np.ndarray']):
+    """L2-normalized (len(prompts), dim) float32 matrix of prompt embeddings,
+    read from CLIP_TEXT_CACHE_DIR when present, otherwise encode(prompts) and saved."""
+    import numpy as np
+    path = _text_cache_path(model_name, prompts)
+    if path and os.path.exists(path):
+        try:
+            cached = np.load(path)
+            if cached.shape[0] == len(prompts):
+                return cached
+        except Exception as e:
+            print(f"[tagger] Ignoring unreadable CLIP text cache {path}: {e}")
+    features = np.asarray(encode(prompts), dtype=np.float32)
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    if path:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.save(path, features)
+        except Exception as e:
+            print(f"[tagger] Could not save CLIP text cache {path}: {e}")
+    return features
+
+
+def _import_torch():
+    global _torch
+    if _torch is None:
+        import torch as _t
+        _torch = _t
+    return _torch
+
+
+def _quantize_int8(model):
+    """Dynamic INT8 quantization of a model's Linear layers (weights int8,
+    activations fp32), in place, so their fp32 weights are freed as it goes."""
+    torch = _import_torch()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _variant(kind: str, variant: str, build: Callable):
+    key = (kind, variant)
+    if key not in _variant_models:
+        _variant_models[key] = build()
+    return _variant_models[key]
+
+
+def _load_clip_int8():
+    """CLIP with INT8 Linear layers. The fp32 weights are loaded only as the
+    quantization input; the fp32 model of the '' variant is not loaded."""
+    def build():
+        from transformers import CLIPModel
+        print("[tagger] Quantizing CLIP to INT8...")
+        return _quantize_int8(CLIPModel.from_pretrained(CLIP_MODEL_NAME).eval())
+    return _variant('clip', 'int8', build)
+
+
+def _clip_onnx_paths() -> Tuple[str, str, str]:
+    base = os.path.join(TAGGER_ONNX_DIR, CLIP_MODEL_NAME.replace('/', '--'))
+    return base + '-vision.onnx', base + '-vision-int8.onnx', base + '-vision.json'
+
+
+def _export_clip_vision_onnx():
+    """Export CLIP's image tower (get_image_features) to ONNX, plus its logit scale."""
+    fp32_path, _int8_path, meta_path = _clip_onnx_paths()
+    model, _processor = _load_clip_model()
+    print(f"[tagger] Exporting CLIP image tower to {fp32_path}...")
+
+    class _ImageTower(_torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.clip = clip
+
+        def forward(self, pixel_values):
+            return self.clip.get_image_features(pixel_values=pixel_values)
+
+    os.makedirs(os.path.dirname(fp32_path), exist_ok=True)
+    size = model.config.vision_config.image_size
+    _torch.onnx.export(
+        _ImageTower(model), (_torch.zeros(1, 3, size, size),), fp32_path,
+        input_names=['pixel_values'], output_names=['image_embeds'],
+        dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+        opset_version=17,
+    )
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'model': CLIP_MODEL_NAME, 'logit_scale': float(model.logit_scale.exp())}, f)
+
+
+def _load_clip_onnx(variant: str):
+    """(onnxruntime session, logit scale) for the 'onnx' / 'onnx-int8' CLIP image tower."""
+    def build():
+        import onnxruntime as ort
+        fp32_path, int8_path, meta_path = _clip_onnx_paths()
+        if not (os.path.exists(fp32_path) and os.path.exists(meta_path)):
+            _export_clip_vision_onnx()
+        path = fp32_path
+        if variant == 'onnx-int8':
+            if not os.path.exists(int8_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                print(f"[tagger] Quantizing {fp32_path} to INT8...")
+                quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+            path = int8_path
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            logit_scale = json.load(f)['logit_scale']
+        options = {**_ort_options(), 'optimized_model_path': None, 'self_benchmark': False}
+        return _create_ort_session(ort, path, options), logit_scale
+    return _variant('clip', variant, build)
+
+
+def _clip_processor_only():
+    """CLIPProcessor without loading the torch model (enough for the ONNX variants)."""
+    global _clip_processor
+    if _clip_processor is None:
+        from transformers import CLIPProcessor
+        _clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    return _clip_processor
+
+
+def _clip_text_side(variant: str = ''):
+    """(normalized ALL_TAGS prompt embeddings as numpy, logit scale) for a CLIP variant,
+    encoded once per load. The ONNX variants export only the image tower and share
+    the fp32 text embeddings."""
+    text_variant = 'int8' if variant == 'int8' else ''
+
+    def build():
+        def encode(prompts):
+            # Only runs on a disk-cache miss, so the ONNX variants can skip torch
+            model = _load_clip_int8() if text_variant == 'int8' else _load_clip_model()[0]
+            inputs = _clip_processor_only()(text=prompts, return_tensors="pt", padding=True)
+            with _torch.no_grad():
+                return model.get_text_features(**inputs).numpy()
+
+        name = CLIP_MODEL_NAME + ('-int8' if text_variant else '')
+        return _cached_text_embeddings(name, _clip_prompts(), encode)
+
+    text = _variant('clip-text', text_variant, build)
+    if variant.startswith('onnx'):
+        return text, _load_clip_onnx(variant)[1]
+    model = _load_clip_int8() if variant == 'int8' else _load_clip_model()[0]
+    return text, float(model.logit_scale.exp())
+
+
+def _ort_options() -> Dict:
+    return {**ORT_OPTION_DEFAULTS, **(_config.get('ort_options') or {})}
+
+
+def _ort_session_options(ort, options: Dict):
+    """onnxruntime.SessionOptions for an ORT_OPTION_DEFAULTS-style dict."""
+    so = ort.SessionOptions()
+    if options.get('intra_op_threads'):
+        so.intra_op_num_threads = int(options['intra_op_threads'])
+    if options.get('inter_op_threads'):
+        so.inter_op_num_threads = int(options['inter_op_threads'])
+    so.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if options.get('execution_mode') == 'parallel'
+                         else ort.ExecutionMode.ORT_SEQUENTIAL)
+    levels = {
+        'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    so.graph_optimization_level = levels.get(str(options.get('graph_optimization', 'all')).lower(),
+                                             levels['all'])
+    so.enable_cpu_mem_arena = bool(options.get('cpu_mem_arena', True))
+    so.enable_mem_pattern = bool(options.get('mem_pattern', True))
+    return so
+
+
+def _create_ort_session(ort, model_path: str, options: Dict):
+    """InferenceSession for model_path, reusing / writing the optimized-model cache if configured."""
+    so = _ort_session_options(ort, options)
+    path = model_path
+    optimized = options.get('optimized_model_path')
+    if optimized:
+        if os.path.exists(optimized) and os.path.getmtime(optimized) >= os.path.getmtime(model_path):
+            path = optimized
+            # Already optimized; don't pay for it again
+            so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        else:
+            os.makedirs(os.path.dirname(optimized) or '.', exist_ok=True)
+            so.optimized_model_filepath = optimized
+    return ort.InferenceSession(path, sess_options=so, providers=["CPUExecutionProvider"])
+
+
+def benchmark_ort_options(model_path: str, variants: List[Dict] = None, batch_size: int = 1,
+                          runs: int = 5) -> List[Dict]:
+    """Load the WD14 model under each option variant (default: a thread-count x
+    optimization-level sweep over the configured options) and time session.run on
+    random input. Returns [{'options', 'load_ms', 'ms_per_batch', 'images_per_sec'}]."""
+    import time
+    import numpy as np
+    import onnxruntime as ort
+    base = {**_ort_options(), 'optimized_model_path': None, 'self_benchmark': False}
+    if variants is None:
+        threads = sorted({1, 2, max(1, (os.cpu_count() or 2) // 2), 0})
+        variants = [{'intra_op_threads': t, 'graph_optimization': level}
+                    for t in threads for level in ('basic', 'all')]
+    results = []
+    for variant in variants:
+        options = {**base, **variant}
+        start = time.perf_counter()
+        session = _create_ort_session(ort, model_path, options)
+        load_ms = (time.perf_counter() - start) * 1000
+        inp = session.get_inputs()[0]
+        n = 1 if inp.shape and inp.shape[0] == 1 else batch_size
+        batch = np.random.default_rng(0).uniform(-1, 1, (n, WD14_SIZE, WD14_SIZE, 3)).astype(np.float32)
+        _wd14_run(session, inp.name, batch, options)   # warm-up
+        start = time.perf_counter()
+        for _ in range(runs):
+            _wd14_run(session, inp.name, batch, options)
+        ms = (time.perf_counter() - start) * 1000 / runs
+        results.append({'options': variant, 'load_ms': round(load_ms, 1),
+                        'ms_per_batch': round(ms, 2), 'images_per_sec': round(n * 1000 / ms, 2)})
+    return results
+
+
+def _print_ort_benchmark(results: List[Dict]):
+    print("[tagger] WD14 onnxruntime option sweep:")
+    for r in results:
+        opts = ', '.join(f"{k}={v}" for k, v in r['options'].items())
+        print(f"[tagger]   {opts:<48} load {r['load_ms']:>8.0f} ms  "
+              f"{r['ms_per_batch']:>8.1f} ms/batch  {r['images_per_sec']:>7.1f} img/s")
+
+
 def _load_wd14(model_path: str, labels_path: str):
     """Lazy-load WD14 ONNX model and labels from local paths."""
     global _ort, _wd14_session, _wd14_labels
@@ -212,7 +507,10 @@ def _load_wd14(model_path: str, labels_path: str):
         print(f"[tagger] Loading WD14 tagger from {model_path}\n         labels: {labels_path}")
         import onnxruntime as ort
         _ort = ort
-        _wd14_session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])  # CPU by default
+        options = _ort_options()
+        _wd14_session = _create_ort_session(ort, model_path, options)  # CPU by default
+        if options['self_benchmark']:
+            _print_ort_benchmark(benchmark_ort_options(model_path))
         # Load labels (CSV or one-per-line) with robust Windows-friendly decoding
         labels = []
         def _read_lines(path):
@@ -288,7 +586,8 @@ def _load_wd14(model_path: str, labels_path: str):
     return _wd14_session, _wd14_labels
 
 
-def _analyze_clip(image_path: str, top_k: int = 10, threshold: float = 0.15) -> List[Dict[str, any]]:
+def _analyze_clip(image_path: str, top_k: int = 10, threshold: float = 0.15,
+                  variant: str = '') -> List[Dict[str, any]]:
     """
     Analyze an image and return relevant tags with confidence scores.
     
@@ -296,92 +595,186 @@ def _analyze_clip(image_path: str, top_k: int = 10, threshold: float = 0.15) ->
         image_path: Path to the image file
         top_k: Number of top tags to return
         threshold: Minimum confidence threshold (0-1)
+        variant: '' (fp32) or one of BACKEND_VARIANTS['clip']
     
     Returns:
         List of dicts with 'tag' and 'confidence' keys, sorted by confidence
     """
     try:
-        model, processor = _load_clip_model()
-        
-        # Load and preprocess image
         image = Image.open(image_path).convert("RGB")
-        
-        # Prepare inputs for CLIP
-        inputs = processor(
-            text=[f"a photo of {tag}" for tag in ALL_TAGS],
-            images=image,
-            return_tensors="pt",
-            padding=True
-        )
-        
-        # Get predictions
-        with _torch.no_grad():
-            outputs = model(**inputs)
-            logits_per_image = outputs.logits_per_image
-            probs = logits_per_image.softmax(dim=1)[0]
-        
-        # Extract top tags
-        results = []
-        for idx, prob in enumerate(probs):
-            confidence = float(prob.item())
-            if confidence >= threshold:
-                results.append({
-                    'tag': ALL_TAGS[idx],
-                    'confidence': round(confidence, 3)
-                })
-        
-        # Sort by confidence and return top_k
-        results.sort(key=lambda x: x['confidence'], reverse=True)
-        return results[:top_k]
-        
+        return _clip_batch([image], top_k=top_k, threshold=threshold, variant=variant)[0]
     except Exception as e:
         print(f"[tagger] Error (CLIP) analyzing image {image_path}: {e}")
         return []
 
+
+def _rank(labels: List[str], confidences, top_k: int, threshold: float) -> List[Dict[str, any]]:
+    """Top `top_k` {tag, confidence} entries at or above threshold, best first."""
+    results = []
+    for idx, p in enumerate(confidences):
+        p = float(p)
+        if p >= threshold and idx < len(labels):
+            results.append({'tag': labels[idx], 'confidence': round(p, 3)})
+    results.sort(key=lambda x: x['confidence'], reverse=True)
+    return results[:top_k]
+
+
+def _clip_image_features(images: List[Image.Image], variant: str = ''):
+    """L2-normalized image embeddings (numpy, one row per image) for a CLIP variant."""
+    import numpy as np
+    if variant.startswith('onnx'):
+        session, _scale = _load_clip_onnx(variant)
+        pixels = _clip_processor_only()(images=images, return_tensors="np")['pixel_values']
+        features = session.run(None, {'pixel_values': pixels.astype(np.float32)})[0]
+    else:
+        model = _load_clip_int8() if variant == 'int8' else _load_clip_model()[0]
+        inputs = _clip_processor_only()(images=images, return_tensors="pt")
+        with _torch.no_grad():
+            features = model.get_image_features(**inputs).numpy()
+    return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+
+def _clip_batch(images: List[Image.Image], top_k: int = 10, threshold: float = 0.15,
+                variant: str = '') -> List[List[Dict[str, any]]]:
+    """Score ALL_TAGS for a batch of RGB images: one image-tower pass plus a
+    matrix multiply against the cached prompt embeddings (same logits as
+    CLIPModel's logits_per_image)."""
+    import numpy as np
+    text_features, logit_scale = _clip_text_side(variant)
+    logits = logit_scale * _clip_image_features(images, variant) @ text_features.T
+    logits -= logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    probs /= probs.sum(axis=1, keepdims=True)
+    return [_rank(ALL_TAGS, row, top_k, threshold) for row in probs]
+
+WD14_SIZE = 448
+
+
+def _wd14_pixels(image: Image.Image):
+    """Resize a PIL image to the WD14 input size; uint8 HWC array."""
+    import numpy as np
+    return np.asarray(image.convert('RGB').resize((WD14_SIZE, WD14_SIZE), Image.BICUBIC), dtype=np.uint8)
+
+
+def _wd14_normalize(pixels, out):
+    """Scale uint8 pixel arrays into out[:len(pixels)] as float32 in [-1, 1], in place."""
+    import numpy as np
+    for i, px in enumerate(pixels):
+        np.multiply(px, 2.0 / 255.0, out=out[i], casting='unsafe')
+    batch = out[:len(pixels)]
+    batch -= 1.0
+    return batch
+
+
+def _wd14_output_buffer(n: int, n_labels: int):
+    """Float32 (n, n_labels) slice of this thread's reusable IO-binding output buffer."""
+    import numpy as np
+    buf = getattr(_wd14_buffers, 'output', None)
+    if buf is None or buf.shape[0] < n or buf.shape[1] != n_labels:
+        buf = _wd14_buffers.output = np.empty((n, n_labels), dtype=np.float32)
+    return buf[:n]
+
+
+def _wd14_run(session, input_name: str, batch, options: Dict = None):
+    """Logits for one input batch. With io_binding the result is written into a
+    preallocated per-thread buffer (overwritten by the next call on this thread)."""
+    import numpy as np
+    options = options if options is not None else _ort_options()
+    if not options.get('io_binding') or not hasattr(session, 'io_binding'):
+        return session.run(None, {input_name: batch})[0]
+    output = session.get_outputs()[0]
+    n_labels = output.shape[-1] if isinstance(output.shape[-1], int) else len(_wd14_labels or ())
+    out = _wd14_output_buffer(batch.shape[0], n_labels)
+    binding = session.io_binding()
+    binding.bind_cpu_input(input_name, batch)
+    binding.bind_output(output.name, 'cpu', 0, np.float32, list(out.shape), out.ctypes.data)
+    session.run_with_iobinding(binding)
+    return out
+
+
+def _wd14_input_buffer(n: int):
+    """Float32 (n, 448, 448, 3) view into this thread's reusable input buffer."""
+    import numpy as np
+    buf = getattr(_wd14_buffers, 'array', None)
+    if buf is None or buf.shape[0] < n:
+        buf = _wd14_buffers.array = np.empty((n, WD14_SIZE, WD14_SIZE, 3), dtype=np.float32)
+    return buf
+
+
 def _preprocess_wd14(image: Image.Image):
     """Preprocess PIL image for WD14 ONNX (ConvNeXt 448x448)."""
     import numpy as np
-    img = image.convert('RGB').resize((448, 448), Image.BICUBIC)
-    arr = np.asarray(img).astype('float32') / 255.0
-    # Normalize to [-1, 1]
-    arr = (arr - 0.5) / 0.5
-    # Keep NHWC layout as expected by many WD14 ONNX models (1, 448, 448, 3)
-    # Add batch dimension
-    arr = arr[None, :, :, :]
-    return arr
+    # Normalize to [-1, 1], NHWC layout as expected by many WD14 ONNX models (1, 448, 448, 3)
+    out = np.empty((1, WD14_SIZE, WD14_SIZE, 3), dtype=np.float32)
+    return _wd14_normalize([_wd14_pixels(image)], out)
 
 
 def _analyze_wd14(image_path: str, top_k: int = 10, threshold: float = 0.35) -> List[Dict[str, any]]:
     try:
-        model_path = _config.get('model_path')
-        labels_path = _config.get('labels_path')
-        if not model_path or not labels_path or not os.path.exists(model_path) or not os.path.exists(labels_path):
+        if not _wd14_ready():
             print("[tagger] WD14 model/labels not configured or missing; falling back to CLIP")
             return _analyze_clip(image_path, top_k=top_k, threshold=threshold)
-        session, labels = _load_wd14(model_path, labels_path)
-
         image = Image.open(image_path).convert('RGB')
-        inp = _preprocess_wd14(image)
-        input_name = session.get_inputs()[0].name
-        out = session.run(None, {input_name: inp})
-        if not out:
-            return []
-        import numpy as np
-        logits = out[0].reshape(-1)
-        # Sigmoid to confidence
-        conf = 1 / (1 + np.exp(-logits))
-        results = []
-        for idx, p in enumerate(conf):
-            p = float(p)
-            if p >= threshold and idx < len(labels):
-                results.append({'tag': labels[idx], 'confidence': round(p, 3)})
-        results.sort(key=lambda x: x['confidence'], reverse=True)
-        return results[:top_k]
+        return _wd14_batch([_wd14_pixels(image)], top_k=top_k, threshold=threshold)[0]
     except Exception as e:
         print(f"[tagger] Error (WD14) analyzing image {image_path}: {e}")
         return []
 
 
+def _wd14_ready() -> bool:
+    model_path = _config.get('model_path')
+    labels_path = _config.get('labels_path')
+    return bool(model_path and labels_path and os.path.exists(model_path) and os.path.exists(labels_path))
+
+
+def _wd14_keep_mask(labels: List[str]):
+    """Boolean mask over label indices, False for FILTERED_TAGS (built once per label list)."""
+    global _wd14_keep
+    import numpy as np
+    if _wd14_keep is None or _wd14_keep[0] is not labels:
+        _wd14_keep = (labels, np.array([label not in FILTERED_TAGS for label in labels], dtype=bool))
+    return _wd14_keep[1]
+
+
+def _rank_wd14(probs, labels: List[str], keep, top_k: int, threshold: float) -> List[Dict[str, any]]:
+    """Vectorized _rank for one row of WD14 confidences, skipping FILTERED_TAGS."""
+    import numpy as np
+    if top_k <= 0:
+        return []
+    n = min(len(labels), probs.shape[0])
+    probs = probs[:n]
+    candidates = np.flatnonzero((probs >= threshold) & keep[:n])
+    if candidates.size > top_k:
+        candidates = candidates[np.argpartition(-probs[candidates], top_k - 1)[:top_k]]
+    candidates = candidates[np.argsort(-probs[candidates], kind='stable')]
+    return [{'tag': labels[i], 'confidence': round(float(probs[i]), 3)} for i in candidates]
+
+
+def _wd14_batch(pixels, top_k: int = 10, threshold: float = 0.35, variant: str = '') -> List[List[Dict[str, any]]]:
+    """Tag a batch of _wd14_pixels() arrays with one session.run (one per image
+    if the model was exported with a fixed batch dimension of 1). FILTERED_TAGS
+    are never returned."""
+    import numpy as np
+    session, labels = _load_wd14(_config.get('model_path'), _config.get('labels_path'))
+    keep = _wd14_keep_mask(labels)
+    inp = session.get_inputs()[0]
+    batch = _wd14_normalize(pixels, _wd14_input_buffer(len(pixels)))
+    options = _ort_options()
+    if inp.shape and inp.shape[0] == 1:
+        logits = np.stack([np.array(_wd14_run(session, inp.name, batch[i:i + 1], options)).reshape(-1)
+                           for i in range(len(pixels))])
+    else:
+        logits = _wd14_run(session, inp.name, batch, options).reshape(len(pixels), -1)
+    # Sigmoid to confidence, in place (exp overflow -> inf -> confidence 0 is fine)
+    probs = np.array(logits, dtype=np.float32)
+    np.negative(probs, out=probs)
+    with np.errstate(over='ignore'):
+        np.exp(probs, out=probs)
+    probs += 1.0
+    np.reciprocal(probs, out=probs)
+    return [_rank_wd14(row, labels, keep, top_k, threshold) for row in probs]
+
+
 def _load_blip_models():
     """Lazy-load BLIP models for realistic image tagging."""
     global _torch, _blip_model, _blip_processor, _blip_vision_model
@@ -392,177 +785,219 @@ def _load_blip_models():
         _torch = _t
         
         # BLIP for captioning
-        _blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-        _blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+        _blip_processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME)
+        _blip_model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME)
         _blip_model.eval()
         
         print("[tagger] BLIP models loaded.")
     return _blip_model, _blip_processor
 
 
-def _analyze_blip(image_path: str, top_k: int = 10, threshold: float = 0.15) -> List[Dict[str, any]]:
+def _blip_processor_only():
+    """BlipProcessor without loading the fp32 model (enough for the INT8 variant)."""
+    global _blip_processor
+    if _blip_processor is None:
+        from transformers import BlipProcessor
+        _blip_processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME)
+    return _blip_processor
+
+
+def _load_blip_int8():
+    """BLIP captioner with INT8 Linear layers (see _load_clip_int8)."""
+    def build():
+        from transformers import BlipForConditionalGeneration
+        print("[tagger] Quantizing BLIP to INT8...")
+        return _quantize_int8(BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME).eval())
+    return _variant('blip', 'int8', build)
+
+
+def _analyze_blip(image_path: str, top_k: int = 10, threshold: float = 0.15,
+                  variant: str = '') -> List[Dict[str, any]]:
     """
     Analyze realistic images using BLIP to generate natural language descriptions and tags.
     Produces tags like: 'woman', 'long hair', 'sitting', 'white background', 'smiling'
     """
     try:
-        model, processor = _load_blip_models()
         image = Image.open(image_path).convert("RGB")
-        
-        # Generate multiple diverse captions with different strategies
-        inputs = processor(image, return_tensors="pt")
-        
-        captions = []
-        
-        # Strategy 1: Beam search for detailed descriptions
-        with _torch.no_grad():
-            out = model.generate(**inputs, max_length=60, num_beams=5, num_return_sequences=4)
-        for seq in out:
-            caption = processor.decode(seq, skip_special_tokens=True)
-            if caption and caption not in captions:
-                captions.append(caption)
-        
-        # Strategy 2: Sampling for more varied descriptions
+        return _blip_batch([image], top_k=top_k, threshold=threshold, variant=variant)[0]
+    except Exception as e:
+        print(f"[tagger] Error (BLIP) analyzing image {image_path}: {e}")
+        import traceback
+        traceback.print_exc()
+        return []
+
+
+def _blip_captions(images: List[Image.Image], variant: str = '') -> List[List[str]]:
+    """Beam-search and sampled captions for a batch of RGB images, per image."""
+    if variant == 'int8':
+        model, processor = _load_blip_int8(), _blip_processor_only()
+    else:
+        model, processor = _load_blip_models()
+    inputs = processor(images, return_tensors="pt")
+    captions = [[] for _ in images]
+
+    # Strategy 1: beam search for detailed descriptions; strategy 2: sampling
+    # for more varied ones. generate() returns num_return_sequences rows per
+    # image, grouped by image.
+    strategies = [
+        (4, dict(max_length=60, num_beams=5, num_return_sequences=4)),
+        (2, dict(max_length=50, do_sample=True, top_k=50, top_p=0.92, num_return_sequences=2)),
+    ]
+    for per_image, kwargs in strategies:
         with _torch.no_grad():
-            out = model.generate(**inputs, max_length=50, do_sample=True, top_k=50, top_p=0.92, num_return_sequences=2)
-        for seq in out:
+            out = model.generate(**inputs, **kwargs)
+        for i, seq in enumerate(out):
             caption = processor.decode(seq, skip_special_tokens=True)
-            if caption and caption not in captions:
-                captions.append(caption)
+            bucket = captions[i // per_image]
+            if caption and caption not in bucket:
+                bucket.append(caption)
+    return captions
+
+
+def _blip_batch(images: List[Image.Image], top_k: int = 10, threshold: float = 0.15,
+                variant: str = '') -> List[List[Dict[str, any]]]:
+    return [_blip_tags(captions, top_k, threshold) for captions in _blip_captions(images, variant)]
+
+
+def _blip_tags(captions: List[str], top_k: int = 10, threshold: float = 0.15) -> List[Dict[str, any]]:
+    """Turn one image's BLIP captions into weighted tags."""
+    # Extract structured information from captions with enhanced detail
+    tags_dict = {}
+    import re
+    
+    # Track attributes separately for better organization
+    appearance_attrs = []
+    action_attrs = []
+    setting_attrs = []
+    
+    for caption in captions:
+        caption = caption.lower().strip()
+        original_caption = caption
         
-        # Extract structured information from captions with enhanced detail
-        tags_dict = {}
-        import re
+        # Extract key descriptive words and phrases
+        # Remove sentence starters
+        caption = re.sub(r'^(a|an|the|this|that|there is|there are|image shows|photo of|picture of)\s+', '', caption)
         
-        # Track attributes separately for better organization
-        appearance_attrs = []
-        action_attrs = []
-        setting_attrs = []
+        # Detect actions/poses
+        action_words = ['sitting', 'standing', 'lying', 'leaning', 'posing', 'smiling', 'looking', 'holding', 'wearing', 'showing', 'facing', 'kneeling', 'bending']
+        for action in action_words:
+            if action in original_caption:
+                action_attrs.append(action)
+                tags_dict[action] = tags_dict.get(action, 0) + 4
         
-        for caption in captions:
-            caption = caption.lower().strip()
-            original_caption = caption
-            
-            # Extract key descriptive words and phrases
-            # Remove sentence starters
-            caption = re.sub(r'^(a|an|the|this|that|there is|there are|image shows|photo of|picture of)\s+', '', caption)
-            
-            # Detect actions/poses
-            action_words = ['sitting', 'standing', 'lying', 'leaning', 'posing', 'smiling', 'looking', 'holding', 'wearing', 'showing', 'facing', 'kneeling', 'bending']
-            for action in action_words:
-                if action in original_caption:
-                    action_attrs.append(action)
-                    tags_dict[action] = tags_dict.get(action, 0) + 4
-            
-            # Detect clothing and appearance
-            clothing_patterns = [
-                r'(wearing|in)\s+(a\s+)?(\w+\s+)?(dress|shirt|top|bottom|pants|jeans|skirt|jacket|coat|swimsuit|bikini|lingerie|underwear)',
-                r'(\w+\s+)?(hair|eyes|skin|lips|nails)',
-                r'(long|short|curly|straight|blonde|brunette|black|red|brown)\s+(hair)',
-                r'(blue|green|brown|hazel|dark)\s+(eyes)'
-            ]
-            for pattern in clothing_patterns:
-                matches = re.finditer(pattern, original_caption)
-                for match in matches:
-                    detail = match.group(0).strip()
-                    detail = re.sub(r'\b(a|an|the|in|wearing)\b', '', detail).strip()
-                    if len(detail) >= 4:
-                        appearance_attrs.append(detail)
-                        tags_dict[detail] = tags_dict.get(detail, 0) + 5
-            
-            # Detect setting/background
-            setting_words = ['background', 'wall', 'floor', 'room', 'outdoor', 'indoor', 'studio', 'bedroom', 'bathroom', 'kitchen', 'office', 'beach', 'forest', 'park', 'street']
-            for setting in setting_words:
-                if setting in original_caption:
-                    setting_attrs.append(setting)
-                    tags_dict[setting] = tags_dict.get(setting, 0) + 3
-            
-            # Extract color descriptions
-            colors = ['white', 'black', 'red', 'blue', 'green', 'yellow', 'pink', 'purple', 'grey', 'gray', 'brown', 'orange']
-            for color in colors:
-                if color in original_caption:
-                    tags_dict[color] = tags_dict.get(color, 0) + 2
-            
-            # Split by common separators for general extraction
-            parts = re.split(r'[,\s]+(?:with|and|in|on|at|wearing|has|having|next to|behind|front of)\s+', caption)
-            
-            for part in parts:
-                part = part.strip()
-                if not part or len(part) < 3:
-                    continue
-                
-                # Clean up
-                part = re.sub(r'\b(a|an|the|is|are|was|were)\b', '', part).strip()
-                
-                # Extract meaningful phrases
-                words = part.split()
-                if len(words) == 1 and len(words[0]) >= 4:
-                    tags_dict[words[0]] = tags_dict.get(words[0], 0) + 2
-                elif len(words) == 2:
-                    # Two-word phrases like "long hair", "white background"
-                    phrase = ' '.join(words)
-                    if phrase not in tags_dict or tags_dict[phrase] < 5:  # Don't override higher scores
-                        tags_dict[phrase] = tags_dict.get(phrase, 0) + 3
-                elif len(words) >= 3:
-                    # Take last 2-3 words for key phrases
-                    phrase = ' '.join(words[-2:])
-                    if len(phrase) >= 6:
-                        tags_dict[phrase] = tags_dict.get(phrase, 0) + 1
-                    # Also try first 2 words if they seem descriptive
-                    phrase2 = ' '.join(words[:2])
-                    if len(phrase2) >= 6 and any(adj in words[0] for adj in ['long', 'short', 'dark', 'light', 'large', 'small']):
-                        tags_dict[phrase2] = tags_dict.get(phrase2, 0) + 2
+        # Detect clothing and appearance
+        clothing_patterns = [
+            r'(wearing|in)\s+(a\s+)?(\w+\s+)?(dress|shirt|top|bottom|pants|jeans|skirt|jacket|coat|swimsuit|bikini|lingerie|underwear)',
+            r'(\w+\s+)?(hair|eyes|skin|lips|nails)',
+            r'(long|short|curly|straight|blonde|brunette|black|red|brown)\s+(hair)',
+            r'(blue|green|brown|hazel|dark)\s+(eyes)'
+        ]
+        for pattern in clothing_patterns:
+            matches = re.finditer(pattern, original_caption)
+            for match in matches:
+                detail = match.group(0).strip()
+                detail = re.sub(r'\b(a|an|the|in|wearing)\b', '', detail).strip()
+                if len(detail) >= 4:
+                    appearance_attrs.append(detail)
+                    tags_dict[detail] = tags_dict.get(detail, 0) + 5
         
-        # Add human detection tags
-        human_indicators = ['woman', 'man', 'person', 'people', 'girl', 'boy', 'child', 'lady', 'gentleman']
-        has_human = any(indicator in ' '.join(captions).lower() for indicator in human_indicators)
+        # Detect setting/background
+        setting_words = ['background', 'wall', 'floor', 'room', 'outdoor', 'indoor', 'studio', 'bedroom', 'bathroom', 'kitchen', 'office', 'beach', 'forest', 'park', 'street']
+        for setting in setting_words:
+            if setting in original_caption:
+                setting_attrs.append(setting)
+                tags_dict[setting] = tags_dict.get(setting, 0) + 3
         
-        if has_human:
-            # Extract gender/age if mentioned
-            text = ' '.join(captions).lower()
-            if 'woman' in text or 'lady' in text or 'girl' in text and 'boy' not in text:
-                tags_dict['woman'] = tags_dict.get('woman', 0) + 5
-            if 'man' in text and 'woman' not in text:
-                tags_dict['man'] = tags_dict.get('man', 0) + 5
+        # Extract color descriptions
+        colors = ['white', 'black', 'red', 'blue', 'green', 'yellow', 'pink', 'purple', 'grey', 'gray', 'brown', 'orange']
+        for color in colors:
+            if color in original_caption:
+                tags_dict[color] = tags_dict.get(color, 0) + 2
         
-        # Convert to result format
-        if not tags_dict:
-            # Fallback: use main caption words
-            main_caption = captions[0] if captions else ""
-            words = [w for w in main_caption.lower().split() if len(w) >= 4]
-            for w in words[:top_k]:
-                tags_dict[w] = 1
+        # Split by common separators for general extraction
+        parts = re.split(r'[,\s]+(?:with|and|in|on|at|wearing|has|having|next to|behind|front of)\s+', caption)
         
-        max_count = max(tags_dict.values()) if tags_dict else 1
-        results = []
-        for tag, count in tags_dict.items():
-            # Filter out junk
-            if tag.count("'") > 2 or tag.count('"') > 2:
-                continue
-            if len(tag) < 3:
+        for part in parts:
+            part = part.strip()
+            if not part or len(part) < 3:
                 continue
-                
-            confidence = min(0.95, (count / max_count) * 0.7 + 0.25)
-            if confidence >= threshold:
-                results.append({
-                    'tag': tag,
-                    'confidence': round(confidence, 3)
-                })
-        
-        # Sort by confidence and return top_k
-        results.sort(key=lambda x: x['confidence'], reverse=True)
-        return results[:top_k]
-        
-    except Exception as e:
-        print(f"[tagger] Error (BLIP) analyzing image {image_path}: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+            
+            # Clean up
+            part = re.sub(r'\b(a|an|the|is|are|was|were)\b', '', part).strip()
+            
+            # Extract meaningful phrases
+            words = part.split()
+            if len(words) == 1 and len(words[0]) >= 4:
+                tags_dict[words[0]] = tags_dict.get(words[0], 0) + 2
+            elif len(words) == 2:
+                # Two-word phrases like "long hair", "white background"
+                phrase = ' '.join(words)
+                if phrase not in tags_dict or tags_dict[phrase] < 5:  # Don't override higher scores
+                    tags_dict[phrase] = tags_dict.get(phrase, 0) + 3
+            elif len(words) >= 3:
+                # Take last 2-3 words for key phrases
+                phrase = ' '.join(words[-2:])
+                if len(phrase) >= 6:
+                    tags_dict[phrase] = tags_dict.get(phrase, 0) + 1
+                # Also try first 2 words if they seem descriptive
+                phrase2 = ' '.join(words[:2])
+                if len(phrase2) >= 6 and any(adj in words[0] for adj in ['long', 'short', 'dark', 'light', 'large', 'small']):
+                    tags_dict[phrase2] = tags_dict.get(phrase2, 0) + 2
+    
+    # Add human detection tags
+    human_indicators = ['woman', 'man', 'person', 'people', 'girl', 'boy', 'child', 'lady', 'gentleman']
+    has_human = any(indicator in ' '.join(captions).lower() for indicator in human_indicators)
+    
+    if has_human:
+        # Extract gender/age if mentioned
+        text = ' '.join(captions).lower()
+        if 'woman' in text or 'lady' in text or 'girl' in text and 'boy' not in text:
+            tags_dict['woman'] = tags_dict.get('woman', 0) + 5
+        if 'man' in text and 'woman' not in text:
+            tags_dict['man'] = tags_dict.get('man', 0) + 5
+    
+    # Convert to result format
+    if not tags_dict:
+        # Fallback: use main caption words
+        main_caption = captions[0] if captions else ""
+        words = [w for w in main_caption.lower().split() if len(w) >= 4]
+        for w in words[:top_k]:
+            tags_dict[w] = 1
+    
+    max_count = max(tags_dict.values()) if tags_dict else 1
+    results = []
+    for tag, count in tags_dict.items():
+        # Filter out junk
+        if tag.count("'") > 2 or tag.count('"') > 2:
+            continue
+        if len(tag) < 3:
+            continue
+            
+        confidence = min(0.95, (count / max_count) * 0.7 + 0.25)
+        if confidence >= threshold:
+            results.append({
+                'tag': tag,
+                'confidence': round(confidence, 3)
+            })
+    
+    # Sort by confidence and return top_k
+    results.sort(key=lambda x: x['confidence'], reverse=True)
+    return results[:top_k]
 
 
-def analyze_image(image_path: str, top_k: int = 10, threshold: float = 0.15) -> List[Dict[str, any]]:
-    """Analyze an image and return relevant tags with confidence scores using configured backend."""
-    # Determine backend, honoring per-collection overrides when possible
+def _backend_for_collection(collection: Optional[str]) -> str:
+    """Configured backend for a collection: its backend_overrides entry (matched
+    case-insensitively), else the default backend."""
+    overrides = _config.get('backend_overrides') or {}
+    if collection:
+        for k, v in overrides.items():
+            if k and k.lower() == collection.lower():
+                return str(v).lower()
+    return (_config.get('backend') or 'clip').lower()
+
+
+def _backend_for(image_path: str) -> str:
+    """Configured backend for an image, honoring per-collection overrides when possible."""
     backend = (_config.get('backend') or 'clip').lower()
     try:
         overrides = _config.get('backend_overrides') or {}
@@ -583,16 +1018,198 @@ def analyze_image(image_path: str, top_k: int = 10, threshold: float = 0.15) ->
                         break
     except Exception:
         pass
+    return backend
+
+
+def _split_backend(name: str) -> Tuple[str, str]:
+    """'clip-onnx-int8' -> ('clip', 'onnx-int8'); unknown names fall back to ('clip', '')."""
+    base, _, variant = (name or 'clip').lower().partition('-')
+    if base not in BACKEND_VARIANTS:
+        return 'clip', ''
+    if variant not in BACKEND_VARIANTS[base]:
+        print(f"[tagger] Unknown {base} variant {variant!r}; using fp32")
+        variant = ''
+    return base, variant
+
+
+def analyze_image(image_path: str, top_k: int = 10, threshold: float = 0.15) -> List[Dict[str, any]]:
+    """Analyze an image and return relevant tags with confidence scores using configured backend."""
+    backend, variant = _split_backend(_backend_for(image_path))
     if backend == 'wd14':
-        # Use the provided threshold directly for WD14; caller can tune as needed
-        raw_results = _analyze_wd14(image_path, top_k=top_k * 2, threshold=threshold)  # Get more, then filter
-        # Filter out generic/irrelevant tags
-        filtered = [r for r in raw_results if r['tag'] not in FILTERED_TAGS]
-        return filtered[:top_k]
+        # Use the provided threshold directly for WD14; caller can tune as needed.
+        # Generic/irrelevant tags (FILTERED_TAGS) are masked out before top-k.
+        return _analyze_wd14(image_path, top_k=top_k, threshold=threshold)
     elif backend == 'blip':
         # Use BLIP for realistic image tagging
-        return _analyze_blip(image_path, top_k=top_k, threshold=threshold)
-    return _analyze_clip(image_path, top_k=top_k, threshold=threshold)
+        return _analyze_blip(image_path, top_k=top_k, threshold=threshold, variant=variant)
+    return _analyze_clip(image_path, top_k=top_k, threshold=threshold, variant=variant)
+
+
+def _load_rgb(source: Union[str, bytes]) -> Optional[Image.Image]:
+    """Decode a path or in-memory image bytes to RGB, or None if unreadable."""
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+            return image.convert('RGB')
+    except Exception as e:
+        label = f"<{len(source)} bytes>" if isinstance(source, bytes) else source
+        print(f"[tagger] Error loading image {label}: {e}")
+        return None
+
+
+def _clip_dim() -> int:
+    return int(_load_clip_model()[0].config.projection_dim)
+
+
+def embed_images(sources: List[Union[str, bytes]], batch_size: int = None):
+    """CLIP image embeddings (fp32 model, whatever the tagging backend): a
+    (len(sources), dim) float32 numpy matrix of L2-normalized rows, in order.
+    Unreadable images get all-zero rows. Decoding runs on a thread pool one
+    batch ahead of the model, as in analyze_images()."""
+    import numpy as np
+    batch_size = max(1, int(batch_size or TAGGER_BATCH_SIZE))
+    out = np.zeros((len(sources), _clip_dim()), dtype=np.float32)
+    chunks = [list(range(i, min(i + batch_size, len(sources)))) for i in range(0, len(sources), batch_size)]
+    if not chunks:
+        return out
+    with ThreadPoolExecutor(max_workers=max(1, TAGGER_DECODE_WORKERS)) as pool:
+        pending = [pool.submit(_load_rgb, sources[j]) for j in chunks[0]]
+        for n, chunk in enumerate(chunks):
+            images = [f.result() for f in pending]
+            if n + 1 < len(chunks):
+                pending = [pool.submit(_load_rgb, sources[j]) for j in chunks[n + 1]]
+            ready = [(j, image) for j, image in zip(chunk, images) if image is not None]
+            if ready:
+                out[[j for j, _ in ready]] = _clip_image_features([image for _, image in ready])
+    return out
+
+
+def embed_texts(texts: List[str]):
+    """CLIP text embeddings of free-form queries, comparable with embed_images()
+    rows: a (len(texts), dim) float32 matrix of L2-normalized rows."""
+    import numpy as np
+    model, processor = _load_clip_model()
+    if not texts:
+        return np.zeros((0, _clip_dim()), dtype=np.float32)
+    inputs = processor(text=list(texts), return_tensors="pt", padding=True, truncation=True)
+    with _torch.no_grad():
+        features = model.get_text_features(**inputs).numpy()
+    return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+
+def _load_wd14_input(source: Union[str, bytes]):
+    image = _load_rgb(source)
+    return _wd14_pixels(image) if image is not None else None
+
+
+# backend -> (decode/preprocess one path, run one batch)
+_BATCH_BACKENDS = {
+    'clip': (_load_rgb, _clip_batch),
+    'blip': (_load_rgb, _blip_batch),
+    'wd14': (_load_wd14_input, _wd14_batch),
+}
+
+
+def analyze_images(image_paths: List[Union[str, bytes]], top_k: int = 10, threshold: float = 0.15,
+                   batch_size: int = None, backend: str = None, cache=None,
+                   collection: str = None) -> List[List[Dict[str, any]]]:
+    """
+    Batched analyze_image(): one result list per path, in the same order.
+
+    Paths are grouped by backend and run through the model `batch_size` at a
+    time (default TAGGER_BATCH_SIZE), while a thread pool decodes and
+    preprocesses the next batch. Unreadable images get []; if a whole batch
+    fails, its images are retried one at a time. `backend` (e.g. 'clip-int8')
+    overrides the configured backend for every path.
+
+    Items may also be encoded image bytes (e.g. streamed from B2); pass
+    `collection` so its backend_overrides entry applies to them.
+
+    With a tag_cache.TagCache as `cache`, images whose content hash already has
+    a result for the same backend / model version / threshold skip the model,
+    and fresh results are stored.
+    """
+    batch_size = max(1, int(batch_size or TAGGER_BATCH_SIZE))
+    results: List[List[Dict[str, any]]] = [[] for _ in image_paths]
+
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for i, path in enumerate(image_paths):
+        if backend:
+            name, variant = _split_backend(backend)
+        elif isinstance(path, bytes) or collection:
+            name, variant = _split_backend(_backend_for_collection(collection))
+        else:
+            name, variant = _split_backend(_backend_for(path))
+        if name == 'wd14' and not _wd14_ready():
+            name = 'clip'
+        groups.setdefault((name, variant), []).append(i)
+
+    with ThreadPoolExecutor(max_workers=max(1, TAGGER_DECODE_WORKERS)) as pool:
+        hashes = list(pool.map(content_sha256, image_paths)) if cache is not None else None
+        for (name, variant), indices in groups.items():
+            if cache is not None:
+                key = (f"{name}-{variant}" if variant else name,
+                       model_version(f"{name}-{variant}"), threshold, top_k)
+                hits = cache.get_many([hashes[j] for j in indices], *key)
+                for j in indices:
+                    if hashes[j] in hits:
+                        results[j] = hits[hashes[j]]
+                indices = [j for j in indices if hashes[j] not in hits]
+                if not indices:
+                    continue
+            prepare, run_batch = _BATCH_BACKENDS[name]
+            run = functools.partial(run_batch, variant=variant)
+            chunks = [indices[i:i + batch_size] for i in range(0, len(indices), batch_size)]
+            pending = [pool.submit(prepare, image_paths[j]) for j in chunks[0]]
+            for n, chunk in enumerate(chunks):
+                inputs = [f.result() for f in pending]
+                if n + 1 < len(chunks):
+                    pending = [pool.submit(prepare, image_paths[j]) for j in chunks[n + 1]]
+                ready = [(j, x) for j, x in zip(chunk, inputs) if x is not None]
+                if not ready:
+                    continue
+                fresh = []
+                for j, out in zip([j for j, _ in ready],
+                                  _run_batch(run, [x for _, x in ready], top_k, threshold)):
+                    if out is not None:
+                        results[j] = out
+                        fresh.append((hashes[j] if hashes else None, out))
+                if cache is not None:
+                    cache.put_many(fresh, *key)
+    return results
+
+
+def _file_identity(path: Optional[str]) -> str:
+    try:
+        st = os.stat(path)
+        return f"{os.path.basename(path)}:{st.st_size}:{int(st.st_mtime)}"
+    except (OSError, TypeError):
+        return 'missing'
+
+
+def model_version(backend: str) -> str:
+    """Identity of the weights, labels and tag post-processing behind `backend`
+    ('clip-int8', 'wd14', ...), used to key tag_cache entries."""
+    name, variant = _split_backend(backend)
+    if name == 'wd14':
+        parts = [_file_identity(_config.get('model_path')), _file_identity(_config.get('labels_path')),
+                 ','.join(sorted(FILTERED_TAGS))]
+    elif name == 'blip':
+        parts = [BLIP_MODEL_NAME]
+    else:
+        parts = [CLIP_MODEL_NAME, '\n'.join(_clip_prompts())]
+    digest = hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()[:16]
+    return f"{name}{'-' + variant if variant else ''}:v{TAG_RESULT_VERSION}:{digest}"
+
+
+def _run_batch(run: Callable, inputs: list, top_k: int, threshold: float) -> List[List[Dict[str, any]]]:
+    try:
+        return run(inputs, top_k=top_k, threshold=threshold)
+    except Exception as e:
+        if len(inputs) == 1:
+            print(f"[tagger] Error analyzing image: {e}")
+            return [None]   # not cached; analyze_images reports it as []
+        print(f"[tagger] Batch of {len(inputs)} failed ({e}); retrying one at a time")
+        return [_run_batch(run, [x], top_k, threshold)[0] for x in inputs]
 
 
 def get_primary_tags(image_path: str, max_tags: int = 5) -> List[str]:
@@ -621,17 +1238,51 @@ def batch_analyze_images(image_paths: List[str], top_k: int = 5) -> Dict[str, Li
     Returns:
         Dict mapping image path to list of tag dicts
     """
-    results = {}
-    for path in image_paths:
-        if os.path.exists(path):
-            results[path] = analyze_image(path, top_k=top_k)
-    return results
+    paths = [path for path in image_paths if os.path.exists(path)]
+    return dict(zip(paths, analyze_images(paths, top_k=top_k)))
+
+
+def tag_agreement(reference: List[List[Dict]], candidate: List[List[Dict]]) -> Dict[str, float]:
+    """How closely `candidate` tags match `reference` (one tag list per image):
+    mean Jaccard overlap of the tag sets and the fraction with the same top tag.
+    Images untagged by both count as full agreement."""
+    if not reference:
+        return {'jaccard': 1.0, 'top1': 1.0}
+    jaccard = top1 = 0.0
+    for ref, cand in zip(reference, candidate):
+        a, b = {t['tag'] for t in ref}, {t['tag'] for t in cand}
+        jaccard += len(a & b) / len(a | b) if a | b else 1.0
+        top1 += (ref[0]['tag'] if ref else None) == (cand[0]['tag'] if cand else None)
+    return {'jaccard': round(jaccard / len(reference), 3), 'top1': round(top1 / len(reference), 3)}
+
+
+def compare_backends(image_paths: List[str], backends: List[str], reference: str = 'clip',
+                     top_k: int = 10, threshold: float = 0.15) -> Dict[str, Dict]:
+    """Tag image_paths with `reference` and each of `backends` (e.g. 'clip-int8',
+    'clip-onnx-int8') and report throughput plus tag_agreement against the
+    reference. The first call to each backend also loads / exports its model,
+    so every backend is warmed up on one image before timing."""
+    import time
+    report = {}
+    reference_tags = None
+    for name in [reference] + [b for b in backends if b != reference]:
+        analyze_images(image_paths[:1], top_k=top_k, threshold=threshold, backend=name)
+        start = time.perf_counter()
+        tags = analyze_images(image_paths, top_k=top_k, threshold=threshold, backend=name)
+        seconds = time.perf_counter() - start
+        if reference_tags is None:
+            reference_tags = tags
+        report[name] = {
+            'images_per_sec': round(len(image_paths) / seconds, 2) if seconds else 0.0,
+            **tag_agreement(reference_tags, tags),
+        }
+    return report
 
 
 if __name__ == "__main__":
     # Test the tagging service
     import sys
-    if len(sys.argv) > 1 and sys.argv[1] not in ("--set-wd14", "--backend"):
+    if len(sys.argv) > 1 and sys.argv[1] not in ("--set-wd14", "--backend", "--ort-bench", "--compare"):
         test_image = sys.argv[1]
         if os.path.exists(test_image):
             print(f"\nAnalyzing: {test_image}\n")
@@ -645,11 +1296,30 @@ if __name__ == "__main__":
         # Usage: python image_tagger.py --set-wd14 <model.onnx> <labels.csv>
         set_tagger_config({'backend': 'wd14', 'model_path': sys.argv[2], 'labels_path': sys.argv[3]})
         print("Saved WD14 config:", _config)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--ort-bench":
+        # Usage: python image_tagger.py --ort-bench [batch_size]
+        if not _wd14_ready():
+            print("WD14 model/labels are not configured (see --set-wd14)")
+        else:
+            _print_ort_benchmark(benchmark_ort_options(
+                _config['model_path'], batch_size=int(sys.argv[2]) if len(sys.argv) > 2 else 1))
+    elif len(sys.argv) > 3 and sys.argv[1] == "--compare":
+        # Usage: python image_tagger.py --compare <image_dir> <backend> [<backend> ...]
+        image_dir = sys.argv[2]
+        paths = sorted(os.path.join(image_dir, f) for f in os.listdir(image_dir)
+                       if f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))
+        reference = _split_backend(sys.argv[3])[0]
+        print(f"{len(paths)} images, reference: {reference} (fp32)")
+        print(f"{'backend':<16} {'images/sec':>11} {'jaccard':>8} {'top-1':>6}")
+        for name, row in compare_backends(paths, sys.argv[3:], reference=reference).items():
+            print(f"{name:<16} {row['images_per_sec']:>11.2f} {row['jaccard']:>8.3f} {row['top1']:>6.3f}")
     elif len(sys.argv) > 2 and sys.argv[1] == "--backend":
-        # Usage: python image_tagger.py --backend clip|wd14
+        # Usage: python image_tagger.py --backend clip|wd14|blip[-int8|-onnx|-onnx-int8]
         set_tagger_config({'backend': sys.argv[2]})
         print("Saved backend:", _config)
     else:
         print("Usage: python image_tagger.py <image_path>")
-        print("       python image_tagger.py --backend clip|wd14")
+        print("       python image_tagger.py --backend clip|wd14|blip[-int8|-onnx|-onnx-int8]")
+        print("       python image_tagger.py --compare <image_dir> <backend> [<backend> ...]")
         print("       python image_tagger.py --set-wd14 <model.onnx> <labels.csv>")
+        print("       python image_tagger.py --ort-bench [batch_size]")
@@ -0,0 +1,319 @@
+"""
+Persistent background jobs.
+
+Long admin operations (collection rename / delete, video upload) are queued as
+rows in the Postgres `jobs` table and executed by a small pool of in-process
+workers, so the request that starts one returns a job id straight away instead
+of holding the (single) gunicorn worker until it finishes.
+
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+workers or processes can poll the same table without handing a job out twice.
+A claimed job holds a lease (`locked_until`) that every progress update
+extends; if the process dies mid-job the lease runs out and the job is claimed
+again, up to `max_attempts` times — handlers must therefore be safe to re-run.
+A job whose lease runs out during its last attempt is marked failed. Every
+write a worker makes is fenced on the attempt it claimed, so a worker whose
+lease ran out (and whose job was claimed again) cannot overwrite the new
+attempt's progress or outcome: its next progress() raises LeaseLost and its
+result is dropped.
+
+Handlers are plain functions `handler(job: Job) -> dict | None`: read
+`job.payload`, call `job.progress(...)` as they go, return a JSON-able result
+or raise to fail the attempt. An optional `on_failed(job)` registered with
+the handler runs once the job has failed for good, for cleanup.
+"""
+
+import json
+import threading
+import traceback
+from typing import Callable, Dict, List, Optional
+
+JOB_COLUMNS = ("id, kind, payload, status, progress, result, error, attempts, max_attempts, "
+               "created_by, created_at, started_at, finished_at, updated_at")
+
+# Statuses a job can be in; 'queued' and 'running' are the unfinished ones.
+STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+# Unfinished jobs that will still run: a 'running' job whose lease expired on
+# its last attempt is dead (and about to be marked failed by _reap).
+_LIVE = ("(status = 'queued' OR (status = 'running' "
+         "AND (locked_until >= NOW() OR attempts < max_attempts)))")
+
+
+class LeaseLost(Exception):
+    """Raised by Job.progress() once the job has been claimed by a newer attempt."""
+
+
+def _row_to_job(row) -> Dict:
+    job = dict(zip([c.strip() for c in JOB_COLUMNS.split(',')], row))
+    for key in ('created_at', 'started_at', 'finished_at', 'updated_at'):
+        if job.get(key) is not None:
+            job[key] = job[key].isoformat()
+    return job
+
+
+class Job:
+    """A claimed job as seen by its handler."""
+
+    def __init__(self, queue: 'JobQueue', job_id: int, kind: str, payload: Dict, attempt: int):
+        self._queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.attempt = attempt
+
+    def progress(self, **fields):
+        """Merge fields into the job's progress, extend its lease and push an update.
+        Raises LeaseLost if the lease ran out and another attempt took the job over."""
+        if not self._queue._update_progress(self.id, self.attempt, fields):
+            raise LeaseLost(f'{self.kind} #{self.id} attempt {self.attempt} lost its lease')
+
+
+class JobQueue:
+    """Postgres-backed queue plus the in-process workers that drain it.
+
+    get_db / release_db borrow and return a pooled connection; spawn(fn) starts
+    a background task (socketio.start_background_task); on_update(job_dict) is
+    called whenever a job changes state or reports progress.
+    """
+
+    def __init__(self, get_db: Callable, release_db: Callable, spawn: Callable = None,
+                 on_update: Callable[[Dict], None] = None, workers: int = 2,
+                 poll_interval: float = 5.0, lease_seconds: int = 600):
+        self._get_db = get_db
+        self._release_db = release_db
+        self._spawn = spawn
+        self._on_update = on_update
+        self.workers = max(0, int(workers))
+        self.poll_interval = poll_interval
+        self.lease_seconds = int(lease_seconds)
+        self._handlers = {}
+        self._on_failed = {}
+        self._wake = threading.Event()
+        self._started = False
+
+    def register(self, kind: str, handler: Callable[[Job], Optional[Dict]],
+                 on_failed: Callable[[Job], None] = None):
+        self._handlers[kind] = handler
+        if on_failed is not None:
+            self._on_failed[kind] = on_failed
+
+    # ── DB helpers ───────────────────────────────────────────────────────────
+
+    def _execute(self, sql: str, params=(), fetch: bool = False):
+        conn = self._get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall() if fetch else None
+            conn.commit()
+            return rows
+        finally:
+            self._release_db(conn)
+
+    def _publish(self, job_id: int):
+        if self._on_update is None:
+            return
+        job = self.get(job_id)
+        if job is not None:
+            self._on_update(job)
+
+    # ── Producer / status API ────────────────────────────────────────────────
+
+    def enqueue(self, kind: str, payload: Dict = None, user_id: int = None,
+                max_attempts: int = 3) -> int:
+        if kind not in self._handlers:
+            raise ValueError(f'No handler registered for job kind {kind!r}')
+        rows = self._execute(
+            "INSERT INTO jobs (kind, payload, created_by, max_attempts) "
+            "VALUES (%s, %s, %s, %s) RETURNING id",
+            (kind, json.dumps(payload or {}), user_id, max_attempts), fetch=True,
+        )
+        self._wake.set()
+        return rows[0][0]
+
+    def enqueue_coalesced(self, kind: str, list_field: str, items: List, user_id: int = None,
+                          max_items: int = 256, max_attempts: int = 3, **match) -> int:
+        """Append `items` to payload[list_field] of a not-yet-started `kind` job whose
+        payload contains `match` and has room, or enqueue a new one. Under a burst
+        the workers are busy, so consecutive calls pile into one job."""
+        rows = self._execute("""
+            UPDATE jobs SET payload = jsonb_set(payload, %s, (payload -> %s) || %s::jsonb),
+                            updated_at = NOW()
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE kind = %s AND status = 'queued' AND attempts = 0
+                  AND payload @> %s::jsonb
+                  AND jsonb_array_length(payload -> %s) + %s <= %s
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id
+        """, ([list_field], list_field, json.dumps(items), kind, json.dumps(match),
+              list_field, len(items), max_items), fetch=True)
+        if rows:
+            return rows[0][0]
+        return self.enqueue(kind, {**match, list_field: list(items)}, user_id=user_id,
+                            max_attempts=max_attempts)
+
+    def backlog(self, kind: str, list_field: str, **match) -> int:
+        """Total payload[list_field] items across queued / running `kind` jobs."""
+        rows = self._execute(
+            "SELECT COALESCE(SUM(jsonb_array_length(payload -> %s)), 0) FROM jobs "
+            f"WHERE kind = %s AND {_LIVE} AND payload @> %s::jsonb",
+            (list_field, kind, json.dumps(match)), fetch=True,
+        )
+        return int(rows[0][0])
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        rows = self._execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s", (job_id,), fetch=True)
+        return _row_to_job(rows[0]) if rows else None
+
+    def find_active(self, kind: str, **payload) -> Optional[int]:
+        """Id of a queued / running `kind` job whose payload contains `payload`, if any
+        (a job that died on its last attempt does not count)."""
+        rows = self._execute(
+            f"SELECT id FROM jobs WHERE kind = %s AND {_LIVE} "
+            "AND payload @> %s::jsonb ORDER BY id LIMIT 1",
+            (kind, json.dumps(payload)), fetch=True,
+        )
+        return rows[0][0] if rows else None
+
+    def list(self, status: str = None, limit: int = 50) -> List[Dict]:
+        where, params = ("WHERE status = %s", (status,)) if status else ("", ())
+        rows = self._execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs {where} ORDER BY id DESC LIMIT %s",
+            (*params, max(1, min(int(limit), 500))), fetch=True,
+        )
+        return [_row_to_job(row) for row in rows]
+
+    # ── Worker side ──────────────────────────────────────────────────────────
+
+    def _reap(self):
+        """Mark jobs whose lease expired during their last attempt as failed."""
+        rows = self._execute("""
+            UPDATE jobs SET status = 'failed', finished_at = NOW(), updated_at = NOW(), locked_until = NULL,
+                            error = 'Worker lost during the final attempt'
+            WHERE status = 'running' AND locked_until < NOW() AND attempts >= max_attempts
+            RETURNING id, kind, payload, attempts
+        """, fetch=True)
+        for job_id, kind, payload, attempt in rows:
+            print(f"[jobs] {kind} #{job_id} lost its worker on attempt {attempt}; marked failed")
+            self._publish(job_id)
+            self._failed_for_good(job_id, kind, payload, attempt)
+
+    def _failed_for_good(self, job_id: int, kind: str, payload, attempt: int):
+        on_failed = self._on_failed.get(kind)
+        if on_failed is None:
+            return
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        try:
+            on_failed(Job(self, job_id, kind, payload or {}, attempt))
+        except Exception as e:
+            print(f"[jobs] on_failed for {kind} #{job_id} raised: {e}")
+
+    def _claim(self):
+        """Atomically take the oldest runnable job (or an expired lease), or None."""
+        rows = self._execute("""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                            started_at = COALESCE(started_at, NOW()), updated_at = NOW(),
+                            locked_until = NOW() + make_interval(secs => %s)
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE (status = 'queued'
+                       OR (status = 'running' AND locked_until < NOW()))
+                  AND attempts < max_attempts
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, kind, payload, attempts, max_attempts
+        """, (self.lease_seconds,), fetch=True)
+        return rows[0] if rows else None
+
+    # The writes below only apply while `attempt` is still the job's current
+    # running attempt; each returns whether it did.
+
+    def _update_progress(self, job_id: int, attempt: int, fields: Dict) -> bool:
+        rows = self._execute(
+            "UPDATE jobs SET progress = progress || %s::jsonb, updated_at = NOW(), "
+            "locked_until = NOW() + make_interval(secs => %s) "
+            "WHERE id = %s AND attempts = %s AND status = 'running' RETURNING id",
+            (json.dumps(fields), self.lease_seconds, job_id, attempt), fetch=True,
+        )
+        if rows:
+            self._publish(job_id)
+        return bool(rows)
+
+    def _finish(self, job_id: int, attempt: int, status: str, result: Dict = None, error: str = None) -> bool:
+        rows = self._execute(
+            "UPDATE jobs SET status = %s, result = %s, error = %s, finished_at = NOW(), "
+            "updated_at = NOW(), locked_until = NULL "
+            "WHERE id = %s AND attempts = %s AND status = 'running' RETURNING id",
+            (status, json.dumps(result) if result is not None else None, error, job_id, attempt), fetch=True,
+        )
+        if rows:
+            self._publish(job_id)
+        return bool(rows)
+
+    def _fail_attempt(self, job_id: int, attempt: int, error: str) -> bool:
+        """Requeue after a failed attempt, or mark failed once attempts run out."""
+        rows = self._execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+            "error = %s, updated_at = NOW(), locked_until = NULL, "
+            "finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE NOW() END "
+            "WHERE id = %s AND attempts = %s AND status = 'running' RETURNING id",
+            (error, job_id, attempt), fetch=True,
+        )
+        if rows:
+            self._publish(job_id)
+        return bool(rows)
+
+    def run_once(self) -> bool:
+        """Claim and run one job. Returns False if there was nothing to do."""
+        self._reap()
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        job_id, kind, payload, attempt, max_attempts = claimed
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        self._publish(job_id)
+        handler = self._handlers.get(kind)
+        if handler is None:
+            self._finish(job_id, attempt, 'failed', error=f'Unknown job kind {kind!r}')
+            return True
+        try:
+            result = handler(Job(self, job_id, kind, payload or {}, attempt))
+        except LeaseLost as e:
+            print(f"[jobs] {e}; abandoning it")
+        except Exception as e:
+            print(f"[jobs] {kind} #{job_id} attempt {attempt} failed: {e}")
+            traceback.print_exc()
+            if self._fail_attempt(job_id, attempt, str(e)) and attempt >= max_attempts:
+                self._failed_for_good(job_id, kind, payload, attempt)
+        else:
+            if not self._finish(job_id, attempt, 'succeeded', result=result):
+                print(f"[jobs] {kind} #{job_id} attempt {attempt} finished after losing its lease; "
+                      "result dropped")
+        return True
+
+    def _worker_loop(self):
+        while True:
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                print(f"[jobs] worker error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def start(self):
+        """Start the worker pool (once)."""
+        if self._started or self._spawn is None:
+            return
+        self._started = True
+        for _ in range(self.workers):
+            self._spawn(self._worker_loop)
@@ -0,0 +1,102 @@
+"""
+In-process top-N leaderboards for the scores table.
+
+The home page and /api/high-scores used to sort every score row on each
+request by casting JSONB fields. LeaderboardCache loads the top `depth`
+entries per (collection, game_type) once — one windowed query over the typed
+score / time_ms columns — and submit_score() folds each new score into the
+cached board for its key, so reads are a dict lookup plus a slice.
+
+Entries are the scores.data dicts the API has always returned. Ordering is
+score DESC, time_ms ASC (missing times last), then oldest first, matching the
+SQL the app uses to trim the table.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# (collection, game_type, score, time_ms, data) in rank order within each key
+Row = Tuple[str, str, int, Optional[int], Dict]
+
+
+def rank_key(score: int, time_ms: Optional[int]):
+    return (-(score or 0), time_ms is None, time_ms or 0)
+
+
+class LeaderboardCache:
+    """{collection: {game_type: top `depth` entries}}, reloaded after `ttl` seconds."""
+
+    def __init__(self, load_all: Callable[[int], Iterable[Row]], depth: int = 10,
+                 ttl: float = 300, clock: Callable[[], float] = time.monotonic):
+        self._load_all = load_all
+        self.depth = depth
+        self.ttl = ttl
+        self._clock = clock
+        self._boards = {}        # collection -> {game_type: [(rank_key, data)]}
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self) -> bool:
+        """Reload every board if the cache is cold or expired; True if it did."""
+        if self._loaded_at is not None and self._clock() - self._loaded_at < self.ttl:
+            return False
+        boards = {}
+        for coll, game_type, score, time_ms, data in self._load_all(self.depth):
+            boards.setdefault(coll, {}).setdefault(game_type, []).append(
+                (rank_key(score, time_ms), data))
+        self._boards = boards
+        self._loaded_at = self._clock()
+        return True
+
+    # ── Reads ────────────────────────────────────────────────────────────────
+
+    def top(self, collection: str, game_type: str, n: int = None) -> List[Dict]:
+        with self._lock:
+            self._ensure_loaded()
+            board = self._boards.get(collection, {}).get(game_type, [])
+            return [data for _key, data in board[:n]]
+
+    def collection(self, collection: str, n: int = None) -> Dict[str, List[Dict]]:
+        """{game_type: top n entries} for one collection."""
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                game_type: [data for _key, data in board[:n]]
+                for game_type, board in sorted(self._boards.get(collection, {}).items())
+            }
+
+    def all(self, n: int = None) -> Dict[str, Dict[str, List[Dict]]]:
+        """{collection: {game_type: top n entries}}."""
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                coll: {game_type: [data for _key, data in board[:n]]
+                       for game_type, board in sorted(boards.items())}
+                for coll, boards in sorted(self._boards.items())
+            }
+
+    # ── Writes ───────────────────────────────────────────────────────────────
+
+    def record(self, collection: str, game_type: str, score: int,
+               time_ms: Optional[int], data: Dict) -> List[Dict]:
+        """Fold a newly committed score into its board; returns the new top `depth`."""
+        with self._lock:
+            # A fresh load already contains the committed row.
+            reloaded = self._ensure_loaded()
+            board = self._boards.setdefault(collection, {}).setdefault(game_type, [])
+            if reloaded:
+                return [d for _key, d in board]
+            key = rank_key(score, time_ms)
+            # bisect_right: ties rank after the entries already on the board,
+            # like the oldest-first id tiebreak in SQL.
+            pos = bisect.bisect_right([k for k, _data in board], key)
+            if pos < self.depth:
+                board.insert(pos, (key, data))
+                del board[self.depth:]
+            return [d for _key, d in board]
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
@@ -0,0 +1,146 @@
+"""
+Collection retagging.
+
+Re-runs the tagger over a collection's images (or a chosen subset) and writes
+the tags back:
+
+  * locked images are never touched: they are left out of the work list, and
+    the write-back repeats the check in case one is locked mid-run;
+  * image bytes are streamed from B2 into memory on a small thread pool and
+    handed straight to the tagger — nothing is written to disk;
+  * inference runs `batch_size` images at a time, and each batch's tags are
+    written with one UPDATE ... FROM (VALUES ...) statement;
+  * progress is reported per collection as batches complete.
+
+Images whose download or tagging fails, or that come back with no tags,
+keep their current tags. A retag can simply be run again (the tag cache makes
+a repeat of an unchanged image cheap).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class CollectionRetag:
+    """Retag collection `collection` (see module docstring).
+
+    tag_images(images: list of bytes) -> one [{tag, confidence}] list per image;
+    notify(cur, collection) is called inside each write transaction;
+    on_written(rows) gets the [(filename, tags)] actually updated after each
+    commit; on_progress(progress_dict) is called as batches complete.
+    """
+
+    def __init__(self, s3, bucket: str, get_db: Callable, release_db: Callable,
+                 tag_images: Callable[[List[bytes]], List[List[Dict]]], collection: str,
+                 filenames: Optional[Sequence[str]] = None, batch_size: int = 32,
+                 download_workers: int = 8, notify: Callable = None,
+                 on_written: Callable = None, on_progress: Callable[[Dict], None] = None):
+        self._s3 = s3
+        self._bucket = bucket
+        self._get_db = get_db
+        self._release_db = release_db
+        self._tag_images = tag_images
+        self.collection = collection
+        self.filenames = list(filenames) if filenames is not None else None
+        self.batch_size = max(1, int(batch_size))
+        self.download_workers = max(1, int(download_workers))
+        self._notify = notify
+        self._on_written = on_written
+        self._on_progress = on_progress
+        self.progress = {'collection': collection, 'total': 0, 'done': 0,
+                         'tagged': 0, 'untagged': 0, 'locked': 0}
+
+    def _report(self):
+        if self._on_progress:
+            self._on_progress(dict(self.progress))
+
+    # ── Reads ────────────────────────────────────────────────────────────────
+
+    def _targets(self) -> List[tuple]:
+        """[(filename, storage key)] of the unlocked images to retag; counts the locked ones."""
+        conn = self._get_db()
+        try:
+            cur = conn.cursor()
+            sql = ("SELECT filename, url, COALESCE(locked, FALSE) FROM images "
+                   "WHERE collection_name = %s")
+            params = [self.collection]
+            if self.filenames is not None:
+                sql += " AND filename = ANY(%s)"
+                params.append(self.filenames)
+            cur.execute(sql + " ORDER BY filename", params)
+            rows = cur.fetchall()
+        finally:
+            self._release_db(conn)
+        self.progress['locked'] = sum(1 for _f, _url, locked in rows if locked)
+        return [(filename, url) for filename, url, locked in rows if not locked]
+
+    def _download(self, key: str) -> Optional[bytes]:
+        try:
+            return self._s3.get_object(Bucket=self._bucket, Key=key)['Body'].read()
+        except Exception as e:
+            print(f"[retag] Could not fetch {key}: {e}")
+            return None
+
+    # ── Writes ───────────────────────────────────────────────────────────────
+
+    def _write(self, rows: List[tuple]) -> List[tuple]:
+        """Set tags for [(filename, tags)] in one statement, skipping rows locked
+        since the work list was read; returns the rows actually updated."""
+        if not rows:
+            return []
+        values = ', '.join(['(%s, %s::text[])'] * len(rows))
+        params = [p for filename, tags in rows for p in (filename, tags)]
+        conn = self._get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                UPDATE images AS i SET tags = v.tags
+                FROM (VALUES {values}) AS v(filename, tags)
+                WHERE i.collection_name = %s AND i.filename = v.filename
+                  AND NOT COALESCE(i.locked, FALSE)
+                RETURNING i.filename
+            """, (*params, self.collection))
+            updated = {row[0] for row in cur.fetchall()}
+            if self._notify and updated:
+                self._notify(cur, self.collection)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release_db(conn)
+        written = [(filename, tags) for filename, tags in rows if filename in updated]
+        if self._on_written and written:
+            self._on_written(written)
+        return written
+
+    # ── Run ──────────────────────────────────────────────────────────────────
+
+    def run(self) -> Dict:
+        """Retag every target; returns the final progress."""
+        targets = self._targets()
+        self.progress['total'] = len(targets)
+        self._report()
+        batches = [targets[i:i + self.batch_size] for i in range(0, len(targets), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.download_workers) as pool:
+            # Download the next batch while the current one is being tagged
+            pending = pool.map(self._download, [key for _f, key in batches[0]]) if batches else None
+            for n, batch in enumerate(batches):
+                images = list(pending)
+                if n + 1 < len(batches):
+                    pending = pool.map(self._download, [key for _f, key in batches[n + 1]])
+                ready = [(filename, data) for (filename, _key), data in zip(batch, images) if data]
+                results = self._tag_images([data for _f, data in ready]) if ready else []
+                rows = []
+                for (filename, _data), tags in zip(ready, results):
+                    names = [t['tag'] for t in tags or []]
+                    if names:
+                        rows.append((filename, names))
+                written = self._write(rows)
+                self.progress['done'] += len(batch)
+                self.progress['tagged'] += len(written)
+                self.progress['untagged'] += len(batch) - len(rows)
+                # Locked since the work list was read, so the UPDATE skipped them
+                self.progress['locked'] += len(rows) - len(written)
+                self._report()
+        return dict(self.progress)
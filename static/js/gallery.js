@@ -230,7 +230,21 @@ document.addEventListener('DOMContentLoaded', () => {
             const formData = new FormData(); formData.append('file', file);
                 try {
                 showLoading();
-                const res = await fetch(`/upload${window.CURRENT_COLLECTION ? '/' + encodeURIComponent(window.CURRENT_COLLECTION) : ''}`, { method: 'POST', body: formData });
+                const url = `/upload${window.CURRENT_COLLECTION ? '/' + encodeURIComponent(window.CURRENT_COLLECTION) : ''}`;
+                let res = await fetch(url, { method: 'POST', body: formData });
+                // 429: the auto-tagging queue is full — wait as told and retry
+                for (let tries = 0; res.status === 429 && tries < 30; tries++) {
+                    const wait = parseInt(res.headers.get('Retry-After') || '10', 10) * 1000;
+                    await new Promise(resolve => setTimeout(resolve, wait));
+                    res = await fetch(url, { method: 'POST', body: formData });
+                }
+                // 409: the collection already has this photo — upload again only if asked to
+                if (res.status === 409 && confirm(`${file.name} looks like a duplicate of an image already in this collection. Upload it anyway?`)) {
+                    formData.append('allow_duplicate', '1');
+                    res = await fetch(url, { method: 'POST', body: formData });
+                } else if (res.status === 409) {
+                    continue;
+                }
                 const data = await res.json();
                 if (data && data.success) addImageToGallery(data.url, data.tags || []); else alert(data.error || 'Upload failed');
             } catch (err) { console.error('upload error', err); alert('Error uploading image'); } finally { hideLoading(); }
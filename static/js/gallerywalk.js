@@ -91,6 +91,7 @@ document.addEventListener('DOMContentLoaded', async () => {
             img.src      = imgObj.url;
             img.alt      = '';
             img.draggable = false;
+            applyImagePlaceholder(img, imgObj);
 
             const num = document.createElement('div');
             num.className   = 'gw-frame-num';
@@ -46,6 +46,9 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     function loadHighScores() {
+        // The page embeds every collection's top scores; only fall back to one
+        // request per collection if that's missing (e.g. a cached old page).
+        const embedded = window.HOME_HIGH_SCORES || null;
         const leaderboardSections = document.querySelectorAll('.leaderboard-section');
         leaderboardSections.forEach(section => {
             const collection = section.getAttribute('data-collection');
@@ -54,6 +57,11 @@ document.addEventListener('DOMContentLoaded', () => {
             const scoresContainer = document.getElementById(`scores-${collection}`);
             if (!scoresContainer) return;
 
+            if (embedded) {
+                renderHighScores(embedded[collection] || {}, scoresContainer, section);
+                return;
+            }
+
             fetch(`/api/high-scores/${collection}`)
                 .then((res) => res.json())
                 .then((data) => {
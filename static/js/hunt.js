@@ -92,6 +92,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const image = document.createElement('img');
             image.src = img;
             image.alt = 'option';
+            applyImagePlaceholder(image, (window.IMAGE_META || {})[img]);
             // apply fit mode and ensure sizing
             image.style.objectFit = prefs.fitCover ? 'cover' : 'contain';
             image.style.width = '100%';
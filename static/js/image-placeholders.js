@@ -0,0 +1,124 @@
+/**
+ * Image placeholders from server-computed metadata (image_metadata.py).
+ *
+ * applyImagePlaceholder(img, meta) gives an <img> its final aspect ratio and a
+ * blurred preview (the BlurHash, else the dominant colour) before a single
+ * byte of the image has arrived; the preview is dropped once it loads.
+ * `meta` is {width, height, dominant_color, blurhash, ...} as returned by
+ * /api/collections/<c>/images, window.IMAGE_META[url] on game pages, or
+ * mm_card_flipped. Missing or empty meta is a no-op.
+ */
+(function () {
+    const BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+    const PREVIEW_PX = 32;
+    const previews = new Map();   // blurhash -> data URL
+
+    function decode83(str) {
+        let value = 0;
+        for (const c of str) value = value * 83 + BASE83.indexOf(c);
+        return value;
+    }
+
+    function srgbToLinear(value) {
+        const v = value / 255;
+        return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4);
+    }
+
+    function linearToSrgb(value) {
+        const v = Math.max(0, Math.min(1, value));
+        return v <= 0.0031308
+            ? Math.trunc(v * 12.92 * 255 + 0.5)
+            : Math.trunc((1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255 + 0.5);
+    }
+
+    function signPow(v, exp) {
+        return Math.sign(v) * Math.pow(Math.abs(v), exp);
+    }
+
+    /** RGBA pixels (Uint8ClampedArray) of `hash` rendered at width x height. */
+    function decodeBlurhash(hash, width, height) {
+        const sizeFlag = decode83(hash[0]);
+        const numX = (sizeFlag % 9) + 1;
+        const numY = Math.floor(sizeFlag / 9) + 1;
+        if (hash.length !== 4 + 2 * numX * numY) throw new Error('Invalid blurhash length');
+        const maxValue = (decode83(hash[1]) + 1) / 166;
+
+        const colors = [];
+        const dc = decode83(hash.substring(2, 6));
+        colors.push([srgbToLinear(dc >> 16), srgbToLinear((dc >> 8) & 255), srgbToLinear(dc & 255)]);
+        for (let i = 1; i < numX * numY; i++) {
+            const ac = decode83(hash.substring(4 + i * 2, 6 + i * 2));
+            colors.push([
+                signPow((Math.floor(ac / 361) - 9) / 9, 2) * maxValue,
+                signPow((Math.floor(ac / 19) % 19 - 9) / 9, 2) * maxValue,
+                signPow((ac % 19 - 9) / 9, 2) * maxValue,
+            ]);
+        }
+
+        const pixels = new Uint8ClampedArray(width * height * 4);
+        for (let y = 0; y < height; y++) {
+            for (let x = 0; x < width; x++) {
+                let r = 0, g = 0, b = 0;
+                for (let j = 0; j < numY; j++) {
+                    for (let i = 0; i < numX; i++) {
+                        const basis = Math.cos(Math.PI * x * i / width) * Math.cos(Math.PI * y * j / height);
+                        const color = colors[i + j * numX];
+                        r += color[0] * basis;
+                        g += color[1] * basis;
+                        b += color[2] * basis;
+                    }
+                }
+                const p = 4 * (x + y * width);
+                pixels[p] = linearToSrgb(r);
+                pixels[p + 1] = linearToSrgb(g);
+                pixels[p + 2] = linearToSrgb(b);
+                pixels[p + 3] = 255;
+            }
+        }
+        return pixels;
+    }
+
+    function blurhashDataUrl(hash) {
+        if (previews.has(hash)) return previews.get(hash);
+        let url = null;
+        try {
+            const canvas = document.createElement('canvas');
+            canvas.width = canvas.height = PREVIEW_PX;
+            const ctx = canvas.getContext('2d');
+            const image = ctx.createImageData(PREVIEW_PX, PREVIEW_PX);
+            image.data.set(decodeBlurhash(hash, PREVIEW_PX, PREVIEW_PX));
+            ctx.putImageData(image, 0, 0);
+            url = canvas.toDataURL();
+        } catch (e) {
+            console.warn('Placeholder: bad blurhash', hash, e);
+        }
+        previews.set(hash, url);
+        return url;
+    }
+
+    function applyImagePlaceholder(img, meta) {
+        if (!img || !meta || !meta.width || !meta.height) return;
+        // Intrinsic size lets the browser reserve the box before the image loads
+        img.setAttribute('width', meta.width);
+        img.setAttribute('height', meta.height);
+        const preview = meta.blurhash && blurhashDataUrl(meta.blurhash);
+        if (meta.dominant_color && !preview) img.style.backgroundColor = meta.dominant_color;
+        if (preview) {
+            // Lay the preview out the way the image itself will be
+            const fit = img.style.objectFit || getComputedStyle(img).objectFit;
+            img.style.backgroundImage = `url(${preview})`;
+            img.style.backgroundSize = fit === 'cover' || fit === 'contain' ? fit : '100% 100%';
+            img.style.backgroundPosition = 'center';
+            img.style.backgroundRepeat = 'no-repeat';
+        }
+        const clear = () => {
+            img.style.backgroundImage = '';
+            img.style.backgroundColor = '';
+        };
+        if (img.complete && img.naturalWidth > 0) clear();
+        else img.addEventListener('load', clear, { once: true });
+    }
+
+    window.decodeBlurhash = decodeBlurhash;
+    window.applyImagePlaceholder = applyImagePlaceholder;
+})();
@@ -0,0 +1,24 @@
+// Background jobs: admin operations (collection rename/delete, video upload)
+// answer with a job id; waitForJob polls /api/jobs/<id> until it finishes.
+(function () {
+    const FINISHED = ['succeeded', 'failed'];
+
+    // Resolves with the finished job (check job.status), calling onProgress(job)
+    // with every poll while it is queued or running.
+    window.waitForJob = function (jobId, onProgress, intervalMs = 1000) {
+        return new Promise((resolve, reject) => {
+            async function poll() {
+                try {
+                    const res = await fetch(`/api/jobs/${jobId}`);
+                    const data = await res.json();
+                    if (!data.success) { reject(new Error(data.error || 'Job not found')); return; }
+                    const job = data.job;
+                    if (FINISHED.includes(job.status)) { resolve(job); return; }
+                    if (onProgress) onProgress(job);
+                } catch (err) { /* transient — keep polling */ }
+                setTimeout(poll, intervalMs);
+            }
+            poll();
+        });
+    };
+})();
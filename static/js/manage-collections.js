@@ -228,22 +228,39 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
 
+            // Large collections take a while — the rename runs as a background job
+            renameMessage.textContent = 'Renaming...';
+            renameMessage.className = 'message';
+            const oldName = currentCollection;
+
             try {
                 const res = await fetch('/api/collections/rename', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ old_name: currentCollection, new_name: newName })
+                    body: JSON.stringify({ old_name: oldName, new_name: newName })
                 });
                 const data = await res.json();
+                if (!data.success) {
+                    renameMessage.textContent = data.error || 'Failed to rename collection';
+                    renameMessage.className = 'message error';
+                    return;
+                }
 
-                if (data.success) {
+                const job = await waitForJob(data.job_id, ({ progress: p }) => {
+                    if (!p || !p.phase) return;
+                    renameMessage.textContent = p.phase === 'copying'
+                        ? `Copying files... ${p.copied + (p.missing || 0)}/${p.total}`
+                        : `Removing old files... ${p.deleted}/${p.total}`;
+                });
+                if (job.status === 'succeeded') {
                     renameMessage.textContent = 'Collection renamed successfully!';
                     renameMessage.className = 'message success';
                     setTimeout(() => {
                         window.location.reload();
                     }, 1000);
                 } else {
-                    renameMessage.textContent = data.error || 'Failed to rename collection';
+                    renameMessage.textContent = (job.error || 'Failed to rename collection') +
+                        ' — click Rename again to resume.';
                     renameMessage.className = 'message error';
                 }
             } catch (err) {
@@ -275,15 +292,25 @@ document.addEventListener('DOMContentLoaded', () => {
                     body: JSON.stringify({ name: currentCollection })
                 });
                 const data = await res.json();
+                if (!data.success) {
+                    deleteMessage.textContent = data.error || 'Failed to delete collection';
+                    deleteMessage.className = 'message error';
+                    return;
+                }
 
-                if (data.success) {
+                deleteMessage.textContent = 'Deleting...';
+                deleteMessage.className = 'message';
+                const job = await waitForJob(data.job_id, ({ progress: p }) => {
+                    if (p && p.deleted) deleteMessage.textContent = `Deleting... ${p.deleted} files removed`;
+                });
+                if (job.status === 'succeeded') {
                     deleteMessage.textContent = 'Collection deleted successfully!';
                     deleteMessage.className = 'message success';
                     setTimeout(() => {
                         window.location.reload();
                     }, 1000);
                 } else {
-                    deleteMessage.textContent = data.error || 'Failed to delete collection';
+                    deleteMessage.textContent = job.error || 'Failed to delete collection';
                     deleteMessage.className = 'message error';
                 }
             } catch (err) {
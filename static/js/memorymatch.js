@@ -273,6 +273,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!el) return;
         const img = el.querySelector('.mm-card-front img');
         img.src = data.imageUrl;
+        applyImagePlaceholder(img, data.imageMeta);
         el.classList.add('mm-flipped');
         state.flippedThisTurn.push(data.index);
         if (state.flippedThisTurn.length >= 2) state.boardLocked = true;
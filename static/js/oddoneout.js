@@ -100,7 +100,24 @@ document.addEventListener('DOMContentLoaded', async () => {
         return a;
     }
 
-    function generateRound(attempt = 0) {
+    // Images of `candidates` that look most like all of `group` together
+    // (/similar), most similar first; [] when the collection has no embeddings.
+    async function similarImages(group, candidates, k = 20) {
+        const allowed = new Map(candidates.map(img => [img.filename, img]));
+        try {
+            const params = new URLSearchParams({ k: String(k) });
+            group.forEach(img => params.append('filename', img.filename));
+            const res  = await fetch(`/api/collections/${COLLECTION}/similar?${params}`);
+            const data = await res.json();
+            if (!data.success) return [];
+            return data.images.map(img => allowed.get(img.filename)).filter(Boolean);
+        } catch (e) {
+            console.warn('Odd One Out: similar images unavailable', e);
+            return [];
+        }
+    }
+
+    async function generateRound(attempt = 0) {
         if (attempt > 20) return null; // safety cap
 
         const tags = validTags();
@@ -116,7 +133,10 @@ document.addEventListener('DOMContentLoaded', async () => {
         );
         if (others.length === 0) return generateRound(attempt + 1);
 
-        const oddImage = others[Math.floor(Math.random() * others.length)];
+        // Hardest odd one: one of the few untagged images that look most like the three
+        const lookalikes = (await similarImages(tagImgs, others)).slice(0, 3);
+        const pick       = lookalikes.length ? lookalikes : others;
+        const oddImage   = pick[Math.floor(Math.random() * pick.length)];
         const fourImages = shuffle([...tagImgs, oddImage]);
 
         return { images: fourImages, correctAnswer: oddImage, sharedTag };
@@ -197,8 +217,9 @@ document.addEventListener('DOMContentLoaded', async () => {
     }
 
     // ── Round start ───────────────────────────────────────────────────────────
-    function startRound() {
-        const round = generateRound();
+    async function startRound() {
+        const round = await generateRound();
+        if (!state.active) return;
         if (!round) {
             messageEl.innerHTML = '<div class="feedback error">Not enough tagged images for a round. Add more or tag your images!</div>';
             endGame();
@@ -72,6 +72,27 @@ document.addEventListener('DOMContentLoaded', () => {
         return copy;
     }
 
+    // Hard options: the images that look most like the target (/similar); []
+    // when the collection has no embeddings yet, so the round stays random.
+    async function lookalikeOptions(targetUrl, count) {
+        const files = window.IMAGE_FILES || {};
+        const filename = files[targetUrl];
+        if (!filename || count <= 0) return [];
+        const urlFor = {};
+        Object.entries(files).forEach(([url, name]) => { urlFor[name] = url; });
+        try {
+            const params = new URLSearchParams({ filename, k: String(count) });
+            const res = await fetch(`/api/collections/${encodeURIComponent(CURRENT_COLLECTION)}/similar?${params}`);
+            const data = await res.json();
+            if (!data.success || !data.indexed) return [];
+            const urls = data.images.map((img) => urlFor[img.filename]).filter(Boolean);
+            return urls.length >= count ? urls.slice(0, count) : [];
+        } catch (err) {
+            console.warn('Remix: similar images unavailable', err);
+            return [];
+        }
+    }
+
     function updateTimer() {
         if (!state.startTime) {
             timeEl.textContent = '0:00';
@@ -418,7 +439,9 @@ document.addEventListener('DOMContentLoaded', () => {
         const shuffled = shuffle(REMIX_IMAGES);
         state.targetUrl = shuffled[0];
         state.correctOption = state.targetUrl;
-        state.options = shuffle(shuffled.slice(0, optionCount));
+        const lookalikes = await lookalikeOptions(state.targetUrl, optionCount - 1);
+        if (!state.active) return;
+        state.options = shuffle(lookalikes.length ? [state.targetUrl, ...lookalikes] : shuffled.slice(0, optionCount));
         if (!state.options.includes(state.correctOption)) {
             state.options[0] = state.correctOption;
             state.options = shuffle(state.options);
@@ -32,9 +32,10 @@ document.addEventListener('DOMContentLoaded', async () => {
 
     async function loadImages() {
         try {
-            const res  = await fetch(`/api/collections/${COLLECTION}/images`);
+            // Card-sized derivatives (thumb_url) rather than the originals
+            const res  = await fetch(`/api/collections/${COLLECTION}/images?w=${SCRATCH_IMAGE_WIDTH}`);
             const data = await res.json();
-            if (data.success) allImages = data.images;
+            if (data.success) allImages = data.images.map(img => ({...img, url: img.thumb_url || img.url}));
         } catch (e) { console.error('Scratch: load error', e); }
     }
 
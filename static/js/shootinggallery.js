@@ -245,9 +245,10 @@ document.addEventListener('DOMContentLoaded', async () => {
 
     async function loadCollection() {
         try {
-            const res  = await fetch(`/api/collections/${COLLECTION}/images`);
+            // Sprites are small: ask for 320px derivatives where they exist
+            const res  = await fetch(`/api/collections/${COLLECTION}/images?w=320`);
             const data = await res.json();
-            if (data.success) allImages = data.images;
+            if (data.success) allImages = data.images.map(img => ({ ...img, url: img.thumb_url || img.url }));
         } catch (e) { console.error('ShootingGallery: load error', e); }
     }
 
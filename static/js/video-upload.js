@@ -0,0 +1,50 @@
+// Streaming video upload: the file is PUT as the raw request body and the
+// server forwards it to storage part by part as it arrives (no spool, no job).
+(function () {
+    let socket = null;
+
+    // Joins the upload's Socket.IO room; resolves once the server has (or
+    // after a second without Socket.IO, so the upload never waits on it).
+    function subscribe(uploadId, onStored) {
+        if (!onStored || typeof io === 'undefined') return Promise.resolve(() => {});
+        socket = socket || io();
+        const handler = d => { if (d.upload_id === uploadId) onStored(d.bytes, d.total); };
+        socket.on('video_upload_progress', handler);
+        const unsubscribe = () => socket.off('video_upload_progress', handler);
+        return new Promise(resolve => {
+            const timer = setTimeout(() => resolve(unsubscribe), 1000);
+            socket.emit('upload_subscribe', {upload_id: uploadId}, () => {
+                clearTimeout(timer);
+                resolve(unsubscribe);
+            });
+        });
+    }
+
+    // Resolves with the server's JSON ({success, filename, ...} or {error}),
+    // calling onProgress(sentBytes, totalBytes) as the browser sends the body
+    // and onStored(storedBytes, totalBytes) as the server's parts reach storage.
+    window.uploadVideoStream = async function (collection, file, onProgress, onStored) {
+        const uploadId = crypto.randomUUID ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        const unsubscribe = await subscribe(uploadId, onStored);
+        try {
+            return await new Promise((resolve, reject) => {
+                const params = new URLSearchParams({filename: file.name, upload_id: uploadId});
+                const xhr = new XMLHttpRequest();
+                xhr.open('PUT', `/upload-video/${encodeURIComponent(collection)}/stream?${params}`);
+                xhr.setRequestHeader('Content-Type', file.type || 'application/octet-stream');
+                if (onProgress) {
+                    xhr.upload.onprogress = e => { if (e.lengthComputable) onProgress(e.loaded, e.total); };
+                }
+                xhr.onload = () => {
+                    try { resolve(JSON.parse(xhr.responseText)); }
+                    catch { resolve({success: false, error: `HTTP ${xhr.status}`}); }
+                };
+                xhr.onerror = () => reject(new Error('Network error'));
+                xhr.send(file);
+            });
+        } finally {
+            unsubscribe();
+        }
+    };
+})();
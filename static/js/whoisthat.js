@@ -65,7 +65,23 @@ document.addEventListener('DOMContentLoaded', async () => {
     }
 
     // ── Round generation ──────────────────────────────────────────────────────
-    function generateRound(attempt = 0) {
+    // Images of `candidates` that look most like `target` (/similar), most
+    // similar first; [] when the collection has no embeddings yet.
+    async function similarImages(target, candidates, k = 20) {
+        const allowed = new Map(candidates.map(img => [img.filename, img]));
+        try {
+            const params = new URLSearchParams({ filename: target.filename, k: String(k) });
+            const res = await fetch(`/api/collections/${COLLECTION}/similar?${params}`);
+            const d   = await res.json();
+            if (!d.success) return [];
+            return d.images.map(img => allowed.get(img.filename)).filter(Boolean);
+        } catch (e) {
+            console.warn('WhoIsThat: similar images unavailable', e);
+            return [];
+        }
+    }
+
+    async function generateRound(attempt = 0) {
         if (attempt > 30) return null;
 
         const numTags = parseInt(tagCountSel.value, 10) || 3;
@@ -86,10 +102,12 @@ document.addEventListener('DOMContentLoaded', async () => {
 
         if (nonMatches.length < 3) return generateRound(attempt + 1);
 
-        // Prefer distractors that share ≥1 of the shown tags (trickier)
+        // Hardest distractors look like the target; otherwise prefer ones that
+        // share ≥1 of the shown tags (trickier)
+        const lookalikes = (await similarImages(target, nonMatches)).slice(0, 3);
         const tricky = nonMatches.filter(img => shownTags.some(t => img.tags.includes(t)));
         const pool   = tricky.length >= 3 ? tricky : nonMatches;
-        const distractors = shuffle(pool).slice(0, 3);
+        const distractors = [...lookalikes, ...shuffle(pool.filter(img => !lookalikes.includes(img)))].slice(0, 3);
 
         return {
             target,
@@ -158,10 +176,11 @@ document.addEventListener('DOMContentLoaded', async () => {
     }
 
     // ── Round start ───────────────────────────────────────────────────────────
-    function startRound() {
+    async function startRound() {
         if (!state.active) return;
 
-        const round = generateRound();
+        const round = await generateRound();
+        if (!state.active) return;
         if (!round) {
             messageEl.innerHTML = '<div class="feedback error">Not enough tagged images to generate a round!</div>';
             endGame();
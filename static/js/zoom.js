@@ -48,59 +48,22 @@ document.addEventListener('DOMContentLoaded', () => {
         if (gameState.timerInterval) clearInterval(gameState.timerInterval);
     }
 
-    function getZoomedImageData(imageUrl) {
-        return new Promise((resolve) => {
-            const img = new Image();
-            img.crossOrigin = 'anonymous';
-            img.onload = () => {
-                const canvas = document.createElement('canvas');
-                const ctx = canvas.getContext('2d');
-                canvas.width = img.width;
-                canvas.height = img.height;
-                ctx.drawImage(img, 0, 0);
-
-                // Get random crop area (zoom in)
-                const zoomLevel = difficultyLevels[difficultySelect.value] || 0.5;
-                const cropWidth = img.width * zoomLevel;
-                const cropHeight = img.height * zoomLevel;
-                const maxX = img.width - cropWidth;
-                const maxY = img.height - cropHeight;
-                const cropX = Math.random() * maxX;
-                const cropY = Math.random() * maxY;
-
-                // Get cropped data
-                const imageData = ctx.getImageData(cropX, cropY, cropWidth, cropHeight);
-                resolve({
-                    imageData: imageData,
-                    zoomLevel: Math.round((1 / zoomLevel) * 100),
-                    x: cropX,
-                    y: cropY,
-                    width: cropWidth,
-                    height: cropHeight
-                });
-            };
-            img.onerror = () => resolve(null);
-            img.src = imageUrl;
-        });
+    // Random crop window (fractions of the image) for the current difficulty.
+    // Positions snap to whole percents so the server renders a bounded set.
+    function randomCrop() {
+        const zoomLevel = difficultyLevels[difficultySelect.value] || 0.5;
+        const x = Math.floor(Math.random() * (1 - zoomLevel) * 100) / 100;
+        const y = Math.floor(Math.random() * (1 - zoomLevel) * 100) / 100;
+        return {x, y, w: zoomLevel, h: zoomLevel, zoomLevel: Math.round((1 / zoomLevel) * 100)};
     }
 
     function displayZoomedImage() {
-        getZoomedImageData(gameState.currentImage).then((data) => {
-            if (!data) {
-                messageEl.textContent = 'Failed to load image';
-                return;
-            }
-
-            // Create canvas and render cropped image
-            const canvas = document.createElement('canvas');
-            canvas.width = data.imageData.width;
-            canvas.height = data.imageData.height;
-            const ctx = canvas.getContext('2d');
-            ctx.putImageData(data.imageData, 0, 0);
-
-            zoomedImageEl.src = canvas.toDataURL();
-            zoomIndicator.textContent = `${data.zoomLevel}%`;
-        });
+        // The piece is cut server-side (/img), so the original is never downloaded
+        const crop = randomCrop();
+        zoomedImageEl.onerror = () => { messageEl.textContent = 'Failed to load image'; };
+        zoomedImageEl.src = `${ZOOM_CROP_SOURCES[gameState.currentImage]}` +
+            `?crop=${crop.x},${crop.y},${crop.w},${crop.h}&w=${ZOOM_CROP_WIDTH}`;
+        zoomIndicator.textContent = `${crop.zoomLevel}%`;
     }
 
     function shuffle(arr) {
@@ -0,0 +1,114 @@
+"""
+Content-addressed cache of tagger results.
+
+Uploads are stored under fresh uuid4 filenames, so the same bytes uploaded
+twice, or re-tagged after a backend switch, used to go through the model
+again. Results are cached here keyed by
+
+    (sha256 of the file, backend, model version, threshold, top_k)
+
+in a local SQLite file, so identical content is never inferred twice for the
+same model and switching backends back and forth is a lookup. `backend`
+includes the variant ('clip-int8'); `model version` comes from
+image_tagger.model_version() and changes whenever the weights, labels or tag
+post-processing do, which makes stale rows unreachable.
+
+A row cached with a larger top_k also answers smaller ones: results are
+sorted best-first and cut at top_k, so its prefix is exactly what a
+smaller top_k would have produced.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TAG_CACHE_PATH = os.environ.get('TAG_CACHE_PATH', os.path.join('data', 'tag_cache.sqlite3'))
+
+_HASH_CHUNK = 1 << 20
+
+
+def file_sha256(path: str) -> Optional[str]:
+    """Hex SHA-256 of a file's bytes, or None if it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def content_sha256(source) -> Optional[str]:
+    """file_sha256 for a path; the digest itself for in-memory image bytes."""
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    return file_sha256(source)
+
+
+class TagCache:
+    """SQLite-backed tag result cache (see module docstring); safe to share between threads."""
+
+    def __init__(self, path: str = None):
+        self.path = path or TAG_CACHE_PATH
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS tag_cache (
+                    sha256        TEXT NOT NULL,
+                    backend       TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    threshold     REAL NOT NULL,
+                    top_k         INTEGER NOT NULL,
+                    tags          TEXT NOT NULL,
+                    created_at    TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (sha256, backend, model_version, threshold, top_k)
+                )
+            """)
+
+    def get_many(self, hashes: Iterable[str], backend: str, model_version: str,
+                 threshold: float, top_k: int) -> Dict[str, List[Dict]]:
+        """Cached results for whichever of `hashes` have one, keyed by hash."""
+        wanted = sorted({h for h in hashes if h})
+        found = {}
+        with self._lock:
+            for start in range(0, len(wanted), 500):   # stay under SQLite's bound-parameter limit
+                batch = wanted[start:start + 500]
+                rows = self._conn.execute(f"""
+                    SELECT sha256, tags FROM tag_cache
+                    WHERE backend = ? AND model_version = ? AND threshold = ? AND top_k >= ?
+                      AND sha256 IN ({','.join('?' * len(batch))})
+                """, (backend, model_version, float(threshold), int(top_k), *batch)).fetchall()
+                for sha, tags in rows:
+                    found[sha] = json.loads(tags)[:top_k]
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, List[Dict]]], backend: str,
+                 model_version: str, threshold: float, top_k: int):
+        """Store (sha256, tags) results computed with the given settings."""
+        rows = [(sha, backend, model_version, float(threshold), int(top_k), json.dumps(tags))
+                for sha, tags in entries if sha]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("""
+                INSERT OR REPLACE INTO tag_cache (sha256, backend, model_version, threshold, top_k, tags)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT backend, COUNT(*) FROM tag_cache GROUP BY backend ORDER BY backend").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,116 @@
+"""
+Inverted tag index over the image catalog.
+
+Maps each tag to the set of (collection, filename) keys carrying it, so tag
+filters become set intersections / unions over posting lists instead of a
+scan of every image, and keeps per-tag, per-collection counts up to date as
+images are added, retagged and removed.
+
+The index is a plain data structure with no locking of its own; ImageCatalog
+owns one and only touches it under its lock.
+"""
+
+import heapq
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+Key = Tuple[str, str]   # (collection, filename)
+
+
+class TagIndex:
+    """tag -> {(collection, filename)} postings plus {tag: {collection: count}}."""
+
+    def __init__(self):
+        self._postings = {}   # tag -> {key}
+        self._folded = {}     # tag.lower() -> {key}, for case-insensitive lookups
+        self._counts = {}     # tag -> {collection: count}
+        self._ranked = None   # tag_counts() result, dropped on any change
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def clear(self):
+        self._postings.clear()
+        self._folded.clear()
+        self._counts.clear()
+        self._ranked = None
+
+    # ── Maintenance ──────────────────────────────────────────────────────────
+
+    def add(self, collection: str, filename: str, tags: Iterable[str]):
+        key = (collection, filename)
+        self._ranked = None
+        for tag in set(tags or ()):
+            self._postings.setdefault(tag, set()).add(key)
+            self._folded.setdefault(tag.lower(), set()).add(key)
+            counts = self._counts.setdefault(tag, {})
+            counts[collection] = counts.get(collection, 0) + 1
+
+    def discard(self, collection: str, filename: str, tags: Iterable[str]):
+        """Undo add() for an image that carried `tags`."""
+        key = (collection, filename)
+        for tag in set(tags or ()):
+            postings = self._postings.get(tag)
+            if not postings or key not in postings:
+                continue
+            postings.discard(key)
+            self._ranked = None
+            if not postings:
+                del self._postings[tag]
+            counts = self._counts[tag]
+            counts[collection] -= 1
+            if not counts[collection]:
+                del counts[collection]
+            if not counts:
+                del self._counts[tag]
+            folded = self._folded.get(tag.lower())
+            # Another case variant of the same tag may still be on this image.
+            if folded is not None and not any(
+                    key in self._postings.get(t, ()) for t in tags if t.lower() == tag.lower()):
+                folded.discard(key)
+                if not folded:
+                    del self._folded[tag.lower()]
+
+    # ── Queries ──────────────────────────────────────────────────────────────
+
+    def match(self, tags: Iterable[str], match_all: bool = False,
+              ignore_case: bool = False) -> Set[Key]:
+        """Keys carrying every tag (match_all) or at least one of them."""
+        if ignore_case:
+            index, tags = self._folded, [tag.lower() for tag in tags]
+        else:
+            index = self._postings
+        postings = [index.get(tag, set()) for tag in dict.fromkeys(tags)]
+        if not postings:
+            return set()
+        if match_all:
+            postings.sort(key=len)   # intersect starting from the rarest tag
+            result = set(postings[0])
+            for other in postings[1:]:
+                if not result:
+                    break
+                result &= other
+            return result
+        return set().union(*postings)
+
+    def tag_counts(self) -> List[Tuple[str, Dict[str, int], int]]:
+        """[(tag, {collection: count}, total)] sorted by total desc, then tag."""
+        if self._ranked is None:
+            rows = [(tag, dict(counts), sum(counts.values()))
+                    for tag, counts in self._counts.items()]
+            rows.sort(key=lambda row: (-row[2], row[0]))
+            self._ranked = rows
+        return list(self._ranked)
+
+
+def page_keys(keys: Iterable[Key], after: Optional[Key] = None,
+              limit: Optional[int] = None) -> List[Key]:
+    """Keys in (collection, filename) order, strictly after `after`, at most `limit`.
+
+    Uses a bounded heap for a page, so a small page out of a large posting
+    list costs O(n log limit) rather than a full sort.
+    """
+    if after is not None:
+        keys = [key for key in keys if key > after]
+    if limit is None:
+        return sorted(keys)
+    return heapq.nsmallest(limit, keys)
@@ -0,0 +1,430 @@
+"""
+Warm tagger service.
+
+Loading a tagger model (from_pretrained / an ONNX session) takes seconds and
+pulls torch into the process, so neither the gevent web worker nor every
+batch_tag.py run should do it. This service owns the models instead:
+
+    python tagger_service.py [--socket PATH]
+
+It listens on a Unix socket (TAGGER_SOCKET) for newline-delimited JSON
+requests, one JSON response line each:
+
+    {"op": "tag", "paths": [...], "top_k": 10, "threshold": 0.15, "backend": null}
+    {"op": "tag", "images": [<base64>, ...], "collection": "name", ...}
+    {"op": "embed", "images": [<base64>, ...]}     # or "paths", or "texts": [...]
+    {"op": "status"}
+    {"op": "swap", "config": {...}}       # set_tagger_config() keys
+    {"op": "ping"}
+
+Inference runs in a worker process that loads the configured models once
+and warms them up before it takes traffic. Tag requests go through a single
+queue: requests waiting with the same settings are merged into one
+analyze_images() call (which uses the tag cache). A swap starts a new
+worker with the new config and switches to it only once it is warm; the old
+worker keeps serving until then, so a model change has no downtime. A
+worker that dies is restarted with the current config.
+
+Embed requests return CLIP embeddings (image_tagger.embed_images /
+embed_texts, always the fp32 CLIP model, loaded on first use) as base64
+little-endian float16 rows plus the model name; they share the queue and
+are merged with each other the same way.
+
+Callers use TaggerClient, which needs only the standard library, so app.py
+never imports torch. The service and its callers must share a host; tagged
+paths must be readable by the service, or the image bytes are sent inline
+(with their collection, so its backend_overrides entry applies).
+"""
+
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+TAGGER_SOCKET = os.environ.get('TAGGER_SOCKET') or os.path.join(tempfile.gettempdir(), 'image-tagger.sock')
+
+# Upper bound on the images merged into one analyze_images() call
+MAX_MERGED_PATHS = int(os.environ.get('TAGGER_MAX_MERGED_PATHS', 256))
+
+
+class TaggerError(Exception):
+    """The tagger service is unreachable or rejected the request."""
+
+
+# ── Client ───────────────────────────────────────────────────────────────────
+
+class TaggerClient:
+    """Talks to a running tagger service; one connection per call."""
+
+    def __init__(self, socket_path: str = None, timeout: float = 600):
+        self.socket_path = socket_path or TAGGER_SOCKET
+        self.timeout = timeout
+
+    def _call(self, request: Dict, timeout: float = None) -> Dict:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout or self.timeout)
+                sock.connect(self.socket_path)
+                sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+                with sock.makefile('rb') as f:
+                    line = f.readline()
+        except OSError as e:
+            raise TaggerError(f'Tagger service unavailable at {self.socket_path}: {e}') from e
+        if not line:
+            raise TaggerError('Tagger service closed the connection')
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise TaggerError(response.get('error') or 'Tagger request failed')
+        return response
+
+    def available(self) -> bool:
+        try:
+            self._call({'op': 'ping'}, timeout=2)
+            return True
+        except TaggerError:
+            return False
+
+    def tag(self, paths: List[str], top_k: int = 10, threshold: float = 0.15,
+            backend: str = None) -> List[List[Dict]]:
+        """analyze_images() in the service: one {tag, confidence} list per path."""
+        return self._call({'op': 'tag', 'paths': list(paths), 'top_k': top_k,
+                           'threshold': threshold, 'backend': backend})['results']
+
+    def tag_images(self, images: List[bytes], collection: str = None, top_k: int = 10,
+                   threshold: float = 0.15, backend: str = None) -> List[List[Dict]]:
+        """Like tag(), for encoded image bytes held in memory (nothing touches disk)."""
+        return self._call({'op': 'tag', 'images': [base64.b64encode(b).decode('ascii') for b in images],
+                           'collection': collection, 'top_k': top_k, 'threshold': threshold,
+                           'backend': backend})['results']
+
+    def embed_images(self, images: List[bytes]) -> Tuple[str, List[bytes]]:
+        """CLIP embeddings of encoded images: (model name, one '<f2' row of bytes
+        per image; all zeros for an unreadable one)."""
+        response = self._call({'op': 'embed', 'images': [base64.b64encode(b).decode('ascii') for b in images]})
+        return response['model'], [base64.b64decode(v) for v in response['vectors']]
+
+    def embed_texts(self, texts: List[str]) -> Tuple[str, List[bytes]]:
+        """CLIP embeddings of text queries, comparable with embed_images() rows."""
+        response = self._call({'op': 'embed', 'texts': list(texts)})
+        return response['model'], [base64.b64decode(v) for v in response['vectors']]
+
+    def status(self) -> Dict:
+        return self._call({'op': 'status'}, timeout=10)['status']
+
+    def swap(self, config: Dict) -> Dict:
+        """Load `config` in a new worker and switch to it once warm; returns the new status."""
+        return self._call({'op': 'swap', 'config': config})['status']
+
+
+# ── Worker process ───────────────────────────────────────────────────────────
+
+def _warm_up(image_tagger):
+    """Run one tiny image through the configured backend so its models load now.
+    Calls the batch function directly: analyze_images() would swallow a load error."""
+    from PIL import Image
+    name, variant = image_tagger._split_backend(image_tagger._config.get('backend'))
+    if name == 'wd14' and not image_tagger._wd14_ready():
+        name = 'clip'
+    prepare, run = image_tagger._BATCH_BACKENDS[name]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'warmup.png')
+        Image.new('RGB', (64, 64), (128, 128, 128)).save(path)
+        run([prepare(path)], top_k=1, threshold=0.0, variant=variant)
+
+
+def _worker_main(conn, config: Dict):
+    """Worker process: load + warm the models, then answer requests from the pipe."""
+    import image_tagger
+    from tag_cache import TagCache
+
+    try:
+        image_tagger._config.update(config)
+        started = time.monotonic()
+        _warm_up(image_tagger)
+        cache = TagCache()
+    except Exception as e:
+        conn.send({'ok': False, 'error': f'{type(e).__name__}: {e}'})
+        return
+    conn.send({'ok': True, 'warm_seconds': round(time.monotonic() - started, 2)})
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        try:
+            if request.get('op') == 'embed':
+                embed = image_tagger.embed_texts if request['kind'] == 'texts' else image_tagger.embed_images
+                results = [row.astype('<f2').tobytes() for row in embed(request['inputs'])]
+            else:
+                results = image_tagger.analyze_images(
+                    request['inputs'], top_k=request['top_k'], threshold=request['threshold'],
+                    backend=request.get('backend'), cache=cache, collection=request.get('collection'))
+            conn.send({'ok': True, 'results': results})
+        except Exception as e:
+            conn.send({'ok': False, 'error': f'{type(e).__name__}: {e}'})
+
+
+class _ProcessWorker:
+    """A warm worker process with one config; run() is called from one thread at a time."""
+
+    def __init__(self, config: Dict, ready_timeout: float = 900):
+        ctx = multiprocessing.get_context('spawn')   # no inherited threads / sockets
+        self._conn, child = ctx.Pipe()
+        self._process = ctx.Process(target=_worker_main, args=(child, config), daemon=True)
+        self._process.start()
+        child.close()
+        if not self._conn.poll(ready_timeout):
+            self.stop()
+            raise TaggerError(f'Tagger worker did not warm up within {ready_timeout}s')
+        try:
+            ready = self._conn.recv()
+        except EOFError:
+            ready = {'ok': False, 'error': 'worker exited during start-up'}
+        if not ready.get('ok'):
+            self.stop()
+            raise TaggerError(f"Tagger worker failed to start: {ready.get('error')}")
+        self.info = {'pid': self._process.pid, 'warm_seconds': ready['warm_seconds']}
+
+    def run(self, request: Dict) -> list:
+        try:
+            self._conn.send(request)
+            response = self._conn.recv()
+        except (EOFError, OSError) as e:
+            raise TaggerError(f'Tagger worker exited: {e}') from e
+        if not response.get('ok'):
+            raise TaggerError(response['error'])
+        return response['results']
+
+    def alive(self) -> bool:
+        return self._process.is_alive()
+
+    def stop(self):
+        try:
+            self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self._process.join(10)
+        if self._process.is_alive():
+            self._process.kill()
+        self._conn.close()
+
+
+# ── Service ──────────────────────────────────────────────────────────────────
+
+class TaggerService:
+    """Request queue in front of a swappable warm worker (see module docstring).
+
+    start_worker(config) -> worker with run(request), alive(), stop() and an
+    `info` dict; defaults to a _ProcessWorker.
+    """
+
+    def __init__(self, config: Dict = None, start_worker: Callable[[Dict], object] = None):
+        if config is None:
+            import image_tagger   # reads data/tagger_config.json; torch stays lazy
+            config = dict(image_tagger._config)
+        self.config = config
+        self._start_worker = start_worker or _ProcessWorker
+        self._queue = queue.Queue()
+        self._worker_lock = threading.Lock()   # held while a worker runs a request
+        self._swap_lock = threading.Lock()     # one swap at a time
+        self._worker = None
+        self.generation = 0
+        self.served = 0
+        self.started_at = time.time()
+
+    def start(self):
+        """Load the first worker (blocking) and start the dispatcher thread."""
+        self._worker = self._start_worker(self.config)
+        self.generation = 1
+        threading.Thread(target=self._dispatch_loop, name='tagger-dispatch', daemon=True).start()
+
+    def tag(self, inputs: list, top_k: int = 10, threshold: float = 0.15,
+            backend: str = None, collection: str = None) -> List[List[Dict]]:
+        """Queue paths and/or image bytes for tagging and wait for their results."""
+        future = Future()
+        self._queue.put(({'inputs': list(inputs), 'top_k': int(top_k), 'threshold': float(threshold),
+                          'backend': backend, 'collection': collection}, future))
+        return future.result()
+
+    def embed(self, inputs: list, kind: str = 'images') -> List[bytes]:
+        """Queue images (paths / bytes) or texts (kind='texts') for CLIP embedding
+        and wait for their float16 rows."""
+        future = Future()
+        self._queue.put(({'op': 'embed', 'kind': kind, 'inputs': list(inputs)}, future))
+        return future.result()
+
+    def _next_group(self):
+        """Block for one request, then merge in queued ones with the same settings."""
+        first = self._queue.get()
+        group, deferred = [first], []
+        settings = lambda r: (r.get('op', 'tag'), r.get('kind'), r.get('top_k'), r.get('threshold'),   # noqa: E731
+                              r.get('backend'), r.get('collection'))
+        size = len(first[0]['inputs'])
+        while size < MAX_MERGED_PATHS:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if settings(item[0]) == settings(first[0]):
+                group.append(item)
+                size += len(item[0]['inputs'])
+            else:
+                deferred.append(item)
+        for item in deferred:
+            self._queue.put(item)
+        return group
+
+    def _dispatch_loop(self):
+        while True:
+            group = self._next_group()
+            request = dict(group[0][0], inputs=[x for r, _f in group for x in r['inputs']])
+            try:
+                with self._worker_lock:
+                    results = self._worker.run(request)
+            except Exception as e:
+                for _request, future in group:
+                    future.set_exception(e if isinstance(e, TaggerError) else TaggerError(str(e)))
+                self._restart_if_dead()
+                continue
+            self.served += len(request['inputs'])
+            offset = 0
+            for r, future in group:
+                future.set_result(results[offset:offset + len(r['inputs'])])
+                offset += len(r['inputs'])
+
+    def _restart_if_dead(self):
+        if self._worker.alive():
+            return
+        print('[tagger-service] Worker died; restarting')
+        try:
+            self.swap(self.config, persist=False)
+        except TaggerError as e:
+            print(f'[tagger-service] Restart failed: {e}')
+
+    def swap(self, config: Dict, persist: bool = True) -> Dict:
+        """Warm a worker with `config` merged over the current one, then switch to it.
+        The current worker serves until the switch; on failure it stays in place."""
+        with self._swap_lock:
+            new_config = {**self.config, **config}
+            worker = self._start_worker(new_config)     # slow part, outside the worker lock
+            with self._worker_lock:                     # waits for an in-flight request
+                old, self._worker = self._worker, worker
+                self.config = new_config
+                self.generation += 1
+            old.stop()
+            if persist:
+                import image_tagger
+                image_tagger.set_tagger_config(new_config)
+            print(f'[tagger-service] Swapped to generation {self.generation}: {new_config.get("backend")}')
+        return self.status()
+
+    def status(self) -> Dict:
+        return {
+            'generation': self.generation,
+            'config': self.config,
+            'worker': dict(getattr(self._worker, 'info', {}) or {}),
+            'queued': self._queue.qsize(),
+            'served': self.served,
+            'uptime_seconds': round(time.time() - self.started_at),
+        }
+
+    def handle(self, request: Dict) -> Dict:
+        """One protocol request -> response dict."""
+        op = request.get('op')
+        try:
+            if op == 'ping':
+                return {'ok': True}
+            if op == 'status':
+                return {'ok': True, 'status': self.status()}
+            if op == 'tag':
+                try:
+                    inputs = [base64.b64decode(b) for b in request.get('images') or []]
+                except ValueError:
+                    return {'ok': False, 'error': 'images must be base64'}
+                return {'ok': True, 'results': self.tag(
+                    inputs + list(request.get('paths') or []), request.get('top_k', 10),
+                    request.get('threshold', 0.15), request.get('backend'), request.get('collection'))}
+            if op == 'embed':
+                import image_tagger
+                if request.get('texts') is not None:
+                    if not all(isinstance(t, str) for t in request['texts']):
+                        return {'ok': False, 'error': 'texts must be strings'}
+                    vectors = self.embed(request['texts'], kind='texts')
+                else:
+                    try:
+                        inputs = [base64.b64decode(b) for b in request.get('images') or []]
+                    except ValueError:
+                        return {'ok': False, 'error': 'images must be base64'}
+                    vectors = self.embed(inputs + list(request.get('paths') or []))
+                return {'ok': True, 'model': image_tagger.CLIP_MODEL_NAME,
+                        'vectors': [base64.b64encode(v).decode('ascii') for v in vectors]}
+            if op == 'swap':
+                if not isinstance(request.get('config'), dict):
+                    return {'ok': False, 'error': 'swap needs a config object'}
+                return {'ok': True, 'status': self.swap(request['config'])}
+            return {'ok': False, 'error': f'Unknown op {op!r}'}
+        except TaggerError as e:
+            return {'ok': False, 'error': str(e)}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = {'ok': False, 'error': 'Invalid JSON'}
+            else:
+                response = self.server.service.handle(request)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path: str = None, service: TaggerService = None) -> _UnixServer:
+    """Bind the service to a Unix socket (replacing a stale one); call serve_forever() on the result."""
+    socket_path = socket_path or TAGGER_SOCKET
+    if os.path.exists(socket_path):
+        if TaggerClient(socket_path).available():
+            raise TaggerError(f'A tagger service is already listening on {socket_path}')
+        os.unlink(socket_path)
+    server = _UnixServer(socket_path, _RequestHandler)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm image tagger service')
+    parser.add_argument('--socket', default=TAGGER_SOCKET, help='Unix socket path')
+    args = parser.parse_args()
+
+    service = TaggerService()
+    print(f"[tagger-service] Loading backend {service.config.get('backend')!r}...")
+    service.start()
+    print(f"[tagger-service] Warm ({service.status()['worker']}); listening on {args.socket}")
+    server = serve(args.socket, service)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
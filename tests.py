@@ -3,7 +3,7 @@ Unit tests for body-part tagging logic and related helpers.
 All DB / cloud dependencies are stubbed so no real services are needed.
 Run: python -m pytest tests.py -v   (or: python tests.py)
 """
-import sys, os, types, unittest
+import sys, os, io, types, json, unittest
 from unittest.mock import MagicMock, patch
 
 # ── Set env vars before importing app ─────────────────────────────────────────
@@ -14,6 +14,8 @@ os.environ.update({
     'B2_APPLICATION_KEY': 'testsecret',
     'B2_BUCKET':          'testbucket',
     'B2_ENDPOINT_URL':    'https://s3.us-west-004.backblazeb2.com',
+    'IMAGE_CATALOG_LISTEN': '0',
+    'JOB_WORKERS': '0',
 })
 
 # ── Stub heavy dependencies so app.py imports cleanly ────────────────────────
@@ -44,6 +46,7 @@ _conn.cursor.return_value   = _cur
 _pg           = types.ModuleType('psycopg2')
 _pg.connect   = MagicMock(return_value=_conn)
 _pg.pool      = types.ModuleType('psycopg2.pool')
+_pg.pool.PoolError = type('PoolError', (Exception,), {})
 _pg.pool.ThreadedConnectionPool = MagicMock(
     return_value=MagicMock(getconn=MagicMock(return_value=_conn))
 )
@@ -55,6 +58,8 @@ sys.modules['psycopg2.extras']  = _pg.extras
 
 # boto3: S3 client is created at import time
 sys.modules['boto3'] = MagicMock()
+sys.modules['boto3.s3'] = MagicMock()
+sys.modules['boto3.s3.transfer'] = MagicMock()
 
 # authlib: OAuth is instantiated at import time
 sys.modules['authlib']                              = MagicMock()
@@ -257,12 +262,12 @@ class TestCcCollectionImages(unittest.TestCase):
     KM = _app.CC_CATEGORY_KEYWORDS_DEFAULT
 
     def _fake_tags_data(self, specs):
-        """Build a fake _load_tags() result for collection 'col'.
+        """Build a fake _load_collection_images() result for collection 'col'.
         specs: list of (body_parts_dict, flat_tags_list).
         """
         data = {}
         for i, (bp, tags) in enumerate(specs):
-            data[f'col/{i}.jpg'] = {
+            data[f'{i}.jpg'] = {
                 'url':        f'col/{i}.jpg',
                 'tags':       tags,
                 'body_parts': bp,
@@ -270,7 +275,7 @@ class TestCcCollectionImages(unittest.TestCase):
             }
         return data
 
-    @patch.object(_app, '_load_tags')
+    @patch.object(_app, '_load_collection_images')
     @patch.object(_app, '_b2_sign_url', side_effect=lambda k: f'signed:{k}')
     def test_two_matching_parts_eligible(self, _sign, mock_load):
         mock_load.return_value = self._fake_tags_data([
@@ -279,7 +284,7 @@ class TestCcCollectionImages(unittest.TestCase):
         result = _app._cc_collection_images('col', self.KM)
         self.assertEqual(len(result), 1)
 
-    @patch.object(_app, '_load_tags')
+    @patch.object(_app, '_load_collection_images')
     @patch.object(_app, '_b2_sign_url', side_effect=lambda k: f'signed:{k}')
     def test_one_matching_part_not_eligible(self, _sign, mock_load):
         mock_load.return_value = self._fake_tags_data([
@@ -288,7 +293,7 @@ class TestCcCollectionImages(unittest.TestCase):
         result = _app._cc_collection_images('col', self.KM)
         self.assertEqual(len(result), 0)
 
-    @patch.object(_app, '_load_tags')
+    @patch.object(_app, '_load_collection_images')
     @patch.object(_app, '_b2_sign_url', side_effect=lambda k: f'signed:{k}')
     def test_options_keys_match_body_part_names(self, _sign, mock_load):
         mock_load.return_value = self._fake_tags_data([
@@ -297,7 +302,7 @@ class TestCcCollectionImages(unittest.TestCase):
         result = _app._cc_collection_images('col', self.KM)
         self.assertSetEqual(set(result[0]['options'].keys()), {'boobs', 'butt', 'face'})
 
-    @patch.object(_app, '_load_tags')
+    @patch.object(_app, '_load_collection_images')
     @patch.object(_app, '_b2_sign_url', side_effect=lambda k: f'signed:{k}')
     def test_body_part_not_in_keyword_map_excluded_from_options(self, _sign, mock_load):
         # 'chest' is in CC_CATEGORY_KEYWORDS_GAY but not DEFAULT — should be ignored
@@ -307,7 +312,7 @@ class TestCcCollectionImages(unittest.TestCase):
         result = _app._cc_collection_images('col', self.KM)
         self.assertEqual(len(result), 0)
 
-    @patch.object(_app, '_load_tags')
+    @patch.object(_app, '_load_collection_images')
     @patch.object(_app, '_b2_sign_url', side_effect=lambda k: f'signed:{k}')
     def test_legacy_flat_tags_fallback_when_no_body_parts(self, _sign, mock_load):
         mock_load.return_value = self._fake_tags_data([
@@ -318,7 +323,7 @@ class TestCcCollectionImages(unittest.TestCase):
         self.assertIn('boobs', result[0]['options'])
         self.assertIn('pussy', result[0]['options'])
 
-    @patch.object(_app, '_load_tags')
+    @patch.object(_app, '_load_collection_images')
     @patch.object(_app, '_b2_sign_url', side_effect=lambda k: f'signed:{k}')
     def test_empty_body_parts_and_no_tags_not_eligible(self, _sign, mock_load):
         mock_load.return_value = self._fake_tags_data([
@@ -327,7 +332,7 @@ class TestCcCollectionImages(unittest.TestCase):
         result = _app._cc_collection_images('col', self.KM)
         self.assertEqual(len(result), 0)
 
-    @patch.object(_app, '_load_tags')
+    @patch.object(_app, '_load_collection_images')
     @patch.object(_app, '_b2_sign_url', side_effect=lambda k: f'signed:{k}')
     def test_mixed_new_and_legacy_images(self, _sign, mock_load):
         mock_load.return_value = self._fake_tags_data([
@@ -338,7 +343,7 @@ class TestCcCollectionImages(unittest.TestCase):
         result = _app._cc_collection_images('col', self.KM)
         self.assertEqual(len(result), 2)
 
-    @patch.object(_app, '_load_tags')
+    @patch.object(_app, '_load_collection_images')
     @patch.object(_app, '_b2_sign_url', side_effect=lambda k: f'signed:{k}')
     def test_url_is_signed(self, _sign, mock_load):
         mock_load.return_value = self._fake_tags_data([
@@ -348,5 +353,2443 @@ class TestCcCollectionImages(unittest.TestCase):
         self.assertTrue(result[0]['url'].startswith('signed:'))
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# 8. image_queries  (collection-scoped SQL instead of full-table scans)
+# ─────────────────────────────────────────────────────────────────────────────
+import image_queries   # noqa: E402
+
+
+class _RecordingConn:
+    """Minimal psycopg2 connection double that records every execute() call."""
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.executed = []
+
+    def cursor(self, *a, **kw):
+        conn = self
+        class _Cur:
+            itersize = 2000
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc):
+                return False
+            def execute(self, sql, params=None):
+                conn.executed.append((' '.join(sql.split()), params))
+                self._pending = list(conn.rows)
+            def fetchall(self):
+                return conn.rows
+            def fetchone(self):
+                return conn.rows[0] if conn.rows else None
+            def fetchmany(self, size):
+                batch, self._pending = self._pending[:size], self._pending[size:]
+                return batch
+        return _Cur()
+
+
+class TestImageQueries(unittest.TestCase):
+    ROW = ('col', 'a.jpg', 'col/a.jpg', ['solo'], True, {'face': 'n'}, None, None, None, None, None, None, None)
+
+    def test_collection_images_filters_in_sql(self):
+        conn = _RecordingConn([self.ROW])
+        out = image_queries.collection_images(conn, 'col')
+        sql, params = conn.executed[0]
+        self.assertIn('WHERE collection_name = %s', sql)
+        self.assertEqual(params, ('col',))
+        self.assertEqual(out, {'a.jpg': {'tags': ['solo'], 'locked': True,
+                                         'url': 'col/a.jpg', 'body_parts': {'face': 'n'},
+                                         'thumbs': {}, 'meta': {}}})
+
+    def test_image_missing_returns_none(self):
+        conn = _RecordingConn([])
+        self.assertIsNone(image_queries.image(conn, 'col', 'nope.jpg'))
+        self.assertEqual(conn.executed[0][1], ('col', 'nope.jpg'))
+
+    def test_all_images_keeps_legacy_key_shape(self):
+        conn = _RecordingConn([self.ROW])
+        self.assertIn('col/a.jpg', image_queries.all_images(conn))
+
+    def test_images_page_uses_keyset_cursor(self):
+        conn = _RecordingConn([self.ROW])
+        page = image_queries.images_page(conn, 'col', after=('col', 'Z.jpg'), limit=50)
+        sql, params = conn.executed[0]
+        self.assertIn('(collection_name, filename) > (%s, %s)', sql)
+        self.assertEqual(params, ('col', 'col', 'Z.jpg', 50))
+        self.assertEqual(page[0][:2], ('col', 'a.jpg'))
+
+    def test_images_page_clamps_limit(self):
+        conn = _RecordingConn([])
+        image_queries.images_page(conn, limit=10**6)
+        self.assertEqual(conn.executed[0][1], (image_queries.MAX_PAGE_SIZE,))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 9. Presigned-URL cache  (_b2_sign_url reuse with a fake S3 client)
+# ─────────────────────────────────────────────────────────────────────────────
+from b2_signing import PresignedUrlCache   # noqa: E402
+
+
+class _FakeS3:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_presigned_url(self, op, Params, ExpiresIn):
+        self.calls += 1
+        return f"https://b2.example/{Params['Key']}?sig={self.calls}&exp={ExpiresIn}"
+
+
+class TestPresignedUrlCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.cache = PresignedUrlCache(max_entries=2, reuse_fraction=0.5,
+                                       clock=lambda: self.now[0])
+        self.s3 = _FakeS3()
+        patcher_s3 = patch.object(_app, '_s3', self.s3)
+        patcher_cache = patch.object(_app, '_b2_url_cache', self.cache)
+        patcher_s3.start(); patcher_cache.start()
+        self.addCleanup(patcher_s3.stop)
+        self.addCleanup(patcher_cache.stop)
+
+    def test_repeat_sign_reuses_url(self):
+        first = _app._b2_sign_url('col/a.jpg', 600)
+        second = _app._b2_sign_url('col/a.jpg', 600)
+        self.assertEqual(first, second)
+        self.assertEqual(self.s3.calls, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_resigns_after_reuse_fraction_elapsed(self):
+        first = _app._b2_sign_url('col/a.jpg', 600)
+        self.now[0] += 299
+        self.assertEqual(_app._b2_sign_url('col/a.jpg', 600), first)
+        self.now[0] += 2   # 301s > 0.5 * 600
+        self.assertNotEqual(_app._b2_sign_url('col/a.jpg', 600), first)
+        self.assertEqual(self.s3.calls, 2)
+
+    def test_different_expiry_is_a_different_entry(self):
+        _app._b2_sign_url('col/a.jpg', 600)
+        _app._b2_sign_url('col/a.jpg', 60)
+        self.assertEqual(self.s3.calls, 2)
+
+    def test_bounded_lru_evicts_oldest(self):
+        for name in ('a', 'b', 'c'):
+            _app._b2_sign_url(f'col/{name}.jpg', 600)
+        stats = self.cache.stats()
+        self.assertEqual((stats['size'], stats['evictions']), (2, 1))
+        _app._b2_sign_url('col/a.jpg', 600)
+        self.assertEqual(self.s3.calls, 4)
+
+    def test_falsy_key_passes_through_unsigned(self):
+        self.assertIsNone(_app._b2_sign_url(None))
+        self.assertEqual(self.s3.calls, 0)
+
+    def test_invalid_reuse_fraction_rejected(self):
+        with self.assertRaises(ValueError):
+            PresignedUrlCache(reuse_fraction=1.0)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 10. Local SigV4 presigner  (byte-for-byte parity with botocore)
+# ─────────────────────────────────────────────────────────────────────────────
+import datetime   # noqa: E402
+from b2_signing import SigV4Presigner   # noqa: E402
+
+try:
+    import botocore.auth
+    import botocore.session
+    _HAS_BOTOCORE = True
+except ImportError:
+    _HAS_BOTOCORE = False
+
+
+@unittest.skipUnless(_HAS_BOTOCORE, 'botocore not installed')
+class TestSigV4PresignerParity(unittest.TestCase):
+    SIGNED_AT = 1792198923   # 2026-10-17T01:02:03Z
+    KEYS = [
+        'col/plain.jpg',
+        'col/a b+c~é.jpg',
+        "col/a!*()'$&=;:@,?#[]%.png",
+        'col/x//y/./../z.webp',
+        'Ünïcode/日本語/файл.gif',
+        'no-collection.png',
+    ]
+
+    def _botocore_urls(self, endpoint, bucket, region, keys, expires_in):
+        client = botocore.session.get_session().create_client(
+            's3', endpoint_url=endpoint, region_name=region,
+            aws_access_key_id='AKIDEXAMPLE', aws_secret_access_key='wJalrXUtnFEMI/K7MDENG+bPxRfiCY',
+        )
+        frozen = datetime.datetime.fromtimestamp(self.SIGNED_AT, datetime.timezone.utc).replace(tzinfo=None)
+        with patch.object(botocore.auth, 'get_current_datetime', return_value=frozen, create=True):
+            return [client.generate_presigned_url(
+                'get_object', Params={'Bucket': bucket, 'Key': k}, ExpiresIn=expires_in
+            ) for k in keys]
+
+    def _assert_parity(self, endpoint, bucket, region, expires_in=21600):
+        presigner = SigV4Presigner(endpoint, bucket, 'AKIDEXAMPLE',
+                                   'wJalrXUtnFEMI/K7MDENG+bPxRfiCY', region)
+        ours = presigner.presign_get(self.KEYS, expires_in, self.SIGNED_AT)
+        theirs = self._botocore_urls(endpoint, bucket, region, self.KEYS, expires_in)
+        for key, a, b in zip(self.KEYS, ours, theirs):
+            self.assertEqual(a, b, f'mismatch for key {key!r}')
+
+    def test_b2_endpoint(self):
+        self._assert_parity('https://s3.us-west-004.backblazeb2.com', 'gamecum-media', 'us-west-004')
+
+    def test_other_region_and_expiry(self):
+        self._assert_parity('https://s3.eu-central-003.backblazeb2.com', 'media', 'eu-central-003', 60)
+
+    def test_explicit_default_port(self):
+        self._assert_parity('https://s3.us-west-004.backblazeb2.com:443', 'gamecum-media', 'us-west-004')
+
+    def test_non_default_port_http(self):
+        self._assert_parity('http://localhost:9000', 'bucket', 'us-west-004', 3600)
+
+    def test_signing_key_derived_once_per_day(self):
+        presigner = SigV4Presigner('https://s3.us-west-004.backblazeb2.com', 'b', 'k', 's', 'us-west-004')
+        with patch('b2_signing.hmac.new', wraps=__import__('hmac').new) as spy:
+            presigner.presign_get(['a', 'b', 'c'], 60, self.SIGNED_AT)
+            first = spy.call_count
+            presigner.presign_get(['a', 'b', 'c'], 60, self.SIGNED_AT + 10)
+            self.assertEqual(spy.call_count - first, 3)   # one HMAC per URL, no key re-derivation
+        self.assertEqual(first, 4 + 3)
+
+
+class TestB2SignUrlsBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = PresignedUrlCache(max_entries=100)
+        self.presigner = SigV4Presigner('https://s3.us-west-004.backblazeb2.com',
+                                        'testbucket', 'testkey', 'testsecret', 'us-west-004')
+        for target, value in (('_b2_url_cache', self.cache), ('_b2_presigner', self.presigner)):
+            patcher = patch.object(_app, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_order_preserved_and_falsy_passthrough(self):
+        urls = _app._b2_sign_urls(['c/a.jpg', None, 'c/b.jpg'])
+        self.assertIn('/testbucket/c/a.jpg?', urls[0])
+        self.assertIsNone(urls[1])
+        self.assertIn('/testbucket/c/b.jpg?', urls[2])
+
+    def test_second_batch_served_from_cache(self):
+        first = _app._b2_sign_urls(['c/a.jpg', 'c/b.jpg'])
+        with patch.object(self.presigner, 'presign_get') as presign:
+            self.assertEqual(_app._b2_sign_urls(['c/a.jpg', 'c/b.jpg']), first)
+            presign.assert_not_called()
+
+    def test_falls_back_to_client_without_region(self):
+        s3 = _FakeS3()
+        with patch.object(_app, '_b2_presigner', None), patch.object(_app, '_s3', s3):
+            _app._b2_sign_urls(['c/a.jpg', 'c/b.jpg'])
+        self.assertEqual(s3.calls, 2)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 11. ImageCatalog  (in-process cache + write-through from the mutators)
+# ─────────────────────────────────────────────────────────────────────────────
+from collections.abc import Mapping   # noqa: E402
+from image_catalog import ImageCatalog   # noqa: E402
+
+
+def _entry(url, tags=()):
+    return {'tags': list(tags), 'locked': False, 'url': url, 'body_parts': {}}
+
+
+class TestImageCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.db = {'a': {'1.jpg': _entry('a/1.jpg', ['solo'])},
+                   'b': {'2.jpg': _entry('b/2.jpg')}}
+        self.loads = []
+        self.now = [0.0]
+
+        def load_all():
+            self.loads.append('*')
+            return {f'{c}/{f}': e for c, imgs in self.db.items() for f, e in imgs.items()}
+
+        def load_collection(name):
+            self.loads.append(name)
+            return dict(self.db.get(name, {}))
+
+        self.cat = ImageCatalog(load_all, load_collection, ttl=60, clock=lambda: self.now[0])
+
+    def test_collection_loaded_once_within_ttl(self):
+        self.cat.collection('a')
+        self.cat.collection('a')
+        self.assertEqual(self.loads, ['a'])
+        self.now[0] = 61
+        self.cat.collection('a')
+        self.assertEqual(self.loads, ['a', 'a'])
+
+    def test_full_load_serves_collections_and_unknown_names(self):
+        self.assertEqual(set(self.cat.all_images()), {'a/1.jpg', 'b/2.jpg'})
+        self.assertIn('2.jpg', self.cat.collection('b'))
+        self.assertEqual(self.cat.collection('missing'), {})
+        self.assertEqual(self.loads, ['*'])
+
+    def test_update_replaces_entry_without_mutating_readers_copy(self):
+        before = self.cat.collection('a')['1.jpg']
+        self.assertTrue(self.cat.update('a', '1.jpg', tags=['new']))
+        self.assertEqual(before['tags'], ['solo'])
+        self.assertEqual(self.cat.image('a', '1.jpg')['tags'], ['new'])
+        self.assertEqual(self.loads, ['a'])
+
+    def test_update_of_uncached_image_is_a_noop(self):
+        self.assertFalse(self.cat.update('a', '1.jpg', tags=['x']))
+
+    def test_put_keeps_filename_order(self):
+        self.cat.collection('a')
+        self.cat.put('a', '0.jpg', _entry('a/0.jpg'))
+        self.assertEqual(list(self.cat.collection('a')), ['0.jpg', '1.jpg'])
+
+    def test_remove_and_invalidate(self):
+        self.cat.collection('a')
+        self.cat.remove('a', '1.jpg')
+        self.assertEqual(self.cat.collection('a'), {})
+        self.cat.invalidate('a')
+        self.assertIn('1.jpg', self.cat.collection('a'))
+        self.assertEqual(self.loads, ['a', 'a'])
+
+    def test_image_copies_only_its_entry(self):
+        class _Images(Mapping):
+            iterated = 0
+
+            def __init__(self, entries):
+                self._entries = entries
+
+            def __getitem__(self, key):
+                return self._entries[key]
+
+            def __len__(self):
+                return len(self._entries)
+
+            def __iter__(self):
+                _Images.iterated += 1
+                return iter(self._entries)
+
+        self.cat = ImageCatalog(None, lambda name: _Images(self.db[name]), ttl=60)
+        entry = self.cat.image('a', '1.jpg')
+        entry['tags'] = ['changed']
+        self.assertEqual(self.cat.image('a', '1.jpg')['tags'], ['solo'])
+        self.assertIsNone(self.cat.image('a', 'missing.jpg'))
+        self.assertEqual(_Images.iterated, 0)
+
+    def test_version_bumps_on_change(self):
+        v0 = self.cat.version
+        self.cat.collection('a')
+        self.cat.update('a', '1.jpg', locked=True)
+        self.assertGreater(self.cat.version, v0 + 1)
+
+
+class TestImageCatalogWriteThrough(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = _RecordingConn()
+        self.cat = ImageCatalog(lambda: {}, lambda name: {'1.jpg': _entry(f'{name}/1.jpg')})
+        for target, value in (('_image_catalog', self.cat),
+                              ('_get_db', lambda: self.conn),
+                              ('_release_db', lambda conn: None),
+                              ('_ensure_collection', lambda name: None)):
+            patcher = patch.object(_app, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.conn.commit = lambda: None
+
+    def _notified(self):
+        return [p for sql, p in self.conn.executed if 'pg_notify' in sql]
+
+    def test_insert_adds_to_cached_collection_and_notifies(self):
+        self.cat.collection('c')
+        _app._db_insert_image('c', '2.jpg', 'c/2.jpg')
+        self.assertEqual(self.cat.image('c', '2.jpg')['url'], 'c/2.jpg')
+        self.assertEqual(json.loads(self._notified()[0][1])['collection'], 'c')
+
+    def test_set_tags_and_lock_write_through(self):
+        self.cat.collection('c')
+        _app._set_image_tags('c', '1.jpg', ['a', ' b '])
+        _app._set_image_locked('c', '1.jpg', True)
+        entry = self.cat.image('c', '1.jpg')
+        self.assertEqual((entry['tags'], entry['locked']), (['a', 'b'], True))
+
+    def test_delete_removes_from_catalog(self):
+        self.cat.collection('c')
+        _app._db_delete_image('c', '1.jpg')
+        self.assertIsNone(self.cat.image('c', '1.jpg'))
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 12. TagIndex  (posting lists behind the tag search / tag browser endpoints)
+# ─────────────────────────────────────────────────────────────────────────────
+from tag_index import TagIndex, page_keys   # noqa: E402
+
+
+class TestTagIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.idx = TagIndex()
+        self.idx.add('a', '1.jpg', ['solo', 'outdoor'])
+        self.idx.add('a', '2.jpg', ['solo'])
+        self.idx.add('b', '3.jpg', ['Solo', 'indoor'])
+
+    def test_any_is_union_all_is_intersection(self):
+        self.assertEqual(self.idx.match(['outdoor', 'indoor']), {('a', '1.jpg'), ('b', '3.jpg')})
+        self.assertEqual(self.idx.match(['solo', 'outdoor'], match_all=True), {('a', '1.jpg')})
+        self.assertEqual(self.idx.match(['solo', 'missing'], match_all=True), set())
+
+    def test_ignore_case_uses_folded_postings(self):
+        self.assertEqual(len(self.idx.match(['SOLO'], ignore_case=True)), 3)
+        self.assertEqual(len(self.idx.match(['SOLO'])), 0)
+
+    def test_counts_per_collection_follow_discard(self):
+        self.assertEqual(self.idx.tag_counts()[0], ('solo', {'a': 2}, 2))
+        self.idx.discard('a', '2.jpg', ['solo'])
+        self.idx.discard('b', '3.jpg', ['Solo', 'indoor'])
+        counts = {tag: total for tag, _colls, total in self.idx.tag_counts()}
+        self.assertEqual(counts, {'solo': 1, 'outdoor': 1})
+        self.assertEqual(self.idx.match(['solo'], ignore_case=True), {('a', '1.jpg')})
+
+    def test_page_keys_orders_and_resumes_after_cursor(self):
+        keys = {('b', '1.jpg'), ('a', '2.jpg'), ('a', '1.jpg')}
+        self.assertEqual(page_keys(keys, limit=2), [('a', '1.jpg'), ('a', '2.jpg')])
+        self.assertEqual(page_keys(keys, after=('a', '2.jpg'), limit=2), [('b', '1.jpg')])
+
+
+class TestCatalogTagQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.db = {'a/1.jpg': _entry('a/1.jpg', ['solo', 'outdoor']),
+                   'a/2.jpg': _entry('a/2.jpg', ['solo']),
+                   'b/3.jpg': _entry('b/3.jpg', ['solo'])}
+        self.cat = ImageCatalog(lambda: dict(self.db), lambda name: {})
+
+    def test_find_by_tags_pages_in_key_order(self):
+        total, page = self.cat.find_by_tags(['solo'], limit=2)
+        self.assertEqual(total, 3)
+        self.assertEqual([row[:2] for row in page], [('a', '1.jpg'), ('a', '2.jpg')])
+        _total, page = self.cat.find_by_tags(['solo'], after=('a', '2.jpg'), limit=2)
+        self.assertEqual([row[:2] for row in page], [('b', '3.jpg')])
+
+    def test_write_through_keeps_index_current(self):
+        self.cat.all_images()
+        self.cat.update('a', '2.jpg', tags=['outdoor'])
+        self.cat.remove('a', '1.jpg')
+        self.cat.put('b', '4.jpg', _entry('b/4.jpg', ['outdoor']))
+        total, page = self.cat.find_by_tags(['outdoor'])
+        self.assertEqual([row[:2] for row in page], [('a', '2.jpg'), ('b', '4.jpg')])
+        self.assertEqual(self.cat.tag_counts()[0], ('outdoor', {'a': 1, 'b': 1}, 2))
+
+    def test_images_by_tags_endpoint_returns_cursor(self):
+        with patch.object(_app, '_image_catalog', self.cat), \
+                patch.object(_app, '_b2_sign_urls', lambda keys, *a: [f'signed:{k}' for k in keys]):
+            with _app.app.test_request_context('/api/images-by-tags?tags=solo&limit=2'):
+                data = _app.api_images_by_tags().get_json()
+        self.assertEqual((data['count'], data['next_cursor']), (3, 'a/2.jpg'))
+        self.assertEqual(data['images'][0]['url'], 'signed:a/1.jpg')
+
+    def test_cursor_without_limit_pages_and_keeps_count_the_total(self):
+        with patch.object(_app, '_image_catalog', self.cat), \
+                patch.object(_app, '_b2_sign_urls', lambda keys, *a: [f'signed:{k}' for k in keys]), \
+                patch.object(image_queries, 'MAX_PAGE_SIZE', 1):
+            with _app.app.test_request_context('/api/search-by-tag?tag=solo&cursor=a/1.jpg'):
+                data = _app.search_by_tag().get_json()
+        self.assertEqual((data['count'], len(data['images']), data['next_cursor']), (3, 1, 'a/2.jpg'))
+
+    def test_row_keeps_meta_when_only_the_hash_is_set(self):
+        entry = image_queries._row_to_entry('a/1.jpg', [], False, {}, None,
+                                            None, None, None, None, None, -1)
+        self.assertEqual(entry['meta']['phash'], (1 << 64) - 1)
+        self.assertIsNone(entry['meta']['width'])
+        self.assertEqual(image_queries._row_to_entry('a/1.jpg', [], False, {})['meta'], {})
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 13. Paged / streamed catalog endpoints  (/api/images, /api/collections, /api/tags)
+# ─────────────────────────────────────────────────────────────────────────────
+class TestCatalogStreaming(unittest.TestCase):
+    ROWS = [('a', f'{i}.jpg', f'a/{i}.jpg', ['solo'], False, {}) for i in range(3)] + \
+           [('b', '0.jpg', 'b/0.jpg', [], False, {})]
+
+    def setUp(self):
+        self.conn = _RecordingConn(self.ROWS)
+        for target, value in (('_get_db', lambda: self.conn),
+                              ('_release_db', lambda conn: None),
+                              ('_load_empty_collections', lambda: ['empty']),
+                              ('CATALOG_STREAM_BATCH', 2),
+                              ('_b2_sign_urls', lambda keys, *a: [f'signed:{k}' for k in keys])):
+            patcher = patch.object(_app, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def _get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_iter_image_batches_uses_named_cursor_in_batches(self):
+        batches = list(image_queries.iter_image_batches(self.conn, after=('a', '0.jpg'), batch_size=3))
+        self.assertEqual([len(b) for b in batches], [3, 1])
+        sql, params = self.conn.executed[0]
+        self.assertIn('(collection_name, filename) > (%s, %s)', sql)
+        self.assertEqual(params, ('a', '0.jpg'))
+
+    def test_streamed_bodies_match_buffered_shapes(self):
+        images = self._get('/api/images?stream=1')
+        self.assertTrue(images.is_streamed)
+        self.assertEqual(json.loads(images.get_data())['images'][-1], 'signed:b/0.jpg')
+        collections = json.loads(self._get('/api/collections?stream=1').get_data())['collections']
+        self.assertEqual(collections, {'a': ['signed:a/0.jpg', 'signed:a/1.jpg', 'signed:a/2.jpg'],
+                                       'b': ['signed:b/0.jpg'], 'empty': []})
+        tags = json.loads(self._get('/api/tags?stream=1').get_data())['tags']
+        self.assertEqual(tags['a/1.jpg']['url'], 'signed:a/1.jpg')
+        self.assertEqual(len(tags), 4)
+
+    def test_paged_mode_returns_keyset_cursor(self):
+        self.conn.rows = self.ROWS[:2]
+        data = self._get('/api/images?limit=2&cursor=a/0.jpg').get_json()
+        self.assertEqual(data['next_cursor'], 'a/1.jpg')
+        self.assertEqual(self.conn.executed[-1][1], ('a', '0.jpg', 2))
+
+    def test_bad_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/api/tags?limit=5&cursor=nofilename').status_code, 400)
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 14. LeaderboardCache  (top-N boards maintained by submit_score)
+# ─────────────────────────────────────────────────────────────────────────────
+from leaderboard import LeaderboardCache   # noqa: E402
+
+
+class TestLeaderboardCache(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [('c', 'memory', 900, 30000, {'username': 'a', 'score': 900}),
+                     ('c', 'memory', 800, None,  {'username': 'b', 'score': 800}),
+                     ('c', 'hunt',   50,  5000,  {'username': 'c', 'score': 50})]
+        self.loads = 0
+        self.now = [0.0]
+
+        def load_all(depth):
+            self.loads += 1
+            return list(self.rows)
+
+        self.board = LeaderboardCache(load_all, depth=3, ttl=60, clock=lambda: self.now[0])
+
+    def test_reads_are_served_from_one_load(self):
+        self.assertEqual([e['username'] for e in self.board.top('c', 'memory')], ['a', 'b'])
+        self.assertEqual(list(self.board.collection('c', 1)), ['hunt', 'memory'])
+        self.assertEqual(self.board.all(1)['c']['memory'][0]['username'], 'a')
+        self.assertEqual(self.loads, 1)
+
+    def test_record_ranks_by_score_then_time_and_trims_to_depth(self):
+        self.board.top('c', 'memory')
+        self.board.record('c', 'memory', 800, 10000, {'username': 'fast'})
+        board = self.board.record('c', 'memory', 900, 30000, {'username': 'tie'})
+        self.assertEqual([e['username'] for e in board], ['a', 'tie', 'fast'])
+        self.assertEqual(self.loads, 1)
+
+    def test_record_after_expiry_reloads_instead_of_double_counting(self):
+        self.board.top('c', 'memory')
+        self.now[0] = 61
+        self.rows.append(('c', 'memory', 1000, 1000, {'username': 'new'}))
+        board = self.board.record('c', 'memory', 1000, 1000, {'username': 'new'})
+        self.assertEqual([e['username'] for e in board].count('new'), 1)
+        self.assertEqual(self.loads, 2)
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 15. CollectionSummary  (home / manage pages from one cached aggregate)
+# ─────────────────────────────────────────────────────────────────────────────
+from collection_summary import CollectionSummary, summary_rows   # noqa: E402
+
+
+class TestCollectionSummary(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [('a', 2, 0), ('b', 0, 1)]
+        self.summary = CollectionSummary(lambda: list(self.rows))
+
+    def test_counts_cached_until_invalidated(self):
+        self.assertEqual(self.summary.counts()['b'], {'images': 0, 'videos': 1})
+        self.rows.append(('c', 1, 0))
+        self.assertNotIn('c', self.summary.counts())
+        self.summary.invalidate()
+        self.assertIn('c', self.summary.counts())
+        self.assertEqual(self.summary.loads, 2)
+
+    def test_summary_rows_is_a_single_grouped_query(self):
+        conn = _RecordingConn([('a', 2, 0)])
+        self.assertEqual(list(summary_rows(conn)), [('a', 2, 0)])
+        self.assertEqual(len(conn.executed), 1)
+        self.assertIn('GROUP BY collection_name', conn.executed[0][0])
+
+    def test_summaries_merge_leaderboards_and_writes_invalidate(self):
+        boards = LeaderboardCache(lambda depth: [('a', 'memory', 10, None, {'score': 10})])
+        conn = _RecordingConn()
+        conn.commit = lambda: None
+        for target, value in (('_collection_summary', self.summary), ('_leaderboards', boards),
+                              ('_get_db', lambda: conn), ('_release_db', lambda c: None)):
+            patcher = patch.object(_app, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        summaries = {c['name']: c for c in _app._collection_summaries()}
+        self.assertEqual(summaries['a']['top_scores'], {'memory': [{'score': 10}]})
+        self.assertEqual(summaries['b']['top_scores'], {})
+        _app._db_delete_image('a', '1.jpg')
+        _app._collection_summaries()
+        self.assertEqual(self.summary.loads, 2)
+
+    def test_video_counts_are_only_shown_to_users_who_can_view_the_videos(self):
+        boards = LeaderboardCache(lambda depth: [])
+        anonymous = types.SimpleNamespace(is_authenticated=False, is_admin=False, id=None)
+        for target, value in (('_collection_summary', self.summary), ('_leaderboards', boards),
+                              ('current_user', anonymous)):
+            patcher = patch.object(_app, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        client = _app.app.test_client()
+        self.assertEqual(client.get('/api/collections/summary').status_code, 302)   # no session
+        with client.session_transaction() as sess:
+            sess['is_guest'] = True
+        guest = {c['name']: c for c in client.get('/api/collections/summary').get_json()['collections']}
+        self.assertNotIn('videos', guest['b'])
+        self.assertEqual(guest['a']['images'], 2)
+        admin = types.SimpleNamespace(is_authenticated=True, is_admin=True, id=1)
+        with patch.object(_app, 'current_user', admin):
+            shown = {c['name']: c for c in client.get('/api/collections/summary').get_json()['collections']}
+        self.assertEqual(shown['b']['videos'], 1)
+        user = types.SimpleNamespace(is_authenticated=True, is_admin=False, id=2)
+        grants = MagicMock(side_effect=[{'b'}, {'other'}])
+        with patch.object(_app, 'current_user', user), patch.object(_app, '_user_video_collections', grants):
+            granted = {c['name']: c for c in _app._visible_summaries(_app._collection_summaries())}
+            refused = {c['name']: c for c in _app._visible_summaries(_app._collection_summaries())}
+        self.assertEqual((granted['b']['videos'], 'videos' in refused['b']), (1, False))
+        grants.assert_called_with(2)
+        self.assertEqual(grants.call_count, 2)   # one query per page, not per collection
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 16. CollectionRename  (parallel copies, one-transaction commit, resume)
+# ─────────────────────────────────────────────────────────────────────────────
+import collection_rename   # noqa: E402
+from collection_rename import CollectionRename, RenameError   # noqa: E402
+
+
+class _RenameDb:
+    """Just enough of the images / collection_renames SQL for CollectionRename."""
+    def __init__(self, images, grants=()):
+        self.images = set(images)       # {(collection, filename)}
+        self.grants = set(grants)       # video_collection_access {(collection, user_id)}
+        self.renames = {}               # old -> [new, phase, total, copied]
+        self.commits = 0
+
+    def cursor(self):
+        db = self
+        class _Cur:
+            description = None
+            def execute(self, sql, params=()):
+                sql = ' '.join(sql.split())
+                self.description, self._rows = None, []
+                if sql.startswith('INSERT INTO collection_renames'):
+                    row = db.renames.setdefault(params[0], [params[1], 'copying', 0, 0])
+                    self.description, self._rows = True, [tuple(row)]
+                elif sql.startswith('SELECT filename FROM images') and 'ANY' in sql:
+                    self.description = True
+                    self._rows = sorted((f,) for c, f in db.images if c == params[0] and f not in params[1])
+                elif sql.startswith('SELECT filename FROM images'):
+                    self.description = True
+                    self._rows = sorted((f,) for c, f in db.images if c == params[0])
+                elif sql.startswith('UPDATE images'):
+                    new, _new, old, filenames = params
+                    db.images = {(new if c == old and f in filenames else c, f) for c, f in db.images}
+                elif sql.startswith('DELETE FROM images'):
+                    db.images -= {(params[0], f) for f in params[1]}
+                elif sql.startswith('UPDATE video_collection_access'):
+                    new, old = params
+                    db.grants = {(new if c == old else c, u) for c, u in db.grants}
+                elif sql.startswith('DELETE FROM collections'):
+                    # ON DELETE CASCADE
+                    db.grants = {(c, u) for c, u in db.grants if c != params[0]}
+                elif "SET phase = 'cleanup'" in sql:
+                    db.renames[params[0]][1] = 'cleanup'
+                elif sql.startswith('DELETE FROM collection_renames'):
+                    db.renames.pop(params[0], None)
+            def fetchall(self):
+                return self._rows
+        return _Cur()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class _RenameS3:
+    def __init__(self, keys, failing=()):
+        self.objects = set(keys)
+        self.failing = set(failing)
+        self.copies, self.delete_batches = [], []
+
+    def copy_object(self, Bucket, Key, CopySource):
+        if CopySource['Key'] in self.failing:
+            raise RuntimeError('503 Slow Down')
+        if CopySource['Key'] not in self.objects:
+            raise type('ClientError', (Exception,), {'response': {'Error': {'Code': 'NoSuchKey'}}})()
+        self.copies.append(Key)
+        self.objects.add(Key)
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [o['Key'] for o in Delete['Objects']]
+        self.delete_batches.append(len(keys))
+        self.objects.difference_update(keys)
+
+    def get_paginator(self, name):
+        s3 = self
+        class _Pager:
+            def paginate(self, Bucket, Prefix):
+                return [{'Contents': [{'Key': k} for k in sorted(s3.objects) if k.startswith(Prefix)]}]
+        return _Pager()
+
+
+class TestCollectionRename(unittest.TestCase):
+    FILES = ['1.jpg', '2.jpg', '3.jpg']
+
+    def setUp(self):
+        self.db = _RenameDb(('old', f) for f in self.FILES)
+        self.s3 = _RenameS3(f'old/{f}' for f in self.FILES)
+        patcher = patch.object(collection_rename, 'DELETE_BATCH', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _rename(self, **kw):
+        return CollectionRename(self.s3, 'bucket', lambda: self.db, lambda conn: None,
+                                'old', 'new', workers=4, **kw)
+
+    def test_moves_objects_and_rows_then_deletes_in_batches(self):
+        phases = []
+        progress = self._rename(on_progress=lambda p: phases.append(p['phase'])).run()
+        self.assertEqual(self.s3.objects, {f'new/{f}' for f in self.FILES})
+        self.assertEqual(sorted(self.s3.delete_batches), [1, 2])
+        self.assertEqual(self.db.images, {('new', f) for f in self.FILES})
+        self.assertEqual((progress['copied'], progress['deleted']), (3, 3))
+        self.assertEqual(self.db.renames, {})
+        self.assertEqual(phases[-1], 'done')
+
+    def test_rows_of_missing_source_objects_are_dropped_not_repointed(self):
+        self.s3.objects.discard('old/2.jpg')
+        progress = self._rename().run()
+        self.assertEqual((progress['copied'], progress['missing']), (2, 1))
+        self.assertEqual(self.db.images, {('new', '1.jpg'), ('new', '3.jpg')})
+        self.assertNotIn('new/2.jpg', self.s3.objects)
+
+    def test_uploads_during_the_copy_are_copied_before_commit(self):
+        copy = self.s3.copy_object
+
+        def copy_then_upload(Bucket, Key, CopySource):
+            if ('old', 'late.jpg') not in self.db.images and Key == 'new/1.jpg':
+                self.db.images.add(('old', 'late.jpg'))
+                self.s3.objects.add('old/late.jpg')
+            copy(Bucket, Key, CopySource)
+        self.s3.copy_object = copy_then_upload
+        progress = self._rename().run()
+        self.assertEqual(self.db.images, {('new', f) for f in self.FILES + ['late.jpg']})
+        self.assertEqual(self.s3.objects, {f'new/{f}' for f in self.FILES + ['late.jpg']})
+        self.assertEqual((progress['total'], progress['copied']), (4, 4))
+
+    def test_video_access_grants_survive_the_rename(self):
+        self.db.grants = {('old', 7), ('other', 8)}
+        self._rename().run()
+        self.assertEqual(self.db.grants, {('new', 7), ('other', 8)})
+
+    def test_failed_copy_leaves_rows_untouched_and_resumes(self):
+        self.s3.failing = {'old/2.jpg'}
+        with self.assertRaises(RenameError):
+            self._rename().run()
+        self.assertEqual(self.db.images, {('old', f) for f in self.FILES})
+        self.assertEqual(self.db.renames['old'][1], 'copying')
+
+        self.s3.failing, self.s3.copies = set(), []
+        self._rename().run()
+        self.assertEqual(self.s3.copies, ['new/2.jpg'])
+        self.assertEqual(self.db.images, {('new', f) for f in self.FILES})
+
+    def test_old_thumbnails_are_deleted_with_the_old_keys(self):
+        self.s3.objects |= {'thumbs/old/1-320.webp', 'thumbs/older/1-320.webp'}
+        self._rename().run()
+        self.assertNotIn('thumbs/old/1-320.webp', self.s3.objects)
+        self.assertIn('thumbs/older/1-320.webp', self.s3.objects)
+
+    def test_rename_to_a_different_target_while_pending_is_refused(self):
+        self.db.renames['old'] = ['other', 'copying', 0, 0]
+        with self.assertRaises(RenameError):
+            self._rename().run()
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 17. JobQueue  (persistent background jobs for long admin operations)
+# ─────────────────────────────────────────────────────────────────────────────
+from jobs import JobQueue   # noqa: E402
+
+
+class _JobsDb:
+    """Just enough of the jobs-table SQL for JobQueue. Leases are modelled only
+    as an `expired` flag a test can set on a running job."""
+    def __init__(self):
+        self.jobs = {}
+
+    @staticmethod
+    def live(j):
+        return j['status'] == 'queued' or (j['status'] == 'running' and
+                                            (not j['expired'] or j['attempts'] < j['max_attempts']))
+
+    def current(self, job_id, attempt):
+        j = self.jobs[job_id]
+        return j['status'] == 'running' and j['attempts'] == attempt
+
+    def _row(self, j):
+        return (j['id'], j['kind'], j['payload'], j['status'], j['progress'], j['result'],
+                j['error'], j['attempts'], j['max_attempts'], j['created_by'],
+                None, None, None, None)
+
+    def cursor(self):
+        db = self
+        class _Cur:
+            def execute(self, sql, params=()):
+                sql = ' '.join(sql.split())
+                self._rows = []
+                if sql.startswith('INSERT INTO jobs'):
+                    kind, payload, user_id, max_attempts = params
+                    job_id = len(db.jobs) + 1
+                    db.jobs[job_id] = dict(id=job_id, kind=kind, payload=json.loads(payload),
+                                           status='queued', progress={}, result=None, error=None,
+                                           attempts=0, max_attempts=max_attempts, created_by=user_id,
+                                           expired=False)
+                    self._rows = [(job_id,)]
+                elif sql.startswith("UPDATE jobs SET status = 'running'"):
+                    for j in sorted(db.jobs.values(), key=lambda j: j['id']):
+                        if j['attempts'] < j['max_attempts'] and (
+                                j['status'] == 'queued' or (j['status'] == 'running' and j['expired'])):
+                            j.update(status='running', attempts=j['attempts'] + 1, expired=False)
+                            self._rows = [(j['id'], j['kind'], j['payload'], j['attempts'], j['max_attempts'])]
+                            break
+                elif sql.startswith("UPDATE jobs SET status = 'failed'"):
+                    for j in db.jobs.values():
+                        if j['status'] == 'running' and j['expired'] and j['attempts'] >= j['max_attempts']:
+                            j.update(status='failed', error='Worker lost during the final attempt')
+                            self._rows.append((j['id'], j['kind'], j['payload'], j['attempts']))
+                elif sql.startswith('UPDATE jobs SET progress'):
+                    if db.current(*params[2:]):
+                        db.jobs[params[2]]['progress'].update(json.loads(params[0]))
+                        self._rows = [(params[2],)]
+                elif sql.startswith('UPDATE jobs SET status = %s'):
+                    status, result, error, job_id, attempt = params
+                    if db.current(job_id, attempt):
+                        db.jobs[job_id].update(status=status, error=error,
+                                               result=json.loads(result) if result else None)
+                        self._rows = [(job_id,)]
+                elif sql.startswith('UPDATE jobs SET status = CASE'):
+                    if db.current(*params[1:]):
+                        j = db.jobs[params[1]]
+                        j.update(error=params[0],
+                                 status='queued' if j['attempts'] < j['max_attempts'] else 'failed')
+                        self._rows = [(j['id'],)]
+                elif sql.startswith('UPDATE jobs SET payload = jsonb_set'):
+                    field, _f, items, kind, match, _f2, n, max_items = params
+                    match = json.loads(match)
+                    for j in sorted(db.jobs.values(), key=lambda j: j['id']):
+                        if (j['kind'] == kind and j['status'] == 'queued' and j['attempts'] == 0
+                                and match.items() <= j['payload'].items()
+                                and len(j['payload'][field[0]]) + n <= max_items):
+                            j['payload'][field[0]] = j['payload'][field[0]] + json.loads(items)
+                            self._rows = [(j['id'],)]
+                            break
+                elif sql.startswith('SELECT COALESCE(SUM'):
+                    field, kind, match = params[0], params[1], json.loads(params[2])
+                    self._rows = [(sum(len(j['payload'].get(field, [])) for j in db.jobs.values()
+                                       if j['kind'] == kind and db.live(j)
+                                       and match.items() <= j['payload'].items()),)]
+                elif sql.startswith('SELECT id FROM jobs'):
+                    kind, match = params[0], json.loads(params[1])
+                    self._rows = [(j['id'],) for j in db.jobs.values()
+                                  if j['kind'] == kind and db.live(j)
+                                  and match.items() <= j['payload'].items()][:1]
+                elif sql.startswith('SELECT') and 'WHERE id = %s' in sql:
+                    j = db.jobs.get(params[0])
+                    self._rows = [db._row(j)] if j else []
+            def fetchall(self):
+                return self._rows
+        return _Cur()
+
+    def commit(self):
+        pass
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.db = _JobsDb()
+        self.updates = []
+        self.queue = JobQueue(lambda: self.db, lambda conn: None,
+                              on_update=lambda job: self.updates.append((job['id'], job['status'])))
+
+    def test_runs_job_recording_progress_and_result(self):
+        def handler(job):
+            job.progress(done=1, total=2)
+            return {'echo': job.payload['x']}
+        self.queue.register('echo', handler)
+        job_id = self.queue.enqueue('echo', {'x': 5}, user_id=7)
+        self.assertEqual(self.queue.get(job_id)['status'], 'queued')
+
+        self.assertTrue(self.queue.run_once())
+        self.assertFalse(self.queue.run_once())
+        job = self.queue.get(job_id)
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['progress'], {'done': 1, 'total': 2})
+        self.assertEqual(job['result'], {'echo': 5})
+        self.assertEqual(self.updates, [(job_id, 'running'), (job_id, 'running'), (job_id, 'succeeded')])
+
+    def test_enqueue_coalesced_fills_a_queued_job_until_started_or_full(self):
+        self.queue.register('tag', lambda job: None)
+        add = lambda name, c='a': self.queue.enqueue_coalesced('tag', 'files', [name], max_items=2, coll=c)   # noqa: E731
+        first = add('1')
+        self.assertEqual(add('2'), first)
+        third = add('3')                      # first is full
+        self.assertNotEqual(third, first)
+        self.assertNotEqual(add('x', c='b'), third)
+        self.assertEqual(self.queue.backlog('tag', 'files', coll='a'), 3)
+        self.queue.run_once()                 # first job starts
+        self.assertEqual(self.queue.get(first)['payload'], {'coll': 'a', 'files': ['1', '2']})
+        self.assertEqual(add('4'), third)
+        self.assertEqual(self.queue.backlog('tag', 'files'), 3)
+
+    def test_failed_attempts_are_retried_then_marked_failed(self):
+        calls = []
+        def handler(job):
+            calls.append(job.attempt)
+            raise RuntimeError('B2 unavailable')
+        self.queue.register('flaky', handler)
+        job_id = self.queue.enqueue('flaky', max_attempts=2)
+        while self.queue.run_once():
+            pass
+        job = self.queue.get(job_id)
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual((job['status'], job['error']), ('failed', 'B2 unavailable'))
+
+    def test_expired_lease_on_last_attempt_is_failed_and_not_found_active(self):
+        failed = []
+        self.queue.register('rename_collection', lambda job: None, on_failed=lambda job: failed.append(job.id))
+        job_id = self.queue.enqueue('rename_collection', {'old_name': 'a'}, max_attempts=1)
+        job = self.db.jobs[job_id]
+        job.update(status='running', attempts=1, expired=True)     # worker died mid-attempt
+        self.assertIsNone(self.queue.find_active('rename_collection', old_name='a'))
+        self.assertFalse(self.queue.run_once())
+        self.assertEqual((job['status'], failed), ('failed', [job_id]))
+
+    def test_on_failed_runs_after_the_last_failed_attempt(self):
+        failed = []
+        def handler(job):
+            raise RuntimeError('boom')
+        self.queue.register('flaky', handler, on_failed=lambda job: failed.append(job.attempt))
+        self.queue.enqueue('flaky', max_attempts=2)
+        self.queue.run_once()
+        self.assertEqual(failed, [])
+        self.queue.run_once()
+        self.assertEqual(failed, [2])
+
+    def test_worker_that_lost_its_lease_cannot_overwrite_the_new_attempt(self):
+        seen = []
+        def handler(job):
+            seen.append(job.attempt)
+            if job.attempt == 1:   # stalls past its lease; another worker claims attempt 2
+                self.db.jobs[job.id]['expired'] = True
+                self.queue._claim()
+                if job.payload.get('report'):
+                    job.progress(done=1)
+            return {'attempt': job.attempt}
+        self.queue.register('slow', handler)
+        quiet = self.queue.enqueue('slow')
+        self.queue.run_once()
+        self.assertEqual((self.db.jobs[quiet]['status'], self.db.jobs[quiet]['result']), ('running', None))
+        reporting = self.queue.enqueue('slow', {'report': True})
+        self.queue.run_once()
+        job = self.db.jobs[reporting]
+        self.assertEqual((job['status'], job['progress'], job['error']), ('running', {}, None))
+        self.assertEqual(seen, [1, 1])
+
+    def test_unknown_kind_is_rejected_and_active_jobs_are_found(self):
+        with self.assertRaises(ValueError):
+            self.queue.enqueue('nope')
+        self.queue.register('delete_collection', lambda job: None)
+        job_id = self.queue.enqueue('delete_collection', {'name': 'a'})
+        self.assertEqual(self.queue.find_active('delete_collection', name='a'), job_id)
+        self.assertIsNone(self.queue.find_active('delete_collection', name='b'))
+
+
+class TestJobEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.db = _JobsDb()
+        self.queue = JobQueue(lambda: self.db, lambda conn: None)
+        self.queue._handlers = dict(_app._jobs._handlers)
+        self.queue._on_failed = dict(_app._jobs._on_failed)
+        for name, value in (('_jobs', self.queue), ('_collection_exists', lambda name: name == 'old'),
+                            ('_pending_renames', lambda old=None: []),
+                            ('current_user', types.SimpleNamespace(is_authenticated=True, is_admin=True, id=1))):
+            patcher = patch.object(_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def test_video_spool_is_removed_when_the_upload_job_gives_up(self):
+        fd, path = tempfile.mkstemp(dir='/tmp')
+        os.close(fd)
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        job_id = self.queue.enqueue('upload_video', {'collection': 'old', 'filename': 'v.mp4', 'path': path},
+                                    max_attempts=1)
+        with patch.object(_app, '_b2_upload_fileobj', side_effect=RuntimeError('B2 down')):
+            self.queue.run_once()
+        self.assertEqual(self.queue.get(job_id)['status'], 'failed')
+        self.assertFalse(os.path.exists(path))
+
+    def test_rename_returns_job_id_and_reposting_reuses_it(self):
+        body = {'old_name': 'old', 'new_name': 'new'}
+        resp = self.client.post('/api/collections/rename', json=body)
+        self.assertEqual(resp.status_code, 202)
+        job_id = resp.get_json()['job_id']
+        self.assertEqual(self.client.post('/api/collections/rename', json=body).get_json()['job_id'], job_id)
+        resp = self.client.post('/api/collections/rename', json={'old_name': 'old', 'new_name': 'other'})
+        self.assertEqual(resp.status_code, 409)
+
+        job = self.client.get(f'/api/jobs/{job_id}').get_json()['job']
+        self.assertEqual((job['kind'], job['status']), ('rename_collection', 'queued'))
+        self.assertEqual(self.client.get('/api/jobs/999').status_code, 404)
+
+    def test_get_db_waits_for_a_returned_connection(self):
+        import threading
+        pool = MagicMock()
+        with patch.object(_app, '_db_pool', pool), patch.object(_app, '_db_slots', threading.BoundedSemaphore(1)), \
+                patch.object(_app, 'DB_POOL_TIMEOUT', 0.05):
+            conn = _app._get_db()
+            with self.assertRaises(_pg.pool.PoolError):
+                _app._get_db()
+            threading.Timer(0.01, _app._release_db, (conn,)).start()
+            with patch.object(_app, 'DB_POOL_TIMEOUT', 5):
+                _app._get_db()
+        self.assertEqual(pool.getconn.call_count, 2)
+
+    def test_rename_job_queues_thumbnails_for_the_new_name(self):
+        self.queue.enqueue('rename_collection', {'old_name': 'old', 'new_name': 'new'})
+        rename = MagicMock()
+        rename.return_value.run.return_value = {'phase': 'done'}
+        with patch.object(_app, 'CollectionRename', rename), patch.object(_app, '_embeddings'):
+            self.assertTrue(self.queue.run_once())
+        job_id = self.queue.find_active('build_thumbnails', collection='new', scope='all')
+        self.assertIsNotNone(job_id)
+        self.assertEqual(self.queue.get(job_id)['payload'], {'collection': 'new', 'scope': 'all', 'force': False})
+
+    def test_delete_job_removes_objects_before_the_row(self):
+        job_id = self.client.post('/api/collections/delete', json={'name': 'old'}).get_json()['job_id']
+        calls, conn = [], MagicMock()
+        conn.cursor.return_value.execute.side_effect = lambda sql, params=None: calls.append(sql)
+        with patch.object(_app, '_b2_delete_prefix', side_effect=lambda prefix, on_progress: calls.append(prefix) or 3), \
+             patch.object(_app, '_get_db', return_value=conn), \
+             patch.object(_app, '_release_db'):
+            self.assertTrue(self.queue.run_once())
+        self.assertEqual(calls[:3], ['old/', 'thumbs/old/', 'DELETE FROM collections WHERE name = %s'])
+        job = self.queue.get(job_id)
+        self.assertEqual((job['status'], job['result']), ('succeeded', {'name': 'old', 'deleted': 6}))
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 18. Tagger inference  (batched analyze_images, cached CLIP text embeddings)
+# ─────────────────────────────────────────────────────────────────────────────
+import tempfile   # noqa: E402
+import numpy as np   # noqa: E402
+from PIL import Image   # noqa: E402
+import image_tagger   # noqa: E402
+
+
+class _FakeWd14Session:
+    """Scores label i as the image's mean red value (0-255) minus i, per batch row."""
+    def __init__(self, batch_dim='N'):
+        self.batch_dim = batch_dim
+        self.batches = []
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(name='input', shape=[self.batch_dim, 448, 448, 3])]
+
+    def run(self, outputs, feeds):
+        x = feeds['input']
+        self.batches.append(x.shape[0])
+        red = (x[..., 0].mean(axis=(1, 2)) + 1) * 127.5
+        return [red[:, None] - np.arange(4)[None, :] * 100.0]
+
+
+class TestAnalyzeImages(unittest.TestCase):
+    LABELS = ['high', 'solo', 'mid', 'low']
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.paths = []
+        for i, red in enumerate((255, 0, 150, 255, 0)):
+            path = os.path.join(tmp.name, f'{i}.png')
+            Image.new('RGB', (8, 8), (red, 0, 0)).save(path)
+            self.paths.append(path)
+        self.session = _FakeWd14Session()
+        for name, value in (('_config', {'backend': 'wd14', 'model_path': __file__,
+                                         'labels_path': __file__, 'backend_overrides': {}}),
+                            ('_load_wd14', lambda m, l: (self.session, self.LABELS))):
+            patcher = patch.object(image_tagger, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_batches_preserve_order_and_match_single_image_path(self):
+        batched = image_tagger.analyze_images(self.paths, top_k=3, threshold=0.6, batch_size=2)
+        self.assertEqual(self.session.batches, [2, 2, 1])
+        self.assertEqual(batched, [image_tagger.analyze_image(p, top_k=3, threshold=0.6)
+                                   for p in self.paths])
+        # 'solo' is in FILTERED_TAGS; a black image scores nothing
+        self.assertEqual([r['tag'] for r in batched[0]], ['high', 'mid'])
+        self.assertEqual(batched[1], [])
+
+    def test_unreadable_image_gets_empty_result(self):
+        with open(self.paths[2], 'wb') as f:
+            f.write(b'not an image')
+        results = image_tagger.analyze_images(self.paths, top_k=3, threshold=0.6, batch_size=8)
+        self.assertEqual(self.session.batches, [4])
+        self.assertEqual(results[2], [])
+        self.assertEqual(len(results[3]), 2)
+
+    def test_fixed_batch_dimension_runs_one_image_at_a_time(self):
+        self.session.batch_dim = 1
+        image_tagger.analyze_images(self.paths[:3], batch_size=8)
+        self.assertEqual(self.session.batches, [1, 1, 1])
+
+
+
+class TestBackendVariants(unittest.TestCase):
+    def test_split_backend(self):
+        split = image_tagger._split_backend
+        self.assertEqual(split('clip'), ('clip', ''))
+        self.assertEqual(split('CLIP-onnx-int8'), ('clip', 'onnx-int8'))
+        self.assertEqual(split('blip-int8'), ('blip', 'int8'))
+        self.assertEqual(split('blip-onnx'), ('blip', ''))     # no ONNX BLIP
+        self.assertEqual(split('nonsense'), ('clip', ''))
+        self.assertEqual(split(None), ('clip', ''))
+
+    def test_analyze_images_routes_variant_to_backend(self):
+        calls = []
+
+        def run(images, top_k, threshold, variant=''):
+            calls.append((len(images), variant))
+            return [[{'tag': variant or 'fp32', 'confidence': 1.0}] for _ in images]
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        paths = []
+        for i in range(3):
+            paths.append(os.path.join(tmp.name, f'{i}.png'))
+            Image.new('RGB', (4, 4)).save(paths[-1])
+        with patch.object(image_tagger, '_BATCH_BACKENDS', {'clip': (lambda p: p, run), 'blip': (lambda p: p, run)}), \
+                patch.object(image_tagger, '_config', {'backend': 'blip-int8', 'backend_overrides': {}}):
+            configured = image_tagger.analyze_images(paths, batch_size=8)
+            overridden = image_tagger.analyze_images(paths, batch_size=8, backend='clip-onnx-int8')
+        self.assertEqual(calls, [(3, 'int8'), (3, 'onnx-int8')])
+        self.assertEqual(configured[0][0]['tag'], 'int8')
+        self.assertEqual(overridden[2][0]['tag'], 'onnx-int8')
+
+    def test_int8_variants_never_load_the_fp32_models(self):
+        class _Model:
+            def eval(self):
+                return self
+
+            def get_image_features(self, pixel_values):
+                return types.SimpleNamespace(numpy=lambda: np.ones((len(pixel_values), 2), dtype=np.float32))
+
+            def generate(self, **kwargs):
+                return [[1]] * kwargs['num_return_sequences']
+
+        fake = types.ModuleType('transformers')
+        fake.CLIPModel = fake.BlipForConditionalGeneration = types.SimpleNamespace(
+            from_pretrained=lambda name: _Model())
+        clip_processor = lambda images, return_tensors: {'pixel_values': images}   # noqa: E731
+        blip_processor = MagicMock(return_value={}, decode=lambda seq, skip_special_tokens: 'a cat on a mat')
+        forbidden = MagicMock(side_effect=AssertionError('fp32 model loaded'))
+        with patch.dict(sys.modules, {'transformers': fake}), \
+                patch.object(image_tagger, '_variant_models', {}), \
+                patch.object(image_tagger, '_torch', MagicMock()), \
+                patch.object(image_tagger, '_quantize_int8', lambda model: model), \
+                patch.object(image_tagger, '_load_clip_model', forbidden), \
+                patch.object(image_tagger, '_load_blip_models', forbidden), \
+                patch.object(image_tagger, '_clip_processor', clip_processor), \
+                patch.object(image_tagger, '_blip_processor', blip_processor):
+            features = image_tagger._clip_image_features([Image.new('RGB', (4, 4))] * 2, 'int8')
+            captions = image_tagger._blip_captions([Image.new('RGB', (4, 4))], 'int8')
+        self.assertEqual(features.shape, (2, 2))
+        self.assertEqual(captions, [['a cat on a mat']])
+
+    def test_tag_agreement(self):
+        def tags(*names):
+            return [{'tag': n, 'confidence': 0.5} for n in names]
+        reference = [tags('cat', 'dog'), tags('car'), []]
+        self.assertEqual(image_tagger.tag_agreement(reference, reference), {'jaccard': 1.0, 'top1': 1.0})
+        got = image_tagger.tag_agreement(reference, [tags('cat'), tags('bus'), []])
+        self.assertEqual(got, {'jaccard': round((0.5 + 0 + 1) / 3, 3), 'top1': round(2 / 3, 3)})
+
+
+class TestWd14Vectorized(unittest.TestCase):
+    def test_rank_matches_python_loop_and_skips_filtered_tags(self):
+        rng = np.random.default_rng(1)
+        labels = [f't{i}' for i in range(500)] + ['solo', 'no_humans']
+        probs = rng.random(len(labels)).astype(np.float32)
+        probs[-2:] = 0.99
+        keep = image_tagger._wd14_keep_mask(labels)
+        expected = sorted(
+            ({'tag': labels[i], 'confidence': round(float(p), 3)}
+             for i, p in enumerate(probs) if p >= 0.35 and labels[i] not in image_tagger.FILTERED_TAGS),
+            key=lambda r: r['confidence'], reverse=True)[:20]
+        got = image_tagger._rank_wd14(probs, labels, keep, 20, 0.35)
+        self.assertEqual([r['confidence'] for r in got], [r['confidence'] for r in expected])
+        self.assertNotIn('solo', [r['tag'] for r in got])
+
+    def test_preprocess_matches_legacy_scaling_and_reuses_buffer(self):
+        image = Image.new('RGB', (10, 6), (255, 0, 128))
+        arr = image_tagger._preprocess_wd14(image)
+        self.assertEqual(arr.shape, (1, 448, 448, 3))
+        np.testing.assert_allclose(arr[0, 0, 0], [1.0, -1.0, 128 / 255 * 2 - 1], atol=1e-6)
+        first = image_tagger._wd14_input_buffer(4)
+        self.assertIs(image_tagger._wd14_input_buffer(2), first)
+
+
+class _FakeOrt:
+    """onnxruntime stand-in recording the SessionOptions each session was built with."""
+    GraphOptimizationLevel = types.SimpleNamespace(ORT_DISABLE_ALL=0, ORT_ENABLE_BASIC=1,
+                                                   ORT_ENABLE_EXTENDED=2, ORT_ENABLE_ALL=99)
+    ExecutionMode = types.SimpleNamespace(ORT_SEQUENTIAL='seq', ORT_PARALLEL='par')
+
+    class SessionOptions:
+        optimized_model_filepath = ''
+
+    def __init__(self):
+        self.sessions = []
+
+    def InferenceSession(self, path, sess_options, providers):
+        self.sessions.append((path, sess_options))
+        return path
+
+
+class TestWd14SessionOptions(unittest.TestCase):
+    def test_options_map_onto_session_options(self):
+        ort = _FakeOrt()
+        so = image_tagger._ort_session_options(ort, {
+            **image_tagger.ORT_OPTION_DEFAULTS, 'intra_op_threads': 2, 'graph_optimization': 'basic',
+            'execution_mode': 'parallel', 'cpu_mem_arena': False})
+        self.assertEqual((so.intra_op_num_threads, so.graph_optimization_level), (2, 1))
+        self.assertEqual((so.execution_mode, so.enable_cpu_mem_arena), ('par', False))
+        self.assertFalse(hasattr(so, 'inter_op_num_threads'))   # 0 leaves the onnxruntime default
+
+    def test_optimized_model_is_written_once_then_loaded_directly(self):
+        ort = _FakeOrt()
+        with tempfile.TemporaryDirectory() as tmp:
+            model = os.path.join(tmp, 'model.onnx')
+            optimized = os.path.join(tmp, 'cache', 'model.opt.onnx')
+            open(model, 'wb').close()
+            options = {**image_tagger.ORT_OPTION_DEFAULTS, 'optimized_model_path': optimized}
+            image_tagger._create_ort_session(ort, model, options)
+            path, so = ort.sessions[-1]
+            self.assertEqual((path, so.optimized_model_filepath), (model, optimized))
+
+            open(optimized, 'wb').close()
+            image_tagger._create_ort_session(ort, model, options)
+            path, so = ort.sessions[-1]
+            self.assertEqual((path, so.graph_optimization_level), (optimized, 0))
+
+    def test_io_binding_writes_into_preallocated_output(self):
+        class _Binding:
+            def bind_cpu_input(self, name, array):
+                self.input = array
+            def bind_output(self, name, device, device_id, dtype, shape, ptr):
+                self.shape, self.ptr = shape, ptr
+
+        class _Session:
+            def get_outputs(self):
+                return [types.SimpleNamespace(name='out', shape=['N', 3])]
+            def io_binding(self):
+                self.binding = _Binding()
+                return self.binding
+            def run_with_iobinding(self, binding):
+                self.ran = True
+
+        session = _Session()
+        out = image_tagger._wd14_run(session, 'in', np.zeros((2, 1), np.float32), {'io_binding': True})
+        self.assertTrue(session.ran)
+        self.assertEqual((session.binding.shape, session.binding.ptr), ([2, 3], out.ctypes.data))
+        again = image_tagger._wd14_run(session, 'in', np.zeros((1, 1), np.float32), {'io_binding': True})
+        self.assertEqual(again.ctypes.data, out.ctypes.data)   # reused, not reallocated
+
+
+class TestClipTextCache(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch.object(image_tagger, 'CLIP_TEXT_CACHE_DIR', tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.encoded = []
+
+    def _encode(self, prompts):
+        self.encoded.append(list(prompts))
+        return np.arange(len(prompts) * 2, dtype=np.float32).reshape(len(prompts), 2) + 1
+
+    def test_embeddings_are_normalized_and_reused_from_disk(self):
+        prompts = ['a photo of cat', 'a photo of dog']
+        first = image_tagger._cached_text_embeddings('org/model', prompts, self._encode)
+        np.testing.assert_allclose(np.linalg.norm(first, axis=1), [1, 1], rtol=1e-6)
+        second = image_tagger._cached_text_embeddings('org/model', prompts, self._encode)
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(len(self.encoded), 1)
+
+    def test_changed_tag_list_or_model_is_re_encoded(self):
+        image_tagger._cached_text_embeddings('org/model', ['a', 'b'], self._encode)
+        image_tagger._cached_text_embeddings('org/model', ['a', 'c'], self._encode)
+        image_tagger._cached_text_embeddings('org/other', ['a', 'b'], self._encode)
+        self.assertEqual(len(self.encoded), 3)
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 19. TagCache  (content-hash keyed tagger results)
+# ─────────────────────────────────────────────────────────────────────────────
+from tag_cache import TagCache, file_sha256   # noqa: E402
+
+
+class TestTagCache(unittest.TestCase):
+    TAGS = [{'tag': 'a', 'confidence': 0.9}, {'tag': 'b', 'confidence': 0.5}]
+
+    def setUp(self):
+        self.cache = TagCache(':memory:')
+        self.addCleanup(self.cache.close)
+
+    def test_round_trip_keyed_by_backend_version_and_threshold(self):
+        self.cache.put_many([('h1', self.TAGS)], 'clip', 'v1', 0.15, 8)
+        self.assertEqual(self.cache.get_many(['h1', 'h2'], 'clip', 'v1', 0.15, 8), {'h1': self.TAGS})
+        self.assertEqual(self.cache.get_many(['h1'], 'clip-int8', 'v1', 0.15, 8), {})
+        self.assertEqual(self.cache.get_many(['h1'], 'clip', 'v2', 0.15, 8), {})
+        self.assertEqual(self.cache.get_many(['h1'], 'clip', 'v1', 0.2, 8), {})
+
+    def test_larger_top_k_answers_smaller(self):
+        self.cache.put_many([('h1', self.TAGS)], 'clip', 'v1', 0.15, 8)
+        self.assertEqual(self.cache.get_many(['h1'], 'clip', 'v1', 0.15, 1), {'h1': self.TAGS[:1]})
+        self.assertEqual(self.cache.get_many(['h1'], 'clip', 'v1', 0.15, 10), {})
+
+    def test_analyze_images_skips_model_for_cached_content(self):
+        fixture = TestAnalyzeImages('test_batches_preserve_order_and_match_single_image_path')
+        fixture.setUp()
+        self.addCleanup(fixture.doCleanups)
+        first = image_tagger.analyze_images(fixture.paths, top_k=3, threshold=0.6, cache=self.cache)
+        self.assertEqual(sum(fixture.session.batches), 5)
+        again = image_tagger.analyze_images(fixture.paths, top_k=3, threshold=0.6, cache=self.cache)
+        self.assertEqual(again, first)
+        self.assertEqual(sum(fixture.session.batches), 5)
+        # Another threshold is another cache key
+        image_tagger.analyze_images(fixture.paths[:1], top_k=3, threshold=0.5, cache=self.cache)
+        self.assertEqual(sum(fixture.session.batches), 6)
+        self.assertEqual(file_sha256(fixture.paths[0]), file_sha256(fixture.paths[3]))
+
+    def test_model_version_tracks_backend_and_wd14_files(self):
+        self.assertNotEqual(image_tagger.model_version('clip'), image_tagger.model_version('clip-int8'))
+        with tempfile.TemporaryDirectory() as tmp:
+            labels = os.path.join(tmp, 'labels.csv')
+            with open(labels, 'w') as f:
+                f.write('a\n')
+            with patch.object(image_tagger, '_config', {'model_path': __file__, 'labels_path': labels}):
+                before = image_tagger.model_version('wd14')
+                with open(labels, 'a') as f:
+                    f.write('b\n')
+                self.assertNotEqual(image_tagger.model_version('wd14'), before)
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 20. Tagger service  (warm worker behind a Unix socket, hot model swap)
+# ─────────────────────────────────────────────────────────────────────────────
+import threading   # noqa: E402
+import tagger_service   # noqa: E402
+from tagger_service import TaggerClient, TaggerError, TaggerService   # noqa: E402
+
+
+class _FakeTaggerWorker:
+    """Tags every path with the worker's backend name."""
+    started = []
+
+    def __init__(self, config):
+        if config.get('backend') == 'broken':
+            raise TaggerError('cannot load broken')
+        self.config = config
+        self.requests = []
+        self.stopped = False
+        self.info = {'backend': config['backend']}
+        _FakeTaggerWorker.started.append(self)
+
+    def run(self, request):
+        self.requests.append(request)
+        if request.get('op') == 'embed':
+            return [np.full(4, len(x), dtype='<f2').tobytes() for x in request['inputs']]
+        return [[{'tag': self.config['backend'], 'confidence': 1.0}] for _ in request['inputs']]
+
+    def alive(self):
+        return not self.stopped
+
+    def stop(self):
+        self.stopped = True
+
+
+class TestTaggerService(unittest.TestCase):
+    def setUp(self):
+        _FakeTaggerWorker.started = []
+        self.service = TaggerService({'backend': 'clip'}, start_worker=_FakeTaggerWorker)
+
+    def test_queued_requests_with_same_settings_are_merged(self):
+        futures = []
+        for paths, top_k in ((['a'], 10), (['b', 'c'], 10), (['d'], 5), (['e'], 10)):
+            future = tagger_service.Future()
+            futures.append(future)
+            self.service._queue.put(({'inputs': paths, 'top_k': top_k, 'threshold': 0.15,
+                                      'backend': None, 'collection': None}, future))
+        group = self.service._next_group()
+        self.assertEqual([r['inputs'] for r, _f in group], [['a'], ['b', 'c'], ['e']])
+        self.assertEqual(self.service._queue.get_nowait()[0]['inputs'], ['d'])
+
+    def test_embed_requests_merge_only_with_embeds_of_the_same_kind(self):
+        for request in ({'op': 'embed', 'kind': 'images', 'inputs': [b'a']},
+                        {'inputs': ['p'], 'top_k': 10, 'threshold': 0.15, 'backend': None, 'collection': None},
+                        {'op': 'embed', 'kind': 'texts', 'inputs': ['cat']},
+                        {'op': 'embed', 'kind': 'images', 'inputs': [b'bb', b'c']}):
+            self.service._queue.put((request, tagger_service.Future()))
+        group = self.service._next_group()
+        self.assertEqual([r['inputs'] for r, _f in group], [[b'a'], [b'bb', b'c']])
+        self.assertEqual([self.service._queue.get_nowait()[0]['inputs'] for _ in range(2)], [['p'], ['cat']])
+
+    def test_swap_switches_only_to_a_warm_worker(self):
+        self.service.start()
+        old = self.service._worker
+        self.assertEqual(self.service.tag(['x'])[0][0]['tag'], 'clip')
+        with patch('image_tagger.set_tagger_config') as persist:
+            with self.assertRaises(TaggerError):
+                self.service.swap({'backend': 'broken'})
+            self.assertIs(self.service._worker, old)
+            status = self.service.swap({'backend': 'wd14'})
+        persist.assert_called_once_with({'backend': 'wd14'})
+        self.assertTrue(old.stopped)
+        self.assertEqual((status['generation'], status['config']['backend']), (2, 'wd14'))
+        self.assertEqual(self.service.tag(['x', 'y'])[1][0]['tag'], 'wd14')
+
+    def test_socket_round_trip(self):
+        self.service.start()
+        tmp = tempfile.mkdtemp(dir='/tmp')
+        self.addCleanup(lambda: __import__('shutil').rmtree(tmp, ignore_errors=True))
+        path = os.path.join(tmp, 's.sock')
+        server = tagger_service.serve(path, self.service)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = TaggerClient(path, timeout=5)
+        self.assertTrue(client.available())
+        self.assertEqual(client.tag(['p1', 'p2'], top_k=3), [[{'tag': 'clip', 'confidence': 1.0}]] * 2)
+        self.assertEqual(len(client.tag_images([b'\x89PNG', b'GIF89a'], collection='c')), 2)
+        self.assertEqual(self.service._worker.requests[-1]['inputs'], [b'\x89PNG', b'GIF89a'])
+        self.assertEqual(self.service._worker.requests[-1]['collection'], 'c')
+        self.assertEqual(client.status()['served'], 4)
+        model, vectors = client.embed_images([b'abc'])
+        self.assertEqual(model, image_tagger.CLIP_MODEL_NAME)
+        self.assertEqual(np.frombuffer(vectors[0], dtype='<f2').tolist(), [3.0] * 4)
+        self.assertEqual(len(client.embed_texts(['a cat', 'a dog'])[1]), 2)
+        self.assertEqual(self.service._worker.requests[-1]['kind'], 'texts')
+        with self.assertRaises(TaggerError):
+            client._call({'op': 'bogus'})
+        self.assertFalse(TaggerClient(os.path.join(tmp, 'missing.sock')).available())
+
+
+class TestTaggerConfigEndpoint(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(_app, 'current_user', types.SimpleNamespace(is_authenticated=True, is_admin=True, id=1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def test_swap_is_forwarded_and_service_outage_is_503(self):
+        tagger = MagicMock()
+        tagger.swap.return_value = {'generation': 2}
+        with patch.object(_app, '_tagger', tagger):
+            resp = self.client.post('/api/tagger-config', json={'backend': 'clip-int8', 'junk': 1})
+            self.assertEqual(resp.get_json()['status'], {'generation': 2})
+            tagger.swap.assert_called_once_with({'backend': 'clip-int8'})
+            self.assertEqual(self.client.post('/api/tagger-config', json={'junk': 1}).status_code, 400)
+            tagger.status.side_effect = TaggerError('down')
+            self.assertEqual(self.client.get('/api/tagger-config').status_code, 503)
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 21. Collection retag  (B2 bytes -> tagger -> bulk UPDATE, lock-aware)
+# ─────────────────────────────────────────────────────────────────────────────
+from retag import CollectionRetag   # noqa: E402
+
+
+class _RetagDb:
+    """Fake connection over {filename: {'url', 'locked', 'tags'}} for one collection."""
+
+    def __init__(self, images):
+        self.images = images
+        self.updates = []
+        self.commits = 0
+
+    def cursor(self):
+        db = self
+
+        class _Cur:
+            def execute(self, sql, params):
+                if sql.lstrip().startswith('SELECT'):
+                    wanted = params[1] if len(params) > 1 else None
+                    self.rows = [(f, i['url'], i['locked']) for f, i in sorted(db.images.items())
+                                 if wanted is None or f in wanted]
+                else:
+                    db.updates.append(sql)
+                    *pairs, _collection = params
+                    self.rows = []
+                    for filename, tags in zip(pairs[::2], pairs[1::2]):
+                        if filename in db.images and not db.images[filename]['locked']:
+                            db.images[filename]['tags'] = tags
+                            self.rows.append((filename,))
+
+            def fetchall(self):
+                return self.rows
+        return _Cur()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class TestCollectionRetag(unittest.TestCase):
+    def setUp(self):
+        self.db = _RetagDb({name: {'url': f'col/{name}', 'locked': name == 'b.jpg', 'tags': ['old']}
+                            for name in ('a.jpg', 'b.jpg', 'c.jpg', 'd.jpg', 'e.jpg')})
+        def get_object(Bucket, Key):
+            if Key == 'col/e.jpg':
+                raise IOError('gone')
+            return {'Body': io.BytesIO(Key.encode())}
+        self.s3 = MagicMock()
+        self.s3.get_object.side_effect = get_object
+        self.tagged = []
+
+    def _tag(self, images):
+        self.tagged.append(list(images))
+        return [[{'tag': data.decode().split('/')[1], 'confidence': 0.9}] for data in images]
+
+    def _retag(self, **kw):
+        progress = []
+        result = CollectionRetag(self.s3, 'bucket', lambda: self.db, lambda conn: None, self._tag, 'col',
+                                 batch_size=2, on_progress=progress.append, **kw).run()
+        return result, progress
+
+    def test_skips_locked_and_failed_downloads_and_writes_per_batch(self):
+        result, progress = self._retag()
+        self.assertEqual(self.tagged, [[b'col/a.jpg', b'col/c.jpg'], [b'col/d.jpg']])
+        self.assertEqual(self.db.images['a.jpg']['tags'], ['a.jpg'])
+        self.assertEqual(self.db.images['b.jpg']['tags'], ['old'])     # locked
+        self.assertEqual(self.db.images['e.jpg']['tags'], ['old'])     # download failed
+        self.assertEqual(len(self.db.updates), 2)
+        self.assertIn('FROM (VALUES (%s, %s::text[]), (%s, %s::text[])) AS v(filename, tags)', self.db.updates[0])
+        self.assertEqual(result, {'collection': 'col', 'total': 4, 'done': 4, 'tagged': 3,
+                                  'untagged': 1, 'locked': 1})
+        self.assertEqual([p['done'] for p in progress], [0, 2, 4])
+
+    def test_image_locked_mid_run_is_not_overwritten(self):
+        tag = self._tag
+
+        def lock_then_tag(images):
+            self.db.images['c.jpg']['locked'] = True
+            return tag(images)
+        self._tag = lock_then_tag
+        written = []
+        result, _progress = self._retag(filenames=['a.jpg', 'c.jpg'], on_written=written.extend)
+        self.assertEqual(self.db.images['c.jpg']['tags'], ['old'])
+        self.assertEqual(written, [('a.jpg', ['a.jpg'])])
+        self.assertEqual({k: result[k] for k in ('done', 'tagged', 'untagged', 'locked')},
+                         {'done': 2, 'tagged': 1, 'untagged': 0, 'locked': 1})
+
+
+class TestRetagEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.db = _JobsDb()
+        self.queue = JobQueue(lambda: self.db, lambda conn: None)
+        self.queue._handlers = dict(_app._jobs._handlers)
+        for name, value in (('_jobs', self.queue), ('_collection_exists', lambda name: name == 'col'),
+                            ('_image_exists_in_tags', lambda c, f: f in ('a.jpg', 'b.jpg')),
+                            ('_get_image_locked_status', lambda c, f: f == 'b.jpg'),
+                            ('current_user', types.SimpleNamespace(is_authenticated=True, is_admin=True, id=1))):
+            patcher = patch.object(_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def test_retag_all_is_a_job_and_reuses_an_active_one(self):
+        resp = self.client.post('/api/collections/col/retag-all')
+        self.assertEqual(resp.status_code, 202)
+        job_id = resp.get_json()['job_id']
+        self.assertEqual(self.client.post('/api/collections/col/retag-all').get_json()['job_id'], job_id)
+        self.assertEqual(self.queue.get(job_id)['payload'], {'collection': 'col', 'scope': 'all'})
+        self.assertEqual(self.client.post('/api/collections/nope/retag-all').status_code, 404)
+
+    def _upload(self, collection='col'):
+        with patch.object(_app, '_b2_upload_fileobj'), patch.object(_app, '_db_insert_image'), \
+                patch.object(_app, '_b2_sign_url', return_value='signed'):
+            return self.client.post(f'/upload/{collection}',
+                                    data={'file': (io.BytesIO(b'img'), 'x.jpg')},
+                                    content_type='multipart/form-data')
+
+    def test_uploads_coalesce_into_one_tagging_job(self):
+        with patch.object(_app, 'TAG_ON_UPLOAD', True):
+            first = self._upload().get_json()
+            second = self._upload().get_json()
+        self.assertEqual(first['tag_job_id'], second['tag_job_id'])
+        payload = self.queue.get(first['tag_job_id'])['payload']
+        self.assertEqual(payload['filenames'], [first['filename'], second['filename']])
+        self.assertEqual((payload['collection'], payload['scope']), ('col', 'upload'))
+
+    def test_full_tagging_queue_pushes_back_on_uploads(self):
+        with patch.object(_app, 'TAG_ON_UPLOAD', True), patch.object(_app, 'TAG_ON_UPLOAD_MAX_PENDING', 1):
+            self.assertEqual(self._upload().status_code, 200)
+            resp = self._upload()
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers['Retry-After'], '10')
+
+    def test_written_tags_are_pushed_to_the_collection_room(self):
+        def fake_retag(*args, on_written, **kw):
+            on_written([('a.jpg', ['cat'])])
+            return MagicMock(run=lambda: {})
+        job = types.SimpleNamespace(payload={'collection': 'col', 'filenames': ['a.jpg']}, progress=lambda **kw: None)
+        with patch.object(_app, 'CollectionRetag', side_effect=fake_retag), \
+                patch.object(_app, '_b2_sign_urls', return_value=['signed']), \
+                patch.object(_app.socketio, 'emit') as emit, patch.object(_app._image_catalog, 'update'):
+            _app._job_retag_images(job)
+        emit.assert_called_once_with('image_tags', {
+            'collection': 'col', 'images': [{'filename': 'a.jpg', 'tags': ['cat'], 'url': 'signed'}],
+        }, room='collection:col')
+
+    def test_single_image_retag_respects_lock(self):
+        self.assertEqual(self.client.post('/api/images/col/a.jpg/retag').status_code, 202)
+        self.assertEqual(self.client.post('/api/retag/col/b.jpg').status_code, 409)
+        self.assertEqual(self.client.post('/api/images/col/zzz.jpg/retag').status_code, 404)
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 22. Streaming multipart upload  (request body -> B2 parts, no spool)
+# ─────────────────────────────────────────────────────────────────────────────
+import b2_multipart   # noqa: E402
+from b2_multipart import StreamingUpload   # noqa: E402
+
+
+class _FakeMultipartS3:
+    """Records multipart calls; upload_part fails for part number `fail_part`."""
+
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.parts = {}
+        self.put = None
+        self.completed = None
+        self.aborted = False
+
+    def put_object(self, Bucket, Key, Body, **extra):
+        self.put = Body
+
+    def create_multipart_upload(self, Bucket, Key, **extra):
+        return {'UploadId': 'up-1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_part:
+            raise IOError('part failed')
+        self.parts[PartNumber] = Body
+        return {'ETag': f'etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload['Parts']
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+class TestStreamingUpload(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(b2_multipart, 'MIN_PART_SIZE', 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _upload(self, s3, data, **kw):
+        return StreamingUpload(s3, 'bucket', 'col/v.mp4', part_size=4, concurrency=2, **kw).upload(io.BytesIO(data))
+
+    def test_small_body_is_a_single_put(self):
+        s3 = _FakeMultipartS3()
+        result = self._upload(s3, b'abc')
+        self.assertEqual((s3.put, result['parts'], result['bytes']), (b'abc', 1, 3))
+        self.assertIsNone(s3.completed)
+
+    def test_large_body_is_uploaded_in_ordered_parts(self):
+        s3 = _FakeMultipartS3()
+        progress = []
+        result = self._upload(s3, b'0123456789', on_progress=lambda b, p: progress.append(p))
+        self.assertEqual(s3.parts, {1: b'0123', 2: b'4567', 3: b'89'})
+        self.assertEqual([p['PartNumber'] for p in s3.completed], [1, 2, 3])
+        self.assertEqual((result['bytes'], result['parts']), (10, 3))
+        self.assertEqual(sorted(progress), [1, 2, 3])
+
+    def test_failed_part_aborts_the_upload(self):
+        s3 = _FakeMultipartS3(fail_part=2)
+        with self.assertRaises(IOError):
+            self._upload(s3, b'0123456789')
+        self.assertTrue(s3.aborted)
+        self.assertIsNone(s3.completed)
+
+
+class TestVideoStreamEndpoint(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(_app, 'current_user',
+                               types.SimpleNamespace(is_authenticated=True, is_admin=True, id=1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def test_body_is_streamed_to_b2_and_the_row_inserted(self):
+        def fake_stream(stream, key, content_type, on_progress):
+            data = stream.read()
+            on_progress(len(data), 1)
+            return {'key': key, 'bytes': len(data), 'parts': 1}
+        with patch.object(_app, '_b2_upload_stream', side_effect=fake_stream), \
+                patch.object(_app, '_db_insert_video') as insert, patch.object(_app.socketio, 'emit') as emit:
+            resp = self.client.put('/upload-video/col/stream?filename=clip.mp4&upload_id=u1',
+                                   data=b'video-bytes', content_type='video/mp4')
+        self.assertEqual(resp.status_code, 200)
+        body = resp.get_json()
+        self.assertEqual((body['bytes'], body['parts']), (11, 1))
+        self.assertTrue(body['filename'].endswith('.mp4'))
+        insert.assert_called_once()
+        self.assertEqual(emit.call_args.kwargs['room'], 'upload:u1')
+
+    def test_upload_subscribe_joins_the_room_and_acknowledges(self):
+        with patch.object(_app, 'sio_join_room') as join:
+            self.assertTrue(_app.upload_subscribe({'upload_id': 'u1'}))
+            self.assertFalse(_app.upload_subscribe({}))
+            with patch.object(_app, 'current_user', types.SimpleNamespace(is_authenticated=True, is_admin=False)):
+                self.assertFalse(_app.upload_subscribe({'upload_id': 'u2'}))
+        join.assert_called_once_with('upload:u1')
+
+    def test_rejects_bad_type_and_missing_length(self):
+        self.assertEqual(self.client.put('/upload-video/col/stream?filename=x.exe', data=b'x').status_code, 400)
+        self.assertEqual(self.client.put('/upload-video/col/stream?filename=x.mp4').status_code, 411)
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 23. Thumbnails  (WebP/AVIF derivatives under thumbs/, size-appropriate URLs)
+# ─────────────────────────────────────────────────────────────────────────────
+import thumbnails   # noqa: E402
+from thumbnails import ThumbnailBuilder   # noqa: E402
+
+
+def _jpeg(width, height):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (width, height), (120, 60, 30)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+class _ThumbsDb:
+    """Fake connection over {filename: thumbs} for one collection's images."""
+
+    def __init__(self, images):
+        self.images = images
+        self.updates = 0
+
+    def cursor(self):
+        db = self
+
+        class _Cur:
+            def execute(self, sql, params):
+                if sql.lstrip().startswith('SELECT'):
+                    self.rows = [(f, f'col/{f}', t) for f, t in sorted(db.images.items())]
+                else:
+                    db.updates += 1
+                    *pairs, _collection = params
+                    for filename, thumbs in zip(pairs[::2], pairs[1::2]):
+                        db.images[filename] = json.loads(thumbs)
+
+            def fetchall(self):
+                return self.rows
+        return _Cur()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class TestThumbnails(unittest.TestCase):
+    THUMBS = {'source_bytes': 1000, 'source_width': 800,
+              'sizes': {'160': {'webp': 50}, '320': {'webp': 100, 'avif': 80}, '640': {'webp': 300}}}
+
+    def test_render_never_upscales(self):
+        source_width, out = thumbnails.render_thumbnails(_jpeg(400, 300), (160, 320, 640), ('webp',))
+        self.assertEqual(source_width, 400)
+        self.assertEqual([(w, f) for w, f, _data in out], [(320, 'webp'), (160, 'webp')])
+        from PIL import Image
+        self.assertEqual(Image.open(io.BytesIO(out[0][2])).size, (320, 240))
+
+    def test_pick_narrowest_wide_enough_derivative(self):
+        pick = thumbnails.pick_thumbnail
+        self.assertEqual(pick('col/a.jpg', self.THUMBS, 200), 'thumbs/col/a-320.webp')
+        self.assertEqual(pick('col/a.jpg', self.THUMBS, 200, ('avif', 'webp')), 'thumbs/col/a-320.avif')
+        self.assertIsNone(pick('col/a.jpg', self.THUMBS, 700))
+        self.assertIsNone(pick('col/a.jpg', {}, 100))
+
+    def test_savings_fall_back_to_source_bytes(self):
+        stats = thumbnails.savings([{'thumbs': self.THUMBS}, {'thumbs': {}}], (320,), ('webp', 'avif'))
+        self.assertEqual((stats['images'], stats['with_thumbnails'], stats['source_bytes']), (2, 1, 1000))
+        self.assertEqual(stats['sizes']['320']['avif'], {'bytes': 80, 'saved_bytes': 920, 'saved_ratio': 0.92})
+
+    def test_builder_uploads_derivatives_and_skips_complete_images(self):
+        db = _ThumbsDb({'a.jpg': {}, 'b.jpg': dict(self.THUMBS, source_width=100), 'c.jpg': {}})
+        s3 = MagicMock()
+        s3.get_object.side_effect = lambda Bucket, Key: (
+            {'Body': io.BytesIO(_jpeg(400, 200))} if Key == 'col/a.jpg' else {'Body': io.BytesIO(b'junk')})
+        result = ThumbnailBuilder(s3, 'bucket', lambda: db, lambda conn: None, 'col',
+                                  widths=(160, 320), formats=('webp',)).run()
+        self.assertEqual((result['total'], result['generated'], result['failed'], result['skipped']), (2, 1, 1, 1))
+        self.assertEqual(sorted(c.kwargs['Key'] for c in s3.put_object.call_args_list),
+                         ['thumbs/col/a-160.webp', 'thumbs/col/a-320.webp'])
+        self.assertEqual(db.images['a.jpg']['source_width'], 400)
+        self.assertEqual(db.images['c.jpg'], {})
+
+    def test_builder_renders_through_offload(self):
+        db = _ThumbsDb({'a.jpg': {}})
+        s3 = MagicMock()
+        s3.get_object.side_effect = lambda Bucket, Key: {'Body': io.BytesIO(_jpeg(400, 200))}
+        offloaded = []
+        ThumbnailBuilder(s3, 'bucket', lambda: db, lambda conn: None, 'col', widths=(160,), formats=('webp',),
+                         offload=lambda fn, *args: offloaded.append(fn) or fn(*args)).run()
+        self.assertEqual(offloaded, [thumbnails.render_thumbnails])
+        self.assertEqual(db.images['a.jpg']['source_width'], 400)
+
+
+class TestThumbnailEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.db = _JobsDb()
+        self.queue = JobQueue(lambda: self.db, lambda conn: None)
+        self.queue._handlers = dict(_app._jobs._handlers)
+        entries = {'a.jpg': {'url': 'col/a.jpg', 'tags': [], 'thumbs': TestThumbnails.THUMBS},
+                   'b.jpg': {'url': 'col/b.jpg', 'tags': [], 'thumbs': {}}}
+        for name, value in (('_jobs', self.queue), ('_collection_exists', lambda name: name == 'col'),
+                            ('_load_collection_images', lambda name: entries),
+                            ('_b2_sign_urls', lambda keys: [f'signed:{k}' for k in keys]),
+                            ('current_user', types.SimpleNamespace(is_authenticated=True, is_admin=True, id=1))):
+            patcher = patch.object(_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def test_game_pages_get_grid_sized_urls(self):
+        with patch.object(_app, 'render_template', side_effect=lambda tpl, **kw: json.dumps(kw['images'])):
+            urls = json.loads(self.client.get('/collection/col/hunt').data)
+            avif = json.loads(self.client.get('/collection/col/hunt', headers={'Accept': 'image/avif,*/*'}).data)
+        self.assertEqual(urls, ['signed:thumbs/col/a-320.webp', 'signed:col/b.jpg'])
+        self.assertEqual(avif[0], 'signed:thumbs/col/a-320.avif')
+
+    def test_zoom_options_are_thumbnails_and_the_piece_is_an_img_crop(self):
+        with patch.object(_app, 'render_template', side_effect=lambda tpl, **kw: json.dumps(kw)):
+            page = json.loads(self.client.get('/collection/col/zoom').data)
+        self.assertEqual(page['images'], ['signed:thumbs/col/a-320.webp', 'signed:col/b.jpg'])
+        self.assertEqual(page['crop_sources'], {'signed:thumbs/col/a-320.webp': '/img/col/a.jpg',
+                                                'signed:col/b.jpg': '/img/col/b.jpg'})
+
+    def test_collection_images_thumb_url_is_opt_in(self):
+        images = self.client.get('/api/collections/col/images?w=600').get_json()['images']
+        self.assertEqual([i['thumb_url'] for i in images], ['signed:thumbs/col/a-640.webp', 'signed:col/b.jpg'])
+        self.assertNotIn('thumb_url', self.client.get('/api/collections/col/images').get_json()['images'][0])
+
+    def test_backfill_is_a_job_and_stats_report_savings(self):
+        job_id = self.client.post('/api/collections/col/thumbnails').get_json()['job_id']
+        self.assertEqual(self.client.post('/api/collections/col/thumbnails').get_json()['job_id'], job_id)
+        self.assertEqual(self.queue.get(job_id)['payload'], {'collection': 'col', 'scope': 'all', 'force': False})
+        stats = self.client.get('/api/collections/col/thumbnails').get_json()
+        self.assertEqual((stats['images'], stats['with_thumbnails'], stats['source_bytes']), (2, 1, 1000))
+        self.assertEqual(stats['sizes']['320']['webp']['bytes'], 100)
+        self.assertEqual(self.client.get('/api/collections/nope/thumbnails').status_code, 404)
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 24. Image proxy  (/img resize + crop, disk LRU, coalesced misses, ETags)
+# ─────────────────────────────────────────────────────────────────────────────
+import tempfile   # noqa: E402
+import threading   # noqa: E402
+import image_proxy   # noqa: E402
+from image_proxy import DiskLRU, ImageProxy, SingleFlight   # noqa: E402
+
+
+class TestDiskLRU(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def test_evicts_least_recently_used(self):
+        cache = DiskLRU(self.root, 10)
+        cache.put('aa1', b'1234')
+        cache.put('bb2', b'1234')
+        self.assertIsNotNone(cache.get('aa1'))        # bb2 is now the oldest
+        cache.put('cc3', b'1234')
+        self.assertIsNone(cache.get('bb2'))
+        self.assertFalse(os.path.exists(cache.path('bb2')))
+        self.assertEqual(cache.total, 8)
+
+    def test_index_is_rebuilt_from_disk(self):
+        DiskLRU(self.root, 100).put('aa1', b'12345')
+        cache = DiskLRU(self.root, 100)
+        with open(cache.get('aa1'), 'rb') as f:
+            self.assertEqual(f.read(), b'12345')
+        self.assertEqual(cache.total, 5)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight, calls, release = SingleFlight(), [], threading.Event()
+
+        def work():
+            calls.append(1)
+            release.wait(2)
+            return 'done'
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('k', work))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        while flight.coalesced < 3:
+            pass
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual((calls, results), ([1], ['done'] * 4))
+
+
+class TestImageProxy(unittest.TestCase):
+    def setUp(self):
+        self.fetches = []
+
+        def fetch(key):
+            self.fetches.append(key)
+            return _jpeg(800, 400)
+        self.proxy = ImageProxy(fetch, DiskLRU(tempfile.mkdtemp(), 50 * 1024 * 1024), max_dim=600)
+
+    def _size(self, path):
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size, img.format
+
+    def test_renders_fit_and_crop_from_one_decoded_source(self):
+        path, mimetype = self.proxy.render('col/a.jpg', 100, 100)
+        self.assertEqual((self._size(path), mimetype), (((100, 50), 'WEBP'), 'image/webp'))
+        path, _ = self.proxy.render('col/a.jpg', crop=(0.5, 0.5, 0.5, 0.5), fmt='jpeg')
+        self.assertEqual(self._size(path), ((300, 150), 'JPEG'))    # half of the 600px source
+        self.assertEqual(self.fetches, ['col/a.jpg'])
+
+    def test_etag_depends_on_every_parameter(self):
+        tags = {self.proxy.etag('col/a.jpg', 100), self.proxy.etag('col/a.jpg', 200),
+                self.proxy.etag('col/a.jpg', 100, fmt='jpeg'), self.proxy.etag('col/b.jpg', 100)}
+        self.assertEqual(len(tags), 4)
+
+    def test_parse_crop_clamps_and_rejects(self):
+        self.assertEqual(image_proxy.parse_crop('0.8,0,0.5,1'), (0.8, 0.0, 0.2, 1.0))
+        for bad in ('1,1,0.5,0.5', '0,0,1', 'a,b,c,d'):
+            with self.assertRaises(ValueError):
+                image_proxy.parse_crop(bad)
+
+
+class TestImageProxyEndpoint(unittest.TestCase):
+    def setUp(self):
+        fetches = self.fetches = []
+        proxy = ImageProxy(lambda key: fetches.append(key) or _jpeg(400, 400),
+                           DiskLRU(tempfile.mkdtemp(), 10 * 1024 * 1024))
+        for name, value in (('_image_proxy', proxy),
+                            ('_load_image', lambda c, f: {'url': f'{c}/{f}'} if f == 'a.jpg' else None),
+                            ('current_user', types.SimpleNamespace(is_authenticated=True, is_admin=False, id=1))):
+            patcher = patch.object(_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def test_serves_render_with_strong_etag_and_revalidates_without_rendering(self):
+        resp = self.client.get('/img/col/a.jpg?w=64', headers={'Accept': 'image/webp,*/*'})
+        self.assertEqual((resp.status_code, resp.mimetype), (200, 'image/webp'))
+        etag = resp.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        resp = self.client.get('/img/col/a.jpg?w=64', headers={'Accept': 'image/webp,*/*', 'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(self.fetches, ['col/a.jpg'])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get('/img/col/zzz.jpg?w=64').status_code, 404)
+        self.assertEqual(self.client.get('/img/col/a.jpg?crop=2,2,1,1').status_code, 400)
+        self.assertEqual(self.client.get('/img/col/a.jpg?w=-5').status_code, 400)
+
+    def test_oversized_boxes_share_the_max_dim_render(self):
+        tags = {self.client.get(f'/img/col/a.jpg?w={w}&h={w}').headers['ETag'] for w in (2048, 5000, 10 ** 9)}
+        self.assertEqual(len(tags), 1)
+        self.assertEqual(_app._image_proxy.cache.stats()['entries'], 2)   # the source and one render
+
+    def test_proxy_url_encodes_crop_box(self):
+        self.assertEqual(_app._proxy_image_url('col', 'a b.jpg', crop={'x': 0.1, 'y': 0.2, 'w': 0.3, 'h': 0.4}, w=512),
+                         '/img/col/a%20b.jpg?crop=0.1,0.2,0.3,0.4&w=512')
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 25. Image metadata  (dimensions, dominant colour, blurhash; streaming backfill)
+# ─────────────────────────────────────────────────────────────────────────────
+import image_metadata   # noqa: E402
+from image_metadata import MetadataBackfill, compute_metadata   # noqa: E402
+
+
+class _MetaDb:
+    """Fake connection over {(collection, filename): meta or None} rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.selects = []
+
+    def cursor(self):
+        db = self
+
+        class _Cur:
+            def execute(self, sql, params):
+                if sql.lstrip().startswith('SELECT'):
+                    db.selects.append(params)
+                    *filters, limit = params
+                    after = tuple(filters[-2:]) if 'filename) >' in sql else None
+                    self.result = [(c, f, f'{c}/{f}') for (c, f), meta in sorted(db.rows.items())
+                                   if meta is None and (after is None or (c, f) > after)][:limit]
+                else:
+                    for i in range(0, len(params), 3):
+                        db.rows[(params[i], params[i + 1])] = json.loads(params[i + 2])
+
+            def fetchall(self):
+                return self.result
+        return _Cur()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class TestImageMetadata(unittest.TestCase):
+    def test_compute_metadata(self):
+        data = _jpeg(300, 200)
+        meta = compute_metadata(io.BytesIO(data))
+        self.assertEqual((meta['width'], meta['height'], meta['byte_size']), (300, 200, len(data)))
+        r, g, b = (int(meta['dominant_color'][i:i + 2], 16) for i in (1, 3, 5))
+        self.assertTrue(abs(r - 120) < 8 and abs(g - 60) < 8 and abs(b - 30) < 8)
+        self.assertEqual(len(meta['blurhash']), 4 + 2 * 4 * 3)     # 4x3 components for landscape
+
+    def test_dimensions_follow_exif_rotation(self):
+        from PIL import Image
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buf = io.BytesIO()
+        Image.new('RGB', (300, 200)).save(buf, 'JPEG', exif=exif.tobytes())
+        meta = compute_metadata(buf.getvalue())
+        self.assertEqual((meta['width'], meta['height']), (200, 300))
+        self.assertEqual(len(meta['blurhash']), 4 + 2 * 3 * 4)     # 3x4 for portrait
+
+    def test_blurhash_of_flat_image_encodes_its_colour(self):
+        from PIL import Image
+        self.assertEqual(image_metadata.blurhash(Image.new('RGB', (8, 8), (255, 0, 0)), 1, 1), '00TI:j')
+
+    def test_public_metadata(self):
+        self.assertEqual(image_metadata.public_metadata({}), {})
+        meta = {'width': 300, 'height': 200, 'byte_size': 5, 'dominant_color': '#000000', 'blurhash': 'x'}
+        self.assertEqual(image_metadata.public_metadata(meta), {**meta, 'aspect': 1.5})
+
+    def test_backfill_streams_in_keyset_pages_and_skips_failures(self):
+        db = _MetaDb({('a', '1.jpg'): None, ('a', '2.jpg'): None, ('b', 'bad.jpg'): None,
+                      ('b', 'done.jpg'): {'width': 1}})
+        s3 = MagicMock()
+        s3.get_object.side_effect = lambda Bucket, Key: {
+            'Body': io.BytesIO(b'junk' if 'bad' in Key else _jpeg(40, 20))}
+        notified, written, progress = [], [], []
+        result = MetadataBackfill(s3, 'bucket', lambda: db, lambda conn: None, batch_size=2,
+                                  notify=lambda cur, c: notified.append(c), on_written=written.extend,
+                                  on_progress=progress.append).run()
+        self.assertEqual(result, {'collection': None, 'done': 3, 'updated': 2, 'failed': 1})
+        self.assertEqual(len(db.selects), 2)                          # second page is short
+        self.assertEqual(db.selects[1], ('a', '2.jpg', 2))
+        self.assertEqual(db.rows[('a', '1.jpg')]['width'], 40)
+        self.assertIsNone(db.rows[('b', 'bad.jpg')])
+        self.assertEqual(notified, ['a'])
+        self.assertEqual([(c, f) for c, f, _m in written], [('a', '1.jpg'), ('a', '2.jpg')])
+        self.assertEqual([p['done'] for p in progress], [2, 3])
+
+    def test_backfill_decodes_through_offload(self):
+        db = _MetaDb({('a', '1.jpg'): None})
+        s3 = MagicMock()
+        s3.get_object.side_effect = lambda Bucket, Key: {'Body': io.BytesIO(_jpeg(40, 20))}
+        offloaded = []
+        MetadataBackfill(s3, 'bucket', lambda: db, lambda conn: None,
+                         offload=lambda fn, *args: offloaded.append(fn) or fn(*args)).run()
+        self.assertEqual(offloaded, [compute_metadata])
+        self.assertEqual(db.rows[('a', '1.jpg')]['width'], 40)
+
+    def test_upload_metadata_is_offloaded_and_rewinds(self):
+        stream, offloaded = io.BytesIO(_jpeg(30, 10)), []
+        with patch.object(_app, '_offload', lambda fn, *args: offloaded.append(fn) or fn(*args)):
+            meta = _app._upload_metadata(stream)
+        self.assertEqual((meta['width'], offloaded, stream.tell()), (30, [compute_metadata], 0))
+
+
+class TestImageMetadataEndpoints(unittest.TestCase):
+    META = {'width': 300, 'height': 150, 'byte_size': 999, 'dominant_color': '#102030', 'blurhash': 'LEHV6n'}
+
+    def setUp(self):
+        self.db = _JobsDb()
+        self.queue = JobQueue(lambda: self.db, lambda conn: None)
+        self.queue._handlers = dict(_app._jobs._handlers)
+        entries = {'a.jpg': {'url': 'col/a.jpg', 'tags': [], 'meta': self.META},
+                   'b.jpg': {'url': 'col/b.jpg', 'tags': [], 'meta': {}}}
+        for name, value in (('_jobs', self.queue), ('_collection_exists', lambda name: name == 'col'),
+                            ('_load_collection_images', lambda name: entries),
+                            ('_b2_sign_urls', lambda keys: [f'signed:{k}' for k in keys]),
+                            ('current_user', types.SimpleNamespace(is_authenticated=True, is_admin=True, id=1))):
+            patcher = patch.object(_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def test_collection_images_carry_metadata(self):
+        a, b = self.client.get('/api/collections/col/images').get_json()['images']
+        self.assertEqual({k: a[k] for k in (*self.META, 'aspect')}, {**self.META, 'aspect': 2.0})
+        self.assertNotIn('width', b)
+
+    def test_game_pages_get_metadata_by_url(self):
+        with patch.object(_app, 'render_template', side_effect=lambda tpl, **kw: json.dumps(kw['image_meta'])):
+            meta = json.loads(self.client.get('/collection/col/zoom').data)
+        self.assertEqual(meta, {'signed:col/a.jpg': {**self.META, 'aspect': 2.0}})
+
+    def test_backfill_is_one_job_per_collection(self):
+        job_id = self.client.post('/api/collections/col/metadata').get_json()['job_id']
+        self.assertEqual(self.client.post('/api/collections/col/metadata').get_json()['job_id'], job_id)
+        self.assertEqual(self.queue.get(job_id)['payload'], {'collection': 'col'})
+        self.assertEqual(self.client.post('/api/collections/nope/metadata').status_code, 404)
+        everything = self.client.post('/api/metadata/backfill').get_json()['job_id']
+        self.assertNotEqual(everything, job_id)
+
+    def test_upload_metadata_rewinds_stream(self):
+        stream = io.BytesIO(_jpeg(64, 32))
+        self.assertEqual(_app._upload_metadata(stream)['width'], 64)
+        self.assertEqual(stream.tell(), 0)
+        self.assertIsNone(_app._upload_metadata(io.BytesIO(b'not an image')))
+
+    def test_memory_match_with_too_few_images_reports_an_error(self):
+        board, board_meta, available = _app._mm_build_board('col', 2)
+        self.assertEqual((sorted(board), available), (['signed:col/a.jpg'] * 2 + ['signed:col/b.jpg'] * 2, 2))
+        self.assertEqual(board_meta['signed:col/a.jpg'], {**self.META, 'aspect': 2.0})
+        self.assertEqual(_app._mm_build_board('col', 4), (None, None, 2))
+        with patch.object(_app, 'emit') as emit:
+            _app.mm_create({'collection': 'col', 'numImages': 4})
+        emit.assert_called_once()
+        self.assertEqual(emit.call_args[0][0], 'mm_error')
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 26. Duplicate detection  (perceptual hash, BK-tree, upload check, report)
+# ─────────────────────────────────────────────────────────────────────────────
+import image_hashes   # noqa: E402
+from image_hashes import BKTree, DuplicateIndex, hamming   # noqa: E402
+
+
+def _noise_image(seed, size=(400, 300)):
+    import numpy as np
+    from PIL import Image, ImageFilter
+    pixels = (np.random.default_rng(seed).random((size[1], size[0], 3)) * 255).astype('uint8')
+    return Image.fromarray(pixels).filter(ImageFilter.GaussianBlur(8))
+
+
+class TestImageHashes(unittest.TestCase):
+    def test_phash_survives_resize_and_reencode(self):
+        from PIL import Image
+        original = _noise_image(1)
+        buf = io.BytesIO()
+        original.resize((200, 150)).save(buf, 'JPEG', quality=40)
+        copy = Image.open(io.BytesIO(buf.getvalue()))
+        self.assertLessEqual(hamming(image_hashes.phash(original), image_hashes.phash(copy)), 4)
+        self.assertGreater(hamming(image_hashes.phash(original), image_hashes.phash(_noise_image(2))), 12)
+
+    def test_db_round_trip_of_high_bit_hashes(self):
+        value = (1 << 63) | 5
+        self.assertLess(image_hashes.to_db(value), 0)
+        self.assertEqual(image_hashes.from_db(image_hashes.to_db(value)), value)
+
+    def test_bk_tree_search_matches_brute_force(self):
+        import random
+        rng = random.Random(7)
+        hashes = [rng.getrandbits(64) for _ in range(300)]
+        hashes += [h ^ (1 << rng.randrange(64)) for h in hashes[:50]]     # near copies
+        tree = BKTree()
+        for i, h in enumerate(hashes):
+            tree.add(h, i)
+        for query in hashes[:20]:
+            expected = sorted(i for i, h in enumerate(hashes) if hamming(query, h) <= 3)
+            self.assertEqual(sorted(i for _d, i in tree.search(query, 3)), expected)
+
+    def test_clusters_are_transitive(self):
+        hashes = {'a': 0b0, 'b': 0b11, 'c': 0b1111, 'd': (1 << 64) - 1}
+        index = DuplicateIndex()
+        self.assertEqual(index.clusters('col', hashes, 2), [[('a', 0), ('b', 2), ('c', 4)]])
+
+    def test_index_extends_on_adds_and_rebuilds_on_removals(self):
+        index = DuplicateIndex()
+        index.near('col', {'a': 1}, 1, 0)
+        index.near('col', {'a': 1, 'b': 3}, 1, 1)
+        self.assertEqual(index.builds, 1)
+        self.assertEqual(index.near('col', {'a': 1, 'b': 3}, 1, 1), [(0, 'a'), (1, 'b')])
+        self.assertEqual(index.near('col', {'b': 3}, 1, 1), [(1, 'b')])
+        self.assertEqual(index.builds, 2)
+
+    def test_pick_distinct_skips_near_copies_until_it_must_not(self):
+        items = [('a', 0), ('a2', 1), ('b', (1 << 40) - 1), ('x', None)]
+        pick = lambda k: [n for n, _h in image_hashes.pick_distinct(items, k, lambda i: i[1], 2)]
+        self.assertEqual(pick(3), ['a', 'b', 'x'])
+        self.assertEqual(pick(4), ['a', 'b', 'x', 'a2'])
+
+
+class TestDuplicateEndpoints(unittest.TestCase):
+    def setUp(self):
+        buf = io.BytesIO()
+        _noise_image(1).save(buf, 'JPEG')
+        self.upload = buf.getvalue()
+        existing = compute_metadata(self.upload)
+        entries = {'a.jpg': {'url': 'col/a.jpg', 'tags': ['x'], 'meta': existing},
+                   'b.jpg': {'url': 'col/b.jpg', 'tags': [], 'meta': {**existing, 'phash': existing['phash'] ^ 1}},
+                   'c.jpg': {'url': 'col/c.jpg', 'tags': [], 'meta': {}}}
+        self.inserted = []
+        for name, value in (('_duplicate_index', DuplicateIndex()), ('_collection_exists', lambda n: n == 'col'),
+                            ('_load_collection_images', lambda name: entries if name == 'col' else {}),
+                            ('_b2_sign_urls', lambda keys: [f'signed:{k}' for k in keys]),
+                            ('_b2_sign_url', lambda key: f'signed:{key}'),
+                            ('_b2_upload_fileobj', lambda *a, **kw: None),
+                            ('_db_insert_image', lambda *a, **kw: self.inserted.append(a)),
+                            ('TAG_ON_UPLOAD', False), ('THUMBS_ON_UPLOAD', False), ('EMBED_ON_UPLOAD', False),
+                            ('current_user', types.SimpleNamespace(is_authenticated=True, is_admin=True, id=1))):
+            patcher = patch.object(_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def _post(self, collection='col', **form):
+        return self.client.post(f'/upload/{collection}', content_type='multipart/form-data',
+                                data={'file': (io.BytesIO(self.upload), 'photo.jpg'), **form})
+
+    def test_duplicate_upload_is_refused_unless_allowed(self):
+        resp = self._post()
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual([(d['filename'], d['distance']) for d in resp.get_json()['duplicates']],
+                         [('a.jpg', 0), ('b.jpg', 1)])
+        self.assertEqual(self.inserted, [])
+        self.assertEqual(self._post(allow_duplicate='1').status_code, 200)
+        self.assertEqual(self._post(collection='other').status_code, 200)
+        self.assertEqual(len(self.inserted), 2)
+
+    def test_report_clusters_duplicates(self):
+        report = self.client.get('/api/collections/col/duplicates').get_json()
+        self.assertEqual((report['images'], report['unhashed'], report['redundant']), (3, 1, 1))
+        self.assertEqual([[i['filename'] for i in c] for c in report['clusters']], [['a.jpg', 'b.jpg']])
+        self.assertEqual(report['clusters'][0][0]['url'], 'signed:col/a.jpg')
+        self.assertEqual(self.client.get('/api/collections/col/duplicates?distance=0').get_json()['clusters'], [])
+        self.assertEqual(self.client.get('/api/collections/col/duplicates?distance=99').status_code, 400)
+        self.assertEqual(self.client.get('/api/collections/nope/duplicates').status_code, 404)
+
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 27. Image embeddings  (float16 memmap store, IVF search, /similar, /search)
+# ─────────────────────────────────────────────────────────────────────────────
+import embedding_store   # noqa: E402
+from embedding_store import CollectionIndex, EmbeddingBuilder, EmbeddingStore   # noqa: E402
+
+
+def _clustered_vectors(n, dim=32, clusters=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = embedding_store.normalize(rng.normal(size=(clusters, dim)))
+    return embedding_store.normalize(centers[rng.integers(0, clusters, n)] + 0.05 * rng.normal(size=(n, dim)))
+
+
+class TestEmbeddingStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir='/tmp')
+        self.addCleanup(lambda: __import__('shutil').rmtree(self.root, ignore_errors=True))
+        self.store = EmbeddingStore(self.root)
+
+    def test_round_trip_is_float16_memmap_and_exact_for_small_collections(self):
+        vectors = _clustered_vectors(50)
+        ids = [f'{i:02d}.jpg' for i in range(50)]
+        index = self.store.write('col', ids, vectors, 'clip')
+        self.assertIsInstance(index.vectors, np.memmap)
+        self.assertEqual((index.model, index.dim, index.ivf), ('clip', 32, None))
+        self.assertTrue(np.allclose(index.vector('07.jpg'), vectors[7], atol=1e-3))
+        found = index.search(vectors[7], k=3)
+        self.assertEqual(found[0][1], '07.jpg')
+        self.assertAlmostEqual(found[0][0], 1.0, places=2)
+        self.assertNotIn('07.jpg', [name for _s, name in index.search(vectors[7], k=3, exclude=['07.jpg'])])
+        self.assertIs(self.store.get('col'), index)
+        self.assertIsNone(self.store.get('missing'))
+
+    def test_rewrite_replaces_generation_and_rename_drop_follow_collection(self):
+        self.store.write('col', ['a'], _clustered_vectors(1), 'clip')
+        self.store.write('col', ['a', 'b'], _clustered_vectors(2), 'clip')
+        self.assertEqual(len(os.listdir(os.path.join(self.root, 'col'))), 2)   # index.json + one vectors file
+        self.assertEqual(self.store.get('col').ids, ['a', 'b'])
+        self.store.rename('col', 'new')
+        self.assertIsNone(self.store.get('col'))
+        self.assertEqual(self.store.stats('new')['indexed'], 2)
+        self.store.drop('new')
+        self.assertIsNone(self.store.get('new'))
+
+    def test_ivf_search_matches_brute_force(self):
+        vectors = _clustered_vectors(3000)
+        ids = [str(i) for i in range(3000)]
+        with patch.object(embedding_store, 'ANN_MIN_ROWS', 1000):
+            index = self.store.write('big', ids, vectors, 'clip')
+        self.assertIsNotNone(index.ivf)
+        exact = CollectionIndex('clip', ids, np.asarray(index.vectors))
+        hits = 0
+        for q in range(0, 3000, 60):
+            ann = {name for _s, name in index.search(vectors[q], k=10, exclude=[str(q)])}
+            self.assertNotIn(str(q), ann)
+            hits += len(ann & {name for _s, name in exact.search(vectors[q], k=10, exclude=[str(q)])})
+        self.assertGreaterEqual(hits / (50 * 10), 0.9)
+
+
+class TestEmbeddingBuilder(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir='/tmp')
+        self.addCleanup(lambda: __import__('shutil').rmtree(self.root, ignore_errors=True))
+        self.store = EmbeddingStore(self.root)
+        self.s3 = MagicMock()
+        self.s3.get_object.side_effect = lambda Bucket, Key: {'Body': io.BytesIO(Key.encode())}
+        self.calls = []
+
+    def embed(self, images, model='clip'):
+        self.calls.append(images)
+        # 'bad' keys stand for unreadable images -> zero rows
+        return model, np.array([[0.0, 0.0] if b'bad' in b else [len(b), 1.0] for b in images])
+
+    def _build(self, images, **kw):
+        kw.setdefault('embed', self.embed)
+        return EmbeddingBuilder(self.s3, 'bucket', self.store, 'col', images, batch_size=2, **kw).run()
+
+    def test_embeds_missing_prunes_deleted_and_counts_failures(self):
+        result = self._build({'a': 'col/a', 'b': 'col/bad', 'c': 'col/ccc'})
+        self.assertEqual((result['total'], result['embedded'], result['failed']), (3, 2, 1))
+        self.assertEqual(self.store.get('col').ids, ['a', 'c'])
+        self.calls = []
+        result = self._build({'a': 'col/a', 'b': 'col/b', 'd': 'col/d'})
+        self.assertEqual((result['total'], result['skipped']), (2, 1))
+        self.assertEqual(self.calls, [[b'col/b', b'col/d']])
+        self.assertEqual(self.store.get('col').ids, ['a', 'b', 'd'])
+
+    def test_model_change_re_embeds_everything(self):
+        self._build({'a': 'col/a', 'b': 'col/b'})
+        result = self._build({'a': 'col/a', 'b': 'col/b', 'c': 'col/c'},
+                             embed=lambda images: self.embed(images, model='clip-v2'))
+        self.assertEqual(result['embedded'], 3)
+        self.assertEqual(self.store.get('col').model, 'clip-v2')
+
+    def test_save_keeps_rows_a_concurrent_build_added(self):
+        self._build({'a': 'col/a', 'gone': 'col/gone'})
+
+        def embed(images):
+            if not self.calls:   # an upload's job finishes while this build is embedding
+                self._build({'a': 'col/a', 'gone': 'col/gone', 'new': 'col/new'}, filenames=['new'])
+            return self.embed(images)
+        self.calls = []
+        self._build({'a': 'col/a', 'b': 'col/b'}, embed=embed)
+        self.assertEqual(self.store.get('col').ids, ['a', 'b', 'new'])
+
+
+class TestSimilarityEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir='/tmp')
+        self.addCleanup(lambda: __import__('shutil').rmtree(self.root, ignore_errors=True))
+        store = EmbeddingStore(self.root)
+        # a, b and c look alike; z does not; gone.jpg was deleted after the build
+        store.write('col', ['a.jpg', 'b.jpg', 'c.jpg', 'gone.jpg', 'z.jpg'],
+                    embedding_store.normalize(np.array([[1, 0.1, 0], [1, 0.2, 0], [1, 0.4, 0],
+                                                        [1, 0.15, 0], [0, 0, 1]])), 'clip')
+        entries = {f: {'url': f'col/{f}', 'tags': ['t']} for f in ('a.jpg', 'b.jpg', 'c.jpg', 'z.jpg', 'new.jpg')}
+        self.tagger = MagicMock()
+        for name, value in (('_embeddings', store), ('_tagger', self.tagger),
+                            ('_collection_exists', lambda n: n in ('col', 'empty')),
+                            ('_load_collection_images', lambda n: entries if n == 'col' else {}),
+                            ('_b2_sign_urls', lambda keys: [f'signed:{k}' for k in keys])):
+            patcher = patch.object(_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = _app.app.test_client()
+
+    def test_similar_ranks_catalog_images_and_skips_deleted(self):
+        data = self.client.get('/api/collections/col/similar?filename=a.jpg&k=2').get_json()
+        self.assertTrue(data['indexed'])
+        self.assertEqual([i['filename'] for i in data['images']], ['b.jpg', 'c.jpg'])
+        self.assertEqual(data['images'][0]['url'], 'signed:col/b.jpg')
+        both = self.client.get('/api/collections/col/similar?filename=a.jpg&filename=b.jpg&k=5').get_json()
+        self.assertEqual([i['filename'] for i in both['images']], ['c.jpg', 'z.jpg'])
+        unindexed = self.client.get('/api/collections/col/similar?filename=new.jpg').get_json()
+        self.assertEqual((unindexed['indexed'], unindexed['images']), (False, []))
+        self.assertFalse(self.client.get('/api/collections/empty/similar?filename=a.jpg').get_json()['indexed'])
+        self.assertEqual(self.client.get('/api/collections/col/similar').status_code, 400)
+        self.assertEqual(self.client.get('/api/collections/col/similar?filename=a.jpg&k=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/collections/nope/similar?filename=a.jpg').status_code, 404)
+
+    def test_text_search_embeds_query_in_tagger_service(self):
+        self.tagger.embed_texts.return_value = ('clip', [np.array([0, 0, 1], dtype='<f2').tobytes()])
+        data = self.client.get('/api/collections/col/search?q=blue+sky&k=1').get_json()
+        self.assertEqual([i['filename'] for i in data['images']], ['z.jpg'])
+        self.tagger.embed_texts.assert_called_once_with(['blue sky'])
+        self.tagger.embed_texts.return_value = ('other-model', [np.array([0, 0, 1], dtype='<f2').tobytes()])
+        self.assertEqual(self.client.get('/api/collections/col/search?q=sky').status_code, 409)
+        self.tagger.embed_texts.side_effect = TaggerError('down')
+        self.assertEqual(self.client.get('/api/collections/col/search?q=sky').status_code, 503)
+        self.assertEqual(self.client.get('/api/collections/col/search').status_code, 400)
+
+    def test_build_job_embeds_through_tagger_and_stats_report_coverage(self):
+        self.tagger.embed_images.side_effect = lambda images: ('clip', [np.ones(3, dtype='<f2').tobytes()] * len(images))
+        with patch.object(_app, '_s3') as s3, \
+                patch.object(_app, 'current_user', types.SimpleNamespace(is_authenticated=True, is_admin=True, id=1)):
+            s3.get_object.side_effect = lambda Bucket, Key: {'Body': io.BytesIO(b'img')}
+            job = types.SimpleNamespace(payload={'collection': 'col', 'filenames': ['new.jpg']},
+                                        progress=lambda **kw: None)
+            self.assertEqual(_app._job_build_embeddings(job)['embedded'], 1)
+            stats = self.client.get('/api/collections/col/embeddings').get_json()
+        self.assertEqual((stats['images'], stats['indexed'], stats['missing'], stats['ann']), (5, 5, 0, False))
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,253 @@
+"""
+Responsive image derivatives ("thumbnails").
+
+Game grids show 20-40 images at a few hundred pixels each but used to be sent
+the full-resolution originals. For every image, downscaled copies are rendered
+at a few fixed widths, in WebP and (when Pillow has the codec) AVIF, and
+stored in B2 beside the originals under a thumbs/ prefix:
+
+    thumbs/<collection>/<stem>-<width>.<format>
+
+What was generated is recorded on the image row (images.thumbs, JSONB):
+
+    {'source_bytes': 2483121, 'source_width': 4032,
+     'sizes': {'160': {'webp': 6120, 'avif': 4388}, '320': {...}, ...}}
+
+so picking a URL needs no B2 listing and the byte savings of a collection are
+computed from the catalog. Widths at or above the original's are skipped (an
+image is never upscaled); callers fall back to the original when no
+derivative is wide enough.
+"""
+
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageOps, features
+
+THUMB_WIDTHS = (160, 320, 640)
+THUMB_FORMATS = tuple(f for f in ('webp', 'avif') if features.check(f))
+# Encoder quality per format; AVIF reaches WebP's visual quality at a lower setting.
+QUALITY = {'webp': 80, 'avif': 55}
+CONTENT_TYPES = {'webp': 'image/webp', 'avif': 'image/avif'}
+# Derivative keys never change content, so browsers and CDNs may keep them for good.
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def thumb_key(image_key: str, width: int, fmt: str) -> str:
+    """B2 key of the `width`px `fmt` derivative of the original at `image_key`."""
+    stem = image_key.rsplit('.', 1)[0] if '.' in image_key.rsplit('/', 1)[-1] else image_key
+    return f'thumbs/{stem}-{int(width)}.{fmt}'
+
+
+def render_thumbnails(data: bytes, widths: Sequence[int] = THUMB_WIDTHS,
+                      formats: Sequence[str] = THUMB_FORMATS) -> Tuple[int, List[Tuple[int, str, bytes]]]:
+    """Decode `data` once and encode it at each width narrower than the
+    original; returns (source_width, [(width, format, encoded bytes)])."""
+    with Image.open(io.BytesIO(data)) as img:
+        # Displayed width, i.e. after EXIF rotation
+        rotated = img.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+        source_width = img.height if rotated else img.width
+        # Let the JPEG decoder downscale by 1/2..1/8 while decoding when the
+        # largest derivative allows it — much faster than a full decode.
+        largest = max(widths)
+        if img.format == 'JPEG' and source_width > 2 * largest:
+            img.draft('RGB', (largest, largest))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+
+    out = []
+    current = img
+    # Largest first, each step resampled from the previous one
+    for width in sorted({int(w) for w in widths if int(w) < source_width}, reverse=True):
+        height = max(1, round(current.height * width / current.width))
+        current = current.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            buf = io.BytesIO()
+            current.save(buf, fmt.upper(), quality=QUALITY.get(fmt, 80))
+            out.append((width, fmt, buf.getvalue()))
+    return source_width, out
+
+
+def is_complete(thumbs: Optional[Dict], widths: Sequence[int] = THUMB_WIDTHS,
+                formats: Sequence[str] = THUMB_FORMATS) -> bool:
+    """True when `thumbs` already holds every derivative the settings call for."""
+    if not thumbs or 'source_width' not in thumbs:
+        return False
+    sizes = thumbs.get('sizes', {})
+    return all(fmt in sizes.get(str(w), {})
+               for w in widths if int(w) < thumbs['source_width'] for fmt in formats)
+
+
+def pick_thumbnail(image_key: str, thumbs: Optional[Dict], width: int,
+                   formats: Sequence[str] = ('webp',)) -> Optional[str]:
+    """Key of the narrowest derivative at least `width` px wide in the first of
+    `formats` it exists in, or None when the original should be served."""
+    sizes = (thumbs or {}).get('sizes', {})
+    for w in sorted(int(s) for s in sizes):
+        if w >= width:
+            for fmt in formats:
+                if fmt in sizes[str(w)]:
+                    return thumb_key(image_key, w, fmt)
+    return None
+
+
+def thumbnail_keys(image_key: str, thumbs: Optional[Dict]) -> List[str]:
+    """Every derivative key recorded in `thumbs` (for deleting them with the original)."""
+    return [thumb_key(image_key, int(w), fmt)
+            for w, by_format in (thumbs or {}).get('sizes', {}).items() for fmt in by_format]
+
+
+def savings(entries: Iterable[Dict], widths: Sequence[int] = THUMB_WIDTHS,
+            formats: Sequence[str] = THUMB_FORMATS) -> Dict:
+    """Byte totals for a collection's catalog entries: the originals, and what
+    a grid of each width / format costs when every image is served at that size
+    (falling back to the original where no derivative exists)."""
+    images = processed = source_total = 0
+    served = {str(w): {fmt: 0 for fmt in formats} for w in widths}
+    for entry in entries:
+        images += 1
+        thumbs = entry.get('thumbs') or {}
+        if 'source_bytes' not in thumbs:
+            continue
+        processed += 1
+        source = int(thumbs['source_bytes'])
+        source_total += source
+        for w in served:
+            for fmt in served[w]:
+                served[w][fmt] += int(thumbs.get('sizes', {}).get(w, {}).get(fmt, source))
+    return {
+        'images': images,
+        'with_thumbnails': processed,
+        'source_bytes': source_total,
+        'sizes': {w: {fmt: {'bytes': n, 'saved_bytes': source_total - n,
+                            'saved_ratio': round(1 - n / source_total, 4) if source_total else 0.0}
+                      for fmt, n in by_format.items()}
+                  for w, by_format in served.items()},
+    }
+
+
+class ThumbnailBuilder:
+    """Generate missing derivatives for collection `collection` (or a subset).
+
+    Originals are fetched from B2 into memory on a small thread pool and each
+    is rendered through offload(render_thumbnails, ...), which the web process
+    points at a pool of real OS threads so decoding and encoding never run on
+    the gevent loop (default: call it in place). Each batch's results are
+    written with one UPDATE ... FROM (VALUES ...). Images that already have
+    every derivative are skipped unless force=True.
+
+    notify(cur, collection) is called inside each write transaction;
+    on_written(rows) gets the [(filename, thumbs)] written after each commit;
+    on_progress(progress_dict) is called as batches complete.
+    """
+
+    def __init__(self, s3, bucket: str, get_db: Callable, release_db: Callable, collection: str,
+                 filenames: Optional[Sequence[str]] = None, widths: Sequence[int] = THUMB_WIDTHS,
+                 formats: Sequence[str] = THUMB_FORMATS, force: bool = False,
+                 batch_size: int = 32, workers: int = 4, notify: Callable = None,
+                 on_written: Callable = None, on_progress: Callable[[Dict], None] = None,
+                 offload: Callable = None):
+        self._s3 = s3
+        self._bucket = bucket
+        self._get_db = get_db
+        self._release_db = release_db
+        self.collection = collection
+        self.filenames = list(filenames) if filenames is not None else None
+        self.widths = tuple(widths)
+        self.formats = tuple(formats)
+        self.force = force
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers))
+        self._notify = notify
+        self._on_written = on_written
+        self._on_progress = on_progress
+        self._offload = offload or (lambda fn, *args: fn(*args))
+        self.progress = {'collection': collection, 'total': 0, 'done': 0,
+                         'generated': 0, 'failed': 0, 'skipped': 0, 'bytes_saved': 0}
+
+    def _report(self):
+        if self._on_progress:
+            self._on_progress(dict(self.progress))
+
+    def _targets(self) -> List[Tuple[str, str]]:
+        """[(filename, storage key)] of the images still missing derivatives."""
+        conn = self._get_db()
+        try:
+            cur = conn.cursor()
+            sql = "SELECT filename, url, thumbs FROM images WHERE collection_name = %s"
+            params = [self.collection]
+            if self.filenames is not None:
+                sql += " AND filename = ANY(%s)"
+                params.append(self.filenames)
+            cur.execute(sql + " ORDER BY filename", params)
+            rows = cur.fetchall()
+        finally:
+            self._release_db(conn)
+        todo = [(filename, url) for filename, url, thumbs in rows
+                if self.force or not is_complete(thumbs, self.widths, self.formats)]
+        self.progress['skipped'] = len(rows) - len(todo)
+        return todo
+
+    def build(self, key: str) -> Optional[Dict]:
+        """Fetch, render and upload one original's derivatives; its thumbs dict, or None on failure."""
+        try:
+            data = self._s3.get_object(Bucket=self._bucket, Key=key)['Body'].read()
+            source_width, rendered = self._offload(render_thumbnails, data, self.widths, self.formats)
+            sizes = {}
+            for width, fmt, body in rendered:
+                self._s3.put_object(Bucket=self._bucket, Key=thumb_key(key, width, fmt), Body=body,
+                                    ContentType=CONTENT_TYPES.get(fmt, 'application/octet-stream'),
+                                    CacheControl=CACHE_CONTROL)
+                sizes.setdefault(str(width), {})[fmt] = len(body)
+        except Exception as e:
+            print(f"[thumbs] Could not build derivatives of {key}: {e}")
+            return None
+        return {'source_bytes': len(data), 'source_width': source_width, 'sizes': sizes}
+
+    def _write(self, rows: List[Tuple[str, Dict]]):
+        if not rows:
+            return
+        values = ', '.join(['(%s, %s::jsonb)'] * len(rows))
+        params = [p for filename, thumbs in rows for p in (filename, json.dumps(thumbs))]
+        conn = self._get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                UPDATE images AS i SET thumbs = v.thumbs
+                FROM (VALUES {values}) AS v(filename, thumbs)
+                WHERE i.collection_name = %s AND i.filename = v.filename
+            """, (*params, self.collection))
+            if self._notify:
+                self._notify(cur, self.collection)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release_db(conn)
+        if self._on_written:
+            self._on_written(rows)
+
+    def run(self) -> Dict:
+        """Build every missing derivative; returns the final progress."""
+        targets = self._targets()
+        self.progress['total'] = len(targets)
+        self._report()
+        grid_width = str(min(self.widths)) if self.widths else None
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for start in range(0, len(targets), self.batch_size):
+                batch = targets[start:start + self.batch_size]
+                results = list(pool.map(self.build, [key for _f, key in batch]))
+                rows = [(filename, thumbs) for (filename, _key), thumbs in zip(batch, results) if thumbs]
+                self._write(rows)
+                self.progress['done'] += len(batch)
+                self.progress['generated'] += len(rows)
+                self.progress['failed'] += len(batch) - len(rows)
+                for _filename, thumbs in rows:
+                    smallest = thumbs['sizes'].get(grid_width, {})
+                    if smallest:
+                        self.progress['bytes_saved'] += thumbs['source_bytes'] - min(smallest.values())
+                self._report()
+        return dict(self.progress)